@@ -0,0 +1,349 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""The cases timed by benchmark.run.
+
+Each case times calls of one function and knows how many points (hkls,
+positions or UB calculations) a call handles, so that results can be given
+per point. Crystals and reflections come from test/diffcalc/scenarios.py.
+Each engine is set up through create_diffcalc with the solution cache off, so
+repeated calls are really calculated.
+
+Cases are named engine.geometry.function[detail], where detail is the mode or
+constraint combination for hkl to angles calculations and the session name
+for UB calculations.
+"""
+
+import os
+from itertools import combinations
+
+from diffcalc.diffcalc_ import create_diffcalc
+from diffcalc.hardware import DummyHardwareAdapter
+from diffcalc.hkl.vlieg.geometry import SixCircleGammaOnArmGeometry, \
+    SixCircleGeometry, Fivec, Fourc
+from diffcalc.hkl.willmott.calc import WillmottHorizontalGeometry, \
+    WillmottHorizontalPosition
+from diffcalc.hkl.you.constraints import YouConstraintManager, NUNAME, \
+    all_constraints, valueless_constraints
+from diffcalc.hkl.you.geometry import SixCircle, FourCircle, YouPosition
+from diffcalc.ub.persistence import UBCalculationJSONPersister
+from diffcalc.util import DiffcalcException
+from test.diffcalc import scenarios
+
+# Values (in degrees) given to constraints and parameters
+YOU_CONSTRAINT_VALUES = {
+    'delta': 10, NUNAME: 10, 'qaz': 90, 'naz': 135, 'alpha': 2, 'beta': 2,
+    'psi': 90, 'mu': 0, 'eta': 0, 'chi': 90, 'phi': 0}
+VLIEG_PARAMETER_VALUES = {
+    'alpha': 5, 'gamma': 0, 'oopgamma': 0, 'betain': 2, 'betaout': 2,
+    'phi': 30}
+WILLMOTT_CONSTRAINT_VALUES = {'betain': 2, 'betaout': 2}
+
+# You constraint combinations also solved numerically to compare the cost per
+# point. The last three have no analytic solution.
+NUMERICAL_COMBINATIONS = (
+    ('a_eq_b', 'mu', NUNAME),
+    ('mu', NUNAME, 'psi'),
+    ('a_eq_b', 'eta', 'qaz'),
+    ('alpha', 'chi', 'delta'),
+    ('beta', 'naz', 'phi'),
+    ('a_eq_b', 'chi', 'phi'),
+    ('chi', 'eta', 'phi'),
+    ('delta', 'eta', 'mu'),
+    ('chi', 'naz', 'phi'),
+    ('alpha', 'mu', 'phi'))
+
+# Implemented You constraint combinations which solve none of the session's
+# reflections with the values above, and so are not timed
+UNSOLVABLE_COMBINATIONS = frozenset(
+    # mu_is_gam needs one of phi, chi, eta or mu to be constrained too
+    [tuple(sorted((reference, detector, 'mu_is_gam')))
+     for reference in ('a_eq_b', 'alpha', 'beta', 'psi')
+     for detector in ('delta', NUNAME, 'naz', 'qaz')] +
+    # math domain error with eta and mu both 0
+    [tuple(sorted((reference, 'eta', 'mu')))
+     for reference in ('a_eq_b', 'alpha', 'beta', 'psi')] +
+    # no solution within the delta limits
+    [('chi', 'eta', 'phi')])
+
+# Limits (in degrees) applied to any axes with these names, to choose
+# between detector solutions
+LIMITS = {'delta': (0, 179.999)}
+
+SESSION = scenarios.session3  # for all hkl and angle calculations
+
+GEOMETRIES = (
+    ('you', SixCircle, ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi')),
+    ('you', FourCircle, ('delta', 'eta', 'chi', 'phi')),
+    ('vlieg', SixCircleGammaOnArmGeometry,
+     ('alpha', 'delta', 'gamma', 'omega', 'chi', 'phi')),
+    ('vlieg', SixCircleGeometry,
+     ('alpha', 'delta', 'oopgamma', 'omega', 'chi', 'phi')),
+    ('vlieg', Fivec, ('alpha', 'delta', 'omega', 'chi', 'phi')),
+    ('vlieg', Fourc, ('delta', 'omega', 'chi', 'phi')),
+    ('willmott', WillmottHorizontalGeometry,
+     ('delta', 'gamma', 'omegah', 'phi')))
+
+
+class Case(object):
+    """A function to time which handles a number of points per call.
+
+    setup, if given, is called before the function is timed.
+    """
+
+    def __init__(self, name, function, points, setup=None):
+        self.name = name
+        self.function = function
+        self.points = points
+        self.setup = setup
+
+
+def _physical_angles(engine, geometry, vlieg_position):
+    """Return a scenario's (Vlieg) position as physical angles of geometry.
+
+    The six circles of the You and Vlieg sixc geometries are driven by the
+    same motors. The Willmott geometry takes delta, gamma, omega and phi.
+    """
+    p = vlieg_position
+    if engine == 'you':
+        position = YouPosition(*p.totuple())
+    elif engine == 'willmott':
+        position = WillmottHorizontalPosition(p.delta, p.gamma, p.omega, p.phi)
+    else:
+        position = p
+    return geometry.internal_position_to_physical_angles(position)
+
+
+def _create(engine, geometry_class, axes, session, persister=None):
+    """Return a Diffcalc with the session's lattice and reflections"""
+    geometry = geometry_class()
+    hardware = DummyHardwareAdapter(axes)
+    for name in axes:
+        if name in LIMITS:
+            hardware.set_lower_limit(name, LIMITS[name][0])
+            hardware.set_upper_limit(name, LIMITS[name][1])
+    dc = create_diffcalc(engine, geometry, hardware, True, persister,
+                         solution_cache_size=0)
+    dc.ub.newub(session.name)
+    dc.ub.setlat(session.name, *session.lattice)
+    for ref in (session.ref1, session.ref2):
+        dc.ub.addref([ref.h, ref.k, ref.l],
+                     list(_physical_angles(engine, geometry, ref.pos)),
+                     ref.energy, ref.tag)
+    return dc
+
+
+def _hkls():
+    hkls = [tuple(hkl) for hkl in SESSION.calculations[0].hklList]
+    hkls.extend([(r.h, r.k, r.l) for r in (SESSION.ref1, SESSION.ref2)])
+    return hkls
+
+
+def _hkl_to_angles_case(name, hklcalc, setup):
+    hkls = _hkls()
+    wavelength = SESSION.calculations[0].wavelength
+
+    def hkl_to_angles():
+        solved = 0
+        for h, k, l in hkls:
+            try:
+                hklcalc.hklToAngles(h, k, l, wavelength)
+                solved += 1
+            except DiffcalcException:
+                pass
+        return solved
+    return Case(name, hkl_to_angles, len(hkls), setup)
+
+
+def _angle_cases(prefix, dc, engine):
+    hklcalc = dc._hklcalc
+    geometry = dc._geometry
+    wavelength = SESSION.calculations[0].wavelength
+    positions = [geometry.physical_angles_to_internal_position(
+                     _physical_angles(engine, geometry, r.pos))
+                 for r in (SESSION.ref1, SESSION.ref2)]
+
+    def angles_to_hkl():
+        for pos in positions:
+            hklcalc.anglesToHkl(pos, wavelength)
+
+    def angles_to_virtual_angles():
+        for pos in positions:
+            hklcalc.anglesToVirtualAngles(pos, wavelength)
+    return [Case(prefix + 'anglesToHkl', angles_to_hkl, len(positions)),
+            Case(prefix + 'anglesToVirtualAngles', angles_to_virtual_angles,
+                 len(positions))]
+
+
+def _ub_cases(prefix, engine, geometry_class, axes):
+    cases = []
+    for session in scenarios.sessions():
+        try:
+            ubcalc = _create(engine, geometry_class, axes, session)._ubcalc
+        except DiffcalcException:
+            continue  # the reflections are parallel in this geometry
+        cases.append(Case(prefix + 'calculate_UB[%s]' % session.name,
+                          ubcalc.calculate_UB, 1))
+    return cases
+
+
+def _persistence_case(prefix, engine, geometry_class, axes, directory):
+    directory = os.path.join(directory, prefix.rstrip('.'))
+    os.mkdir(directory)
+    persister = UBCalculationJSONPersister(directory)
+    ubcalc = _create(engine, geometry_class, axes, SESSION, persister)._ubcalc
+
+    def round_trip():
+        ubcalc.saveas(SESSION.name)
+        ubcalc.load(SESSION.name)
+    return Case(prefix + 'json_round_trip', round_trip, 1)
+
+
+### You ###
+
+def _you_constraints(manager_factory, names):
+    """Return a new constraint manager with names constrained (to the values
+    in YOU_CONSTRAINT_VALUES), or None unless they complete a valid set"""
+    manager = manager_factory()
+    fixed = set(manager.all)
+    try:
+        for name in names:
+            manager.constrain(name)
+            if name not in valueless_constraints:
+                manager.set_constraint(name, YOU_CONSTRAINT_VALUES[name])
+    except DiffcalcException:
+        return None
+    if set(manager.all) != fixed | set(names):  # one replaced another
+        return None
+    if not manager.is_fully_constrained():
+        return None
+    return manager
+
+
+def you_combinations(manager_factory, implemented=True):
+    """Return the (un)implemented You constraint combinations, beyond any
+    fixed by the geometry, as sorted tuples of names"""
+    found = []
+    for n in (1, 2, 3):
+        for names in combinations(sorted(all_constraints), n):
+            manager = _you_constraints(manager_factory, names)
+            if (manager is not None and
+                manager.is_current_mode_implemented() == implemented):
+                found.append(names)
+    return found
+
+
+def _you_cases(prefix, geometry_class, axes):
+    dc = _create('you', geometry_class, axes, SESSION)
+    hklcalc = dc._hklcalc
+
+    def manager_factory():
+        return YouConstraintManager(dc._hardware,
+                                    dc._geometry.fixed_constraints)
+
+    def use(names):
+        def setup():
+            manager = _you_constraints(manager_factory, names)
+            hklcalc.constraints = hklcalc.parameter_manager = manager
+        return setup
+
+    cases = []
+    for names in you_combinations(manager_factory):
+        if names in UNSOLVABLE_COMBINATIONS:
+            continue
+        cases.append(_hkl_to_angles_case(
+            prefix + 'hklToAngles[%s]' % ','.join(names), hklcalc, use(names)))
+    if geometry_class is SixCircle:
+        for names in NUMERICAL_COMBINATIONS:
+            cases.append(_you_numerical_case(
+                prefix + 'numerical[%s]' % ','.join(sorted(names)), hklcalc,
+                use(names)))
+    return cases
+
+
+def _you_numerical_case(name, hklcalc, setup):
+    hkls = _hkls()
+    wavelength = SESSION.calculations[0].wavelength
+
+    def hkl_to_angles_numerical():
+        return int(sum(hklcalc.hkl_to_angles_numerical(hkls, wavelength).ok))
+    return Case(name, hkl_to_angles_numerical, len(hkls), setup)
+
+
+### Vlieg ###
+
+def _vlieg_cases(prefix, geometry_class, axes):
+    dc = _create('vlieg', geometry_class, axes, SESSION)
+    hklcalc = dc._hklcalc
+    geometry = dc._geometry
+    modes = hklcalc.mode_selector._modelist
+
+    def use(mode):
+        def setup():
+            hklcalc.mode_selector.setModeByIndex(mode.index)
+            for name in mode.parameterNames:
+                if not geometry.parameter_fixed(name):
+                    hklcalc.parameter_manager.set_constraint(
+                        name, VLIEG_PARAMETER_VALUES[name])
+        return setup
+
+    cases = []
+    for index in sorted(modes):
+        mode = modes[index]
+        if mode.implemented and geometry.supports_mode_group(mode.group):
+            cases.append(_hkl_to_angles_case(
+                prefix + 'hklToAngles[%s]' % mode.name, hklcalc, use(mode)))
+    return cases
+
+
+### Willmott ###
+
+def _willmott_cases(prefix, geometry_class, axes):
+    dc = _create('willmott', geometry_class, axes, SESSION)
+    hklcalc = dc._hklcalc
+    constraints = hklcalc.constraints
+
+    def use(name):
+        def setup():
+            constraints.constrain(name)
+            if name in WILLMOTT_CONSTRAINT_VALUES:
+                constraints.set_constraint(name,
+                                           WILLMOTT_CONSTRAINT_VALUES[name])
+        return setup
+
+    return [_hkl_to_angles_case(prefix + 'hklToAngles[%s]' % name, hklcalc,
+                                use(name))
+            for name in constraints.available_constraint_names]
+
+
+_ENGINE_CASES = {'you': _you_cases,
+                 'vlieg': _vlieg_cases,
+                 'willmott': _willmott_cases}
+
+
+def create_cases(directory):
+    """Return the list of Cases, saving UB calculations in directory"""
+    cases = []
+    for engine, geometry_class, axes in GEOMETRIES:
+        prefix = '%s.%s.' % (engine, geometry_class().name)
+        cases.extend(_ENGINE_CASES[engine](prefix, geometry_class, axes))
+        cases.extend(_angle_cases(
+            prefix, _create(engine, geometry_class, axes, SESSION), engine))
+        cases.extend(_ub_cases(prefix, engine, geometry_class, axes))
+        cases.append(_persistence_case(prefix, engine, geometry_class, axes,
+                                       directory))
+    return cases
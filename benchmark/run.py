@@ -0,0 +1,213 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Time diffcalc's calculations and compare them with a stored baseline.
+
+Run from the top of the source tree::
+
+   $ python -m benchmark.run                   # compare with the baseline
+   $ python -m benchmark.run -o results.json   # also save the results
+   $ python -m benchmark.run --save-baseline   # replace the baseline
+   $ python -m benchmark.run -k you.sixc       # only matching cases
+
+Each case (see benchmark.cases) is timed for at least --time seconds, and the
+best of --repeat such runs is reported in seconds per point. The results are
+written as json: a dictionary of cases, each with 'seconds_per_point',
+'points' and, for hkl to angles calculations, 'solved' (the number of points
+solved per call).
+
+A case is reported as a regression if it takes longer per point than the
+baseline by more than the --tolerance fraction, and the exit status is then
+1. Timings depend on the machine, so regenerate the baseline when moving to a
+new one.
+"""
+
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+from StringIO import StringIO
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from benchmark.cases import create_cases
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+TOLERANCE = .25  # fraction slower than the baseline allowed
+MINIMUM_TIME = .05  # seconds per run
+REPEAT = 3
+
+
+class _Quiet(object):
+    """Context manager which hides what the timed code prints"""
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def __exit__(self, *args):
+        sys.stdout = self._stdout
+
+
+def time_case(case, minimum_time=MINIMUM_TIME, repeat=REPEAT):
+    """Return a result dictionary for case. Exceptions from the case's first
+    call are passed on, as timing it would then be meaningless."""
+    with _Quiet():
+        if case.setup is not None:
+            case.setup()
+        solved = case.function()  # also warms up any caches
+        best = None
+        for _ in range(repeat):
+            calls = 0
+            start = time.time()
+            while True:
+                case.function()
+                calls += 1
+                elapsed = time.time() - start
+                if elapsed >= minimum_time:
+                    break
+            if best is None or elapsed / calls < best:
+                best = elapsed / calls
+    result = {'seconds_per_point': best / case.points,
+              'points': case.points}
+    if solved is not None:
+        result['solved'] = solved
+    return result
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Return lists of (name, ratio) for regressed and improved cases and the
+    names of cases that are new or missing, comparing results with a baseline
+    (both dictionaries of cases)"""
+    regressed = []
+    improved = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = (results[name]['seconds_per_point'] /
+                 baseline[name]['seconds_per_point'])
+        if ratio > 1 + tolerance:
+            regressed.append((name, ratio))
+        elif ratio < 1 - tolerance:
+            improved.append((name, ratio))
+    new = sorted(set(results) - set(baseline))
+    missing = sorted(set(baseline) - set(results))
+    return regressed, improved, new, missing
+
+
+def _save(results, path):
+    document = {'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'cases': results}
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=1, sort_keys=True,
+                  separators=(',', ': '))
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)['cases']
+
+
+def main(argv=None):
+    parser = OptionParser(usage='python -m benchmark.run [options]')
+    parser.add_option('-k', dest='pattern', default='',
+                      help='only run cases whose names contain PATTERN')
+    parser.add_option('-o', '--output', dest='output',
+                      help='write results as json to OUTPUT')
+    parser.add_option('-b', '--baseline', dest='baseline', default=BASELINE,
+                      help='baseline to compare with [%default]')
+    parser.add_option('--save-baseline', dest='save_baseline',
+                      action='store_true', default=False,
+                      help='write the results to the baseline instead')
+    parser.add_option('-t', '--tolerance', dest='tolerance', type='float',
+                      default=TOLERANCE,
+                      help='allowed fraction slower than the baseline '
+                           '[%default]')
+    parser.add_option('--time', dest='minimum_time', type='float',
+                      default=MINIMUM_TIME,
+                      help='minimum seconds per timed run [%default]')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int',
+                      default=REPEAT, help='timed runs per case [%default]')
+    options, _ = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        with _Quiet():
+            cases = create_cases(directory)
+        results = {}
+        for case in cases:
+            if options.pattern not in case.name:
+                continue
+            try:
+                result = time_case(case, options.minimum_time, options.repeat)
+            except Exception, e:
+                message = (str(e).strip().splitlines() or [''])[0]
+                print '%-60s failed: %s %s' % (case.name,
+                                               e.__class__.__name__, message)
+                continue
+            results[case.name] = result
+            solved = ''
+            if 'solved' in result:
+                solved = '  (%i/%i solved)' % (result['solved'], case.points)
+            print '%-60s %10.1f us/point%s' % (
+                case.name, result['seconds_per_point'] * 1e6, solved)
+    finally:
+        shutil.rmtree(directory)
+
+    if options.output:
+        _save(results, options.output)
+    if options.save_baseline:
+        if options.pattern and os.path.exists(options.baseline):
+            baseline = _load(options.baseline)
+            baseline.update(results)
+            results = baseline
+        _save(results, options.baseline)
+        print 'Saved baseline to', options.baseline
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print 'No baseline at %s to compare with' % options.baseline
+        return 0
+    baseline = _load(options.baseline)
+    if options.pattern:
+        baseline = dict((name, result) for name, result in baseline.items()
+                        if options.pattern in name)
+    regressed, improved, new, missing = compare(results, baseline,
+                                                options.tolerance)
+    for name, ratio in improved:
+        print 'faster: %s (%.2f times the baseline)' % (name, ratio)
+    for name in new:
+        print 'new: %s (not in the baseline)' % name
+    for name in missing:
+        print 'missing: %s (in the baseline only)' % name
+    for name, ratio in regressed:
+        print 'SLOWER: %s (%.2f times the baseline)' % (name, ratio)
+    print '%i cases, %i slower and %i faster than the baseline' % (
+        len(results), len(regressed), len(improved))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -46,6 +46,30 @@ from diffcalc.ub.persistence import UbCalculationNonPersister
 
 AVAILABLE_ENGINES = ('vlieg', 'willmott', 'you')
 
+SOLUTION_CACHE_SIZE = 256  # hklToAngles solutions kept per calculator
+
+
+class UBCheck(object):
+    """Entered and calculated hkl for each of N reflections.
+
+    entered_hkl, computed_hkl -- N*3 arrays of hkl
+    residuals -- N*3 array of computed minus entered hkl
+    energies -- N array of energies in keV
+    tags -- list of N tags (or None)
+
+    The arrays are lists of tuples if numpy is not available.
+    """
+
+    def __init__(self, entered_hkl, computed_hkl, residuals, energies, tags):
+        self.entered_hkl = entered_hkl
+        self.computed_hkl = computed_hkl
+        self.residuals = residuals
+        self.energies = energies
+        self.tags = tags
+
+    def __len__(self):
+        return len(self.tags)
+
 
 class DummySolutionTransformer(object):
 
@@ -59,7 +83,8 @@ def create_diffcalc(engine_name,
                     raise_exceptions_for_all_errors=True,
                     ub_persister=None,
                     diffractometer_name = None, # used for user help if no hardware plugin given
-                    diffractometer_axes_names = None):         # used for user help if no hardware plugin given
+                    diffractometer_axes_names = None,          # used for user help if no hardware plugin given
+                    solution_cache_size=SOLUTION_CACHE_SIZE):
 
     if not ub_persister:
         ub_persister = UbCalculationNonPersister()
@@ -99,6 +124,7 @@ def create_diffcalc(engine_name,
         hklcalc = YouHklCalculator(
             ubcalc, geometry, hardware, YouConstraintManager(hardware, geometry.fixed_constraints))
         hkl_commands = YouHklCommands(hklcalc)
+    hklcalc.set_solution_cache_size(solution_cache_size)
 
     # Hardware
     hardware_commands = HardwareCommands(hardware)
@@ -166,6 +192,7 @@ class Diffcalc(object):
         self.ub = ub_commands
         self.hkl = hkl_commands
         self.hardware = hardware_commands
+        self._reachability = None
         if transform_commands is not None:
             self.transform = transform_commands
 
@@ -213,6 +240,133 @@ class Diffcalc(object):
 
         return angle_tuple, params
 
+    def hkl_to_angles_batch(self, hkl, energy=None):
+        """Convert an N*3 array of hkl vectors to diffractometer angles
+
+        Energy may be one value or N values in keV. Returns an HklBatchResult
+        whose positions are an array of physical angles, one row per hkl.
+        Points that could not be solved are NaN and carry a reason code.
+        """
+        import numpy as np
+        from diffcalc.hkl.batch import HklBatchResult
+
+        if not hasattr(self._hklcalc, 'hkl_to_angles_batch'):
+            raise DiffcalcException(
+                "Batch calculations are not supported by this engine")
+        if energy is None:
+            energy = self._hardware.get_energy()
+        energy = np.asarray(energy, dtype=float)
+        if np.any(energy == 0):
+            raise DiffcalcException(
+                "Cannot calculate hkl position as Energy is set to 0")
+
+        result = self._hklcalc.hkl_to_angles_batch(hkl, 12.39842 / energy)
+
+        axes = self._hardware.get_axes_names()
+        positions = np.full((len(result), len(axes)), np.nan)
+        solved = np.flatnonzero(result.ok)
+        internal = []
+        for i in solved:
+            pos = self._geometry.create_position(*result.positions[i])
+            if self._transformer:
+                pos = self._transformer.transform(pos)  # Vlieg only
+            internal.append(pos)
+        if len(solved):
+            physical = self._internal_positions_to_physical_angles(internal)
+            for i, angle_tuple in zip(solved, physical):
+                positions[i] = self._hardware.cut_angles(angle_tuple)
+        return HklBatchResult(positions, result.virtual_angles,
+                              result.reasons, result.messages)
+
+    def _internal_positions_to_physical_angles(self, positions):
+        to_physical = getattr(self._geometry,
+                              'internal_positions_to_physical_angles', None)
+        if to_physical is not None:
+            return to_physical([pos.totuple() for pos in positions])
+        to_physical = self._geometry.internal_position_to_physical_angles
+        return [to_physical(pos) for pos in positions]
+
+    def _physical_angles_to_internal_positions(self, positions):
+        import numpy as np
+        to_internal = getattr(self._geometry,
+                              'physical_angles_to_internal_positions', None)
+        if to_internal is not None:
+            return to_internal(positions)
+        to_internal = self._geometry.physical_angles_to_internal_position
+        return [to_internal(tuple(angles)).totuple()
+                for angles in np.atleast_2d(positions)]
+
+    def hkl_to_angles_trajectory(self, hkl_list, energy=None, start=None,
+                                 max_jump=90.):
+        """Convert an ordered sequence of hkl vectors to diffractometer angles
+
+        Each point follows the solution branch of the point before, starting
+        from the start angles (the current position if not given). Returns a
+        list of (angle_tuple, params) pairs. Raises a DiffcalcException if any
+        axis would move by more than max_jump degrees between points.
+        """
+        if not hasattr(self._hklcalc, 'hkl_to_angles_trajectory'):
+            raise DiffcalcException(
+                "Trajectory calculations are not supported by this engine")
+        if energy is None:
+            energy = self._hardware.get_energy()
+
+        try:
+            wavelength = 12.39842 / energy
+        except ZeroDivisionError:
+            raise DiffcalcException(
+                "Cannot calculate hkl position as Energy is set to 0")
+
+        if start is None:
+            start = self._hardware.get_position()
+        start = self._geometry.physical_angles_to_internal_position(
+            tuple(start))
+
+        solutions = self._hklcalc.hkl_to_angles_trajectory(
+            hkl_list, wavelength, start, max_jump)
+        result = []
+        for pos, params in solutions:
+            angle_tuple = self._geometry.internal_position_to_physical_angles(
+                pos)
+            result.append((self._hardware.cut_angles(angle_tuple), params))
+        return result
+
+    def configure_reachability(self, lower, upper, steps, path=None):
+        """Check hkl moves against a map of an hkl box (None to stop)
+
+        The box from lower to upper hkl is sampled with steps nodes along each
+        side (one number or three). The map is built on first use and rebuilt
+        whenever the UB matrix, constraints, limits, cuts or energy change.
+        If path is given the map is stored there as a memory-mapped file.
+        """
+        if lower is None:
+            self._reachability = None
+            return
+        from diffcalc.hkl.reachability import ReachabilityIndex
+        self._reachability = ReachabilityIndex(self._hklcalc, lower, upper,
+                                               steps, path)
+
+    def check_reachable(self, h, k, l, energy=None):
+        """Raise a DiffcalcException if hkl is known to be unreachable
+
+        Does nothing if no reachability map is configured, or if the map
+        cannot be certain that hkl is unreachable (see ReachabilityMap.reason).
+        """
+        if self._reachability is None:
+            return
+        if energy is None:
+            energy = self._hardware.get_energy()
+        try:
+            wavelength = 12.39842 / energy
+        except ZeroDivisionError:
+            raise DiffcalcException(
+                "Cannot calculate hkl position as Energy is set to 0")
+        code = self._reachability.reason(h, k, l, wavelength)
+        if code is not None and code != 0:  # 0 is reachable
+            raise DiffcalcException(
+                "hkl=(%f,%f,%f) cannot be reached: %s" %
+                (h, k, l, self._reachability.describe(code)))
+
     def angles_to_hkl(self, angleTuple, energy=None):
         """Converts a set of diffractometer angles to an hkl position
         ((h, k, l), paramDict)=angles_to_hkl(self, (a1, a2,aN), energy=None)"""
@@ -229,6 +383,74 @@ class Diffcalc(object):
         i_pos = self._geometry.physical_angles_to_internal_position(angleTuple)
         return self._hklcalc.anglesToHkl(i_pos, wavelength)
 
+    def angles_to_hkl_batch(self, positions, energy=None):
+        """Convert an N*k array of diffractometer angles to an N*3 hkl array
+
+        Energy may be one value or N values in keV. The angles are converted
+        to internal positions with the geometry's array method; a geometry
+        without physical_angles_to_internal_positions is converted one point
+        at a time.
+        """
+        import numpy as np
+
+        if energy is None:
+            energy = self._hardware.get_energy()
+        energy = np.asarray(energy, dtype=float)
+        if np.any(energy == 0):
+            raise DiffcalcException(
+                "Cannot calculate hkl position as Energy is set to 0")
+
+        internal = self._physical_angles_to_internal_positions(positions)
+        return self._hklcalc.angles_to_hkl_batch(internal, 12.39842 / energy)
+
+    def angles_to_virtual_angles_batch(self, positions):
+        """Calculate virtual angles for an N*k array of diffractometer angles
+
+        Returns a dictionary of N arrays of virtual angles in degrees and an
+        N array of flags which are non-zero where psi is undefined (and NaN).
+        """
+        if not hasattr(self._hklcalc, 'angles_to_virtual_angles_batch'):
+            raise DiffcalcException(
+                "Batch calculations are not supported by this engine")
+        internal = self._physical_angles_to_internal_positions(positions)
+        return self._hklcalc.angles_to_virtual_angles_batch(internal)
+
+    def check_ub(self):
+        """Return a UBCheck comparing the entered hkl of each reflection with
+        that calculated from its position and energy using the current UB
+        matrix.
+
+        The reflections are read back in one batch if numpy is available.
+        """
+        reflist = self._ubcalc.reflist
+        try:
+            import numpy as np
+        except ImportError:
+            return self._check_ub_pointwise(reflist)
+
+        entered = reflist.get_hkl_array()
+        energies = reflist.get_energies()
+        if len(reflist):
+            computed = self._hklcalc.angles_to_hkl_batch(
+                reflist.get_positions_array(), 12.39842 / energies)
+        else:
+            computed = np.zeros((0, 3))
+        return UBCheck(entered, computed, computed - entered, energies,
+                       reflist.get_tags())
+
+    def _check_ub_pointwise(self, reflist):
+        entered, computed, residuals, energies = [], [], [], []
+        for n in range(len(reflist)):
+            hkl_entered, pos, energy, _, _ = reflist.getReflection(n + 1)
+            hkl = self._hklcalc._anglesToHkl(pos.inRadians(),
+                                             12.39842 / energy)
+            entered.append(tuple(hkl_entered))
+            computed.append(tuple(hkl))
+            residuals.append(tuple(c - e for c, e in zip(hkl, hkl_entered)))
+            energies.append(energy)
+        return UBCheck(entered, computed, residuals, energies,
+                       reflist.get_tags())
+
     # This command requires the ubcalc
     @command
     def checkub(self):
@@ -238,18 +460,17 @@ class Diffcalc(object):
         s = "\n    %7s  %4s  %4s  %4s    %6s   %6s   %6s     TAG\n" % \
         ('ENERGY', 'H', 'K', 'L', 'H_COMP', 'K_COMP', 'L_COMP')
 
-        nref = self._ubcalc.get_number_reflections()
-        if not nref:
+        check = self.check_ub()
+        if not len(check):
             s += "<<empty>>"
-        for n in range(nref):
-            hklguess, pos, energy, tag, time = self._ubcalc.get_reflection(n + 1)
-            wavelength = 12.39842 / energy
-            hkl, params = self._hklcalc.anglesToHkl(pos, wavelength)
-            del time, params
+        for n in range(len(check)):
+            hklguess = check.entered_hkl[n]
+            hkl = check.computed_hkl[n]
+            tag = check.tags[n]
             if tag is None:
                 tag = ""
             s += ("% 2d % 6.4f % 4.2f % 4.2f % 4.2f   % 6.4f  % 6.4f  "
-                  "% 6.4f  %6s\n" % (n + 1, energy, hklguess[0],
+                  "% 6.4f  %6s\n" % (n + 1, check.energies[n], hklguess[0],
                   hklguess[1], hklguess[2], hkl[0], hkl[1], hkl[2], tag))
         print s
 
@@ -158,6 +158,7 @@ def create_objects(
     # Create hardware adapter
     hardware = ScannableHardwareAdapter(diff_scannable, energy_scannable,
                                         energy_scannable_multiplier_to_get_KeV)
+    objects['wl'].hardware = hardware
 
     # Instantiate diffcalc
 
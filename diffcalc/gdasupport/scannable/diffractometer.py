@@ -69,10 +69,16 @@ class DiffractometerScannableGroup(ScannableMotionBase):
         return list(self.__group.getOutputFormat()) + slave_formats
 
     def asynchronousMoveTo(self, position):
+        self._invalidate_hardware_snapshot()
         self.__group.asynchronousMoveTo(position)
         if self.slave_driver is not None:
             self.slave_driver.triggerAsynchronousMove(position)
 
+    def _invalidate_hardware_snapshot(self):
+        hardware = getattr(self.diffcalc, '_hardware', None)
+        if hardware is not None:
+            hardware.invalidate_snapshot()
+
     def getPosition(self):
         if self.slave_driver is None:
             slave_positions = []
@@ -90,6 +96,7 @@ class DiffractometerScannableGroup(ScannableMotionBase):
         self.__group.waitWhileBusy()
         if self.slave_driver is not None:
             self.slave_driver.waitWhileBusy()
+        self._invalidate_hardware_snapshot()  # may have been read mid-move
 
     def simulateMoveTo(self, pos):
         if len(pos) != len(self.getInputNames()):
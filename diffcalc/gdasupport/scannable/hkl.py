@@ -88,6 +88,34 @@ class Hkl(ScannableMotionWithScannableFieldsBase):
                 result.append(params[vAngleName])
         return result
 
+    def getPositionsFromAngles(self, positions):
+        """Return hkl and reported virtual angles for many positions
+
+        positions is a sequence of diffractometer positions, such as those
+        recorded during a scan. Returns one row per position, as from
+        getPosition(). Engines that support it calculate all rows at once;
+        undefined virtual angles are then NaN rather than printing warnings.
+        """
+        try:
+            hkls = self._diffcalc.angles_to_hkl_batch(positions)
+            params = {}
+            if self.vAngleNames:
+                params = self._diffcalc.angles_to_virtual_angles_batch(
+                    positions)[0]
+            columns = [params[name] for name in (self.vAngleNames or ())]
+        except (DiffcalcException, ImportError, KeyError):
+            # not all engines (or virtual angles) can be done in a batch
+            rows = []
+            for pos in positions:
+                (hkl, params) = self._diffcalc.angles_to_hkl(pos)
+                rows.append(list(hkl) + [params[name] for name in
+                                         (self.vAngleNames or ())])
+            return rows
+        rows = []
+        for i, hkl in enumerate(hkls):
+            rows.append(list(hkl) + [float(column[i]) for column in columns])
+        return rows
+
     def getFieldPosition(self, i):
         return self.getPosition()[i]
 
@@ -102,6 +130,8 @@ class Hkl(ScannableMotionWithScannableFieldsBase):
             raise ValueError('Hkl device expects three inputs')
         if len(hkl) != 3:
             raise ValueError('Hkl device expects three inputs')
+        # fails fast if a reachability map shows hkl cannot be reached
+        self._diffcalc.check_reachable(hkl[0], hkl[1], hkl[2])
         (pos, params) = self._diffcalc.hkl_to_angles(hkl[0], hkl[1], hkl[2])
 
         width = max(len(k) for k in (params.keys() + list(self.diffhw.getInputNames())))
@@ -27,14 +27,17 @@ except ImportError:
 class Wavelength(DummyPD):
 
     def __init__(self, name, energyScannable,
-                 energyScannableMultiplierToGetKeV=1):
+                 energyScannableMultiplierToGetKeV=1, hardware=None):
         self.energyScannable = energyScannable
         self.energyScannableMultiplierToGetKeV = \
             energyScannableMultiplierToGetKeV
+        self.hardware = hardware  # snapshot invalidated on moves if set
 
         DummyPD.__init__(self, name)
 
     def asynchronousMoveTo(self, pos):
+        if self.hardware is not None:
+            self.hardware.invalidate_snapshot()
         self.energyScannable.asynchronousMoveTo(
             (12.39842 / pos) / self.energyScannableMultiplierToGetKeV)
 
@@ -18,6 +18,8 @@
 
 from __future__ import absolute_import
 
+import time
+
 from diffcalc.util import DiffcalcException
 
 SMALL = 1e-8
@@ -94,6 +96,11 @@ class HardwareAdapter(object):
         self._upperLimitDict = {}
         self._lowerLimitDict = {}
         self._cut_angles = {}
+        self.revision = 0  # bumped whenever a limit or cut changes
+        self.snapshot_lifetime = 0  # seconds (0 to read on every request)
+        self._snapshot = {}  # name --> (value, time read)
+        self.real_reads = 0
+        self.cached_reads = 0
         self._configure_cuts(defaultCuts)
         self.energyScannableMultiplierToGetKeV = \
             energyScannableMultiplierToGetKeV
@@ -121,6 +128,34 @@ class HardwareAdapter(object):
         """energy = get_energy() -- returns energy in kEv  """
         raise NotImplementedError()
 
+### Snapshot ###
+
+    def set_snapshot_lifetime(self, seconds):
+        """Reuse positions and energy read from the hardware for up to seconds
+        (0 to read the hardware on every request)"""
+        self.snapshot_lifetime = seconds
+        self.invalidate_snapshot()
+
+    def invalidate_snapshot(self):
+        """Forget positions and energy read from the hardware (call after
+        anything moves)"""
+        self._snapshot.clear()
+
+    def _read(self, name, read_function):
+        """Return read_function(), or the value it returned for name within the
+        last snapshot_lifetime seconds"""
+        now = time.time()
+        if self.snapshot_lifetime > 0 and name in self._snapshot:
+            value, read_time = self._snapshot[name]
+            if now - read_time <= self.snapshot_lifetime:
+                self.cached_reads += 1
+                return value
+        value = read_function()
+        self.real_reads += 1
+        if self.snapshot_lifetime > 0:
+            self._snapshot[name] = (value, now)
+        return value
+
     def __str__(self):
         s = self._name + ":\n"
         s += "  energy : " + str(self.get_energy()) + " keV\n"
@@ -169,6 +204,7 @@ class HardwareAdapter(object):
                        "clear" % name)
         else:
             self._lowerLimitDict[name] = value
+        self.revision += 1
 
     def set_upper_limit(self, name, value):
         """value may be None to remove limit"""
@@ -184,6 +220,7 @@ class HardwareAdapter(object):
                        "clear" % name)
         else:
             self._upperLimitDict[name] = value
+        self.revision += 1
 
     def is_position_within_limits(self, positionArray):
         """
@@ -195,6 +232,25 @@ class HardwareAdapter(object):
                 return False
         return True
 
+    def are_positions_within_limits(self, positionArrays):
+        """
+        As is_position_within_limits, but for a list of position arrays. The
+        limits are looked up once for all of them.
+        """
+        limits = [(self._lowerLimitDict.get(name),
+                   self._upperLimitDict.get(name))
+                  for name in self._diffractometerAngleNames]
+        result = []
+        for positionArray in positionArrays:
+            okay = True
+            for (lower, upper), value in zip(limits, positionArray):
+                if ((upper is not None and value > upper) or
+                    (lower is not None and value < lower)):
+                    okay = False
+                    break
+            result.append(okay)
+        return result
+
     def is_axis_value_within_limits(self, axis_name, value):
         if axis_name in self._upperLimitDict:
             if value > self._upperLimitDict[axis_name]:
@@ -244,6 +300,7 @@ class HardwareAdapter(object):
     def set_cut(self, name, value):
         if name in self._cut_angles:
             self._cut_angles[name] = value
+            self.revision += 1
         else:
             raise KeyError("Diffractometer has no angle %s. Try: %s." %
                             (name, self._diffractometerAngleNames))
@@ -351,12 +408,12 @@ class ScannableHardwareAdapter(HardwareAdapter):
         pos = getDiffractometerPosition() -- returns the current physical
         diffractometer position as a list in degrees
         """
-        return self.diffhw.getPosition()
+        return list(self._read('position', self.diffhw.getPosition))
 
     def get_energy(self):
         """energy = get_energy() -- returns energy in kEv (NOT eV!) """
         multiplier = self.energyScannableMultiplierToGetKeV
-        energy = self.energyhw.getPosition() * multiplier
+        energy = self._read('energy', self.energyhw.getPosition) * multiplier
         if energy is None:
             raise DiffcalcException("Energy has not been set")
         return energy
@@ -0,0 +1,413 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Support for solving many reflections in a single call.
+
+Batch calculations work on numpy arrays rather than on Position objects and
+matrices. They require numpy and so are not available under Jython.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.util import DiffcalcException
+
+TORAD = pi / 180
+TODEG = 180 / pi
+
+SMALL = 1e-8
+
+# Reason codes for points in a batch that could not be solved
+
+OK = 0
+Q_ZERO = 1
+Q_TOO_LONG = 2
+REFERENCE_UNREACHABLE = 3
+DETECTOR_UNREACHABLE = 4
+NO_DETECTOR_SOLUTION = 5
+MULTIPLE_DETECTOR_SOLUTIONS = 6
+SAMPLE_UNREACHABLE = 7
+NO_SAMPLE_SOLUTION = 8
+VERIFICATION_FAILED = 9
+UNSOLVED = 10
+
+REASONS = {
+    OK: 'ok',
+    Q_ZERO: '|Q| is 0',
+    Q_TOO_LONG: '|Q| is too long',
+    REFERENCE_UNREACHABLE: 'reference constraint cannot be met',
+    DETECTOR_UNREACHABLE: 'detector constraint cannot be met',
+    NO_DETECTOR_SOLUTION: 'no detector solution within limits',
+    MULTIPLE_DETECTOR_SOLUTIONS: 'multiple detector solutions',
+    SAMPLE_UNREACHABLE: 'sample constraint cannot be met',
+    NO_SAMPLE_SOLUTION: 'no sample solution within limits',
+    VERIFICATION_FAILED: 'solution does not map back to hkl',
+    UNSOLVED: 'no solution found'}
+
+
+def as_hkl_array(hkl):
+    """Return hkl as an N*3 float array"""
+    hkl = np.array(hkl, dtype=float)
+    if hkl.ndim == 1:
+        hkl = hkl.reshape(1, -1)
+    if hkl.ndim != 2 or hkl.shape[1] != 3:
+        raise DiffcalcException('Expected an N*3 array of hkl values, '
+                                'but got shape %s' % (hkl.shape,))
+    return hkl
+
+
+def as_position_array(positions, naxes):
+    """Return positions (or a PositionBatch, in degrees) as an N*naxes float
+    array"""
+    if isinstance(positions, PositionBatch):
+        positions = positions.inDegrees()._data.T
+    positions = np.array(positions, dtype=float)
+    if positions.ndim == 1:
+        positions = positions.reshape(1, -1)
+    if positions.ndim != 2 or positions.shape[1] != naxes:
+        raise DiffcalcException('Expected an N*%i array of positions, '
+                                'but got shape %s' % (naxes, positions.shape))
+    return positions
+
+
+def as_wavelength_array(wavelength, n):
+    """Return a wavelength or sequence of N wavelengths as an N array"""
+    wavelength = np.array(wavelength, dtype=float)
+    if wavelength.ndim == 0:
+        wavelength = np.repeat(wavelength, n)
+    if wavelength.shape != (n,):
+        raise DiffcalcException('Expected one wavelength or %i wavelengths, '
+                                'but got shape %s' % (n, wavelength.shape))
+    if np.any(wavelength <= 0):
+        raise DiffcalcException('Wavelengths must be greater than 0')
+    return wavelength
+
+
+### Stacked rotation matrices ###
+
+def x_rotations(th):
+    """Return an N*3*3 array of x rotations for an array of N angles"""
+    th = np.asarray(th, dtype=float)
+    m = np.zeros(th.shape + (3, 3))
+    c, s = np.cos(th), np.sin(th)
+    m[..., 0, 0] = 1
+    m[..., 1, 1] = c
+    m[..., 1, 2] = -s
+    m[..., 2, 1] = s
+    m[..., 2, 2] = c
+    return m
+
+
+def y_rotations(th):
+    """Return an N*3*3 array of y rotations for an array of N angles"""
+    th = np.asarray(th, dtype=float)
+    m = np.zeros(th.shape + (3, 3))
+    c, s = np.cos(th), np.sin(th)
+    m[..., 0, 0] = c
+    m[..., 0, 2] = s
+    m[..., 1, 1] = 1
+    m[..., 2, 0] = -s
+    m[..., 2, 2] = c
+    return m
+
+
+def z_rotations(th):
+    """Return an N*3*3 array of z rotations for an array of N angles"""
+    th = np.asarray(th, dtype=float)
+    m = np.zeros(th.shape + (3, 3))
+    c, s = np.cos(th), np.sin(th)
+    m[..., 0, 0] = c
+    m[..., 0, 1] = -s
+    m[..., 1, 0] = s
+    m[..., 1, 1] = c
+    m[..., 2, 2] = 1
+    return m
+
+
+def transposed(m):
+    """Return the transpose of each matrix in a stack of matrices"""
+    return np.swapaxes(m, -1, -2)
+
+
+def matmul(a, b):
+    """Multiply two stacks of 3*3 matrices"""
+    return np.einsum('...ij,...jk->...ik', a, b)
+
+
+def matvec(m, v):
+    """Multiply a stack of 3*3 matrices by a stack of 3-vectors"""
+    return np.einsum('...ij,...j->...i', m, v)
+
+
+def norms(v):
+    """Return the length of each vector in a stack of 3-vectors"""
+    return np.sqrt(np.einsum('...i,...i->...', v, v))
+
+
+def bound(x):
+    """Move values rounded slightly outside -1 and 1 back inside"""
+    return np.clip(x, -1, 1)
+
+
+def cut_at_minus_pi(value):
+    value = np.where(value < (-pi - SMALL), value + 2 * pi, value)
+    return np.where(value >= pi + SMALL, value - 2 * pi, value)
+
+
+### Limits ###
+
+def cut_angles_at(cut_angle, value):
+    """Array version of diffcalc.hardware.cut_angle_at (degrees)"""
+    from diffcalc.hardware import SMALL as HW_SMALL
+    value = np.asarray(value, dtype=float)
+    zero = ((cut_angle == 0) & (abs(value - 360) < HW_SMALL) |
+            (abs(value + 360) < HW_SMALL) | (abs(value) < HW_SMALL))
+    value = np.where(zero, 0., value)
+    value = np.where(value < (cut_angle - HW_SMALL), value + 360., value)
+    return np.where(value >= cut_angle + 360. + HW_SMALL, value - 360., value)
+
+
+def axis_values_within_limits(hardware, axis_name, values):
+    """Return a boolean array, True where the axis value (in radians) lies
+    within the hardware limits once the hardware cut has been applied.
+    """
+    values = np.asarray(values, dtype=float) * TODEG
+    cut = hardware.get_cuts()[axis_name]
+    if cut is not None:
+        values = cut_angles_at(cut, values)
+    okay = np.ones(values.shape, dtype=bool)
+    upper = hardware.get_upper_limit(axis_name)
+    if upper is not None:
+        okay &= ~(values > upper)
+    lower = hardware.get_lower_limit(axis_name)
+    if lower is not None:
+        okay &= ~(values < lower)
+    return okay
+
+
+### Results ###
+
+class HklBatchResult(object):
+    """The result of solving N reflections in one call.
+
+    positions -- N*k array of positions in degrees (NaN where unsolved)
+    virtual_angles -- dictionary of N arrays of virtual angles in degrees
+    reasons -- N array of reason codes (OK where solved)
+    messages -- dictionary of error messages by point index (if available)
+    """
+
+    def __init__(self, positions, virtual_angles, reasons, messages=None):
+        self.positions = positions
+        self.virtual_angles = virtual_angles
+        self.reasons = reasons
+        self.messages = {} if messages is None else messages
+
+    def __len__(self):
+        return len(self.reasons)
+
+    @property
+    def ok(self):
+        """boolean array, True where a point was solved"""
+        return self.reasons == OK
+
+    def reason(self, index):
+        """Return a description of why point index could (not) be solved"""
+        try:
+            return self.messages[index]
+        except KeyError:
+            return REASONS[int(self.reasons[index])]
+
+    def position_batch(self, position_class):
+        """Return the positions as a PositionBatch (in degrees)"""
+        return PositionBatch.from_array(position_class, self.positions)
+
+    def __str__(self):
+        nfailed = int(np.count_nonzero(~self.ok))
+        return ('HklBatchResult(%i points, %i unsolved)' %
+                (len(self), nfailed))
+
+
+### Positions ###
+
+class PositionBatch(object):
+    """N positions of one Position class, stored as one contiguous float64
+    array per axis.
+
+    The axes are those named in the Position class's __slots__ and unit is
+    'deg' or 'rad'. Indexing with an integer returns a view of one position,
+    which behaves like an instance of the Position class but reads and
+    writes the batch. Slicing returns a batch sharing the same arrays.
+    Neither copies any values. Use to_positions or a view's clone for
+    independent Position objects.
+    """
+
+    __slots__ = ('position_class', 'unit', '_data')
+
+    def __init__(self, position_class, data, unit='deg'):
+        """data is a k*N array with a row for each of the k axes"""
+        if unit not in ('deg', 'rad'):
+            raise DiffcalcException("unit must be 'deg' or 'rad', not %r" %
+                                    unit)
+        data = np.asarray(data, dtype=float)
+        if data.ndim == 2 and data.strides[1] != data.itemsize:
+            data = np.ascontiguousarray(data)  # so each row is contiguous
+        naxes = len(position_class.__slots__)
+        if data.ndim != 2 or data.shape[0] != naxes:
+            raise DiffcalcException(
+                'Expected a %i*N array of %s axis values, but got shape %s' %
+                (naxes, position_class.__name__, data.shape))
+        self.position_class = position_class
+        self.unit = unit
+        self._data = data
+
+    @classmethod
+    def from_array(cls, position_class, positions, unit='deg'):
+        """Create from an N*k array (or sequence) of positions"""
+        positions = as_position_array(positions,
+                                      len(position_class.__slots__))
+        return cls(position_class, positions.T, unit)
+
+    @classmethod
+    def from_positions(cls, positions, unit='deg'):
+        """Create from a non-empty sequence of Position objects"""
+        position_class = type(positions[0])
+        if isinstance(positions[0], _PositionView):
+            position_class = position_class.__bases__[0]
+        return cls.from_array(position_class,
+                              [pos.totuple() for pos in positions], unit)
+
+    @property
+    def axes(self):
+        """tuple of axis names"""
+        return self.position_class.__slots__
+
+    def axis(self, name):
+        """Return the (writable) array of values for the named axis"""
+        try:
+            return self._data[self.axes.index(name)]
+        except ValueError:
+            raise DiffcalcException('%s has no axis %r' %
+                                    (self.position_class.__name__, name))
+
+    def to_array(self):
+        """Return a new N*k array of positions"""
+        return self._data.T.copy()
+
+    def to_positions(self):
+        """Return a list of new Position objects"""
+        return [self.position_class(*values) for values in self._data.T]
+
+    def __len__(self):
+        return self._data.shape[1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PositionBatch(self.position_class, self._data[:, index],
+                                 self.unit)
+        n = len(self)
+        if not -n <= index < n:
+            raise IndexError('position index out of range')
+        return _view_class(self.position_class)(self._data, index % n)
+
+    def __iter__(self):
+        view_class = _view_class(self.position_class)
+        for index in range(len(self)):
+            yield view_class(self._data, index)
+
+    def clone(self):
+        return PositionBatch(self.position_class, self._data.copy(),
+                             self.unit)
+
+    def changeToRadians(self):
+        if self.unit == 'deg':
+            self._data *= TORAD
+            self.unit = 'rad'
+
+    def changeToDegrees(self):
+        if self.unit == 'rad':
+            self._data *= TODEG
+            self.unit = 'deg'
+
+    def inRadians(self):
+        batch = self.clone()
+        batch.changeToRadians()
+        return batch
+
+    def inDegrees(self):
+        batch = self.clone()
+        batch.changeToDegrees()
+        return batch
+
+    def __str__(self):
+        return 'PositionBatch(%i %s in %s)' % (
+            len(self), self.position_class.__name__, self.unit)
+
+    __repr__ = __str__
+
+
+class _PositionView(object):
+    """Base of the classes returned by _view_class"""
+
+    __slots__ = ()
+
+
+def _axis_property(column):
+    def get(self):
+        return float(self._data[column, self._index])
+
+    def set(self, value):  # @ReservedAssignment
+        self._data[column, self._index] = value
+    return property(get, set)
+
+
+def _change_view_unit(self):
+    raise DiffcalcException('Positions in a PositionBatch share its unit: '
+                            'convert the batch or a clone of the position')
+
+
+def _reduce_view(self):
+    # pickles as an independent Position
+    return (type(self).__bases__[0], self.totuple())
+
+
+_VIEW_CLASSES = {}
+
+
+def _view_class(position_class):
+    """Return a subclass of position_class whose axes are read from and
+    written to column _index of a k*N array _data"""
+    try:
+        return _VIEW_CLASSES[position_class]
+    except KeyError:
+        pass
+    namespace = {'__slots__': ('_data', '_index'),
+                 '__init__': _init_view,
+                 'changeToRadians': _change_view_unit,
+                 'changeToDegrees': _change_view_unit,
+                 '__reduce__': _reduce_view}
+    for column, name in enumerate(position_class.__slots__):
+        namespace[name] = _axis_property(column)
+    view_class = type(position_class.__name__ + 'View',
+                      (position_class, _PositionView), namespace)
+    _VIEW_CLASSES[position_class] = view_class
+    return view_class
+
+
+def _init_view(self, data, index):
+    self._data = data
+    self._index = index
@@ -0,0 +1,103 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Bounded cache of hklToAngles solutions.
+
+Entries are keyed on the requested hkl and wavelength together with the
+revisions of the UB calculation, the constraints (or mode and parameters) and
+the hardware limits and cuts. Each of these objects bumps its revision when it
+changes, so stale solutions are simply never looked up again and are
+eventually evicted.
+"""
+
+from diffcalc.util import DiffcalcException
+
+
+class SolutionCache(object):
+    """Least-recently-used cache with hit, miss and eviction counters.
+
+    A cache with a size of 0 is disabled: lookups always miss and nothing is
+    stored.
+    """
+
+    def __init__(self, size=0):
+        self._entries = {}  # key -> [last_used, value]
+        self._clock = 0
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resize(size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return ("solution cache: %i/%i entries, %i hits, %i misses, "
+                "%i evictions" % (len(self), self._size, self.hits,
+                                  self.misses, self.evictions))
+
+    @property
+    def size(self):
+        return self._size
+
+    def resize(self, size):
+        """Set the maximum number of entries, evicting the oldest if needed"""
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise DiffcalcException(
+                "The solution cache size must be an integer, not %r" % size)
+        if size < 0:
+            raise DiffcalcException(
+                "The solution cache size cannot be negative")
+        self._size = size
+        while len(self._entries) > size:
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the value stored for key, or None if there is none"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        entry[0] = self._clock
+        return entry[1]
+
+    def put(self, key, value):
+        if not self._size:
+            return
+        if key not in self._entries and len(self._entries) >= self._size:
+            self._evict()
+        self._clock += 1
+        self._entries[key] = [self._clock, value]
+
+    def _evict(self):
+        # A linear scan keeps this usable under Jython 2.5 (no OrderedDict).
+        # Evictions only happen after a miss, which costs a full solve anyway.
+        oldest = min(self._entries, key=lambda k: self._entries[k][0])
+        del self._entries[oldest]
+        self.evictions += 1
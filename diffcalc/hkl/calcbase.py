@@ -18,11 +18,19 @@
 
 from math import pi
 
+from diffcalc import profiling
 from diffcalc.util import DiffcalcException, differ
+from diffcalc.hkl.cache import SolutionCache
 
 TORAD = pi / 180
 TODEG = 180 / pi
 
+# Verification policies for hklToAngles
+VERIFY_ALWAYS = 'always'    # check every solution maps back
+VERIFY_SAMPLED = 'sampled'  # check one solution in every N
+VERIFY_TRUST = 'trust'      # trust the engine and never check
+VERIFICATION_POLICIES = (VERIFY_ALWAYS, VERIFY_SAMPLED, VERIFY_TRUST)
+
 
 class HklCalculatorBase(object):
 
@@ -35,6 +43,12 @@ class HklCalculatorBase(object):
         self._hardware = hardware  # Used for tracking parameters only
         self.raiseExceptionsIfAnglesDoNotMapBackToHkl = \
             raiseExceptionsIfAnglesDoNotMapBackToHkl
+        self.solution_cache = SolutionCache()  # disabled until resized
+        self.verification_policy = VERIFY_ALWAYS
+        self.verification_interval = 1
+        self._verification_calls = 0
+        self.verifications = 0
+        self.verification_failures = 0
 
     def anglesToHkl(self, pos, wavelength):
         """
@@ -46,6 +60,17 @@ class HklCalculatorBase(object):
         paramDict = self.anglesToVirtualAngles(pos, wavelength)
         return ((h, k, l), paramDict)
 
+    def angles_to_hkl_batch(self, positions, wavelength):
+        """
+        Return N*3 array of hkl from an N*k array of positions in degrees
+        (with columns ordered as in the engine's Position) and a wavelength
+        (or N wavelengths) in Angstroms. Requires numpy.
+        """
+        from diffcalc.hkl.batch import as_position_array, as_wavelength_array
+        positions = as_position_array(positions, self._batch_axes_count)
+        wavelength = as_wavelength_array(wavelength, len(positions))
+        return self._angles_to_hkl_batch(positions * TORAD, wavelength)
+
     def anglesToVirtualAngles(self, pos, wavelength):
         """
         Return dictionary of all virtual angles in degrees from Position object
@@ -71,6 +96,10 @@ class HklCalculatorBase(object):
         Throws a DiffcalcException if either check fails and
         raiseExceptionsIfAnglesDoNotMapBackToHkl is True, otherwise displays a
         warning.
+
+        If the solution cache has been given a size, previously verified
+        solutions are returned (as copies) until the UB matrix, constraints or
+        hardware limits and cuts change.
         """
 
         # Update tracked parameters. During this calculation parameter values
@@ -79,6 +108,22 @@ class HklCalculatorBase(object):
         # position update.
         self.parameter_manager.update_tracked()
 
+        if not self.solution_cache.size:
+            return self._hkl_to_angles(h, k, l, wavelength)
+
+        key = self._solution_cache_key(h, k, l, wavelength)
+        solution = self.solution_cache.get(key)
+        if solution is None:
+            solution = self._hkl_to_angles(h, k, l, wavelength)
+            self.solution_cache.put(key, solution)
+        pos, virtual_angles = solution
+        return pos.clone(), virtual_angles.copy()
+
+    def _hkl_to_angles(self, h, k, l, wavelength):
+        """
+        Return verified Position and all virtual angles in degrees. Tracked
+        parameters must already have been updated.
+        """
         pos, virtualAngles = self._hklToAngles(h, k, l, wavelength)  # in rad
 
         # to degrees:
@@ -88,29 +133,104 @@ class HklCalculatorBase(object):
             if val is not None:
                 virtualAngles[key] = val * TODEG
 
-        self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
+        # The readback is returned whether or not it is checked
+        t = profiling.start()
+        virtualAnglesReadback = self.anglesToVirtualAngles(pos, wavelength)
+        profiling.stop('readback.virtual_angles', t)
 
-        virtualAnglesReadback = self._verify_virtual_angles(h, k, l, wavelength, pos, virtualAngles)
+        if self._should_verify():
+            t = profiling.start()
+            self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
+            profiling.stop('verify.hkl', t)
+            t = profiling.start()
+            self._verify_virtual_angles(h, k, l, pos, virtualAngles,
+                                        virtualAnglesReadback)
+            profiling.stop('verify.virtual_angles', t)
 
         return pos, virtualAnglesReadback
 
+    def _solution_cache_key(self, h, k, l, wavelength):
+        return (h, k, l, wavelength) + self.state_revision()
+
+    def state_revision(self):
+        """
+        Return a tuple which changes whenever the UB calculation, constraints
+        or hardware limits and cuts change.
+        """
+        # hardware may be None if only used for tracking parameters
+        hardware_revision = getattr(self._hardware, 'revision', None)
+        return (self._ubcalc.revision, self._constraints_revision(),
+                hardware_revision)
+
+    def _constraints_revision(self):
+        return self.parameter_manager.revision
+
+    def set_solution_cache_size(self, size):
+        """Set the number of hklToAngles solutions to cache (0 to disable)"""
+        self.solution_cache.resize(size)
+
+    def clear_solution_cache(self):
+        self.solution_cache.clear()
+
+    def set_verification_policy(self, policy, every=None):
+        """
+        Set how hklToAngles solutions are checked. policy is 'always',
+        'sampled' (check one call in every N) or 'trust' (never check).
+        """
+        if policy not in VERIFICATION_POLICIES:
+            raise DiffcalcException(
+                "Unknown verification policy %r. Try one of: %s" %
+                (policy, ', '.join(VERIFICATION_POLICIES)))
+        if policy == VERIFY_SAMPLED:
+            if every is None or int(every) < 1:
+                raise DiffcalcException(
+                    "A sampled verification policy requires every >= 1")
+            self.verification_interval = int(every)
+        elif every is not None:
+            raise DiffcalcException(
+                "Only the sampled verification policy takes an interval")
+        self.verification_policy = policy
+        self._verification_calls = 0
+
+    def repr_verification(self):
+        if self.verification_policy == VERIFY_SAMPLED:
+            policy = 'sampled every %i calls' % self.verification_interval
+        else:
+            policy = self.verification_policy
+        return ("verification: %s, %i solutions checked, %i failed checks" %
+                (policy, self.verifications, self.verification_failures))
+
+    def _should_verify(self):
+        if self.verification_policy == VERIFY_TRUST:
+            return False
+        if self.verification_policy == VERIFY_SAMPLED:
+            self._verification_calls += 1
+            if (self._verification_calls - 1) % self.verification_interval:
+                return False
+        self.verifications += 1
+        return True
+
+    def _verification_failed(self, message):
+        self.verification_failures += 1
+        if self.raiseExceptionsIfAnglesDoNotMapBackToHkl:
+            raise DiffcalcException(message)
+        else:
+            print message
+
     def _verify_pos_map_to_hkl(self, h, k, l, wavelength, pos):
-        hkl, _ = self.anglesToHkl(pos, wavelength)
+        hkl = self._anglesToHkl(pos.inRadians(), wavelength)
         e = 0.001
         if ((abs(hkl[0] - h) > e) or (abs(hkl[1] - k) > e) or 
             (abs(hkl[2] - l) > e)):
             s = "ERROR: The angles calculated for hkl=(%f,%f,%f) were %s.\n" % (h, k, l, str(pos))
             s += "Converting these angles back to hkl resulted in hkl="\
             "(%f,%f,%f)" % (hkl[0], hkl[1], hkl[2])
-            if self.raiseExceptionsIfAnglesDoNotMapBackToHkl:
-                raise DiffcalcException(s)
-            else:
-                print s
+            self._verification_failed(s)
 
-    def _verify_virtual_angles(self, h, k, l, wavelength, pos, virtualAngles):
+    def _verify_virtual_angles(self, h, k, l, pos, virtualAngles,
+                               virtualAnglesReadback):
         # Check that the virtual angles calculated/fixed during the hklToAngles
-    # those read back from pos using anglesToVirtualAngles
-        virtualAnglesReadback = self.anglesToVirtualAngles(pos, wavelength)
+        # match those read back from pos using anglesToVirtualAngles
         for key, val in virtualAngles.items():
             if val != None: # Some values calculated in some mode_selector
                 r = virtualAnglesReadback[key]
@@ -121,16 +241,20 @@ class HklCalculatorBase(object):
                     "from (or set for) this calculation of %f" % (key, val)
                     s += "did not match that calculated by "\
                     "anglesToVirtualAngles of %f" % virtualAnglesReadback[key]
-                    if self.raiseExceptionsIfAnglesDoNotMapBackToHkl:
-                        raise DiffcalcException(s)
-                    else:
-                        print s
-        
-        return virtualAnglesReadback
+                    self._verification_failed(s)
 
     def repr_mode(self):
         pass
 
+    _batch_axes_count = 6
+
+    def _angles_to_hkl_batch(self, positions, wavelength):
+        """
+        Return N*3 array of hkl from N*k array of positions in radians and N
+        array of wavelengths.
+        """
+        raise NotImplementedError()
+
 ### Collect all math access to context here
 
     def _getUBMatrix(self):
@@ -26,6 +26,8 @@ def getNameFromScannableOrString(o):
 
 class DummyParameterManager(object):
 
+    revision = 0
+
     def getParameterDict(self):
         return {}
 
@@ -0,0 +1,245 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Precomputed maps of which reflections can be reached.
+
+A ReachabilityMap holds a uint8 reason code (see diffcalc.hkl.batch) for each
+node of a regular grid over an hkl box, together with the grid's origin, step
+and shape. Point queries look up the eight nodes around a point and so take
+constant time. A point is reported reachable if all eight nodes are, but
+unreachable only if that is certain for the whole cell: limits and
+constraints that fail at every corner may still be met inside, so the only
+failure known between nodes is a cell lying entirely beyond |Q| = 2k.
+
+Maps can be saved to an .npy file (with a .json file of grid metadata) and
+reopened as a read-only np.memmap.
+
+Requires numpy and so is not available under Jython.
+"""
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import numpy as np
+
+from diffcalc.hkl.batch import OK, Q_TOO_LONG, UNSOLVED, REASONS, \
+    as_hkl_array
+from diffcalc.util import DiffcalcException
+
+
+class ReachabilityMap(object):
+
+    def __init__(self, lower, step, reasons, wavelength=None, UB=None):
+        self.lower = np.array(lower, dtype=float)
+        self.step = np.array(step, dtype=float)
+        self.reasons = reasons  # uint8 array, one code per grid node
+        self.wavelength = wavelength
+        self.UB = None if UB is None else np.array(UB, dtype=float)
+
+    @property
+    def shape(self):
+        return self.reasons.shape
+
+    @property
+    def upper(self):
+        return self.lower + self.step * (np.array(self.shape) - 1)
+
+    def __str__(self):
+        reachable = np.count_nonzero(self.reasons == OK)
+        return ("ReachabilityMap(%s to %s in %s nodes, %i reachable)" %
+                (tuple(self.lower), tuple(self.upper), self.shape, reachable))
+
+    def _corner_indices(self, hkl):
+        # Indices of the grid cell containing hkl, or None outside the grid
+        position = (np.asarray(hkl, dtype=float) - self.lower) / self.step
+        last = np.array(self.shape) - 1
+        if np.any(position < -1e-9) or np.any(position > last + 1e-9):
+            return None
+        low = np.clip(np.floor(position + 1e-9).astype(int), 0, last)
+        high = np.where(position - low > 1e-9, low + 1, low)
+        return low, np.minimum(high, last)
+
+    def reason(self, h, k, l):
+        """Return the reason code for hkl if the map can tell
+
+        On a grid node this is the node's code. Between nodes it is OK if all
+        the surrounding nodes are reachable, or Q_TOO_LONG if the whole cell
+        is beyond |Q| = 2k. Otherwise (or outside the map) returns None and
+        only the full solver can tell.
+        """
+        corners = self._corner_indices((h, k, l))
+        if corners is None:
+            return None
+        low, high = corners
+        cell = self.reasons[low[0]:high[0] + 1, low[1]:high[1] + 1,
+                            low[2]:high[2] + 1]
+        first = int(cell.flat[0])
+        if cell.size == 1:
+            return first
+        if np.any(cell != first):
+            return None
+        if first == OK:
+            return OK
+        if first == Q_TOO_LONG and self._beyond_2k(low, high):
+            return Q_TOO_LONG
+        return None
+
+    def _beyond_2k(self, low, high):
+        # True if |Q| > 2k throughout the cell between nodes low and high:
+        # |Q| there is at least that of the centre less the half diagonal
+        if self.UB is None or self.wavelength is None:
+            return False
+        lower = self.lower + self.step * low
+        upper = self.lower + self.step * high
+        half = (upper - lower) / 2
+        signs = np.array([(i, j, k) for i in (-1, 1) for j in (-1, 1)
+                          for k in (-1, 1)])
+        radius = np.max(np.sqrt(np.sum(np.dot(signs * half, self.UB.T) ** 2,
+                                       axis=-1)))
+        q_centre = np.sqrt(np.sum(np.dot(self.UB, lower + half) ** 2))
+        return q_centre - radius > 2 * 2 * np.pi / self.wavelength
+
+    def is_reachable(self, h, k, l):
+        """Return True or False, or None if the map cannot tell (see reason)
+        """
+        code = self.reason(h, k, l)
+        return None if code is None else code == OK
+
+    def region(self, lower, upper):
+        """Return the reason codes of the grid nodes within an hkl box"""
+        lower = np.ceil((np.asarray(lower, dtype=float) - self.lower) /
+                        self.step - 1e-9).astype(int)
+        upper = np.floor((np.asarray(upper, dtype=float) - self.lower) /
+                         self.step + 1e-9).astype(int)
+        lower = np.maximum(lower, 0)
+        upper = np.minimum(upper, np.array(self.shape) - 1)
+        if np.any(upper < lower):
+            return self.reasons[0:0, 0:0, 0:0]
+        return self.reasons[lower[0]:upper[0] + 1, lower[1]:upper[1] + 1,
+                            lower[2]:upper[2] + 1]
+
+    def hkl_grid(self):
+        """Return an N*3 array of the hkl value at each grid node"""
+        axes = [self.lower[i] + self.step[i] * np.arange(self.shape[i])
+                for i in range(3)]
+        mesh = np.meshgrid(*axes, indexing='ij')
+        return np.column_stack([m.ravel() for m in mesh])
+
+    def save(self, path):
+        """Save the reason codes to path (.npy) and the grid to path.json"""
+        f = open(path, 'wb')  # np.save would append .npy to a name
+        try:
+            np.save(f, np.asarray(self.reasons))
+        finally:
+            f.close()
+        metadata = {'lower': list(self.lower), 'step': list(self.step),
+                    'wavelength': self.wavelength,
+                    'UB': None if self.UB is None else self.UB.tolist()}
+        f = open(path + '.json', 'w')
+        try:
+            json.dump(metadata, f)
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved map, as a read-only memory map by default"""
+        f = open(path + '.json')
+        try:
+            metadata = json.load(f)
+        finally:
+            f.close()
+        reasons = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(metadata['lower'], metadata['step'], reasons,
+                   metadata['wavelength'], metadata.get('UB'))
+
+
+def grid_spec(lower, upper, steps):
+    """Return (lower, step, shape) for a box sampled with steps nodes a side"""
+    lower = np.array(lower, dtype=float).reshape(3)
+    upper = np.array(upper, dtype=float).reshape(3)
+    shape = np.array(steps, dtype=int) * np.ones(3, dtype=int)
+    if np.any(shape < 1) or np.any(upper < lower):
+        raise DiffcalcException(
+            "A reachability map needs upper >= lower and at least one step")
+    span = np.where(shape > 1, shape - 1, 1)
+    step = np.where(upper > lower, (upper - lower) / span, 1.)
+    return lower, step, tuple(shape)
+
+
+def build_reachability_map(hklcalc, lower, upper, steps, wavelength):
+    """Sweep an hkl box through an engine's solver and return its map
+
+    Engines with a batch solver are swept in one call; others are solved
+    point by point with any failure recorded as UNSOLVED.
+    """
+    lower, step, shape = grid_spec(lower, upper, steps)
+    grid = ReachabilityMap(lower, step, np.zeros(shape, dtype=np.uint8),
+                           wavelength, hklcalc._getUBMatrix())
+    hkl = as_hkl_array(grid.hkl_grid())
+    if hasattr(hklcalc, 'hkl_to_angles_batch'):
+        reasons = hklcalc.hkl_to_angles_batch(hkl, wavelength).reasons
+    else:
+        reasons = np.empty(len(hkl), dtype=np.uint8)
+        for i, (h, k, l) in enumerate(hkl):
+            try:
+                hklcalc.hklToAngles(h, k, l, wavelength)
+                reasons[i] = OK
+            except Exception:  # not all failures raise DiffcalcException
+                reasons[i] = UNSOLVED
+    grid.reasons = np.asarray(reasons, dtype=np.uint8).reshape(shape)
+    return grid
+
+
+class ReachabilityIndex(object):
+    """A ReachabilityMap rebuilt lazily whenever it goes out of date.
+
+    The map is rebuilt on the next query after the UB calculation,
+    constraints, limits or cuts change, or when asked about another
+    wavelength. If a path is given each map built is saved there and used
+    through a memory map.
+    """
+
+    def __init__(self, hklcalc, lower, upper, steps, path=None):
+        grid_spec(lower, upper, steps)  # check before the first build
+        self._hklcalc = hklcalc
+        self._box = (lower, upper, steps)
+        self._path = path
+        self._map = None
+        self._key = None
+        self.builds = 0
+
+    def map_for(self, wavelength):
+        key = (wavelength,) + self._hklcalc.state_revision()
+        if self._map is None or key != self._key:
+            lower, upper, steps = self._box
+            reachability_map = build_reachability_map(
+                self._hklcalc, lower, upper, steps, wavelength)
+            if self._path is not None:
+                reachability_map.save(self._path)
+                reachability_map = ReachabilityMap.load(self._path)
+            self._map, self._key = reachability_map, key
+            self.builds += 1
+        return self._map
+
+    def reason(self, h, k, l, wavelength):
+        return self.map_for(wavelength).reason(h, k, l)
+
+    def describe(self, code):
+        return REASONS[code]
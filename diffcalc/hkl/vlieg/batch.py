@@ -0,0 +1,529 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Vectorized calculations for the Vlieg engine. Requires numpy.
+
+The four and five circle modes (except fixed-phi) and the z-axis modes are
+solved for all points at once, following the same steps as
+VliegHklCalculator._hklToAnglesFourAndFiveCirclesModes and
+_hklToAnglesZaxisModes. Points that cannot be solved are marked with a reason
+code rather than raising an exception. The fixed-phi mode is solved point by
+point with the scalar calculator.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.hkl import batch
+from diffcalc.hkl.batch import HklBatchResult, x_rotations, y_rotations, \
+    z_rotations, transposed, matmul, matvec, norms, as_hkl_array, \
+    as_wavelength_array
+from diffcalc.hkl.vlieg.geometry import \
+    createVliegsSurfaceTransformationMatrices
+from diffcalc.util import DiffcalcException
+
+TORAD = pi / 180
+TODEG = 180 / pi
+SMALL = 1e-8
+
+VIRTUAL_ANGLE_NAMES = ('Bin', 'Bout', 'azimuth', '2theta')
+
+X = np.array([1., 0., 0.])
+Z = np.array([0., 0., 1.])
+
+
+def _sign(x):
+    return np.where(x < 0, -1., 1.)
+
+
+def _q_alpha(alpha, delta, gamma):
+    """Return N*3 array of Q in the alpha frame in units of the wavevector
+    (Equation 47 before normalisation)"""
+    DELTA_GAMMA = matmul(z_rotations(-delta), x_rotations(gamma))
+    ALPHA_I = transposed(x_rotations(alpha))
+    return DELTA_GAMMA[..., 1] - ALPHA_I[..., 1]
+
+
+def _sample_rotations(omega, chi, phi):
+    """Return N*3*3 array of OMEGA*CHI*PHI (Equation 48)"""
+    return matmul(matmul(z_rotations(-omega), y_rotations(chi)),
+                  z_rotations(-phi))
+
+
+def surface_matrix(sigma, tau):
+    """Return S = TAU*SIGMA as a 3*3 array from sigma and tau in radians"""
+    SIGMA, TAU = createVliegsSurfaceTransformationMatrices(sigma, tau)
+    return np.dot(np.asarray(TAU, dtype=float),
+                  np.asarray(SIGMA, dtype=float))
+
+
+def transform_a_into_b(a, b):
+    """Vectorized VliegHklCalculator._findMatrixToTransformAIntoB.
+
+    Return N*3*3 array of matrices Mo with Mo*a=b from N*3 arrays (or single
+    3-vectors) of unit vectors a and b.
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float),
+                               np.asarray(b, dtype=float))
+    xi = np.arccos(batch.bound(np.einsum('...i,...i->...', a, b)))  # (A2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        c = np.cross(a, b) / np.sin(xi)[..., np.newaxis]            # (A3)
+    D = np.stack((a, np.cross(c, a), c), axis=-2)                   # (A4)
+    # D is orthonormal, so its inverse is its transpose
+    Mo = matmul(matmul(transposed(D), z_rotations(xi)), D)          # (A6)
+    # Mo is the identity matrix if xi is zero (the above would blow up)
+    Mo[abs(xi) < 1e-10] = np.identity(3)
+    return Mo
+
+
+def vlieg_angles_to_hkl(positions, wavelength, UBMatrix):
+    """
+    Return N*3 array of hkl from N*6 array of alpha, delta, gamma, omega, chi
+    and phi in radians and one or N wavelengths.
+    """
+    alpha, delta, gamma, omega, chi, phi = \
+        np.asarray(positions, dtype=float).T
+    wavevector = 2 * pi / np.asarray(wavelength, dtype=float)
+
+    # Create the plane normal vector in the alpha axis coordinate frame
+    qa = _q_alpha(alpha, delta, gamma) * wavevector[..., np.newaxis]
+
+    # Transform the plane normal vector from the alpha frame to reciprical
+    # lattice frame.
+    OMEGA_CHI_PHI = _sample_rotations(omega, chi, phi)
+    q_phi = matvec(transposed(OMEGA_CHI_PHI), qa)
+    return np.dot(q_phi, np.linalg.inv(np.asarray(UBMatrix, dtype=float)).T)
+
+
+def vlieg_virtual_angles(positions, wavelength, S):
+    """
+    Return dictionary of N arrays of Bin, Bout, azimuth and 2theta in radians
+    from N*6 array of positions in radians, one or N wavelengths and the
+    surface matrix S (vectorized _anglesToVirtualAngles).
+
+    azimuth is NaN where Q is too close to zero for it to be calculated.
+    """
+    alpha, delta, gamma, omega, chi, phi = \
+        np.asarray(positions, dtype=float).T
+    wavevector = 2 * pi / np.asarray(wavelength, dtype=float)
+    ALPHA = x_rotations(alpha)
+    R = _sample_rotations(omega, chi, phi)
+
+    # Calculate Bin from equation 15:
+    surfacenormal_alpha = matvec(R, S[:, 2])
+    incoming_alpha = transposed(ALPHA)[..., 1]
+    minus_sin_Bin = np.einsum('...i,...i->...', surfacenormal_alpha,
+                              incoming_alpha)
+    Bin = np.arcsin(batch.bound(-minus_sin_Bin))
+
+    # Calculate Bout from equation 16:
+    outgoing_alpha = matmul(z_rotations(-delta), x_rotations(gamma))[..., 1]
+    sin_Bout = np.einsum('...i,...i->...', surfacenormal_alpha,
+                         outgoing_alpha)
+    Bout = np.arcsin(batch.bound(sin_Bout))
+
+    # Calculate 2theta from equation 25:
+    cos_twotheta = matvec(ALPHA, outgoing_alpha)[..., 1]
+    twotheta = np.arccos(batch.bound(cos_twotheta))
+
+    # Calculate psi by solving equation 49 (as _anglesToPsi)
+    Q_alpha = outgoing_alpha - incoming_alpha
+    normq = norms(Q_alpha)
+    undefined = normq * wavevector < 1e-10
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Q_alpha = Q_alpha / normq[..., np.newaxis]
+    H_phi = matvec(transposed(R), Q_alpha)
+    Ro = transform_a_into_b(H_phi, Q_alpha)
+    D = transform_a_into_b(Q_alpha, X)                               # (50)
+    # PSI = D*R*((D*Ro)^-1) with D and Ro orthonormal
+    PSI = matmul(matmul(D, R), transposed(matmul(D, Ro)))
+    psi = np.arctan2(PSI[..., 1, 2], PSI[..., 2, 2])                # (51)
+    psi = np.where(undefined, np.nan, psi)
+
+    return {'Bin': Bin, 'Bout': Bout, 'azimuth': psi, '2theta': twotheta}
+
+
+def gamma_on_base_to_arm(deltaB, gammaB, alpha):
+    """
+    Return (deltaA, gammaA) arrays from arrays (or single values) of
+    gamma-on-base deltaB and gammaB and alpha in radians (vectorized
+    geometry.gammaOnBaseToArm).
+
+    Rather than trying each root of equations 11 and 12 against equation 8,
+    the solving pair is chosen directly: the first root of equation 12 has
+    cos(gammaA) >= 0, so deltaA is fixed by the signs of sin(deltaA)cos(gammaA)
+    and cos(deltaA)cos(gammaA) in equation 8.
+    """
+    deltaB = np.asarray(deltaB, dtype=float)
+    gammaB_alpha = np.asarray(gammaB, dtype=float) - alpha
+    cos_deltaB = np.cos(deltaB)
+    gammaA = np.arcsin(batch.bound(cos_deltaB * np.sin(gammaB_alpha)))  # (12)
+    deltaA = np.arctan2(np.sin(deltaB), np.cos(gammaB_alpha) * cos_deltaB)
+    return deltaA, gammaA
+
+
+def gamma_on_arm_to_base(deltaA, gammaA, alpha):
+    """
+    Return (deltaB, gammaB) arrays from arrays (or single values) of
+    gamma-on-arm deltaA and gammaA and alpha in radians (vectorized
+    geometry.gammaOnArmToBase). gammaB is between 0 and pi.
+
+    Rather than trying each root of equations 9 and 10 against equation 8,
+    the solving pair is chosen directly. The first root of equation 10 pairs
+    with the root of equation 9 whose cosine has the sign of
+    cos(deltaA)cos(gammaA). It is used if it lies between 0 and pi, otherwise
+    the second root (gammaB+pi, with the other deltaB root) is.
+    """
+    deltaA = np.asarray(deltaA, dtype=float)
+    gammaA = np.asarray(gammaA, dtype=float)
+    cos_gammaA = np.cos(gammaA)
+    deltaB1 = np.arcsin(batch.bound(np.sin(deltaA) * cos_gammaA))  # (9)
+    deltaB2 = np.where(deltaB1 >= 0, pi, -pi) - deltaB1
+    # first root of equation 10: -pi/2 <= gammaB-alpha <= pi/2
+    cos_term = np.cos(deltaA) * cos_gammaA
+    gammaB = np.arctan2(np.sin(gammaA) * _sign(cos_term),
+                        abs(cos_term)) + alpha
+    first = (gammaB >= 0) & (gammaB <= pi)
+    gammaB = np.where(first, gammaB, pi - np.mod(-gammaB, 2 * pi))
+    deltaB = np.where(first == (cos_term >= 0), deltaB1, deltaB2)
+    return deltaB, gammaB
+
+
+def _delta_and_twotheta(h2, alpha, gamma, fail):
+    """Vectorized VliegHklCalculator._determineDelta given the squared
+    length of hkl normalised to the wavevector"""
+    # See Vlieg section 5 (with K=1)
+    cos_delta = ((1 + np.sin(gamma) * np.sin(alpha) - h2 / 2) /
+                 (np.cos(gamma) * np.cos(alpha)))
+    fail(~(abs(cos_delta) <= 1 + 1e-10), batch.DETECTOR_UNREACHABLE)
+    cos_delta = batch.bound(cos_delta)
+    cos_twotheta = (np.cos(alpha) * np.cos(gamma) * cos_delta -
+                    np.sin(alpha) * np.sin(gamma))
+    return np.arccos(cos_delta), np.arccos(batch.bound(cos_twotheta))
+
+
+def _equations_49_through_59(psi, D, Ro):
+    """Return omega, chi and phi from R = (D^-1)*PSI*D*Ro (Equation 49)"""
+    # PSI = createVliegsPsiTransformationMatrix(psi)
+    R = matmul(matmul(transposed(D), x_rotations(-psi)), matmul(D, Ro))
+    R13, R23 = R[:, 0, 2], R[:, 1, 2]
+    R31, R32 = R[:, 2, 0], R[:, 2, 1]
+
+    # eq 57: extract omega from R
+    omega = np.where(abs(R13) < 1e-20, -_sign(R23) * _sign(R13) * pi / 2,
+                     -np.arctan2(R23, R13))
+    # eq 58: extract chi from R (only the first root is also a solution to
+    # R33=cos(chi))
+    chi = np.arcsin(batch.bound(np.hypot(R13, R23)))
+    # eq 59: extract phi from R (pi/2 when R31 is 0, as in the scalar
+    # calculation)
+    phi = np.where(abs(R31) < 1e-20, pi / 2, np.arctan2(-R32, -R31))
+    return omega, chi, phi
+
+
+class VliegBatchSolver(object):
+    """Solve many reflections at once for a VliegHklCalculator"""
+
+    def __init__(self, calc):
+        self._calc = calc
+
+    def hkl_to_angles(self, hkl, wavelength):
+        """Return HklBatchResult with positions and virtual angles in degrees
+        for an N*3 array of hkl and one or N wavelengths in Angstroms.
+        Tracked parameters must already have been updated.
+        """
+        hkl = as_hkl_array(hkl)
+        wavelength = as_wavelength_array(wavelength, len(hkl))
+
+        plan = self._calc.mode_selector.plan
+        if not plan.mode.implemented:
+            raise DiffcalcException("Mode %s is not implemented" %
+                                    plan.mode.name)
+        if plan.fixed_phi:
+            return self._solve_pointwise(hkl, wavelength)
+
+        # Points that cannot be solved carry NaNs through the calculation and
+        # are marked with reason codes as they are found
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if plan.mode.group == 'zaxis':
+                return self._solve_zaxis(hkl, wavelength, plan)
+            return self._solve_four_and_five_circle(hkl, wavelength, plan)
+
+    def _solve_pointwise(self, hkl, wavelength):
+        n = len(hkl)
+        positions = np.full((n, 6), np.nan)
+        angles = dict((name, np.full(n, np.nan))
+                      for name in VIRTUAL_ANGLE_NAMES)
+        reasons = np.zeros(n, dtype=np.uint8)
+        messages = {}
+        for i, ((h, k, l), wl) in enumerate(zip(hkl, wavelength)):
+            try:
+                pos, virtual_angles = self._calc.hklToAngles(h, k, l, wl)
+            except Exception, e:
+                reasons[i] = batch.UNSOLVED
+                messages[i] = str(e)
+                continue
+            positions[i] = pos.totuple()
+            for name, value in virtual_angles.items():
+                angles[name][i] = np.nan if value is None else value
+        return HklBatchResult(positions, angles, reasons, messages)
+
+    def _parameter(self, name, plan):
+        """Return the named parameter in radians"""
+        value = self._calc._getParameter(name)
+        if value is None:
+            raise DiffcalcException(
+                "The parameter %s must be set for mode %s" %
+                (name, plan.mode.name))
+        return value * TORAD
+
+    def _surface_matrix(self):
+        return np.array(self._calc._frames().S, dtype=float)
+
+    def _solve_four_and_five_circle(self, hkl, wavelength, plan):
+        calc = self._calc
+        n = len(hkl)
+        reasons = np.zeros(n, dtype=np.uint8)
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        UB = np.array(calc._frames().UB, dtype=float)
+        S = self._surface_matrix()
+
+        # Normalise hkl and compute it in the phi axis coordinate frame
+        wavevector = 2 * pi / wavelength
+        h_phi_norm = np.dot(hkl / wavevector[:, np.newaxis], UB.T)
+        normh = norms(h_phi_norm)
+        fail(normh < 1e-10, batch.Q_ZERO)
+        fail(normh > 2, batch.Q_TOO_LONG)
+
+        # Determine Bin and Bout from the RHS of equation 20
+        rhs = np.dot(h_phi_norm, np.linalg.inv(S)[2])
+        Bin, Bout = self._betas(rhs, plan, fail)
+
+        # Determine alpha and gamma
+        if plan.mode.group == 'fourc':
+            alpha = np.full(n, self._parameter('alpha', plan))
+            gamma = np.full(n, self._parameter(
+                calc._getGammaParameterName(), plan))
+        else:
+            alpha, gamma = self._five_circle_alpha_and_gamma(
+                Bin, h_phi_norm, S, plan, fail)
+        alpha = np.where(alpha < -pi, alpha + 2 * pi, alpha)
+        alpha = np.where(alpha > pi, alpha - 2 * pi, alpha)
+
+        # Determine delta
+        delta, twotheta = _delta_and_twotheta(normh ** 2, alpha, gamma, fail)
+
+        # Determine omega, chi & phi
+        omega, chi, phi, psi = self._sample_angles(
+            h_phi_norm, normh, alpha, delta, gamma, Bin, S, fail)
+
+        # Ensure that by default omega is between -90 and 90, by possibly
+        # transforming the sample angles (as TransformCInRadians). Omega is
+        # often exactly +-90 in the five circle modes, so it is only
+        # transformed if clearly outside this range (the scalar calculation
+        # leaves this to rounding).
+        flip = abs(omega) > pi / 2 + SMALL
+        omega = np.where(flip, np.where(omega > 0, omega - pi, omega + pi),
+                         omega)
+        chi = np.where(flip, -chi, chi)
+        phi = np.where(flip, phi + pi, phi)
+
+        #   -pi<psi<=pi
+        psi = np.where(psi > pi, psi - 2 * pi, psi)
+        psi = np.where(psi < -pi, psi + 2 * pi, psi)
+
+        positions = np.stack((alpha, delta, gamma, omega, chi, phi), axis=-1)
+        calculated = {'2theta': twotheta, 'Bin': Bin, 'Bout': Bout,
+                      'azimuth': psi}
+        return self._verified_result(hkl, wavelength, UB, S, positions,
+                                     calculated, reasons)
+
+    def _solve_zaxis(self, hkl, wavelength, plan):
+        calc = self._calc
+        n = len(hkl)
+        reasons = np.zeros(n, dtype=np.uint8)
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        UB = np.array(calc._frames().UB, dtype=float)
+        S = self._surface_matrix()
+
+        wavevector = 2 * pi / wavelength
+        h_phi = np.dot(hkl, UB.T)
+        normh = norms(h_phi) / wavevector
+        fail(normh < 1e-10, batch.Q_ZERO)
+        fail(normh > 2, batch.Q_TOO_LONG)
+
+        # Determine chi and phi (Equation 29)
+        phi = np.full(n, -calc._getTau() * TORAD)
+        chi = np.full(n, -calc._getSigma() * TORAD)
+
+        # Equation 30:
+        CHI_PHI = np.dot(y_rotations(chi[0]), z_rotations(-phi[0]))
+        Hw = np.dot(h_phi, CHI_PHI.T)
+
+        # Determine Bin and Bout (Equation 32), then alpha and gamma
+        Bin, Bout = self._betas(Hw[:, 2] / wavevector, plan, fail)
+        alpha = Bin
+        gamma = Bout
+
+        # Determine delta
+        delta, twotheta = _delta_and_twotheta(normh ** 2, alpha, gamma, fail)
+
+        # Determine omega
+        d1 = (Hw[:, 1] * np.sin(delta) * np.cos(gamma) - Hw[:, 0] *
+              (np.cos(delta) * np.cos(gamma) - np.cos(alpha)))
+        d2 = (Hw[:, 0] * np.sin(delta) * np.cos(gamma) + Hw[:, 1] *
+              (np.cos(delta) * np.cos(gamma) - np.cos(alpha)))
+        omega = np.where(abs(d2) < 1e-30, _sign(d1) * _sign(d2) * pi / 2,
+                         np.arctan2(d1, d2))
+
+        positions = np.stack((alpha, delta, gamma, omega, chi, phi), axis=-1)
+        calculated = {'2theta': twotheta, 'Bin': Bin, 'Bout': Bout}
+        return self._verified_result(hkl, wavelength, UB, S, positions,
+                                     calculated, reasons)
+
+    def _betas(self, rhs, plan, fail):
+        """Return Bin and Bout given sin(Bin) + sin(Bout) (Equations 20 and
+        32)"""
+        n = len(rhs)
+        if plan.beta == 'betain':
+            Bin = np.full(n, self._parameter('betain', plan))
+            sin_Bout = rhs - np.sin(Bin)
+            fail(~(abs(sin_Bout) <= 1), batch.REFERENCE_UNREACHABLE)
+            Bout = np.arcsin(batch.bound(sin_Bout))
+        elif plan.beta == 'betaout':
+            Bout = np.full(n, self._parameter('betaout', plan))
+            sin_Bin = rhs - np.sin(Bout)
+            fail(~(abs(sin_Bin) <= 1), batch.REFERENCE_UNREACHABLE)
+            Bin = np.arcsin(batch.bound(sin_Bin))
+        elif plan.beta == 'beq':
+            sin_Beq = rhs / 2
+            fail(~(abs(sin_Beq) <= 1), batch.REFERENCE_UNREACHABLE)
+            Bin = Bout = np.arcsin(batch.bound(sin_Beq))
+        else:
+            raise DiffcalcException("Mode %s is not implemented" %
+                                    plan.mode.name)
+        return Bin, Bout
+
+    def _five_circle_alpha_and_gamma(self, Bin, h_phi_norm, S, plan, fail):
+        """Vectorized _determineAlphaAndGammaForFiveCircleModes"""
+        ## Solve equation 34 for one possible Y, Yo
+        surface_normal_phi = S[:, 2]
+        zeros = np.zeros(len(Bin))
+        beta_vector = np.stack((zeros, -np.sin(Bin), np.cos(Bin)), axis=-1)
+        Yo = transform_a_into_b(surface_normal_phi, beta_vector)
+
+        ## Calculate Hv from equation 39
+        Hv3 = matvec(matmul(x_rotations(-Bin), Yo), h_phi_norm)[:, 2]
+        H2 = np.einsum('ij,ij->i', h_phi_norm, h_phi_norm)
+        if plan.mode.group == 'fivecFixedGamma':
+            gamma = np.full(len(Bin), self._parameter(
+                self._calc._getGammaParameterName(), plan))
+            a = -(0.5 * H2 * np.sin(Bin) - Hv3)
+            b = -(1.0 - 0.5 * H2) * np.cos(Bin)
+            c = np.cos(Bin) * np.sin(gamma)
+            discriminant = b * b + a * a - c * c
+            fail(~(discriminant >= 0), batch.DETECTOR_UNREACHABLE)
+            alpha = 2 * np.arctan2(-(b + np.sqrt(discriminant)), -(a + c))
+        elif plan.mode.group == 'fivecFixedAlpha':
+            alpha = np.full(len(Bin), self._parameter('alpha', plan))
+            t0 = ((2 * np.cos(alpha) * Hv3 - np.sin(Bin) * np.cos(alpha) * H2 +
+                   np.cos(Bin) * np.sin(alpha) * H2 -
+                   2 * np.cos(Bin) * np.sin(alpha)) / (np.cos(Bin) * 2.0))
+            fail(~(abs(t0) <= 1), batch.DETECTOR_UNREACHABLE)
+            gamma = np.arcsin(batch.bound(t0))
+        else:
+            raise RuntimeError(
+                "determineAlphaAndGammaInFiveCirclesModes() is not "
+                "appropriate for %s modes" % plan.mode.group)
+        return alpha, gamma
+
+    def _sample_angles(self, h_phi_norm, normh, alpha, delta, gamma, Bin, S,
+                       fail):
+        """Vectorized _determineSampleAnglesInFourAndFiveCircleModes using Bin
+        as the final constraint (Vlieg section 7.2)"""
+        # Normalise hkl and create Q_alpha from equation 47
+        H_phi = h_phi_norm / normh[:, np.newaxis]
+        Q_alpha = _q_alpha(alpha, delta, gamma)
+        Q_alpha = Q_alpha / norms(Q_alpha)[:, np.newaxis]
+
+        # Find a solution Ro to Ro*H_phi=Q_alpha
+        Ro = transform_a_into_b(H_phi, Q_alpha)
+        ## equation 50: Find a solution D to D*Q=norm(Q)*[[1],[0],[0]])
+        D = transform_a_into_b(Q_alpha, X)
+
+        # eq 54: compute u=D*Ro*S*[[0],[0],[1]], the surface normal in psi
+        # frame. If u points along 100, then any psi is a solution: choose 0
+        u = matvec(matmul(D, Ro), S[:, 2])
+        along_x = norms(u - X) < 1e-9
+
+        # equation 53: V=A*(D^-1)
+        V = matmul(x_rotations(alpha), transposed(D))
+        v21, v22, v23 = V[:, 1, 0], V[:, 1, 1], V[:, 1, 2]
+        u1, u2, u3 = u.T
+        # equation 55
+        a = v22 * u2 + v23 * u3
+        b = v22 * u3 - v23 * u2
+        c = -np.sin(Bin) - v21 * u1
+        # equation 44 (first root)
+        discriminant = b * b + a * a - c * c
+        fail(~along_x & ~(discriminant >= 0), batch.SAMPLE_UNREACHABLE)
+        y = -(b - np.sqrt(discriminant))
+        x = -(a + c)
+        psi = 2 * np.where((abs(x) < 1e-20) & (abs(y) < 1e-20), pi / 2,
+                           np.arctan2(y, x))
+        psi = np.where(along_x, 0., psi)
+        omega, chi, phi = _equations_49_through_59(psi, D, Ro)
+
+        # if u points along z axis, the psi could have been either 0 or 180.
+        # Choose 0 to match that read up by angles-to-virtual-angles
+        along_z = norms(u - Z) < 1e-9
+        psi = np.where(along_z & (abs(psi - pi) < 1e-10), 0., psi)
+        return omega, chi, phi, psi
+
+    def _verified_result(self, hkl, wavelength, UB, S, positions, calculated,
+                         reasons):
+        """Check that positions (in radians) map back to hkl and that the
+        calculated virtual angles match those read back, and return an
+        HklBatchResult in degrees"""
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        fail(np.any(np.isnan(positions), axis=-1), batch.UNSOLVED)
+        positions[reasons != batch.OK] = np.nan
+
+        readback = vlieg_angles_to_hkl(positions, wavelength, UB)
+        fail(np.any(abs(readback - hkl) > .001, axis=-1),
+             batch.VERIFICATION_FAILED)
+        angles = vlieg_virtual_angles(positions, wavelength, S)
+        for name, value in calculated.items():
+            difference = abs(value - angles[name]) * TODEG
+            fail(np.minimum(difference, abs(difference - 360)) >= .00001,
+                 batch.VERIFICATION_FAILED)
+
+        unsolved = reasons != batch.OK
+        positions[unsolved] = np.nan
+        for name in angles:
+            angles[name] = np.where(unsolved, np.nan, angles[name] * TODEG)
+        return HklBatchResult(positions * TODEG, angles, reasons)
@@ -25,12 +25,14 @@ except ImportError:
     from numjy import matrix
     from numjy.linalg import norm
 
+from diffcalc import kernel, profiling
+from diffcalc.kernel import mmul_all, mvmul, mtvmul, as_matrix
 from diffcalc.hkl.calcbase import HklCalculatorBase
 from diffcalc.hkl.vlieg.transform import TransformCInRadians
 from diffcalc.util import dot3, cross3, bound, differ
 from diffcalc.hkl.vlieg.geometry import createVliegMatrices, \
-    createVliegsPsiTransformationMatrix, \
-    createVliegsSurfaceTransformationMatrices, calcPHI
+    createVliegRotations, createVliegsPsiTransformationMatrix, \
+    createVliegsSurfaceTransformationMatrices, calcALPHA, calcCHI, calcPHI
 from diffcalc.hkl.vlieg.geometry import VliegPosition
 from diffcalc.hkl.vlieg.constraints import VliegParameterManager
 from diffcalc.hkl.vlieg.constraints import ModeSelector
@@ -45,7 +47,6 @@ transformC = TransformCInRadians()
 PREFER_POSITIVE_CHI_SOLUTIONS = True
 
 I = matrix('1 0 0; 0 1 0; 0 0 1')
-y = matrix('0; 1; 0')
 
 
 def check(condition, ErrorOrStringOrCallable, *args):
@@ -79,31 +80,76 @@ def vliegAnglesToHkl(pos, wavelength, UBMatrix):
     Returns hkl indices from pos object in radians.
     """
     wavevector = 2 * pi / wavelength
+    u1p = kernel.scale(_q_phi(pos), wavevector)
 
-    # Create transformation matrices
-    [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegMatrices(
+    # Transform the plane normal vector from the phi frame to reciprical
+    # lattice frame.
+    return mvmul(kernel.inverse(as_matrix(UBMatrix)), u1p)
+
+
+def _q_phi(pos):
+    """Return the plane normal vector in the phi frame in units of the
+    wavevector from pos object in radians"""
+    # Create transformation matrices (the inverse of each is its transpose)
+    [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegRotations(
         pos.alpha, pos.delta, pos.gamma, pos.omega, pos.chi, pos.phi)
 
     # Create the plane normal vector in the alpha axis coordinate frame
-    qa = ((DELTA * GAMMA) - ALPHA.I) * matrix([[0], [wavevector], [0]])
-
-    # Transform the plane normal vector from the alpha frame to reciprical
-    # lattice frame.
-    hkl = UBMatrix.I * PHI.I * CHI.I * OMEGA.I * qa
+    qa = kernel.sub(mvmul(mmul_all(DELTA, GAMMA), kernel.Y),
+                    mtvmul(ALPHA, kernel.Y))
 
-    return hkl[0, 0], hkl[1, 0], hkl[2, 0]
+    # Transform the plane normal vector from the alpha frame to the phi frame
+    return mtvmul(PHI, mtvmul(CHI, mtvmul(OMEGA, qa)))
 
 
 class VliegUbCalcStrategy(PaperSpecificUbCalcStrategy):
 
     def calculate_q_phi(self, pos):
 
-        [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegMatrices(
-           pos.alpha, pos.delta, pos.gamma, pos.omega, pos.chi, pos.phi)
+        return kernel.to_column(_q_phi(pos))
+
 
-        u1a = (DELTA * GAMMA - ALPHA.I) * y
-        u1p = PHI.I * CHI.I * OMEGA.I * u1a
-        return u1p
+class VliegFrames(object):
+    """Matrices derived from UB, sigma, tau and the mode parameters.
+
+    Built by VliegHklCalculator._frames whenever the UB calculation (UB, sigma
+    or tau), the mode or a parameter (including a tracked one) changes, so
+    that each solve only does the work that depends on hkl. Attributes not
+    used by the mode, or whose parameter is not set, are None.
+    """
+
+    def __init__(self, calc, plan, revision):
+        self.revision = revision
+        sigma = calc._getSigma() * TORAD
+        tau = calc._getTau() * TORAD
+
+        # Surface transformation (S is a rotation: its inverse is S.T)
+        [SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(sigma, tau)
+        self.UB = calc._getUBMatrix()
+        self.S = TAU * SIGMA
+        self.S_rotation = as_matrix(self.S)  # for diffcalc.kernel
+        self.S_I_UB = self.S.T * self.UB  # for the RHS of equation 20
+        self.surface_normal_phi = self.S * matrix([[0], [0], [1]])
+
+        # z-axis modes: chi and phi are fixed by the surface normal (29, 30)
+        self.zaxis_chi = -sigma
+        self.zaxis_phi = -tau
+        self.zaxis_CHI_PHI = calcCHI(self.zaxis_chi) * calcPHI(self.zaxis_phi)
+
+        # modes with alpha fixed by a parameter
+        self.ALPHA = self.ALPHA_I = None
+        if plan.mode.group in ('fourc', 'fivecFixedAlpha'):
+            alpha = calc._getParameter('alpha')
+            if alpha is not None:
+                self.ALPHA = calcALPHA(alpha * TORAD)
+                self.ALPHA_I = self.ALPHA.T
+
+        # five circle modes with Bin fixed by a parameter (34 and 39)
+        self.ZYo = None
+        if plan.mode.group != 'fourc' and plan.beta == 'betain':
+            Bin = calc._getParameter('betain')
+            if Bin is not None:
+                self.ZYo = calc._calcZYo(Bin * TORAD, self.surface_normal_phi)
 
 
 class VliegHklCalculator(HklCalculatorBase):
@@ -121,6 +167,7 @@ class VliegHklCalculator(HklCalculatorBase):
             self._geometry, self._hardware, self.mode_selector,
             self._gammaParameterName)
         self.mode_selector.setParameterManager(self.parameter_manager)
+        self._cached_frames = None
 
     def __str__(self):
         # should list paramemeters and indicate which are used in selected mode
@@ -132,6 +179,20 @@ class VliegHklCalculator(HklCalculatorBase):
         result += self.parameter_manager.reportAllParameters()
         return result
 
+    def _constraints_revision(self):
+        return (self.mode_selector.revision, self.parameter_manager.revision)
+
+    def _frames(self, plan=None):
+        """VliegFrames for the current UB calculation, mode and parameters
+        (rebuilt on change)"""
+        revision = (self._ubcalc.revision, self._constraints_revision())
+        frames = self._cached_frames
+        if frames is None or frames.revision != revision:
+            if plan is None:
+                plan = self.mode_selector.plan
+            frames = self._cached_frames = VliegFrames(self, plan, revision)
+        return frames
+
     def _anglesToHkl(self, pos, wavelength):
         """
         Return hkl tuple from VliegPosition in radians and wavelength in
@@ -139,6 +200,23 @@ class VliegHklCalculator(HklCalculatorBase):
         """
         return vliegAnglesToHkl(pos, wavelength, self._getUBMatrix())
 
+    def _angles_to_hkl_batch(self, positions, wavelength):
+        from diffcalc.hkl.vlieg.batch import vlieg_angles_to_hkl
+        return vlieg_angles_to_hkl(positions, wavelength, self._getUBMatrix())
+
+    def hkl_to_angles_batch(self, hkl, wavelength):
+        """
+        Return HklBatchResult with positions and virtual angles in degrees for
+        an N*3 array of hkl values and a wavelength (or N wavelengths) in
+        Angstroms.
+
+        Points which cannot be reached are marked with a reason code in the
+        result rather than raising an exception. Requires numpy.
+        """
+        from diffcalc.hkl.vlieg.batch import VliegBatchSolver
+        self.parameter_manager.update_tracked()
+        return VliegBatchSolver(self).hkl_to_angles(hkl, wavelength)
+
     def _anglesToVirtualAngles(self, pos, wavelength):
         """
         Return dictionary of all virtual angles in radians from VliegPosition
@@ -147,29 +225,26 @@ class VliegHklCalculator(HklCalculatorBase):
         """
 
         # Create transformation matrices
-        [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegMatrices(
+        [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegRotations(
             pos.alpha, pos.delta, pos.gamma, pos.omega, pos.chi, pos.phi)
-        [SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(
-            self._getSigma() * TORAD, self._getTau() * TORAD)
-
-        S = TAU * SIGMA
-        y_vector = matrix([[0], [1], [0]])
+        S = self._frames().S_rotation
+        y_vector = kernel.Y
 
         # Calculate Bin from equation 15:
-        surfacenormal_alpha = OMEGA * CHI * PHI * S * matrix([[0], [0], [1]])
-        incoming_alpha = ALPHA.I * y_vector
-        minusSinBetaIn = dot3(surfacenormal_alpha, incoming_alpha)
+        surfacenormal_alpha = mvmul(mmul_all(OMEGA, CHI, PHI, S), kernel.Z)
+        incoming_alpha = mtvmul(ALPHA, y_vector)
+        minusSinBetaIn = kernel.dot(surfacenormal_alpha, incoming_alpha)
         Bin = asin(bound(-minusSinBetaIn))
 
         # Calculate Bout from equation 16:
         #  surfacenormal_alpha has just ben calculated
-        outgoing_alpha = DELTA * GAMMA * y_vector
-        sinBetaOut = dot3(surfacenormal_alpha, outgoing_alpha)
+        outgoing_alpha = mvmul(mmul_all(DELTA, GAMMA), y_vector)
+        sinBetaOut = kernel.dot(surfacenormal_alpha, outgoing_alpha)
         Bout = asin(bound(sinBetaOut))
 
         # Calculate 2theta from equation 25:
 
-        cosTwoTheta = dot3(ALPHA * DELTA * GAMMA * y_vector, y_vector)
+        cosTwoTheta = kernel.dot(mvmul(ALPHA, outgoing_alpha), y_vector)
         twotheta = acos(bound(cosTwoTheta))
         psi = self._anglesToPsi(pos, wavelength)
 
@@ -183,18 +258,11 @@ class VliegHklCalculator(HklCalculatorBase):
         azimuth in four and five circle modes.
         """
 
-        if self._getMode().group in ("fourc", "fivecFixedGamma",
-                                     "fivecFixedAlpha"):
-            return self._hklToAnglesFourAndFiveCirclesModes(h, k, l,
-                                                            wavelength)
-        elif self._getMode().group == "zaxis":
-            return self._hklToAnglesZaxisModes(h, k, l, wavelength)
-        else:
-            raise RuntimeError(
-                'The current mode (%s) has an unrecognised group: %s.'
-                 % (self._getMode().name, self._getMode().group))
+        # the branches for the mode are chosen once each time it changes
+        plan = self.mode_selector.plan
+        return getattr(self, plan.solver)(h, k, l, wavelength, plan)
 
-    def _hklToAnglesFourAndFiveCirclesModes(self, h, k, l, wavelength):
+    def _hklToAnglesFourAndFiveCirclesModes(self, h, k, l, wavelength, plan):
         """
         Return VliegPosition and virtual angles in radians from h, k & l and
         wavelength in Angstrom for four and five circle modes. The virtual
@@ -204,28 +272,34 @@ class VliegHklCalculator(HklCalculatorBase):
 
         # Results in radians during calculations, returned in degreess
         pos = VliegPosition(None, None, None, None, None, None)
+        frames = self._frames(plan)
 
         # Normalise hkl
         wavevector = 2 * pi / wavelength
         hklNorm = matrix([[h], [k], [l]]) / wavevector
 
         # Compute hkl in phi axis coordinate frame
-        hklPhiNorm = self._getUBMatrix() * hklNorm
+        hklPhiNorm = frames.UB * hklNorm
 
         # Determine Bin and Bout
-        if self._getMode().name == '4cPhi':
+        t = profiling.start()
+        if plan.fixed_phi:
             Bin = Bout = None
         else:
             Bin, Bout = self._determineBinAndBoutInFourAndFiveCirclesModes(
-                                                                    hklNorm)
+                                                     hklNorm, plan, frames)
+        profiling.stop('vlieg.reference', t)
 
         # Determine alpha and gamma
-        if self._getMode().group == 'fourc':
+        t = profiling.start()
+        if plan.mode.group == 'fourc':
             pos.alpha, pos.gamma = \
-                self._determineAlphaAndGammaForFourCircleModes(hklPhiNorm)
+                self._determineAlphaAndGammaForFourCircleModes(hklPhiNorm,
+                                                               plan)
         else:
             pos.alpha, pos.gamma = \
-                self._determineAlphaAndGammaForFiveCircleModes(Bin, hklPhiNorm)
+                self._determineAlphaAndGammaForFiveCircleModes(
+                    Bin, hklPhiNorm, plan, frames)
         if pos.alpha < -pi:
             pos.alpha += 2 * pi
         if pos.alpha > pi:
@@ -234,18 +308,22 @@ class VliegHklCalculator(HklCalculatorBase):
         # Determine delta
         (pos.delta, twotheta) = self._determineDelta(hklPhiNorm, pos.alpha,
                                                      pos.gamma)
+        profiling.stop('vlieg.detector', t)
 
         # Determine omega, chi & phi
+        t = profiling.start()
         pos.omega, pos.chi, pos.phi, psi = \
             self._determineSampleAnglesInFourAndFiveCircleModes(
-                hklPhiNorm, pos.alpha, pos.delta, pos.gamma, Bin)
+                hklPhiNorm, pos.alpha, pos.delta, pos.gamma, Bin, plan,
+                frames)
         # (psi will be None in fixed phi mode)
 
         # Ensure that by default omega is between -90 and 90, by possibly
         # transforming the sample angles
-        if self._getMode().name != '4cPhi':  # not in fixed-phi mode
+        if not plan.fixed_phi:
             if pos.omega < -pi / 2 or pos.omega > pi / 2:
                 pos = transformC.transform(pos)
+        profiling.stop('vlieg.sample', t)
 
         # Gather up the virtual angles calculated along the way...
         #   -pi<psi<=pi
@@ -258,7 +336,7 @@ class VliegHklCalculator(HklCalculatorBase):
         v = {'2theta': twotheta, 'Bin': Bin, 'Bout': Bout, 'azimuth': psi}
         return pos, v
 
-    def _hklToAnglesZaxisModes(self, h, k, l, wavelength):
+    def _hklToAnglesZaxisModes(self, h, k, l, wavelength, plan):
         """
         Return VliegPosition and virtual angles in radians from h, k & l and
         wavelength in Angstroms for z-axis modes. The virtual angles are those
@@ -269,6 +347,7 @@ class VliegHklCalculator(HklCalculatorBase):
 
         # Results in radians during calculations, returned in degreess
         pos = VliegPosition(None, None, None, None, None, None)
+        frames = self._frames(plan)
 
         # Normalise hkl
         wavevector = 2 * pi / wavelength
@@ -276,32 +355,35 @@ class VliegHklCalculator(HklCalculatorBase):
         hklNorm = hkl * (1.0 / wavevector)
 
         # Compute hkl in phi axis coordinate frame
-        hklPhi = self._getUBMatrix() * hkl
-        hklPhiNorm = self._getUBMatrix() * hklNorm
+        hklPhi = frames.UB * hkl
+        hklPhiNorm = frames.UB * hklNorm
 
-        # Determine Chi and Phi (Equation 29):
-        pos.phi = -self._getTau() * TORAD
-        pos.chi = -self._getSigma() * TORAD
+        # Determine Chi and Phi (Equation 29). These are fixed by the
+        # surface normal, so are profiled with the reference stage:
+        t = profiling.start()
+        pos.phi = frames.zaxis_phi
+        pos.chi = frames.zaxis_chi
 
         # Equation 30:
-        [ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI] = createVliegMatrices(
-                None, None, None, None, pos.chi, pos.phi)
-        del ALPHA, DELTA, GAMMA, OMEGA
-        Hw = CHI * PHI * hklPhi
+        Hw = frames.zaxis_CHI_PHI * hklPhi
 
         # Determine Bin and Bout:
         (Bin, Bout) = self._determineBinAndBoutInZaxisModes(
-            Hw[2, 0] / wavevector)
+            Hw[2, 0] / wavevector, plan)
+        profiling.stop('vlieg.reference', t)
 
         # Determine Alpha and Gamma (Equation 32):
+        t = profiling.start()
         pos.alpha = Bin
         pos.gamma = Bout
 
         # Determine Delta:
         (pos.delta, twotheta) = self._determineDelta(hklPhiNorm, pos.alpha,
                                                      pos.gamma)
+        profiling.stop('vlieg.detector', t)
 
         # Determine Omega:
+        t = profiling.start()
         delta = pos.delta
         gamma = pos.gamma
         d1 = (Hw[1, 0] * sin(delta) * cos(gamma) - Hw[0, 0] *
@@ -313,96 +395,87 @@ class VliegHklCalculator(HklCalculatorBase):
             pos.omega = sign(d1) * sign(d2) * pi / 2.0
         else:
             pos.omega = atan2(d1, d2)
+        profiling.stop('vlieg.sample', t)
 
         # Gather up the virtual angles calculated along the way
         return pos, {'2theta': twotheta, 'Bin': Bin, 'Bout': Bout}
 
 ###
 
-    def _determineBinAndBoutInFourAndFiveCirclesModes(self, hklNorm):
+    def _determineBinAndBoutInFourAndFiveCirclesModes(self, hklNorm, plan,
+                                                      frames):
         """(Bin, Bout) = _determineBinAndBoutInFourAndFiveCirclesModes()"""
-        BinModes = ('4cBin', '5cgBin', '5caBin')
-        BoutModes = ('4cBout', '5cgBout', '5caBout')
-        BeqModes = ('4cBeq', '5cgBeq', '5caBeq')
-        azimuthModes = ('4cAzimuth')
-        fixedBusingAndLeviWmodes = ('4cFixedw')
+        name = plan.mode.name
 
         # Calculate RHS of equation 20
         # RHS (1/K)(S^-1*U*B*H)_3 where H/K = hklNorm
-        UB = self._getUBMatrix()
-        [SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(
-            self._getSigma() * TORAD, self._getTau() * TORAD)
-        #S = SIGMA * TAU
-        S = TAU * SIGMA
-        RHS = (S.I * UB * hklNorm)[2, 0]
-
-        if self._getMode().name in BinModes:
+        RHS = (frames.S_I_UB * hklNorm)[2, 0]
+
+        if plan.beta == 'betain':
             Bin = self._getParameter('betain')
             check(Bin != None, "The parameter betain must be set for mode %s" %
-                  self._getMode().name)
+                  name)
             Bin = Bin * TORAD
             sinBout = RHS - sin(Bin)
             check(fabs(sinBout) <= 1, "Could not compute Bout")
             Bout = asin(sinBout)
 
-        elif self._getMode().name in BoutModes:
+        elif plan.beta == 'betaout':
             Bout = self._getParameter('betaout')
             check(Bout != None, "The parameter Bout must be set for mode %s" %
-                  self._getMode().name)
+                  name)
             Bout = Bout * TORAD
             sinBin = RHS - sin(Bout)
             check(fabs(sinBin) <= 1, "Could not compute Bin")
             Bin = asin(sinBin)
 
-        elif self._getMode().name in BeqModes:
+        elif plan.beta == 'beq':
             sinBeq = RHS / 2
             check(fabs(sinBeq) <= 1, "Could not compute Bin=Bout")
             Bin = Bout = asin(sinBeq)
 
-        elif self._getMode().name in azimuthModes:
+        elif plan.beta == 'azimuth':
             azimuth = self._getParameter('azimuth')
             check(azimuth != None, "The parameter azimuth must be set for "
-                  "mode %s" % self._getMode().name)
+                  "mode %s" % name)
             del azimuth
             # TODO: codeit
             raise NotImplementedError()
 
-        elif self._getMode().name in fixedBusingAndLeviWmodes:
+        elif plan.beta == 'blw':
             bandlomega = self._getParameter('blw')
             check(bandlomega != None, "The parameter abandlomega must be set "
-                  "for mode %s" % self._getMode().name)
+                  "for mode %s" % name)
             del bandlomega
             # TODO: codeit
             raise NotImplementedError()
         else:
             raise RuntimeError("AngleCalculator does not know how to handle "
-                               "mode %s" % self._getMode().name)
+                               "mode %s" % name)
 
         return (Bin, Bout)
 
-    def _determineBinAndBoutInZaxisModes(self, Hw3OverK):
+    def _determineBinAndBoutInZaxisModes(self, Hw3OverK, plan):
         """(Bin, Bout) = _determineBinAndBoutInZaxisModes(HwOverK)"""
-        BinModes = ('6czBin')
-        BoutModes = ('6czBout')
-        BeqModes = ('6czBeq')
+        name = plan.mode.name
 
-        if self._getMode().name in BinModes:
+        if plan.beta == 'betain':
             Bin = self._getParameter('betain')
             check(Bin != None, "The parameter betain must be set for mode %s" %
-                  self._getMode().name)
+                  name)
             Bin = Bin * TORAD
             # Equation 32a:
             Bout = asin(Hw3OverK - sin(Bin))
 
-        elif self._getMode().name in BoutModes:
+        elif plan.beta == 'betaout':
             Bout = self._getParameter('betaout')
             check(Bout != None, "The parameter Bout must be set for mode %s" %
-                  self._getMode().name)
+                  name)
             Bout = Bout * TORAD
             # Equation 32b:
             Bin = asin(Hw3OverK - sin(Bout))
 
-        elif self._getMode().name in BeqModes:
+        elif plan.beta == 'beq':
             # Equation 32c:
             Bin = Bout = asin(Hw3OverK / 2)
 
@@ -410,9 +483,9 @@ class VliegHklCalculator(HklCalculatorBase):
 
 ###
 
-    def _determineAlphaAndGammaForFourCircleModes(self, hklPhiNorm):
+    def _determineAlphaAndGammaForFourCircleModes(self, hklPhiNorm, plan):
 
-        if self._getMode().group == 'fourc':
+        if plan.mode.group == 'fourc':
             alpha = self._getParameter('alpha') * TORAD
             gamma = self._getParameter(self._getGammaParameterName()) * TORAD
             check(alpha != None, "alpha parameter must be set in fourc modes")
@@ -421,28 +494,33 @@ class VliegHklCalculator(HklCalculatorBase):
         else:
             raise RuntimeError(
                 "determineAlphaAndGammaForFourCirclesModes() "
-                "is not appropriate for %s modes" % self._getMode().group)
-
-    def _determineAlphaAndGammaForFiveCircleModes(self, Bin, hklPhiNorm):
+                "is not appropriate for %s modes" % plan.mode.group)
 
+    def _calcZYo(self, Bin, surfaceNormalPhi):
+        """Return Z*Yo from equations 34 and 39 given Bin in radians and the
+        surface normal in the phi frame"""
         ## Solve equation 34 for one possible Y, Yo
-        # Calculate surface normal in phi frame
-        [SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(
-            self._getSigma() * TORAD, self._getTau() * TORAD)
-        S = TAU * SIGMA
-        surfaceNormalPhi = S * matrix([[0], [0], [1]])
         # Compute beta in vector
         BetaVector = matrix([[0], [-sin(Bin)], [cos(Bin)]])
         # Find Yo
         Yo = self._findMatrixToTransformAIntoB(surfaceNormalPhi, BetaVector)
-
-        ## Calculate Hv from equation 39
         Z = matrix([[1, 0, 0],
                     [0, cos(Bin), sin(Bin)],
                     [0, -sin(Bin), cos(Bin)]])
-        Hv = Z * Yo * hklPhiNorm
+        return Z * Yo
+
+    def _determineAlphaAndGammaForFiveCircleModes(self, Bin, hklPhiNorm,
+                                                  plan, frames):
+
+        # Z*Yo depends only on Bin, so is precomputed when Bin is fixed
+        ZYo = frames.ZYo
+        if ZYo is None:
+            ZYo = self._calcZYo(Bin, frames.surface_normal_phi)
+
+        ## Calculate Hv from equation 39
+        Hv = ZYo * hklPhiNorm
         # Fixed gamma:
-        if self._getMode().group == 'fivecFixedGamma':
+        if plan.mode.group == 'fivecFixedGamma':
             gamma = self._getParameter(self._getGammaParameterName())
             check(gamma != None,
                   "gamma parameter must be set in fivecFixedGamma modes")
@@ -456,7 +534,7 @@ class VliegHklCalculator(HklCalculatorBase):
             alpha = 2 * atan2(-(b + sqrt(b * b + a * a - c * c)), -(a + c))
 
         # Fixed Alpha:
-        elif self._getMode().group == 'fivecFixedAlpha':
+        elif plan.mode.group == 'fivecFixedAlpha':
             alpha = self._getParameter('alpha')
             check(alpha != None,
                   "alpha parameter must be set in fivecFixedAlpha modes")
@@ -471,7 +549,7 @@ class VliegHklCalculator(HklCalculatorBase):
         else:
             raise RuntimeError(
                 "determineAlphaAndGammaInFiveCirclesModes() is not "
-                "appropriate for %s modes" % self._getMode().group)
+                "appropriate for %s modes" % plan.mode.group)
 
         return (alpha, gamma)
 
@@ -497,7 +575,8 @@ class VliegHklCalculator(HklCalculatorBase):
         return (acos(bound(cosdelta)), acos(bound(costwotheta)))
 
     def _determineSampleAnglesInFourAndFiveCircleModes(self, hklPhiNorm, alpha,
-                                                       delta, gamma, Bin):
+                                                       delta, gamma, Bin, plan,
+                                                       frames):
         """
         (omega, chi, phi, psi)=determineNonZAxisSampleAngles(hklPhiNorm, alpha,
         delta, gamma, sigma, tau) where hkl has been normalised by the
@@ -508,7 +587,7 @@ class VliegHklCalculator(HklCalculatorBase):
         def equation49through59(psi):
             # equation 49 R = (D^-1)*PI*D*Ro
             PSI = createVliegsPsiTransformationMatrix(psi)
-            R = D.I * PSI * D * Ro
+            R = D.T * PSI * D * Ro  # D is a rotation, so D^-1 = D.T
 
             #  eq 57: extract omega from R
             if abs(R[0, 2]) < 1e-20:
@@ -542,9 +621,15 @@ class VliegHklCalculator(HklCalculatorBase):
 
         # Using Vlieg section 7.2
 
-        # Needed througout:
+        # Needed througout (ALPHA is precomputed if alpha is fixed):
         [ALPHA, DELTA, GAMMA, _, _, _] = createVliegMatrices(
-            alpha, delta, gamma, None, None, None)
+            None, delta, gamma, None, None, None)
+        if frames.ALPHA is None:
+            ALPHA = calcALPHA(alpha)
+            ALPHA_I = ALPHA.T
+        else:
+            ALPHA = frames.ALPHA
+            ALPHA_I = frames.ALPHA_I
 
         ## Find Ro, one possible solution to equation 46: R*H_phi=Q_alpha
 
@@ -555,10 +640,10 @@ class VliegHklCalculator(HklCalculatorBase):
         H_phi = hklPhiNorm * (1 / normh)
 
         # Create Q_alpha from equation 47, (it comes normalised)
-        Q_alpha = ((DELTA * GAMMA) - ALPHA.I) * matrix([[0], [1], [0]])
+        Q_alpha = ((DELTA * GAMMA) - ALPHA_I) * matrix([[0], [1], [0]])
         Q_alpha = Q_alpha * (1 / norm(Q_alpha))
 
-        if self._getMode().name == '4cPhi':
+        if plan.fixed_phi:
             ### Use the fixed value of phi as the final constraint ###
             phi = self._getParameter('phi') * TORAD
             PHI = calcPHI(phi)
@@ -579,17 +664,14 @@ class VliegHklCalculator(HklCalculatorBase):
 
             # eq 54: compute u=D*Ro*S*[[0],[0],[1]], the surface normal in
             # psi frame
-            [SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(
-                self._getSigma() * TORAD, self._getTau() * TORAD)
-            S = TAU * SIGMA
-            [u1], [u2], [u3] = (D * Ro * S * matrix([[0], [0], [1]])).tolist()
+            [u1], [u2], [u3] = (D * Ro * frames.surface_normal_phi).tolist()
             # TODO: If u points along 100, then any psi is a solution. Choose 0
             if not differ([u1, u2, u3], [1, 0, 0], 1e-9):
                 psi = 0
                 omega, chi, phi = equation49through59(psi)
             else:
                 # equation 53: V=A*(D^-1)
-                V = ALPHA * D.I
+                V = ALPHA * D.T
                 v21 = V[1, 0]
                 v22 = V[1, 1]
                 v23 = V[1, 2]
@@ -713,8 +795,8 @@ class VliegHklCalculator(HklCalculatorBase):
                      [sin(xi), cos(xi), 0],
                      [0, 0, 1]])
 
-        # eq A6: compute Mo
-        return D.I * XI * D
+        # eq A6: compute Mo (D is orthonormal, so D^-1 = D.T)
+        return D.T * XI * D
 
 
 def _findOmegaAndChiToRotateHchiIntoQalpha(h_chi, q_alpha):
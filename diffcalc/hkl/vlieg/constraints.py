@@ -42,6 +42,51 @@ class Mode(object):
         return name in self.parameterNames
 
 
+# The calculation routine used for each mode group
+_SOLVERS = {'fourc': '_hklToAnglesFourAndFiveCirclesModes',
+            'fivecFixedGamma': '_hklToAnglesFourAndFiveCirclesModes',
+            'fivecFixedAlpha': '_hklToAnglesFourAndFiveCirclesModes',
+            'zaxis': '_hklToAnglesZaxisModes'}
+
+# How Bin and Bout are determined in each mode (None in fixed-phi mode)
+_BETA_CONSTRAINTS = {'4cFixedw': 'blw', '4cBeq': 'beq', '4cBin': 'betain',
+                     '4cBout': 'betaout', '4cAzimuth': 'azimuth',
+                     '4cPhi': None,
+                     '5cgBeq': 'beq', '5cgBin': 'betain', '5cgBout': 'betaout',
+                     '5caBeq': 'beq', '5caBin': 'betain', '5caBout': 'betaout',
+                     '6czBeq': 'beq', '6czBin': 'betain', '6czBout': 'betaout'}
+
+
+class VliegSolverPlan(object):
+    """The branches of the Vlieg calculation chosen by the current mode.
+
+    Built by ModeSelector.plan whenever the mode changes, so that
+    VliegHklCalculator does not compare mode names and groups for each hkl.
+    solver names the calculator method for the mode group; beta says how Bin
+    and Bout are determined. Parameter values are not bound here as they may
+    track the hardware. Plans cannot be modified.
+    """
+
+    def __init__(self, mode, revision):
+        if mode.group not in _SOLVERS:
+            raise RuntimeError(
+                'The current mode (%s) has an unrecognised group: %s.'
+                 % (mode.name, mode.group))
+        if mode.name not in _BETA_CONSTRAINTS:
+            raise RuntimeError("AngleCalculator does not know how to handle "
+                               "mode %s" % mode.name)
+        attributes = (('revision', revision),
+                      ('mode', mode),
+                      ('solver', _SOLVERS[mode.group]),
+                      ('beta', _BETA_CONSTRAINTS[mode.name]),
+                      ('fixed_phi', mode.name == '4cPhi'))
+        for name, value in attributes:
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('a solver plan cannot be modified')
+
+
 class ModeSelector(object):
 
     def __init__(self, geometry, parameterManager=None,
@@ -52,6 +97,8 @@ class ModeSelector(object):
         self._modelist = {}  # indexed by non-contiguous mode number
         self._configureAvailableModes()
         self._selectedIndex = 1
+        self.revision = 0  # bumped whenever the mode changes
+        self._plan = None
 
     def setParameterManager(self, manager):
         """
@@ -114,6 +161,7 @@ class ModeSelector(object):
     def setModeByIndex(self, index):
         if index in self._modelist:
             self._selectedIndex = index
+            self.revision += 1
         else:
             raise DiffcalcException("mode %r is not defined" % index)
 
@@ -132,6 +180,7 @@ class ModeSelector(object):
                 'modeSelector: %s' % self._supportedModes.keys())
         if  self._geometry.supports_mode_group(mode.group):
             self._selectedIndex = index
+            self.revision += 1
         else:
             raise DiffcalcException(
                 "Mode %s not supported for this diffractometer (%s)." %
@@ -140,6 +189,13 @@ class ModeSelector(object):
     def getMode(self):
         return self._modelist[self._selectedIndex]
 
+    @property
+    def plan(self):
+        """VliegSolverPlan for the current mode (rebuilt on change)"""
+        if self._plan is None or self._plan.revision != self.revision:
+            self._plan = VliegSolverPlan(self.getMode(), self.revision)
+        return self._plan
+
     def reportCurrentMode(self):
         return self.getMode().__str__()
 
@@ -173,6 +229,7 @@ class VliegParameterManager(object):
         self._modeSelector = modeSelector
         self._gammaParameterName = gammaParameterName
         self._parameters = {}
+        self.revision = 0  # bumped whenever a parameter or tracking changes
         self._defineParameters()
 
     def _defineParameters(self):
@@ -271,6 +328,7 @@ class VliegParameterManager(object):
             print ("WARNING: The parameter %s is not used in mode %i" %
                    (name, self._modeSelector.getMode().index))
         self._parameters[name] = value
+        self.revision += 1
 
     def isParameterUsedInSelectedMode(self, name):
         return self._modeSelector.getMode().usesParameter(name)
@@ -307,9 +365,11 @@ class VliegParameterManager(object):
         if switch:
             if name not in self._trackedParameters:
                 self._trackedParameters.append(name)
+                self.revision += 1
         else:
             if name in self._trackedParameters:
                 self._trackedParameters.remove(name)
+                self.revision += 1
 
     def isParameterTracked(self, name):
         return (name in self._trackedParameters)
@@ -322,8 +382,11 @@ class VliegParameterManager(object):
             externalAnglePositionArray = self._hardware.get_position()
             externalAngleNames = list(self._hardware.get_axes_names())
             for name in self._trackedParameters:
-                self._parameters[name] = \
-                    externalAnglePositionArray[externalAngleNames.index(name)]
+                value = externalAnglePositionArray[
+                    externalAngleNames.index(name)]
+                if self._parameters[name] != value:
+                    self._parameters[name] = value
+                    self.revision += 1
 
     def _isParameterChangeable(self, name, mode=None):
         """
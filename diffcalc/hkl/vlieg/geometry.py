@@ -24,6 +24,7 @@ except ImportError:
     from numjy import matrix
 
 from diffcalc.util import x_rotation, z_rotation, y_rotation
+from diffcalc import kernel
 from diffcalc.util import AbstractPosition
 from diffcalc.util import bound, nearlyEqual
 
@@ -68,6 +69,15 @@ def createVliegMatrices(alpha=None, delta=None, gamma=None, omega=None,
     return ALPHA, DELTA, GAMMA, OMEGA, CHI, PHI
 
 
+def createVliegRotations(alpha, delta, gamma, omega, chi, phi):
+    """Return the transformation matrices as tuples for use with
+    diffcalc.kernel. Angles in radians.
+    """
+    return (kernel.x_rotation(alpha), kernel.z_rotation(-delta),
+            kernel.x_rotation(gamma), kernel.z_rotation(-omega),
+            kernel.y_rotation(chi), kernel.z_rotation(-phi))
+
+
 def createVliegsSurfaceTransformationMatrices(sigma, tau):
     """[SIGMA, TAU] = createVliegsSurfaceTransformationMatrices(sigma, tau)
     angles in radians
@@ -93,6 +103,9 @@ def createVliegsPsiTransformationMatrix(psi):
 
 class VliegPosition(AbstractPosition):
     """The position of all six diffractometer axis"""
+
+    __slots__ = ('alpha', 'delta', 'gamma', 'omega', 'chi', 'phi')
+
     def __init__(self, alpha=None, delta=None, gamma=None, omega=None,
                  chi=None, phi=None):
         self.alpha = alpha
@@ -184,11 +197,32 @@ class VliegGeometry(object):
     def internal_position_to_physical_angles(self, physicalAngles):
         raise NotImplementedError()
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        """Return N*6 array of internal angles from N*k array of physical
+        angles (in degrees). Requires numpy."""
+        import numpy as np
+        to_internal = self.physical_angles_to_internal_position
+        return np.array([to_internal(tuple(angles)).totuple()
+                         for angles in np.atleast_2d(physicalAngles).tolist()],
+                        dtype=float)
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        """Return N*k array of physical angles from N*6 array of internal
+        angles (in degrees). Requires numpy."""
+        import numpy as np
+        to_physical = self.internal_position_to_physical_angles
+        return np.array([to_physical(VliegPosition(*angles))
+                         for angles in np.atleast_2d(internalAngles).tolist()],
+                        dtype=float)
+
 ### Do not overide these these ###
 
     def supports_mode_group(self, name):
         return name in self.supported_mode_groups
 
+    def create_position(self, *args):
+        return VliegPosition(*args)
+
     def parameter_fixed(self, name):  # parameter_fixed
         return name in self.fixed_parameters.keys()
 
@@ -220,6 +254,16 @@ class SixCircleGammaOnArmGeometry(VliegGeometry):
         """
         return internalPosition.totuple()
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 6), "Wrong length of input list"
+        return angles
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        import numpy as np
+        return np.array(internalAngles, dtype=float, ndmin=2)
+
 
 class SixCircleGeometry(VliegGeometry):
     """
@@ -274,6 +318,43 @@ class SixCircleGeometry(VliegGeometry):
 
         return alpha, deltaB, gammaB, omega, chi, phi
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        from diffcalc.hkl.vlieg.batch import gamma_on_base_to_arm
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 6), "Wrong length of input list"
+        deltaA, gammaA = gamma_on_base_to_arm(
+            angles[:, 1] * TORAD, angles[:, 2] * TORAD, angles[:, 0] * TORAD)
+        angles[:, 1] = deltaA * TODEG
+        angles[:, 2] = gammaA * TODEG
+        return angles
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        import numpy as np
+        from diffcalc.hkl.vlieg.batch import gamma_on_arm_to_base
+        angles = np.array(internalAngles, dtype=float, ndmin=2)
+        deltaB, gammaB = gamma_on_arm_to_base(
+            angles[:, 1] * TORAD, angles[:, 2] * TORAD, angles[:, 0] * TORAD)
+        deltaB, gammaB = deltaB * TODEG, gammaB * TODEG
+
+        if self.hardwareMonitor is not None:
+            gammaName = self.hardwareMonitor.get_axes_names()[2]
+            minGamma = self.hardwareMonitor.get_lower_limit(gammaName)
+            maxGamma = self.hardwareMonitor.get_upper_limit(gammaName)
+
+            if maxGamma is not None:
+                above = gammaB > maxGamma
+                gammaB = np.where(above, gammaB - 180, gammaB)
+                deltaB = np.where(above, 180 - deltaB, deltaB)
+            if minGamma is not None:
+                below = gammaB < minGamma
+                gammaB = np.where(below, gammaB + 180, gammaB)
+                deltaB = np.where(below, 180 - deltaB, deltaB)
+
+        angles[:, 1] = deltaB
+        angles[:, 2] = gammaB
+        return angles
+
 
 class FivecWithGammaOnBase(SixCircleGeometry):
 
@@ -299,6 +380,17 @@ class FivecWithGammaOnBase(SixCircleGeometry):
         return SixCircleGeometry.internal_position_to_physical_angles(
             self, internalPosition)[1:]
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 5), "Wrong length of input list"
+        return SixCircleGeometry.physical_angles_to_internal_positions(
+            self, np.hstack((np.zeros((len(angles), 1)), angles)))
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        return SixCircleGeometry.internal_positions_to_physical_angles(
+            self, internalAngles)[:, 1:]
+
 
 class Fivec(VliegGeometry):
     """
@@ -328,6 +420,17 @@ class Fivec(VliegGeometry):
         sixAngles = internalPosition.totuple()
         return sixAngles[0:2] + sixAngles[3:]
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 5), "Wrong length of input list"
+        return np.insert(angles, 2, 0., axis=1)
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        import numpy as np
+        return np.delete(np.array(internalAngles, dtype=float, ndmin=2), 2,
+                         axis=1)
+
 
 class Fourc(VliegGeometry):
     """
@@ -357,6 +460,17 @@ class Fourc(VliegGeometry):
         sixAngles = internalPosition.totuple()
         return sixAngles[1:2] + sixAngles[3:]
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 4), "Wrong length of input list"
+        return np.insert(angles, [0, 1], 0., axis=1)
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        import numpy as np
+        return np.delete(np.array(internalAngles, dtype=float, ndmin=2),
+                         [0, 2], axis=1)
+
 
 def sign(x):
     if x < 0:
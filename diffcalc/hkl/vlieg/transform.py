@@ -98,6 +98,28 @@ sectorFromTransforms = {}
 for k, v in transformsFromSector.iteritems():
     sectorFromTransforms[v] = k
 
+# Each sector maps (alpha, delta, gamma, omega, chi, phi) to
+# sign * angle + offset, angle by angle (in degrees)
+SECTOR_SIGNS = (
+    (1, 1, 1, 1, 1, 1),
+    (1, 1, 1, 1, -1, 1),
+    (1, -1, 1, -1, 1, 1),
+    (1, -1, 1, -1, -1, 1),
+    (1, 1, 1, -1, -1, 1),
+    (1, 1, 1, -1, 1, 1),
+    (1, -1, 1, 1, -1, 1),
+    (1, -1, 1, 1, 1, 1))
+
+SECTOR_OFFSETS = (
+    (0., 0., 0., 0., 0., 0.),
+    (0., 0., 0., -180., 0., -180.),
+    (0., 0., 0., 0., -180., 0.),
+    (0., 0., 0., 180., 180., -180.),
+    (0., 0., 0., 0., 180., -180.),
+    (0., 0., 0., 180., -180., 0.),
+    (0., 0., 0., 0., 0., -180.),
+    (0., 0., 0., -180., 0., 0.))
+
 
 class VliegPositionTransformer(object):
 
@@ -106,6 +128,7 @@ class VliegPositionTransformer(object):
         self._hardware = hardware
         self._solution_transformer = solution_transformer
         solution_transformer.limitCheckerFunction = self.is_position_within_limits
+        solution_transformer.candidateCheckerFunction = self.check_candidates
 
     def transform(self, pos):
         # 1. Choose the correct sector/transforms
@@ -117,6 +140,20 @@ class VliegPositionTransformer(object):
         angleTuple = self._hardware.cut_angles(angleTuple)
         return self._hardware.is_position_within_limits(angleTuple)
 
+    def check_candidates(self, positions):
+        '''Return (withinLimits, moves) lists for a list of Position objects in
+        degrees. Each move is the largest single axis move from the current
+        hardware position.
+        '''
+        angleTuples = [self._hardware.cut_angles(
+            self._geometry.internal_position_to_physical_angles(position))
+                       for position in positions]
+        withinLimits = self._hardware.are_positions_within_limits(angleTuples)
+        current = self._hardware.get_position()
+        moves = [max([abs(a - c) for a, c in zip(angles, current)])
+                 for angles in angleTuples]
+        return withinLimits, moves
+
 
 class VliegTransformSelector(object):
     '''All returned angles are between -180. and 180. -180.<=angle<180.
@@ -128,6 +165,7 @@ class VliegTransformSelector(object):
         self.autotransforms = []
         self.autosectors = []
         self.limitCheckerFunction = None  # inject
+        self.candidateCheckerFunction = None  # inject (optional)
         self.sector = None
         self.setSector(0)
 
@@ -223,14 +261,16 @@ class VliegTransformSelector(object):
         self.autosectors = list(sectorList)
 
     def transformPosition(self, pos):
-        pos = self.transformNWithoutCut(self.sector, pos)
-        cutpos = self.cutPosition(pos)
+        '''Transform pos, a sector 0 solution, into the selected sector, or
+        into the auto sector closest to the current position if the selected
+        one is not within limits'''
+        cutpos = self.cutPosition(self.transformNWithoutCut(self.sector, pos))
         # -180 <= cutpos < 180, NOT the externally applied cuts
         if len(self.autosectors) > 0:
             if self.is_position_within_limits(cutpos):
                 return cutpos
             else:
-                return self.autoTransformPositionBySector(cutpos)
+                return self.autoTransformPositionBySector(pos)
         if len(self.autotransforms) > 0:
             if self.is_position_within_limits(cutpos):
                 return cutpos
@@ -240,83 +280,71 @@ class VliegTransformSelector(object):
         return cutpos
 
     def transformNWithoutCut(self, n, pos):
-
-        if n == 0:
-            return P(pos.alpha, pos.delta, pos.gamma,
-                     pos.omega, pos.chi, pos.phi)
-        if n == 1:
-            return P(pos.alpha, pos.delta, pos.gamma,
-                     pos.omega - 180., -pos.chi, pos.phi - 180.)
-        if n == 2:
-            return P(pos.alpha, -pos.delta, pos.gamma,
-                     -pos.omega, pos.chi - 180., pos.phi)
-        if n == 3:
-            return P(pos.alpha, -pos.delta, pos.gamma,
-                     180. - pos.omega, 180. - pos.chi, pos.phi - 180.)
-        if n == 4:
-            return P(pos.alpha, pos.delta, pos.gamma,
-                     -pos.omega, 180. - pos.chi, pos.phi - 180.)
-        if n == 5:
-            return P(pos.alpha, pos.delta, pos.gamma,
-                     180. - pos.omega, pos.chi - 180., pos.phi)
-        if n == 6:
-            return P(pos.alpha, -pos.delta, pos.gamma,
-                     pos.omega, -pos.chi, pos.phi - 180.)
-        if n == 7:
-            return P(pos.alpha, -pos.delta, pos.gamma,
-                     pos.omega - 180., pos.chi, pos.phi)
-        else:
+        if not 0 <= n <= 7:
             raise Exception("sector must be between 0 and 7")
+        return P(*[None if a is None else s * a + o for a, s, o in
+                   zip(pos.totuple(), SECTOR_SIGNS[n], SECTOR_OFFSETS[n])])
+
+    def transformSectorsWithCut(self, sectors, pos):
+        '''Return pos transformed into each of sectors and cut'''
+        angles = pos.totuple()
+        cut = self._cutAngle
+        return [P(*[None if a is None else cut(s * a + o) for a, s, o in
+                    zip(angles, SECTOR_SIGNS[n], SECTOR_OFFSETS[n])])
+                for n in sectors]
 
 ### autosector
 
     def hasAutoSectorsOrTransformsToApply(self):
         return len(self.autosectors) > 0 or len(self.autotransforms) > 0
 
+    def _chooseSector(self, sectors, pos):
+        '''Return (indices of sectors within limits, index of the one with the
+        smallest move, list of cut positions) for sector 0 position pos'''
+        positions = self.transformSectorsWithCut(sectors, pos)
+        withinLimits, moves = self.check_candidates(positions)
+        okay = [i for i in range(len(sectors)) if withinLimits[i]]
+        if len(okay) == 0:
+            return okay, None, positions
+        best = min(okay, key=lambda i: moves[i])  # first on a tie
+        return okay, best, positions
+
     def autoTransformPositionBySector(self, pos):
-        okaysectors = []
-        okaypositions = []
-        for sector in self.autosectors:
-            newpos = self.transformNWithoutCut(sector, pos)
-            if self.is_position_within_limits(newpos):
-                okaysectors.append(sector)
-                okaypositions.append(newpos)
-        if len(okaysectors) == 0:
+        sectors = self.autosectors
+        okay, best, positions = self._chooseSector(sectors, pos)
+        if best is None:
             raise Exception(
                 "Autosector could not find a sector (from %s) to move %s into "
                 "limits." % (self.autosectors, str(pos)))
-        if len(okaysectors) > 1:
+        if len(okay) > 1:
             print ("WARNING: Autosector found multiple sectors that would "
-                   "move %s to move into limits: %s" % (str(pos), okaysectors))
+                   "move %s to move into limits: %s (choosing the smallest "
+                   "move)" % (str(pos), [sectors[i] for i in okay]))
 
         print ("INFO: Autosector changed sector from %i to %i" %
-               (self.sector, okaysectors[0]))
-        self.sector = okaysectors[0]
-        return okaypositions[0]
+               (self.sector, sectors[best]))
+        self.sector = sectors[best]
+        return positions[best]
 
     def autoTransformPositionByTransforms(self, pos):
         possibleTransforms = self.createListOfPossibleTransforms()
-        okaytransforms = []
-        okaypositions = []
-        for transforms in possibleTransforms:
-            sector = sectorFromTransforms[tuple(transforms)]
-            newpos = self.cutPosition(self.transformNWithoutCut(sector, pos))
-            if self.is_position_within_limits(newpos):
-                okaytransforms.append(transforms)
-                okaypositions.append(newpos)
-        if len(okaytransforms) == 0:
+        sectors = [sectorFromTransforms[tuple(transforms)]
+                   for transforms in possibleTransforms]
+        okay, best, positions = self._chooseSector(sectors, pos)
+        if best is None:
             raise Exception(
                 "Autosector could not find a sector (from %r) to move %r into "
                 "limits." % (self.autosectors, pos))
-        if len(okaytransforms) > 1:
+        if len(okay) > 1:
             print ("WARNING: Autosector found multiple sectors that would "
-                   "move %s to move into limits: %s" %
-                   (repr(pos), repr(okaytransforms)))
+                   "move %s to move into limits: %s (choosing the smallest "
+                   "move)" %
+                   (repr(pos), repr([possibleTransforms[i] for i in okay])))
 
         print ("INFO: Autosector changed selected transforms from %r to %r" %
-               (self.transforms, okaytransforms[0]))
-        self.setTransforms(okaytransforms[0])
-        return okaypositions[0]
+               (self.transforms, possibleTransforms[best]))
+        self.setTransforms(possibleTransforms[best])
+        return positions[best]
 
     def createListOfPossibleTransforms(self):
         def vary(possibleTransforms, name):
@@ -334,10 +362,7 @@ class VliegTransformSelector(object):
                 result.append(toadd)
             return result
         # start with the currently selected list of transforms
-        if len(self.transforms) == 0:
-            possibleTransforms = [()]
-        else:
-            possibleTransforms = copy(self.transforms)
+        possibleTransforms = [tuple(self.transforms)]
 
         for name in self.autotransforms:
             possibleTransforms = vary(possibleTransforms, name)
@@ -348,6 +373,15 @@ class VliegTransformSelector(object):
         '''where pos os a poistion object in degrees'''
         return self.limitCheckerFunction(pos)
 
+    def check_candidates(self, positions):
+        '''Return (withinLimits, moves) lists for positions in degrees. Without
+        a candidateCheckerFunction every move is 0, so the first candidate
+        within limits is chosen.'''
+        if self.candidateCheckerFunction is not None:
+            return self.candidateCheckerFunction(positions)
+        return ([self.is_position_within_limits(pos) for pos in positions],
+                [0.] * len(positions))
+
     def __repr__(self):
         def createPrefix(transform):
             if transform in self.transforms:
@@ -375,17 +409,16 @@ class VliegTransformSelector(object):
     def cutPosition(self, position):
         '''Cuts angles at -180.; moves each argument between -180. and 180.
         '''
-        def cut(a):
-            if a is None:
-                return None
-            else:
-                if a < (-180. - SMALL):
-                    return a + 360.
-                if a > (180. + SMALL):
-                    return a - 360.
-            return a
-        return P(cut(position.alpha), cut(position.delta), cut(position.gamma),
-                 cut(position.omega), cut(position.chi), cut(position.phi))
+        cut = self._cutAngle
+        return P(*[None if a is None else cut(a) for a in position.totuple()])
+
+    @staticmethod
+    def _cutAngle(a):
+        if a < (-180. - SMALL):
+            return a + 360.
+        if a > (180. + SMALL):
+            return a - 360.
+        return a
 
 
 def getNameFromScannableOrString(o):
@@ -0,0 +1,159 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Vectorized calculations for the Willmott engine. Requires numpy.
+
+The betain, betaout and bin_eq_bout modes are solved for all points at once,
+following the same steps as WillmottHorizontalCalculator._hklToAngles. Points
+that cannot be solved are marked with a reason code rather than raising an
+exception.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.hkl import batch
+from diffcalc.hkl.batch import HklBatchResult, x_rotations, z_rotations, \
+    transposed, matmul, matvec, bound, as_hkl_array, as_wavelength_array
+
+TORAD = pi / 180
+TODEG = 180 / pi
+SMALL = 1e-10
+
+VIRTUAL_ANGLE_NAMES = ('betain', 'betaout')
+
+
+def angles_to_hkl_phi(delta, gamma, omegah, phi):
+    """Calculate N*3 array of hkl in phi frame in units of 2*pi/lambda
+    """
+    GAMMA_DELTA = matmul(z_rotations(gamma), x_rotations(delta))
+    H_lab = GAMMA_DELTA[..., 1] - [0, 1, 0]                              # (43)
+    OMEGAH_PHI = matmul(x_rotations(omegah), z_rotations(phi))
+    return matvec(transposed(OMEGAH_PHI), H_lab)                         # (44)
+
+
+def angles_to_hkl(positions, wavelength, UB):
+    """Calculate N*3 array of hkl in reprical lattice space from N*4 array of
+    delta, gamma, omegah and phi in radians and one or N wavelengths
+    """
+    delta, gamma, omegah, phi = np.asarray(positions, dtype=float).T
+    k = 2 * pi / np.asarray(wavelength, dtype=float)
+    H_phi = angles_to_hkl_phi(delta, gamma, omegah, phi) * k[..., np.newaxis]
+    return np.dot(H_phi, np.linalg.inv(np.asarray(UB, dtype=float)).T)  # (5)
+
+
+class WillmottBatchSolver(object):
+    """Solve many reflections at once for a WillmottHorizontalCalculator"""
+
+    def __init__(self, calc):
+        self._calc = calc
+
+    def hkl_to_angles(self, hkl, wavelength):
+        """Return HklBatchResult with positions (delta, gamma, omegah, phi)
+        and virtual angles in degrees for an N*3 array of hkl and one or N
+        wavelengths in Angstroms.
+        """
+        from diffcalc.hkl.willmott import calc as willmott_calc
+        hkl = as_hkl_array(hkl)
+        wavelength = as_wavelength_array(wavelength, len(hkl))
+        ref_name, ref_value = self._calc._reference()
+        UB = np.array(self._calc._UB, dtype=float)
+
+        # Points that cannot be solved carry NaNs through the calculation and
+        # are marked with reason codes as they are found
+        n = len(hkl)
+        reasons = np.zeros(n, dtype=np.uint8)
+        messages = {}
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # units: 2*pi/wavelength
+            H_phi = np.dot(hkl, UB.T) / (2 * pi / wavelength)[:, np.newaxis]
+            h_phi, k_phi, l_phi = H_phi.T                                # (5)
+            fail(np.sum(H_phi ** 2, axis=-1) < SMALL, batch.Q_ZERO)
+
+            ### determine betain (omegah) and betaout ###
+            if ref_name == 'betain':
+                sin_other = l_phi - np.sin(ref_value)
+                betain = np.full(n, ref_value)
+                betaout = np.arcsin(bound(sin_other))                    # (53)
+            elif ref_name == 'betaout':
+                sin_other = l_phi - np.sin(ref_value)
+                betaout = np.full(n, ref_value)
+                betain = np.arcsin(bound(sin_other))                     # (54)
+            else:
+                sin_other = l_phi / 2
+                betain = betaout = np.arcsin(bound(sin_other))           # (55)
+            fail(abs(sin_other) > 1 + SMALL, batch.REFERENCE_UNREACHABLE)
+
+            unsolved = reasons != batch.OK
+            for i in np.flatnonzero((abs(betain) < SMALL) & ~unsolved):
+                messages[int(i)] = ('required betain was 0 degrees (requested '
+                                    'q is perpendicular to surface normal)')
+            for i in np.flatnonzero((betain < -SMALL) & ~unsolved):
+                messages[int(i)] = "betain was -ve (%.4f)" % betain[i]
+            fail((abs(betain) < SMALL) | (betain < -SMALL),
+                 batch.REFERENCE_UNREACHABLE)
+            omegah = betain                                              # (52)
+
+            ### determine H_lab (X, Y and Z) ###
+            Y = -(h_phi ** 2 + k_phi ** 2 + l_phi ** 2) / 2              # (45)
+            Z = (np.sin(betaout) + np.sin(betain) * (Y + 1)) / np.cos(omegah)
+            X_squared = (h_phi ** 2 + k_phi ** 2 -
+                         (np.cos(betain) * Y + np.sin(betain) * Z) ** 2)  # (48)
+            fail(X_squared < -SMALL, batch.NO_DETECTOR_SOLUTION)
+            X = np.sqrt(np.maximum(X_squared, 0))
+            if willmott_calc.CHOOSE_POSITIVE_GAMMA:
+                X = -X
+
+            ### determine diffractometer angles ###
+            gamma = np.arctan2(-X, Y + 1)                                # (49)
+            # degenerate case, only occurs when q || z
+            delta = np.where(abs(gamma) < SMALL, 2 * omegah,
+                             np.arctan2(Z * np.sin(gamma), -X))          # (50)
+            M = np.cos(betain) * Y + np.sin(betain) * Z
+            phi = np.arctan2(h_phi * M - k_phi * X,
+                             h_phi * X + k_phi * M)                      # (51)
+
+            positions = np.stack((delta, gamma, omegah, phi), axis=-1)
+            return self._verified_result(
+                hkl, wavelength, UB, positions,
+                {'betain': betain, 'betaout': betaout}, reasons, messages)
+
+    def _verified_result(self, hkl, wavelength, UB, positions, calculated,
+                         reasons, messages):
+        """Check that positions (in radians) map back to hkl and return an
+        HklBatchResult in degrees"""
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        fail(np.any(np.isnan(positions), axis=-1), batch.UNSOLVED)
+        positions[reasons != batch.OK] = np.nan
+
+        readback = angles_to_hkl(positions, wavelength, UB)
+        fail(np.any(abs(readback - hkl) > .001, axis=-1),
+             batch.VERIFICATION_FAILED)
+
+        unsolved = reasons != batch.OK
+        positions[unsolved] = np.nan
+        angles = dict((name, np.where(unsolved, np.nan, value * TODEG))
+                      for name, value in calculated.items())
+        return HklBatchResult(positions * TODEG, angles, reasons, messages)
@@ -26,6 +26,7 @@ except ImportError:
 from diffcalc.log import logging
 from diffcalc.util import bound, AbstractPosition, DiffcalcException,\
     x_rotation, z_rotation
+from diffcalc import kernel, profiling
 from diffcalc.hkl.vlieg.geometry import VliegGeometry
 from diffcalc.ub.calc import PaperSpecificUbCalcStrategy
 from diffcalc.hkl.calcbase import HklCalculatorBase
@@ -67,22 +68,38 @@ def calc_PHI(phi):
 def angles_to_hkl_phi(delta, gamma, omegah, phi):
     """Calculate hkl matrix in phi frame in units of 2*pi/lambda
     """
-    DELTA, GAMMA, OMEGAH, PHI = create_matrices(delta, gamma, omegah, phi)
-    H_lab = (GAMMA * DELTA - I) * matrix([[0], [1], [0]])                # (43)
-    H_phi = PHI.I * OMEGAH.I * H_lab                                     # (44)
-    return H_phi
+    return kernel.to_column(_hkl_phi(delta, gamma, omegah, phi))
+
+
+def _hkl_phi(delta, gamma, omegah, phi):
+    """Calculate hkl vector (tuple) in phi frame in units of 2*pi/lambda
+    """
+    GAMMA_DELTA = kernel.mmul(kernel.z_rotation(gamma),
+                              kernel.x_rotation(delta))
+    H_lab = kernel.sub(kernel.column(GAMMA_DELTA, 1), kernel.Y)         # (43)
+    H_omegah = kernel.mtvmul(kernel.x_rotation(omegah), H_lab)
+    return kernel.mtvmul(kernel.z_rotation(phi), H_omegah)              # (44)
+
+
+def _angles_to_hkl(delta, gamma, omegah, phi, wavelength, UB):
+    """Calculate hkl tuple in reprical lattice space in units of 1/Angstrom
+    """
+    H_phi = kernel.scale(_hkl_phi(delta, gamma, omegah, phi),
+                         2 * pi / wavelength)
+    return kernel.mvmul(kernel.inverse(kernel.as_matrix(UB)), H_phi)    # (5)
 
 
 def angles_to_hkl(delta, gamma, omegah, phi, wavelength, UB):
     """Calculate hkl matrix in reprical lattice space in units of 1/Angstrom
     """
-    H_phi = angles_to_hkl_phi(delta, gamma, omegah, phi) * 2 * pi / wavelength
-    hkl = UB.I * H_phi                                                    # (5)
-    return hkl
+    return kernel.to_column(
+        _angles_to_hkl(delta, gamma, omegah, phi, wavelength, UB))
 
 
 class WillmottHorizontalPosition(AbstractPosition):
 
+    __slots__ = ('delta', 'gamma', 'omegah', 'phi')
+
     def __init__(self, delta=None, gamma=None, omegah=None, phi=None):
         self.delta = delta
         self.gamma = gamma
@@ -125,6 +142,16 @@ class WillmottHorizontalGeometry(object):
     def internal_position_to_physical_angles(self, internalPosition):
         return internalPosition.totuple()
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        import numpy as np
+        angles = np.array(physicalAngles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 4), "Wrong length of input list"
+        return angles
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        import numpy as np
+        return np.array(internalAngles, dtype=float, ndmin=2)
+
     def create_position(self, delta, gamma, omegah, phi):
         return WillmottHorizontalPosition(delta, gamma, omegah, phi)
 
@@ -132,8 +159,7 @@ class WillmottHorizontalGeometry(object):
 class WillmottHorizontalUbCalcStrategy(PaperSpecificUbCalcStrategy):
 
     def calculate_q_phi(self, pos):
-        H_phi = angles_to_hkl_phi(*pos.totuple())
-        return matrix(H_phi.tolist())
+        return angles_to_hkl_phi(*pos.totuple())
 
 
 class DummyConstraints(object):
@@ -166,6 +192,10 @@ class ConstraintAdapter(object):
     def update_tracked(self):
         pass
 
+    @property
+    def revision(self):
+        return self._constraints.revision
+
 
 class WillmottHorizontalCalculator(HklCalculatorBase):
 
@@ -195,9 +225,42 @@ class WillmottHorizontalCalculator(HklCalculatorBase):
         """
         Calculate miller indices from position in radians.
         """
-        hkl_matrix = angles_to_hkl(pos.delta, pos.gamma, pos.omegah, pos.phi,
-                             wavelength, self._UB)
-        return hkl_matrix[0, 0], hkl_matrix[1, 0], hkl_matrix[2, 0],
+        return _angles_to_hkl(pos.delta, pos.gamma, pos.omegah, pos.phi,
+                              wavelength, self._UB)
+
+    _batch_axes_count = 4
+
+    def _angles_to_hkl_batch(self, positions, wavelength):
+        from diffcalc.hkl.willmott.batch import angles_to_hkl
+        return angles_to_hkl(positions, wavelength, self._UB)
+
+    def hkl_to_angles_batch(self, hkl, wavelength):
+        """
+        Return HklBatchResult with positions and virtual angles in degrees for
+        an N*3 array of hkl values and a wavelength (or N wavelengths) in
+        Angstroms.
+
+        Points which cannot be reached (including those requiring a zero or
+        negative betain) are marked with a reason code in the result rather
+        than raising an exception. Requires numpy.
+        """
+        from diffcalc.hkl.willmott.batch import WillmottBatchSolver
+        self.parameter_manager.update_tracked()
+        return WillmottBatchSolver(self).hkl_to_angles(hkl, wavelength)
+
+    def _reference(self):
+        """
+        Return the constrained reference name and its value in radians (or
+        None for 'bin_eq_bout').
+        """
+        if not self.constraints.reference:
+            raise ValueError("No reference constraint has been constrained.")
+        ref_name, ref_value = self.constraints.reference.items()[0]
+        if ref_name not in ('betain', 'betaout', 'bin_eq_bout'):
+            raise ValueError("Unexpected constraint name'%s'." % ref_name)
+        if ref_value is not None:
+            ref_value *= TORAD
+        return ref_name, ref_value
 
     def _anglesToVirtualAngles(self, pos, wavelength):
         """
@@ -234,22 +297,16 @@ class WillmottHorizontalCalculator(HklCalculatorBase):
 
         ### determine betain (omegah) and betaout ###
 
-        if not self.constraints.reference:
-            raise ValueError("No reference constraint has been constrained.")
-
-        ref_name, ref_value = self.constraints.reference.items()[0]
-        if ref_value is not None:
-            ref_value *= TORAD
+        t = profiling.start()
+        ref_name, ref_value = self._reference()
         if ref_name == 'betain':
             betain = ref_value
             betaout = asin(bound(l_phi - sin(betain)))                   # (53)
         elif ref_name == 'betaout':
             betaout = ref_value
             betain = asin(bound(l_phi - sin(betaout)))                   # (54)
-        elif ref_name == 'bin_eq_bout':
-            betain = betaout = asin(bound(l_phi / 2))                    # (55)
         else:
-            raise ValueError("Unexpected constraint name'%s'." % ref_name)
+            betain = betaout = asin(bound(l_phi / 2))                    # (55)
 
         if abs(betain) < SMALL:
             raise DiffcalcException('required betain was 0 degrees (requested '
@@ -259,9 +316,11 @@ class WillmottHorizontalCalculator(HklCalculatorBase):
 #        logger.info('betain = %.4f, betaout = %.4f',
 #                    betain * TODEG, betaout * TODEG)
         omegah = betain                                                  # (52)
+        profiling.stop('willmott.reference', t)
 
         ### determine H_lab (X, Y and Z) ###
 
+        t = profiling.start()
         Y = -(h_phi ** 2 + k_phi ** 2 + l_phi ** 2) / 2                  # (45)
 
         Z = (sin(betaout) + sin(betain) * (Y + 1)) / cos(omegah)         # (47)
@@ -284,9 +343,13 @@ class WillmottHorizontalCalculator(HklCalculatorBase):
             delta = 2 * omegah
         else:
             delta = atan2(Z * sin(gamma), -X)                            # (50)
+        profiling.stop('willmott.detector', t)
+
+        t = profiling.start()
         M = cos(betain) * Y + sin(betain) * Z
         phi = atan2(h_phi * M - k_phi * X, h_phi * X + k_phi * M)        # (51)
 
         pos = WillmottHorizontalPosition(delta, gamma, omegah, phi)
+        profiling.stop('willmott.sample', t)
         virtual_angles = {'betain': betain, 'betaout': betaout}
         return pos, virtual_angles
@@ -36,6 +36,7 @@ class WillmottConstraintManager(object):
 
     def __init__(self):
         self._constrained = {'bin_eq_bout': None}
+        self.revision = 0  # bumped whenever the constraints change
 
     @property
     def available_constraint_names(self):
@@ -113,6 +114,7 @@ class WillmottConstraintManager(object):
         if name in self.all:
             return "%s is already constrained." % name.capitalize()
         elif name in ref_constraints:
+            self.revision += 1
             return self._constrain_reference(name)
         else:
             raise DiffcalcException('%s is not a valid constraint name')
@@ -129,6 +131,7 @@ class WillmottConstraintManager(object):
     def unconstrain(self, name):
         if name in self._constrained:
             del self._constrained[name]
+            self.revision += 1
         else:
             return "%s was not already constrained." % name.capitalize()
 
@@ -152,5 +155,6 @@ class WillmottConstraintManager(object):
         old_value = self.all[name]
         old = str(old_value) if old_value is not None else '---'
         self._constrained[name] = float(value)
+        self.revision += 1
         new = str(value)
         return "%(name)s : %(old)s --> %(new)s" % locals()
@@ -0,0 +1,567 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Vectorized hkl to angles calculations for the You engine.
+
+The modes with one sample constraint (plus one detector or naz constraint and
+one reference constraint) are solved for all points at once, following the
+same steps as YouHklCalculator._hklToAngles. Points that cannot be solved are
+marked with a reason code rather than raising an exception. Other modes are
+solved point by point with the scalar calculator.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.hkl import batch
+from diffcalc.hkl.batch import HklBatchResult, x_rotations, y_rotations, \
+    z_rotations, transposed, matmul, matvec, norms, cut_at_minus_pi, \
+    axis_values_within_limits, as_hkl_array, as_wavelength_array
+from diffcalc.hkl.you.constraints import NUNAME
+from diffcalc.util import DiffcalcException
+
+SMALL = 1e-8
+TODEG = 180 / pi
+TORAD = pi / 180
+
+AXES = ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi')
+VIRTUAL_ANGLE_NAMES = ('theta', 'qaz', 'alpha', 'naz', 'tau', 'psi', 'beta')
+
+# Why psi could not be calculated for a position
+PSI_OK = 0
+PSI_Q_PARALLEL_TO_N = 1      # Q and the reference vector are parallel
+PSI_Q_PARALLEL_TO_BEAM = 2   # Q and the beam do not form a reference plane
+
+
+def is_small(x):
+    return abs(x) < SMALL
+
+
+def ne(a, b):
+    return is_small(a - b)
+
+
+def _angle_between(a, b):
+    cos_angle = np.einsum('...i,...i->...', a, b) / (norms(a) * norms(b))
+    return np.arccos(batch.bound(cos_angle))
+
+
+def _theta_and_qaz_from_detector_angles(delta, nu):
+    theta = np.arccos(batch.bound(np.cos(delta) * np.cos(nu))) / 2.  # (19)
+    qaz = np.arctan2(np.tan(delta), np.sin(nu))
+    return theta, qaz
+
+
+def _calc_N(Q, n):
+    """Return N*3*3 array of the N matrices described by Equation 31, and a
+    boolean array which is False where Q and n are parallel"""
+    Q = Q / norms(Q)[..., np.newaxis]
+    n = n / norms(n)[..., np.newaxis]
+    okay = ~(_angle_between(Q, n) < SMALL)
+    Qxn = np.cross(Q, n)
+    QxnxQ = np.cross(Qxn, Q)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        QxnxQ = QxnxQ / norms(QxnxQ)[..., np.newaxis]
+        Qxn = Qxn / norms(Qxn)[..., np.newaxis]
+    return np.stack((Q, QxnxQ, Qxn), axis=-1), okay
+
+
+def angles_to_hkl(positions, wavelength, UB):
+    """Return N*3 array of hkl from N*6 array of positions in radians and
+    one or N wavelengths (Equation 12 for each point)"""
+    mu, delta, nu, eta, chi, phi = np.asarray(positions, dtype=float).T
+    k = 2 * pi / np.asarray(wavelength, dtype=float)
+    NU_DELTA = matmul(x_rotations(nu), z_rotations(-delta))
+    q_lab = (NU_DELTA[..., 1] - [0, 1, 0]) * k[..., np.newaxis]         # (12)
+    Z = matmul(matmul(x_rotations(mu), z_rotations(-eta)),
+               matmul(y_rotations(chi), z_rotations(-phi)))
+    q_phi = matvec(transposed(Z), q_lab)
+    return np.dot(q_phi, np.linalg.inv(np.asarray(UB, dtype=float)).T)
+
+
+def virtual_angles(positions, n_phi):
+    """Return dictionary of N arrays of virtual angles in radians from an N*6
+    array of positions in radians.
+
+    psi is NaN where it cannot be uniquely determined.
+    """
+    return virtual_angles_and_psi_flags(positions, n_phi)[0]
+
+
+def virtual_angles_and_psi_flags(positions, n_phi):
+    """Return dictionary of N arrays of virtual angles in radians from an N*6
+    array of positions in radians, and an N array of PSI_* flags.
+
+    psi is NaN where the flag is not PSI_OK, rather than a warning being
+    printed as YouHklCalculator._anglesToVirtualAngles does.
+    """
+    mu, delta, nu, eta, chi, phi = np.asarray(positions, dtype=float).T
+    theta, qaz = _theta_and_qaz_from_detector_angles(delta, nu)       # (19)
+    Z = matmul(matmul(x_rotations(mu), z_rotations(-eta)),
+               matmul(y_rotations(chi), z_rotations(-phi)))
+    n_lab = matvec(Z, n_phi)
+    alpha = np.arcsin(batch.bound(-n_lab[..., 1]))
+    naz = np.arctan2(n_lab[..., 0], n_lab[..., 2])                    # (20)
+    cos_tau = (np.cos(alpha) * np.cos(theta) * np.cos(naz - qaz) +
+               np.sin(alpha) * np.sin(theta))
+    tau = np.arccos(batch.bound(cos_tau))                             # (23)
+    sin_beta = 2 * np.sin(theta) * np.cos(tau) - np.sin(alpha)
+    beta = np.arcsin(batch.bound(sin_beta))                           # (24)
+    sin_tau = np.sin(tau)
+    cos_theta = np.cos(theta)
+    psi_flags = np.where(sin_tau == 0, PSI_Q_PARALLEL_TO_N,
+                         np.where(cos_theta == 0, PSI_Q_PARALLEL_TO_BEAM,
+                                  PSI_OK))
+    undefined = psi_flags != PSI_OK
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_psi = ((np.cos(tau) * np.sin(theta) - np.sin(alpha)) /
+                   (sin_tau * cos_theta))
+    psi = np.where(undefined, np.nan,
+                   np.arccos(batch.bound(np.where(undefined, 0, cos_psi))))
+    return ({'theta': theta, 'qaz': qaz, 'alpha': alpha, 'naz': naz,
+             'tau': tau, 'psi': psi, 'beta': beta}, psi_flags)
+
+
+def _transformed_values(value, constrained):
+    """Return N*4 array of candidate values and N*4 boolean array marking
+    which are used, as _generate_transformed_values does for one value"""
+    n = len(value)
+    values = np.zeros((n, 4))
+    used = np.zeros((n, 4), dtype=bool)
+    if constrained:
+        values[:, 0] = value
+        used[:, 0] = True
+        return values, used
+    zero = is_small(value)
+    right = ~zero & (is_small(value - pi / 2) | is_small(value + pi / 2))
+    general = ~zero & ~right
+    values[:] = np.stack((value, -value, pi + value, pi - value), axis=-1)
+    values[zero, :2] = 0., pi
+    values[right, :2] = pi / 2, -pi / 2
+    used[:, :2] = True
+    used[general, 2:] = True
+    return values, used
+
+
+def _possible_solutions(hardware, values, names, constrained_names):
+    """Vectorized YouHklCalculator._generate_possible_solutions.
+
+    Return a N*M*len(values) array of candidate combinations and a N*M
+    boolean array marking which are valid, in the same order as the scalar
+    calculation generates them.
+    """
+    n = len(values[0])
+    combos = np.zeros((n, 1, 0))
+    valid = np.ones((n, 1), dtype=bool)
+    for value, name in zip(values, names):
+        constrained = name in constrained_names
+        candidates, used = _transformed_values(value, constrained)
+        if not constrained:
+            used &= axis_values_within_limits(hardware, name, candidates)
+        candidates = cut_at_minus_pi(candidates)
+        m = combos.shape[1]
+        combos = np.concatenate(
+            (np.repeat(combos, 4, axis=1),
+             np.tile(candidates, (1, m))[..., np.newaxis]), axis=-1)
+        valid = np.repeat(valid, 4, axis=1) & np.tile(used, (1, m))
+    return combos, valid
+
+
+def _merge_nearly_equal(values, valid, order):
+    """Vectorized merge_nearly_equal_pairs. Candidates are visited in the
+    given order and those nearly equal to one already kept are dropped."""
+    values = np.take_along_axis(values, order[..., np.newaxis], axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    kept = np.zeros_like(valid)
+    for i in range(valid.shape[1]):
+        duplicate = np.zeros(len(valid), dtype=bool)
+        for j in range(i):
+            duplicate |= kept[:, j] & np.all(
+                is_small(values[:, i] - values[:, j]), axis=-1)
+        kept[:, i] = valid[:, i] & ~duplicate
+    return values, kept
+
+
+class YouBatchSolver(object):
+    """Solve many reflections at once for a YouHklCalculator"""
+
+    def __init__(self, calc):
+        self._calc = calc
+        self._constraints = calc.constraints
+        self._hardware = calc._hardware
+
+    def hkl_to_angles(self, hkl, wavelength):
+        """Return HklBatchResult with positions and virtual angles in degrees
+        for an N*3 array of hkl and one or N wavelengths in Angstroms.
+        """
+        hkl = as_hkl_array(hkl)
+        wavelength = as_wavelength_array(wavelength, len(hkl))
+
+        plan = self._constraints.plan
+        if not plan.implemented:
+            if self._calc.numerical_fallback:
+                return self.hkl_to_angles_numerically(hkl, wavelength)
+            raise DiffcalcException(
+                "Sorry, the selected constraint combination is valid but "
+                "is not implemented. Type 'help con' for implemented "
+                "combinations")
+
+        if len(plan.samp_constraints) == 1:
+            # Points that cannot be solved carry NaNs through the calculation
+            # and are marked with reason codes as they are found
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self._solve_one_sample_constraint(hkl, wavelength)
+        return self._solve_pointwise(hkl, wavelength)
+
+    def hkl_to_angles_numerically(self, hkl, wavelength, start=None):
+        """Return HklBatchResult for an N*3 array of hkl and one or N
+        wavelengths, solving numerically from one or N start positions in
+        degrees (if given).
+        """
+        from diffcalc.hkl.you.numerical import plan_constraints
+        hkl = as_hkl_array(hkl)
+        wavelength = as_wavelength_array(wavelength, len(hkl))
+        if start is not None:
+            start = np.asarray(start, dtype=float) * TORAD
+        calc = self._calc
+        solver = calc._numerical_solver(self._constraints.plan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            positions = solver.solve(hkl, wavelength, start)
+        reasons = np.where(np.isnan(positions[:, 0]), batch.UNSOLVED,
+                           batch.OK).astype(np.uint8)
+        q_length = norms(np.dot(hkl, solver.UB.T))
+        reasons[q_length == 0] = batch.Q_ZERO
+        reasons[q_length > 2 * 2 * pi / wavelength] = batch.Q_TOO_LONG
+        phi = positions[:, 5]
+        positions[:, 5] = np.where(phi <= -pi + SMALL, phi + 2 * pi, phi)
+        angles = virtual_angles(positions, solver.n_phi)
+        for name in angles:
+            angles[name] = angles[name] * TODEG
+        return HklBatchResult(positions * TODEG, angles, reasons)
+
+    def _solve_pointwise(self, hkl, wavelength):
+        n = len(hkl)
+        positions = np.full((n, 6), np.nan)
+        angles = dict((name, np.full(n, np.nan))
+                      for name in VIRTUAL_ANGLE_NAMES)
+        reasons = np.zeros(n, dtype=np.uint8)
+        messages = {}
+        for i, ((h, k, l), wl) in enumerate(zip(hkl, wavelength)):
+            try:
+                pos, virtual_angles = self._calc.hklToAngles(h, k, l, wl)
+            except Exception, e:
+                reasons[i] = batch.UNSOLVED
+                messages[i] = str(e)
+                continue
+            positions[i] = pos.totuple()
+            for name, value in virtual_angles.items():
+                angles[name][i] = np.nan if value is None else value
+        return HklBatchResult(positions, angles, reasons, messages)
+
+    def _solve_one_sample_constraint(self, hkl, wavelength):
+        calc = self._calc
+        n = len(hkl)
+        reasons = np.zeros(n, dtype=np.uint8)
+
+        def fail(mask, reason):
+            reasons[mask & (reasons == batch.OK)] = reason
+
+        UB = np.array(calc._get_ubmatrix(), dtype=float)
+        n_phi = np.array(calc._get_n_phi(), dtype=float).ravel()
+
+        h_phi = np.dot(hkl, UB.T)
+        q_length = norms(h_phi)
+        fail(q_length == 0, batch.Q_ZERO)
+        sin_theta = q_length / (2 * 2 * pi / wavelength)
+        fail(sin_theta > 1, batch.Q_TOO_LONG)
+        theta = np.arcsin(batch.bound(sin_theta))
+        tau = _angle_between(h_phi, n_phi)
+
+        alpha = self._reference_column(theta, tau, fail)
+        qaz, naz, delta, nu = self._detector_column(theta, tau, alpha, fail)
+        mu, eta, chi, phi = self._sample_column(
+            hkl, wavelength, UB, n_phi, h_phi, theta, alpha, qaz, naz, delta,
+            nu, fail)
+
+        positions = np.stack((mu, delta, nu, eta, chi, phi), axis=-1)
+        positions[reasons != batch.OK] = np.nan
+        positions = self._tidy_degenerate_solutions(positions)
+        phi = positions[:, 5]
+        positions[:, 5] = np.where(phi <= -pi + SMALL, phi + 2 * pi, phi)
+
+        angles = virtual_angles(positions, n_phi)
+        readback = angles_to_hkl(positions, wavelength, UB)
+        fail(np.any(abs(readback - hkl) > .001, axis=-1),
+             batch.VERIFICATION_FAILED)
+
+        unsolved = reasons != batch.OK
+        positions[unsolved] = np.nan
+        for name in angles:
+            angles[name] = np.where(unsolved, np.nan, angles[name] * TODEG)
+        return HklBatchResult(positions * TODEG, angles, reasons)
+
+    def _reference_column(self, theta, tau, fail):
+        """Return alpha given one of a_eq_b, alpha, beta or psi"""
+        name, value = self._constraints.reference.items()[0]
+        fail((np.sin(tau) == 0) | (np.cos(theta) == 0),
+             batch.REFERENCE_UNREACHABLE)
+
+        if name == 'psi':                                             # (26)
+            sin_alpha = (np.cos(tau) * np.sin(theta) -
+                         np.cos(theta) * np.sin(tau) * np.cos(value))
+            sin_beta = (np.cos(tau) * np.sin(theta) +
+                        np.cos(theta) * np.sin(tau) * np.cos(value))  # (27)
+            fail((abs(sin_alpha) > 1 + SMALL) | (abs(sin_beta) > 1 + SMALL),
+                 batch.REFERENCE_UNREACHABLE)
+            alpha = np.arcsin(batch.bound(sin_alpha))
+        elif name == 'a_eq_b':
+            alpha = np.arcsin(batch.bound(np.cos(tau) * np.sin(theta)))  # (24)
+        elif name == 'alpha':
+            alpha = np.full(len(theta), value)
+            sin_beta = 2 * np.sin(theta) * np.cos(tau) - np.sin(alpha)
+            fail(abs(sin_beta) > 1, batch.REFERENCE_UNREACHABLE)
+        elif name == 'beta':
+            sin_alpha = 2 * np.sin(theta) * np.cos(tau) - np.sin(value)  # (24)
+            fail(abs(sin_alpha) > 1, batch.REFERENCE_UNREACHABLE)
+            alpha = np.arcsin(batch.bound(sin_alpha))
+
+        if name != 'psi':
+            cos_psi = ((np.cos(tau) * np.sin(theta) - np.sin(alpha)) /
+                       (np.sin(tau) * np.cos(theta)))             # (28)
+            fail(abs(cos_psi) > 1 + SMALL, batch.REFERENCE_UNREACHABLE)
+        return alpha
+
+    def _detector_column(self, theta, tau, alpha, fail):
+        """Return qaz, naz, delta and nu given a detector or naz constraint"""
+        constraints = self._constraints
+        det_constraint = constraints.detector or constraints.naz
+        name, value = det_constraint.items()[0]
+
+        # Equation 30
+        top = np.cos(tau) - np.sin(alpha) * np.sin(theta)
+        bottom = np.cos(alpha) * np.cos(theta)
+        fail(is_small(bottom) & (is_small(np.cos(alpha)) |
+                                 is_small(np.cos(theta))),
+             batch.DETECTOR_UNREACHABLE)
+        ratio = top / bottom
+        fail(~(abs(ratio) <= 1 + 1e-10), batch.DETECTOR_UNREACHABLE)
+        naz_qaz_angle = np.arccos(batch.bound(ratio))
+
+        sin_2theta = np.sin(2 * theta)
+        if name == 'naz':
+            naz = np.full(len(theta), value)
+            qaz = naz - naz_qaz_angle
+            nu = np.arctan2(sin_2theta * np.cos(qaz), np.cos(2 * theta))
+            delta = np.arctan2(np.sin(qaz) * np.sin(nu), np.cos(qaz))
+        else:
+            delta, nu, qaz = self._remaining_detector_angles(
+                name, value, theta, fail)
+            naz = qaz - naz_qaz_angle
+
+        delta, nu = self._detector_solutions(delta, nu, qaz, theta, name, fail)
+        return qaz, naz, delta, nu
+
+    def _remaining_detector_angles(self, name, value, theta, fail):
+        """Return delta, nu and qaz given one detector angle"""
+        n = len(theta)
+        sin_2theta = np.sin(2 * theta)
+        if name == 'delta':
+            delta = np.full(n, value)
+            fail(is_small(sin_2theta), batch.DETECTOR_UNREACHABLE)
+            qaz = np.arcsin(batch.bound(np.sin(delta) / sin_2theta))
+        elif name == NUNAME:
+            nu = np.full(n, value)
+            fail(is_small(sin_2theta), batch.DETECTOR_UNREACHABLE)
+            cos_qaz = np.tan(nu) / np.tan(2 * theta)
+            fail(abs(cos_qaz) > 1 + SMALL, batch.DETECTOR_UNREACHABLE)
+            qaz = np.arccos(batch.bound(cos_qaz))
+        else:
+            qaz = np.full(n, value)
+
+        if name != NUNAME:
+            nu = np.arctan2(sin_2theta * np.cos(qaz), np.cos(2 * theta))
+        if name != 'delta':
+            cos_qaz = np.cos(qaz)
+            # qaz close to 90 (a common place for it)
+            delta_near_90 = np.where(qaz > 0, 1, -1) * np.arccos(
+                batch.bound(np.cos(2 * theta) / np.cos(nu)))
+            delta = np.where(
+                is_small(cos_qaz), delta_near_90,
+                np.arctan2(np.sin(qaz) * np.sin(nu), cos_qaz))
+        return delta, nu, qaz
+
+    def _detector_solutions(self, delta, nu, qaz, theta, constraint_name,
+                            fail):
+        """Vectorized _generate_detector_solutions followed by
+        _choose_detector_solution"""
+        combos, valid = _possible_solutions(
+            self._hardware, (delta, nu), ('delta', NUNAME), (constraint_name,))
+        theta_, qaz_ = _theta_and_qaz_from_detector_angles(
+            combos[..., 0], combos[..., 1])
+        valid &= (ne(theta_, theta[:, np.newaxis]) &
+                  ne(qaz_, qaz[:, np.newaxis]))
+
+        # When delta and mu are close to 90, two solutions for mu just below
+        # and just above 90 may be found that fit theta to the specified
+        # accuracy. In this case choose only the better of the two.
+        d90 = abs(combos[..., 0] - pi / 2)
+        close = valid & (d90 < .01) & (d90 != 0)
+        prune = (np.count_nonzero(valid, axis=1) > 1) & np.any(close, axis=1)
+        th_err = np.where(close, abs(theta_ - theta[:, np.newaxis]), np.inf)
+        closest = np.argmin(th_err, axis=1)
+        is_closest = np.zeros_like(valid)
+        is_closest[np.arange(len(valid)), closest] = True
+        valid &= ~(prune[:, np.newaxis] & close & ~is_closest)
+        # The chosen pair close to 90 is moved to the end of the list
+        moved = prune[:, np.newaxis] & is_closest
+        order = np.argsort(np.where(moved, valid.shape[1], 0) +
+                           np.arange(valid.shape[1]), axis=1)
+        combos, kept = _merge_nearly_equal(combos, valid, order)
+
+        # with delta=90, nu is degenerate and is chosen as 0 if unconstrained
+        if NUNAME in self._constraints.detector:
+            at_90 = np.zeros(len(delta), dtype=bool)
+        else:
+            at_90 = ne(delta, pi / 2)
+
+        count = np.count_nonzero(kept, axis=1)
+        fail(~at_90 & (count == 0), batch.NO_DETECTOR_SOLUTION)
+        fail(~at_90 & (count > 1), batch.MULTIPLE_DETECTOR_SOLUTIONS)
+        chosen = combos[np.arange(len(kept)), np.argmax(kept, axis=1)]
+        return (np.where(at_90, delta, chosen[:, 0]),
+                np.where(at_90, 0., chosen[:, 1]))
+
+    def _sample_column(self, hkl, wavelength, UB, n_phi, h_phi, theta, alpha,
+                       qaz, naz, delta, nu, fail):
+        """Return mu, eta, chi and phi given one sample constraint"""
+        name, value = self._constraints.sample.items()[0]
+        n = len(hkl)
+
+        q_lab = np.stack((np.cos(theta) * np.sin(qaz), -np.sin(theta),
+                          np.cos(theta) * np.cos(qaz)), axis=-1)     # (18)
+        n_lab = np.stack((np.cos(alpha) * np.sin(naz), -np.sin(alpha),
+                          np.cos(alpha) * np.cos(naz)), axis=-1)     # (20)
+        N_lab, okay_lab = _calc_N(q_lab, n_lab)
+        N_phi, okay_phi = _calc_N(h_phi, np.tile(n_phi, (n, 1)))
+        fail(~okay_lab | ~okay_phi, batch.SAMPLE_UNREACHABLE)
+        constant = np.full(n, value)
+
+        if name == 'mu':                                          # (35)
+            mu = constant
+            V = matmul(matmul(transposed(x_rotations(mu)), N_lab),
+                       transposed(N_phi))
+            phi = np.arctan2(V[:, 2, 1], V[:, 2, 0])
+            eta = np.arctan2(-V[:, 1, 2], V[:, 0, 2])
+            chi = np.arctan2(np.hypot(V[:, 2, 0], V[:, 2, 1]), V[:, 2, 2])
+            # chi ~= 0 or 180 and therefor phi || eta: choose eta=0
+            degenerate = is_small(np.sin(chi))
+            eta = np.where(degenerate, 0., eta)
+            phi = np.where(degenerate,
+                           np.arctan2(V[:, 0, 1], V[:, 0, 0]), phi)
+        elif name == 'phi':                                       # (37)
+            phi = constant
+            V = matmul(matmul(N_lab, np.linalg.inv(N_phi)),
+                       transposed(z_rotations(-phi)))
+            eta = np.arctan2(V[:, 0, 1], np.hypot(V[:, 1, 1], V[:, 2, 1]))
+            mu = np.arctan2(V[:, 2, 1], V[:, 1, 1])
+            chi = np.arctan2(V[:, 0, 2], V[:, 0, 0])
+            fail(is_small(np.cos(eta)), batch.SAMPLE_UNREACHABLE)
+        elif name in ('eta', 'chi'):
+            V = matmul(N_lab, transposed(N_phi))
+            if name == 'eta':                                     # (39)
+                eta = constant
+                sin_chi = V[:, 0, 2] / np.cos(eta)
+                fail(is_small(np.cos(eta)) | ~(abs(sin_chi) <= 1),
+                     batch.SAMPLE_UNREACHABLE)
+                chi = np.arcsin(batch.bound(sin_chi))
+            else:                                                 # (40)
+                chi = constant
+                cos_eta = V[:, 0, 2] / np.sin(chi)
+                fail(is_small(np.sin(chi)) | ~(abs(cos_eta) <= 1),
+                     batch.SAMPLE_UNREACHABLE)
+                eta = np.arccos(batch.bound(cos_eta))
+            top_for_mu = (V[:, 2, 2] * np.sin(eta) * np.sin(chi) +
+                          V[:, 1, 2] * np.cos(chi))
+            bot_for_mu = (-V[:, 2, 2] * np.cos(chi) +
+                          V[:, 1, 2] * np.sin(eta) * np.sin(chi))
+            mu = np.arctan2(-top_for_mu, -bot_for_mu)             # (41)
+            top_for_phi = (V[:, 0, 1] * np.cos(eta) * np.cos(chi) -
+                           V[:, 0, 0] * np.sin(eta))
+            bot_for_phi = (V[:, 0, 1] * np.sin(eta) +
+                           V[:, 0, 0] * np.cos(eta) * np.cos(chi))
+            phi = np.arctan2(top_for_phi, bot_for_phi)            # (42)
+        else:
+            raise ValueError(
+                'Given angle must be one of phi, chi, eta or mu')
+
+        return self._sample_solutions(
+            (mu, eta, chi, phi), name, delta, nu, wavelength, hkl, UB, n_phi,
+            fail)
+
+    def _sample_solutions(self, values, constraint_name, delta, nu,
+                          wavelength, hkl, UB, n_phi, fail):
+        """Vectorized _generate_sample_solutions followed by
+        _choose_sample_solution"""
+        combos, valid = _possible_solutions(
+            self._hardware, values, ('mu', 'eta', 'chi', 'phi'),
+            (constraint_name,))
+        n, m = valid.shape
+        mu, eta, chi, phi = np.rollaxis(combos, -1)
+        positions = np.stack(
+            (mu, np.repeat(delta[:, np.newaxis], m, axis=1),
+             np.repeat(nu[:, np.newaxis], m, axis=1), eta, chi, phi), axis=-1)
+        positions = positions.reshape(n * m, 6)
+        wl = np.repeat(wavelength, m)
+        hkl_actual = angles_to_hkl(positions, wl, UB).reshape(n, m, 3)
+        valid &= np.all(is_small(hkl_actual - hkl[:, np.newaxis]),
+                        axis=-1)
+        angles = virtual_angles(positions, n_phi)
+        ref_name, ref_value = self._constraints.reference.items()[0]
+        if ref_name == 'a_eq_b':
+            valid &= ne(angles['alpha'], angles['beta']).reshape(n, m)
+        else:
+            valid &= ne(ref_value, angles[ref_name]).reshape(n, m)
+
+        fail(~np.any(valid, axis=1), batch.NO_SAMPLE_SOLUTION)
+        # choose the solution with shortest distance to all-zeros position
+        distance = np.where(valid, np.sum(abs(combos), axis=-1), np.inf)
+        chosen = combos[np.arange(n), np.argmin(distance, axis=1)]
+        return np.rollaxis(chosen, -1)
+
+    def _tidy_degenerate_solutions(self, positions):
+        constraints = self._constraints
+        mu, delta, nu, eta, chi, phi = positions.T.copy()
+        detector_like_constraint = bool(constraints.detector or
+                                        constraints.naz)
+        nu_constrained_to_0 = is_small(nu) & detector_like_constraint
+        mu_constrained_to_0 = is_small(mu) & ('mu' in constraints.sample)
+        delta_constrained_to_0 = (is_small(delta) &
+                                  detector_like_constraint)
+        eta_constrained_to_0 = is_small(eta) & ('eta' in constraints.sample)
+
+        # constrained to vertical 4-circle like mode with phi || eta
+        vertical = nu_constrained_to_0 & mu_constrained_to_0
+        fix = vertical & is_small(chi)
+        eta_diff = np.where(fix, delta / 2. - eta, 0.)
+        # constrained to horizontal 4-circle like mode with phi || mu
+        fix = (~vertical & delta_constrained_to_0 & eta_constrained_to_0 &
+               is_small(chi - pi / 2))
+        mu_diff = np.where(fix, nu / 2. - mu, 0.)
+
+        return np.stack((mu + mu_diff, delta, nu, eta + eta_diff, chi,
+                         phi - eta_diff + mu_diff), axis=-1)
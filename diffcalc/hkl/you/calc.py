@@ -20,24 +20,22 @@ from math import pi, sin, cos, tan, acos, atan2, asin, sqrt, atan
 
 try:
     from numpy import matrix
-    from numpy.linalg import norm
 except ImportError:
     from numjy import matrix
-    from numjy.linalg import norm
 
 from diffcalc.log import logging
+from diffcalc import kernel, profiling
+from diffcalc.kernel import mmul, mmul_all, mvmul, mtvmul, transpose, \
+    as_vector, as_matrix
 from diffcalc.hkl.calcbase import HklCalculatorBase
-from diffcalc.hkl.you.geometry import create_you_matrices, calcMU, calcPHI, \
-    calcCHI
+from diffcalc.hkl.you.geometry import create_you_rotations
 from diffcalc.hkl.you.geometry import YouPosition
-from diffcalc.util import DiffcalcException, bound, angle_between_vectors
-from diffcalc.util import cross3, z_rotation, x_rotation
+from diffcalc.util import DiffcalcException, bound
 from diffcalc.ub.calc import PaperSpecificUbCalcStrategy
 
 from diffcalc.hkl.you.constraints import NUNAME
 logger = logging.getLogger("diffcalc.hkl.you.calc")
 I = matrix('1 0 0; 0 1 0; 0 0 1')
-y = matrix('0; 1; 0')
 
 SMALL = 1e-8
 TORAD = pi / 180
@@ -45,6 +43,10 @@ TODEG = 180 / pi
 
 PRINT_DEGENERATE = False
 
+# When following a trajectory only sample solutions with every angle within
+# this distance of the previous solution are checked first
+SEED_WINDOW = pi / 2
+
 
 def is_small(x):
     return abs(x) < SMALL
@@ -66,7 +68,7 @@ def sign(x):
 
 
 def normalised(vector):
-    return vector * (1 / norm(vector))
+    return kernel.normalised(as_vector(vector))
 
 
 def cut_at_minus_pi(value):
@@ -77,6 +79,10 @@ def cut_at_minus_pi(value):
     return value
 
 
+def angular_distance(a, b):
+    return abs(cut_at_minus_pi(a - b))
+
+
 def merge_nearly_equal_pairs(delta_nu_pairs):
     
     def pair_nearly_in_pair_list(pair, pair_list):
@@ -93,19 +99,17 @@ def merge_nearly_equal_pairs(delta_nu_pairs):
 
 
 def _calc_N(Q, n):
-    """Return N as described by Equation 31"""
+    """Return N as described by Equation 31 (as a kernel matrix)"""
     Q = normalised(Q)
     n = normalised(n)
-    if is_small(angle_between_vectors(Q, n)):
+    if is_small(kernel.angle_between(Q, n)):
         raise ValueError('Q and n are parallel and cannot be used to create '
                          'an orthonormal matrix')
-    Qxn = cross3(Q, n)
-    QxnxQ = cross3(Qxn, Q)
-    QxnxQ = normalised(QxnxQ)
-    Qxn = normalised(Qxn)
-    return matrix([[Q[0, 0], QxnxQ[0, 0], Qxn[0, 0]],
-                   [Q[1, 0], QxnxQ[1, 0], Qxn[1, 0]],
-                   [Q[2, 0], QxnxQ[2, 0], Qxn[2, 0]]])
+    Qxn = kernel.cross(Q, n)
+    QxnxQ = kernel.cross(Qxn, Q)
+    QxnxQ = kernel.normalised(QxnxQ)
+    Qxn = kernel.normalised(Qxn)
+    return kernel.from_columns(Q, QxnxQ, Qxn)
 
 
 def _calc_angle_between_naz_and_qaz(theta, alpha, tau):
@@ -124,13 +128,21 @@ def youAnglesToHkl(pos, wavelength, UBmatrix):
     """Calculate miller indices from position in radians.
     """
 
-    [MU, DELTA, NU, ETA, CHI, PHI] = create_you_matrices(*pos.totuple())
+    return kernel.mvmul(kernel.inverse(as_matrix(UBmatrix)),
+                        _q_phi(pos, 2 * pi / wavelength))
+
 
-    q_lab = (NU * DELTA - I) * matrix([[0], [2 * pi / wavelength], [0]])   # 12
+def _q_phi(pos, wavevector=1):
+    """Return the momentum transfer vector in the phi frame"""
+    [MU, DELTA, NU, ETA, CHI, PHI] = create_you_rotations(*pos.totuple())
 
-    hkl = UBmatrix.I * PHI.I * CHI.I * ETA.I * MU.I * q_lab
+    # Equation 12: Compute the momentum transfer vector in the lab  frame
+    q_lab = kernel.sub(kernel.column(mmul(NU, DELTA), 1), kernel.Y)
+    q_lab = kernel.scale(q_lab, wavevector)
 
-    return hkl[0, 0], hkl[1, 0], hkl[2, 0]
+    # Transform this into the phi frame (the rotations' inverses are their
+    # transposes)
+    return mtvmul(PHI, mtvmul(CHI, mtvmul(ETA, mtvmul(MU, q_lab))))
 
 
 def _tidy_degenerate_solutions(pos, constraints):
@@ -209,11 +221,7 @@ class YouUbCalcStrategy(PaperSpecificUbCalcStrategy):
 
     def calculate_q_phi(self, pos):
 
-        [MU, DELTA, NU, ETA, CHI, PHI] = create_you_matrices(*pos.totuple())
-        # Equation 12: Compute the momentum transfer vector in the lab  frame
-        q_lab = (NU * DELTA - I) * y
-        # Transform this into the phi frame.
-        return PHI.I * CHI.I * ETA.I * MU.I * q_lab
+        return kernel.to_column(_q_phi(pos))
 
 
 UNREACHABLE_MSG = (
@@ -230,12 +238,20 @@ class YouHklCalculator(HklCalculatorBase):
         self._hardware = hardware  # for checking limits only
         self.constraints = constraints
         self.parameter_manager = constraints  # TODO: remove need for this attr
+        self._seed = None  # previous (mu, eta, chi, phi) in radians
+        self.numerical_fallback = False
+
+    def set_numerical_fallback(self, enabled):
+        """Solve constraint combinations with no analytic solution numerically
+        (see diffcalc.hkl.you.numerical). Requires numpy."""
+        self.numerical_fallback = bool(enabled)
+        self.clear_solution_cache()
 
     def __str__(self):
         return self.constraints.__str__()
 
     def _get_n_phi(self):
-        return self._ubcalc.reference.n_phi
+        return as_vector(self._ubcalc.reference.n_phi)
     
     def _get_ubmatrix(self):
         return self._getUBMatrix()  # for consistency
@@ -248,6 +264,31 @@ class YouHklCalculator(HklCalculatorBase):
         """
         return youAnglesToHkl(pos, wavelength, self._get_ubmatrix())
 
+    def _angles_to_hkl_batch(self, positions, wavelength):
+        from diffcalc.hkl.you.batch import angles_to_hkl
+        return angles_to_hkl(positions, wavelength, self._get_ubmatrix())
+
+    def angles_to_virtual_angles_batch(self, positions):
+        """
+        Return a dictionary of N arrays of virtual angles in degrees, and an N
+        array of batch.PSI_* flags, from an N*6 array of positions in degrees.
+
+        The reference vector is calculated once for all positions. Where psi
+        is undefined it is NaN and its flag says why, rather than a warning
+        being printed. The virtual angles do not depend on wavelength. Requires
+        numpy.
+        """
+        import numpy as np
+        from diffcalc.hkl.batch import as_position_array
+        from diffcalc.hkl.you.batch import virtual_angles_and_psi_flags
+        positions = as_position_array(positions, self._batch_axes_count)
+        n_phi = np.array(self._get_n_phi(), dtype=float).ravel()
+        angles, psi_flags = virtual_angles_and_psi_flags(positions * TORAD,
+                                                         n_phi)
+        for name in angles:
+            angles[name] = angles[name] * TODEG
+        return angles, psi_flags
+
     def _anglesToVirtualAngles(self, pos, _wavelength):
         """Calculate pseudo-angles in radians from position in radians.
 
@@ -260,12 +301,12 @@ class YouHklCalculator(HklCalculatorBase):
 
         theta, qaz = _theta_and_qaz_from_detector_angles(delta, nu)      # (19)
 
-        [MU, _, _, ETA, CHI, PHI] = create_you_matrices(mu,
+        [MU, _, _, ETA, CHI, PHI] = create_you_rotations(mu,
                                            delta, nu, eta, chi, phi)
-        Z = MU * ETA * CHI * PHI
-        n_lab = Z * self._get_n_phi()
-        alpha = asin(bound((-n_lab[1, 0])))
-        naz = atan2(n_lab[0, 0], n_lab[2, 0])                            # (20)
+        Z = mmul_all(MU, ETA, CHI, PHI)
+        n_lab = mvmul(Z, self._get_n_phi())
+        alpha = asin(bound((-n_lab[1])))
+        naz = atan2(n_lab[0], n_lab[2])                                  # (20)
 
         cos_tau = cos(alpha) * cos(theta) * cos(naz - qaz) + \
                   sin(alpha) * sin(theta)
@@ -301,21 +342,11 @@ class YouHklCalculator(HklCalculatorBase):
                 'naz': naz, 'tau': tau, 'psi': psi, 'beta': beta}
 
 
-    def hklToAngles(self, h, k, l, wavelength):
+    def _hkl_to_angles(self, h, k, l, wavelength):
         """
-        Return verified Position and all virtual angles in degrees from
-        h, k & l and wavelength in Angstroms.
-
-        The calculated Position is verified by checking that it maps back using
-        anglesToHkl() to the requested hkl value.
-
-        Those virtual angles fixed or generated while calculating the position
-        are verified by by checking that they map back using
-        anglesToVirtualAngles to the virtual angles for the given position.
-
-        Throws a DiffcalcException if either check fails and
-        raiseExceptionsIfAnglesDoNotMapBackToHkl is True, otherwise displays a
-        warning.
+        Return verified Position and all virtual angles in degrees. Only the
+        Position is verified as the virtual angles returned are already those
+        read back from it.
         """
 
         pos_virtual_angles_pairs = self._hklToAngles(h, k, l, wavelength)  # in rad
@@ -328,7 +359,10 @@ class YouHklCalculator(HklCalculatorBase):
             if val is not None:
                 virtual_angles[key] = val * TODEG
 
-        self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
+        if self._should_verify():
+            t = profiling.start()
+            self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
+            profiling.stop('verify.hkl', t)
 
         return pos, virtual_angles
 
@@ -348,6 +382,90 @@ class YouHklCalculator(HklCalculatorBase):
             self._verify_pos_map_to_hkl(h, k, l, wavelength, pos)
             pos_virtual_angles_pairs_in_degrees.append((pos, virtual_angles))
         return pos_virtual_angles_pairs_in_degrees
+
+    def hkl_to_all_angles_grid(self, hkl_list, wavelength, workers=None,
+                               chunk_size=None):
+        """
+        Yield (hkl, solutions, message) for each reflection in hkl_list, in
+        order, where solutions is as returned by hkl_to_all_angles and
+        message describes why a reflection could not be solved.
+
+        The reflections are solved in chunks of chunk_size (grid.CHUNK_SIZE
+        by default) by a pool of worker processes (one per cpu by default,
+        or in this process if workers is 0), each working from a snapshot of
+        the current UB matrix, constraints, limits and cuts.
+        """
+        from diffcalc.hkl.you import grid
+        if chunk_size is None:
+            chunk_size = grid.CHUNK_SIZE
+        return grid.iter_all_angles(self, hkl_list, wavelength, workers,
+                                    chunk_size)
+
+    def hkl_to_angles_near(self, h, k, l, wavelength, previous,
+                           max_jump=None):
+        """
+        Return verified Position and all virtual angles in degrees choosing
+        the sample solution closest to the previous Position (in degrees)
+        rather than the one closest to all zeros.
+
+        If max_jump (in degrees) is given, a DiffcalcException is raised if
+        any axis would have to move further than this from previous.
+        """
+        self.parameter_manager.update_tracked()
+        seed = previous.inRadians()
+        self._seed = (seed.mu, seed.eta, seed.chi, seed.phi)
+        try:
+            # bypass the solution cache as the seed is not part of its key
+            pos, virtual_angles = self._hkl_to_angles(h, k, l, wavelength)
+        finally:
+            self._seed = None
+        if max_jump is not None:
+            names = ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi')
+            for name, new, old in zip(names, pos.totuple(),
+                                      previous.totuple()):
+                if angular_distance(new * TORAD, old * TORAD) > \
+                        max_jump * TORAD + SMALL:
+                    raise DiffcalcException(
+                        "Following the previous solution to hkl=(%f,%f,%f) "
+                        "would move %s by more than %.3f degrees "
+                        "(%.3f --> %.3f)" % (h, k, l, name, max_jump, old,
+                                             new))
+        return pos, virtual_angles
+
+    def hkl_to_angles_trajectory(self, hkl_list, wavelength, start=None,
+                                 max_jump=90.):
+        """
+        Return a list of verified (Position, virtual angles) pairs in degrees
+        for an ordered sequence of hkl values. Each point is seeded from the
+        solution to the one before so that the sample stays on one solution
+        branch. The first point is seeded from the start Position if given.
+
+        A DiffcalcException is raised if any axis would have to move by more
+        than max_jump degrees between neighbouring points (None to allow any).
+        """
+        solutions = []
+        previous = start
+        for h, k, l in hkl_list:
+            if previous is None:
+                pos, virtual_angles = self.hklToAngles(h, k, l, wavelength)
+            else:
+                pos, virtual_angles = self.hkl_to_angles_near(
+                    h, k, l, wavelength, previous, max_jump)
+            solutions.append((pos, virtual_angles))
+            previous = pos
+        return solutions
+
+    def hkl_to_angles_batch(self, hkl, wavelength):
+        """
+        Return HklBatchResult with positions and virtual angles in degrees for
+        an N*3 array of hkl values and a wavelength (or N wavelengths) in
+        Angstroms.
+
+        Points which cannot be reached are marked with a reason code in the
+        result rather than raising an exception. Requires numpy.
+        """
+        from diffcalc.hkl.you.batch import YouBatchSolver
+        return YouBatchSolver(self).hkl_to_angles(hkl, wavelength)
         
 
     def _hklToAngles(self, h, k, l, wavelength, return_all_solutions=False):
@@ -356,68 +474,41 @@ class YouHklCalculator(HklCalculatorBase):
         modes may not calculate all virtual angles.
         """
 
-        if not self.constraints.is_fully_constrained():
-            raise DiffcalcException(
-                "Diffcalc is not fully constrained.\n"
-                "Type 'help con' for instructions")
-
-        if not self.constraints.is_current_mode_implemented():
-            raise DiffcalcException(
-                "Sorry, the selected constraint combination is valid but "
-                "is not implemented. Type 'help con' for implemented combinations")
-              
-        # constraints are dictionaries  
-        ref_constraint = self.constraints.reference
-        if ref_constraint:
-            ref_constraint_name, ref_constraint_value = ref_constraint.items()[0]
-        det_constraint = self.constraints.detector
-        naz_constraint = self.constraints.naz
-        samp_constraints = self.constraints.sample
-            
-        assert not (det_constraint and naz_constraint), (
-               "Two 'detector' constraints given")
-
+        # checked and unpacked once each time the constraints change
+        plan = self.constraints.plan
+        if not plan.implemented:
+            return self._hkl_to_angles_numerically(h, k, l, wavelength, plan)
 
-        h_phi = self._get_ubmatrix() * matrix([[h], [k], [l]])
+        h_phi = mvmul(as_matrix(self._get_ubmatrix()), (h, k, l))
         theta = self._calc_theta(h_phi, wavelength)
-        tau = angle_between_vectors(h_phi, self._get_n_phi())
+        tau = kernel.angle_between(h_phi, self._get_n_phi())
+        psi = alpha = qaz = naz = delta = nu = None
 
         ### Reference constraint column ###
 
-        if ref_constraint:
-            # An angle for the reference vector (n) is given      (Section 5.2)         
+        if plan.ref_name is not None:
+            # An angle for the reference vector (n) is given      (Section 5.2)
+            t = profiling.start()
             psi, alpha, _ = self._calc_remaining_reference_angles(
-                ref_constraint_name, ref_constraint_value, theta, tau)
+                plan.ref_name, plan.ref_value, theta, tau)
+            profiling.stop('you.reference', t)
 
         ### Detector constraint column ###
 
-        if det_constraint or naz_constraint:
+        if plan.det_constraint or plan.naz_constraint:
+            t = profiling.start()
             qaz, naz, delta, nu = self._calc_det_angles_given_det_or_naz_constraint(
-                                  det_constraint, naz_constraint, theta, tau, alpha)
-        
+                plan.det_constraint, plan.naz_constraint, theta, tau, alpha)
+            profiling.stop('you.detector', t)
+
         ### Sample constraint column ###
 
-        if len(samp_constraints) == 1:
-            # a detector and reference constraint will have been given
-            mu, eta, chi, phi = self._calc_sample_angles_from_one_sample_constraint(
-                h, k, l, wavelength, samp_constraints, h_phi, theta,
-                ref_constraint_name, ref_constraint_value, alpha, qaz, naz,
-                delta, nu)
-            solution_tuples = [(mu, delta, nu, eta, chi, phi)]
-
-        elif len(samp_constraints) == 2:
-            assert ref_constraint, ('No code yet to handle 2 sample '
-                                    'without a reference constraint!')
-            angles = self._calc_sample_given_two_sample_and_reference(
-                h, k, l, wavelength, samp_constraints, h_phi, theta,
-                ref_constraint_name, ref_constraint_value, psi)
-            solution_tuples = [angles]
-
-        elif len(samp_constraints) == 3:
-            solution_tuples = self._calc_angles_given_three_sample_constraints(
-                h, k, l, wavelength, return_all_solutions, samp_constraints,
-                 h_phi, theta)
-            
+        t = profiling.start()
+        solution_tuples = getattr(self, plan.sample_column)(
+            plan, h, k, l, wavelength, h_phi, theta, psi, alpha, qaz, naz,
+            delta, nu, return_all_solutions)
+        profiling.stop('you.sample', t, len(solution_tuples))
+
         position_pseudo_angles_pairs = []
         for mu, delta, nu, eta, chi, phi in solution_tuples:
             pair = self._create_position_pseudo_angles_pair(
@@ -428,12 +519,79 @@ class YouHklCalculator(HklCalculatorBase):
 
 
 
+    def _numerical_solver(self, plan):
+        from diffcalc.hkl.you.numerical import NumericalSolver, \
+            plan_constraints
+        return NumericalSolver(self._get_ubmatrix(), self._get_n_phi(),
+                               plan_constraints(plan), self._hardware)
+
+    def _hkl_to_angles_numerically(self, h, k, l, wavelength, plan):
+        if not self.numerical_fallback:
+            raise DiffcalcException(
+                "Sorry, the selected constraint combination is valid but "
+                "is not implemented. Type 'help con' for implemented "
+                "combinations")
+        position = self._numerical_solver(plan).solve([(h, k, l)],
+                                                      [wavelength])[0]
+        if position[0] != position[0]:  # NaN
+            raise DiffcalcException(
+                'No solution was found numerically for hkl=(%.4f, %.4f, %.4f) '
+                'within the hardware limits' % (h, k, l))
+        mu, delta, nu, eta, chi, phi = [float(v) for v in position]
+        return [self._create_position_pseudo_angles_pair(
+            wavelength, mu, delta, nu, eta, chi, phi)]
+
+    def hkl_to_angles_numerical(self, hkl, wavelength, start=None):
+        """
+        Return HklBatchResult with positions and virtual angles in degrees for
+        an N*3 array of hkl values and a wavelength (or N wavelengths) in
+        Angstroms, solving the current constraints numerically.
+
+        This works for any fully constrained set, whether or not an analytic
+        solution is implemented. start may give one or N positions in degrees
+        to start from; solutions closest to these are preferred. Requires
+        numpy.
+        """
+        from diffcalc.hkl.you.batch import YouBatchSolver
+        return YouBatchSolver(self).hkl_to_angles_numerically(hkl, wavelength,
+                                                             start)
+
+    # Sample columns named by YouSolverPlan.sample_column. Each returns a list
+    # of (mu, delta, nu, eta, chi, phi) tuples.
+
+    def _sample_column_given_one_sample(
+            self, plan, h, k, l, wavelength, h_phi, theta, psi, alpha, qaz,
+            naz, delta, nu, return_all_solutions):
+        # a detector and reference constraint will have been given
+        mu, eta, chi, phi = self._calc_sample_angles_from_one_sample_constraint(
+            h, k, l, wavelength, plan.samp_constraints, h_phi, theta,
+            plan.ref_name, plan.ref_value, alpha, qaz, naz, delta, nu)
+        return [(mu, delta, nu, eta, chi, phi)]
+
+    def _sample_column_given_two_sample_and_reference(
+            self, plan, h, k, l, wavelength, h_phi, theta, psi, alpha, qaz,
+            naz, delta, nu, return_all_solutions):
+        assert plan.ref_name is not None, ('No code yet to handle 2 sample '
+                                           'without a reference constraint!')
+        return [self._calc_sample_given_two_sample_and_reference(
+            h, k, l, wavelength, plan.samp_constraints, h_phi, theta,
+            plan.ref_name, plan.ref_value, psi)]
+
+    def _sample_column_given_three_sample(
+            self, plan, h, k, l, wavelength, h_phi, theta, psi, alpha, qaz,
+            naz, delta, nu, return_all_solutions):
+        return self._calc_angles_given_three_sample_constraints(
+            h, k, l, wavelength, return_all_solutions, plan.samp_constraints,
+            h_phi, theta)
+
     def _create_position_pseudo_angles_pair(self, wavelength, mu, delta, nu, eta, chi, phi):
         # Create position
+        t = profiling.start()
         position = YouPosition(mu, delta, nu, eta, chi, phi)
         position = _tidy_degenerate_solutions(position, self.constraints)
         if position.phi <= -pi + SMALL:
             position.phi += 2 * pi
+        profiling.stop('you.tidy', t)
         # pseudo angles calculated along the way were for the initial solution
         # and may be invalid for the chosen solution TODO: anglesToHkl need no
         # longer check the pseudo_angles as they will be generated with the
@@ -445,7 +603,7 @@ class YouHklCalculator(HklCalculatorBase):
     def _calc_theta(self, h_phi, wavelength):
         """Calculate theta using Equation1
         """
-        q_length = norm(h_phi)
+        q_length = kernel.norm(as_vector(h_phi))
         if q_length == 0:
             raise DiffcalcException('Reflection is unreachable as |Q| is 0')
         wavevector = 2 * pi / wavelength
@@ -603,12 +761,12 @@ class YouHklCalculator(HklCalculatorBase):
             ref_constraint_name, ref_constraint_value, alpha, qaz, naz, delta, nu):
         
         sample_constraint_name, sample_value = samp_constraints.items()[0]
-        q_lab = matrix([[cos(theta) * sin(qaz)], 
-                [-sin(theta)], 
-                [cos(theta) * cos(qaz)]]) # (18)
-        n_lab = matrix([[cos(alpha) * sin(naz)], 
-                [-sin(alpha)], 
-                [cos(alpha) * cos(naz)]]) # (20)
+        q_lab = (cos(theta) * sin(qaz),
+                 -sin(theta),
+                 cos(theta) * cos(qaz))  # (18)
+        n_lab = (cos(alpha) * sin(naz),
+                 -sin(alpha),
+                 cos(alpha) * cos(naz))  # (20)
         phi, chi, eta, mu = self._calc_remaining_sample_angles(
             sample_constraint_name, sample_value, q_lab, n_lab, h_phi, 
             self._get_n_phi())
@@ -673,10 +831,11 @@ class YouHklCalculator(HklCalculatorBase):
 
         if constraint_name == 'mu':                                      # (35)
             mu = constraint_value
-            V = calcMU(mu).I * N_lab * N_phi.T
-            phi = atan2(V[2, 1], V[2, 0])
-            eta = atan2(-V[1, 2], V[0, 2])
-            chi = atan2(sqrt(V[2, 0] ** 2 + V[2, 1] ** 2), V[2, 2])
+            V = mmul_all(transpose(kernel.x_rotation(mu)), N_lab,
+                         transpose(N_phi))
+            phi = atan2(V[2][1], V[2][0])
+            eta = atan2(-V[1][2], V[0][2])
+            chi = atan2(sqrt(V[2][0] ** 2 + V[2][1] ** 2), V[2][2])
             if is_small(sin(chi)):
                 # chi ~= 0 or 180 and therefor phi || eta The solutions for phi
                 # and eta here will be valid but will be chosen unpredictably.
@@ -684,7 +843,7 @@ class YouHklCalculator(HklCalculatorBase):
                 phi_orig, eta_orig = phi, eta
                 # tan(phi+eta)=v12/v11 from docs/extensions_to_yous_paper.wxm
                 eta = 0
-                phi = atan2(V[0, 1], V[0, 0])
+                phi = atan2(V[0][1], V[0][0])
                 logger.debug(
                     'Eta and phi cannot be chosen uniquely with chi so close '
                     'to 0 or 180. Ignoring solution phi=%.3f and eta=%.3f, and'
@@ -694,10 +853,11 @@ class YouHklCalculator(HklCalculatorBase):
 
         if constraint_name == 'phi':                                     # (37)
             phi = constraint_value
-            V = N_lab * N_phi.I * calcPHI(phi).T
-            eta = atan2(V[0, 1], sqrt(V[1, 1] ** 2 + V[2, 1] ** 2))
-            mu = atan2(V[2, 1], V[1, 1])
-            chi = atan2(V[0, 2], V[0, 0])
+            V = mmul_all(N_lab, transpose(N_phi),
+                         transpose(kernel.z_rotation(-phi)))
+            eta = atan2(V[0][1], sqrt(V[1][1] ** 2 + V[2][1] ** 2))
+            mu = atan2(V[2][1], V[1][1])
+            chi = atan2(V[0][2], V[0][0])
             if is_small(cos(eta)):
                 raise ValueError(
                     'Chi and mu cannot be chosen uniquely with eta so close '
@@ -705,7 +865,7 @@ class YouHklCalculator(HklCalculatorBase):
             return phi, chi, eta, mu
 
         elif constraint_name in ('eta', 'chi'):
-            V = N_lab * N_phi.T
+            V = mmul(N_lab, transpose(N_phi))
             if constraint_name == 'eta':                                 # (39)
                 eta = constraint_value
                 cos_eta = cos(eta)
@@ -714,7 +874,7 @@ class YouHklCalculator(HklCalculatorBase):
                     raise ValueError(
                         'Chi and mu cannot be chosen uniquely with eta '
                         'constrained so close to +-90.')
-                chi = asin(V[0, 2] / cos_eta)
+                chi = asin(V[0][2] / cos_eta)
 
             else:  # constraint_name == 'chi'                            # (40)
                 chi = constraint_value
@@ -724,10 +884,10 @@ class YouHklCalculator(HklCalculatorBase):
                         'Eta and phi cannot be chosen uniquely with chi '
                         'constrained so close to 0. (Please contact developer '
                         'if this case is useful for you)')
-                eta = acos(V[0, 2] / sin_chi)
+                eta = acos(V[0][2] / sin_chi)
 
-            top_for_mu = V[2, 2] * sin(eta) * sin(chi) + V[1, 2] * cos(chi)
-            bot_for_mu = -V[2, 2] * cos(chi) + V[1, 2] * sin(eta) * sin(chi)
+            top_for_mu = V[2][2] * sin(eta) * sin(chi) + V[1][2] * cos(chi)
+            bot_for_mu = -V[2][2] * cos(chi) + V[1][2] * sin(eta) * sin(chi)
             mu = atan2(-top_for_mu, -bot_for_mu)                         # (41)
             # (minus signs added from paper to pass (pieces) tests)
             if is_small(top_for_mu) and is_small(bot_for_mu):
@@ -744,15 +904,15 @@ class YouHklCalculator(HklCalculatorBase):
                 # here if the one found was incorrect.
 
                 # tan(phi+eta)=v12/v11 from extensions_to_yous_paper.wxm
-                phi_minus_mu = -atan2(V[2, 0], V[1, 1])
+                phi_minus_mu = -atan2(V[2][0], V[1][1])
                 logger.debug(
                     'Mu and phi cannot be chosen uniquely with chi so close '
                     'to +-90 and eta so close 0 or 180.\n After the final '
                     'solution has been chose phi-mu should equal: %.3f',
                     phi_minus_mu * TODEG)
 
-            top_for_phi = V[0, 1] * cos(eta) * cos(chi) - V[0, 0] * sin(eta)
-            bot_for_phi = V[0, 1] * sin(eta) + V[0, 0] * cos(eta) * cos(chi)
+            top_for_phi = V[0][1] * cos(eta) * cos(chi) - V[0][0] * sin(eta)
+            bot_for_phi = V[0][1] * sin(eta) + V[0][0] * cos(eta) * cos(chi)
             phi = atan2(top_for_phi, bot_for_phi)                        # (42)
 #            if is_small(bot_for_phi) and is_small(top_for_phi):
 #                raise ValueError(
@@ -768,9 +928,9 @@ class YouHklCalculator(HklCalculatorBase):
             h_phi, theta):
         
         if not 'mu' in samp_constraints:
-            eta_ = self.constraints.sample['eta']
-            chi_ = self.constraints.sample['chi']
-            phi_ = self.constraints.sample['phi']
+            eta_ = samp_constraints['eta']
+            chi_ = samp_constraints['chi']
+            phi_ = samp_constraints['phi']
             two_mu_qaz_pairs = _mu_and_qaz_from_eta_chi_phi(eta_, chi_, phi_, theta, h_phi)
         else:
             raise DiffcalcException(
@@ -820,31 +980,32 @@ class YouHklCalculator(HklCalculatorBase):
         """
 
         N_phi = _calc_N(q_phi, n_phi)
-        THETA = z_rotation(-theta)
-        PSI = x_rotation(psi)
+        THETA = kernel.z_rotation(-theta)
+        PSI = kernel.x_rotation(psi)
 
         if 'chi' in samp_constraints and 'phi' in samp_constraints:
 
             chi = samp_constraints['chi']
             phi = samp_constraints['phi']
 
-            CHI = calcCHI(chi)
-            PHI = calcPHI(phi)
-            V = CHI * PHI * N_phi * PSI.T * THETA.T                     # (56)
+            CHI = kernel.y_rotation(chi)
+            PHI = kernel.z_rotation(-phi)
+            V = mmul_all(CHI, PHI, N_phi, transpose(PSI),
+                         transpose(THETA))                               # (56)
 
-            xi = atan2(-V[2, 0], V[2, 2])
-            eta = atan2(-V[0, 1], V[1, 1])
-            mu = atan2(-V[2, 1], sqrt(V[2, 2] ** 2 + V[2, 0] ** 2))
+            xi = atan2(-V[2][0], V[2][2])
+            eta = atan2(-V[0][1], V[1][1])
+            mu = atan2(-V[2][1], sqrt(V[2][2] ** 2 + V[2][0] ** 2))
 
         elif 'mu' in samp_constraints and 'eta' in samp_constraints:
 
             mu = samp_constraints['mu']
             eta = samp_constraints['eta']
 
-            V = N_phi * PSI.T * THETA.T                                  # (49)
+            V = mmul_all(N_phi, transpose(PSI), transpose(THETA))        # (49)
 
             bot = sqrt(sin(eta) ** 2 * cos(mu) ** 2 + sin(mu) ** 2)
-            chi_orig = (asin(-V[2, 1] / bot) -
+            chi_orig = (asin(-V[2][1] / bot) -
                    atan2(sin(mu), (sin(eta) * cos(mu))))                 # (52)
 
             # Choose final chi solution here to obtain compatable xi and mu
@@ -859,13 +1020,13 @@ class YouHklCalculator(HklCalculatorBase):
 
             a = sin(chi) * cos(eta)
             b = sin(chi) * sin(eta) * sin(mu) - cos(chi) * cos(mu)
-            xi = atan2(V[2, 2] * a + V[2, 0] * b,
-                       V[2, 0] * a - V[2, 2] * b)                        # (54)
+            xi = atan2(V[2][2] * a + V[2][0] * b,
+                       V[2][0] * a - V[2][2] * b)                        # (54)
 
             a = sin(chi) * sin(mu) - cos(mu) * cos(chi) * sin(eta)
             b = cos(mu) * cos(eta)
-            phi = atan2(V[1, 1] * a - V[0, 1] * b,
-                        V[0, 1] * a + V[1, 1] * b)                       # (55)
+            phi = atan2(V[1][1] * a - V[0][1] * b,
+                        V[0][1] * a + V[1][1] * b)                       # (55)
 #            if is_small(mu+pi/2) and is_small(eta) and False:
 #                phi_general = phi
 #                # solved in extensions_to_yous_paper.wxm
@@ -881,10 +1042,10 @@ class YouHklCalculator(HklCalculatorBase):
             if not is_small(mu) and not is_small(chi - pi / 2):
                 raise Exception('The fixed chi, mu, psi/alpha/beta modes only '
                                 ' currently work with chi=90 and mu=0')
-            V = N_phi * PSI.T * THETA.T
-            eta = asin(-V[2, 1])
-            xi = atan2(V[2, 2], V[2, 0])
-            phi = -atan2(V[0, 1], V[1, 1])
+            V = mmul_all(N_phi, transpose(PSI), transpose(THETA))
+            eta = asin(-V[2][1])
+            xi = atan2(V[2][2], V[2][0])
+            phi = -atan2(V[0][1], V[1][1])
 
         else:
             raise DiffcalcException(
@@ -946,14 +1107,33 @@ class YouHklCalculator(HklCalculatorBase):
         possible_tuples = self._generate_possible_solutions(
             [mu_, eta_, chi_, phi_], ['mu', 'eta', 'chi', 'phi'],
             sample_constraint_names, filter_out_of_limits)
+        if self._seed is not None:
+            # Check only the neighbourhood of the previous solution unless
+            # the sample has had to leave it
+            mu_eta_chi_phi_tuples = self._filter_valid_sample_solutions(
+                delta, nu, self._solutions_near_seed(possible_tuples),
+                wavelength, hkl, ref_constraint_name, ref_constraint_value)
+            if mu_eta_chi_phi_tuples:
+                return mu_eta_chi_phi_tuples
         mu_eta_chi_phi_tuples = self._filter_valid_sample_solutions(
             delta, nu, possible_tuples, wavelength, hkl, ref_constraint_name,
             ref_constraint_value)
         return mu_eta_chi_phi_tuples
 
+    def _solutions_near_seed(self, mu_eta_chi_phi_tuples):
+        near = []
+        for solution in mu_eta_chi_phi_tuples:
+            for value, seed in zip(solution, self._seed):
+                if angular_distance(value, seed) > SEED_WINDOW:
+                    break
+            else:
+                near.append(solution)
+        return near
+
     def _filter_valid_sample_solutions(
         self, delta, nu, possible_mu_eta_chi_phi_tuples, wavelength, hkl,
         ref_constraint_name, ref_constraint_value):
+        t = profiling.start()
         mu_eta_chi_phi_tuples = []
 
         if logger.isEnabledFor(logging.DEBUG):
@@ -995,6 +1175,8 @@ class YouHklCalculator(HklCalculatorBase):
                 msg += '\n'
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug(msg)
+        profiling.stop('you.filter_candidates', t,
+                       len(possible_mu_eta_chi_phi_tuples))
         return mu_eta_chi_phi_tuples
 
     def _choose_detector_solution(self, delta_nu_pairs):
@@ -1013,9 +1195,16 @@ class YouHklCalculator(HklCalculatorBase):
             return mu_eta_chi_phi_tuples[0]
 
         # there are multiple solutions
+        if self._seed is None:
+            origin = (0., 0., 0., 0.)
+            origin_name = 'all-zeros position'
+        else:
+            origin = self._seed
+            origin_name = 'previous solution'
         absolute_distances = []
         for solution in mu_eta_chi_phi_tuples:
-            absolute_distances.append(sum([abs(v) for v in solution]))
+            absolute_distances.append(sum([angular_distance(v, o)
+                                           for v, o in zip(solution, origin)]))
 
         shortest_solution_index = absolute_distances.index(
             min(absolute_distances))
@@ -1023,7 +1212,7 @@ class YouHklCalculator(HklCalculatorBase):
 
         if logger.isEnabledFor(logging.INFO):
             msg = ('Multiple sample solutions found (choosing solution with '
-                   'shortest distance to all-zeros position):\n')
+                   'shortest distance to %s):\n' % origin_name)
             i = 0
             for solution, distance in zip(mu_eta_chi_phi_tuples,
                                           absolute_distances):
@@ -1042,6 +1231,7 @@ class YouHklCalculator(HklCalculatorBase):
     def _generate_possible_solutions(self, values, names, constrained_names,
                                      filter_out_of_limits=True):
 
+        t = profiling.start()
         # Expand each value into a list of values
         transformed_values = []
         for value, name in zip(values, names):
@@ -1068,12 +1258,14 @@ class YouHklCalculator(HklCalculatorBase):
                     r.append(new)
             return r
 
-        return reduce(expand, transformed_values)
+        solutions = reduce(expand, transformed_values)
+        profiling.stop('you.expand_candidates', t, len(solutions))
+        return solutions
 
 def _mu_and_qaz_from_eta_chi_phi(eta, chi, phi, theta, h_phi):
     
-    h_phi_norm = normalised(h_phi)                                    # (68,69) 
-    h1, h2, h3 = h_phi_norm[0, 0], h_phi_norm[1, 0], h_phi_norm[2, 0]
+    h_phi_norm = normalised(h_phi)                                    # (68,69)
+    h1, h2, h3 = h_phi_norm
     a = sin(chi) * h2 * sin(phi) + sin(chi) * h1 * cos(phi) - cos(chi) * h3
     b = (- cos(chi) * sin(eta) * h2 * sin(phi)
          - cos(eta) * h1 * sin(phi) + cos(eta) * h2 * cos(phi)
@@ -1101,13 +1293,13 @@ def _mu_and_qaz_from_eta_chi_phi(eta, chi, phi, theta, h_phi):
 #             raise AssertionError("mu_simplified != mu , %f!=%f" % (mu_simplified, mu))
         
     
-    [MU, _, _, ETA, CHI, PHI] = create_you_matrices(mu1, None, None, eta, chi, phi)
-    h_lab = MU * ETA * CHI * PHI * h_phi                                 # (11)
-    qaz1 = atan2(h_lab[0, 0] , h_lab[2, 0])
+    [MU, _, _, ETA, CHI, PHI] = create_you_rotations(mu1, 0, 0, eta, chi, phi)
+    h_lab = mvmul(mmul_all(MU, ETA, CHI, PHI), h_phi)                    # (11)
+    qaz1 = atan2(h_lab[0] , h_lab[2])
 
-    [MU, _, _, ETA, CHI, PHI] = create_you_matrices(mu2, None, None, eta, chi, phi)
-    h_lab = MU * ETA * CHI * PHI * h_phi                                 # (11)
-    qaz2 = atan2(h_lab[0, 0] , h_lab[2, 0])
+    [MU, _, _, ETA, CHI, PHI] = create_you_rotations(mu2, 0, 0, eta, chi, phi)
+    h_lab = mvmul(mmul_all(MU, ETA, CHI, PHI), h_phi)                    # (11)
+    qaz2 = atan2(h_lab[0] , h_lab[2])
 
     return (mu1, qaz1) , (mu2, qaz2)
 
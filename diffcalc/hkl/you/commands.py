@@ -59,8 +59,12 @@ class YouHklCommands(object):
         msg = self.handle_con(args)
         if (self._hklcalc.constraints.is_fully_constrained() and 
             not self._hklcalc.constraints.is_current_mode_implemented()):
-            msg += ("\n\nWARNING:. The selected constraint combination is valid but "
-                "is not implemented.\n\nType 'help con' to see implemented combinations")
+            if self._hklcalc.numerical_fallback:
+                msg += ("\n\nThe selected constraint combination has no "
+                        "analytic solution and will be solved numerically.")
+            else:
+                msg += ("\n\nWARNING:. The selected constraint combination is valid but "
+                    "is not implemented.\n\nType 'help con' to see implemented combinations")
 
         if msg:
             print msg
@@ -48,10 +48,60 @@ number_single_sample = (len(det_constraints) * len(ref_constraints) *
                         len(samp_constraints))
 
 
+class YouSolverPlan(object):
+    """The current constraints, checked and unpacked once for the solver.
+
+    Built by YouConstraintManager.plan whenever the constraints change, so
+    that YouHklCalculator._hklToAngles does not re-check and unpack them for
+    each hkl. Values are in radians. sample_column names the calculator
+    method that solves the sample angles for this constraint combination, or
+    is None if the combination has no analytic solution (implemented is
+    False). Plans cannot be modified.
+    """
+
+    def __init__(self, manager):
+        if not manager.is_fully_constrained():
+            raise DiffcalcException(
+                "Diffcalc is not fully constrained.\n"
+                "Type 'help con' for instructions")
+        implemented = manager.is_current_mode_implemented()
+
+        ref_name = ref_value = None
+        if manager.reference:
+            ref_name, ref_value = manager.reference.items()[0]
+        det_constraint = manager.detector
+        naz_constraint = manager.naz
+        assert not (det_constraint and naz_constraint), (
+               "Two 'detector' constraints given")
+        samp_constraints = manager.sample
+        sample_column = None
+        if implemented:
+            sample_column = {
+                1: '_sample_column_given_one_sample',
+                2: '_sample_column_given_two_sample_and_reference',
+                3: '_sample_column_given_three_sample'}[len(samp_constraints)]
+
+        attributes = (('revision', manager.revision),
+                      ('implemented', implemented),
+                      ('ref_name', ref_name),
+                      ('ref_value', ref_value),
+                      ('det_constraint', det_constraint),
+                      ('naz_constraint', naz_constraint),
+                      ('samp_constraints', samp_constraints),
+                      ('sample_column', sample_column))
+        for name, value in attributes:
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('a solver plan cannot be modified')
+
+
 class YouConstraintManager(object):
 
     def __init__(self, hardware, fixed_constraints = {}):
         self._hardware = hardware
+        self.revision = 0  # bumped whenever the constraints change
+        self._plan = None
         self._constrained = {}
 #        self._tracking = []
         self.n_phi = matrix([[0], [0], [1]])
@@ -138,6 +188,29 @@ class YouConstraintManager(object):
         names.sort(key=lambda name: list(all_constraints).index(name))
         return tuple(names)
 
+    def _get_constrained(self):
+        return self._constrained_dict
+
+    def _set_constrained(self, constrained):
+        self._constrained_dict = constrained
+        self.revision += 1
+
+    _constrained = property(_get_constrained, _set_constrained)
+
+    @property
+    def plan(self):
+        """YouSolverPlan for the current constraints (rebuilt on change)
+
+        Raises a DiffcalcException if the constraints are incomplete or the
+        combination is not implemented.
+        """
+        if self._plan is None or self._plan.revision != self.revision:
+            self._plan = YouSolverPlan(self)
+        return self._plan
+
+    def update_tracked(self):
+        pass  # no constraints track hardware
+
     def _fix_constraints(self, fixed_constraints):
         for name in fixed_constraints:
             self.constrain(name)
@@ -264,7 +337,8 @@ class YouConstraintManager(object):
             raise DiffcalcException('%s is not a valid constraint name')
         if name in self.all:
             return "%s is already constrained." % name.capitalize()
-        elif name in det_constraints:
+        self.revision += 1
+        if name in det_constraints:
             return self._constrain_detector(name)
         elif name in ref_constraints:
             return self._constrain_reference(name)
@@ -329,6 +403,7 @@ class YouConstraintManager(object):
             raise DiffcalcException('%s is not a valid constraint name')
         if name in self._constrained:
             del self._constrained[name]
+            self.revision += 1
         else:
             return "%s was not already constrained." % name.capitalize()
 
@@ -361,6 +436,7 @@ class YouConstraintManager(object):
         old_value = self.get_constraint(name)
         old = str(old_value) if old_value is not None else '---'
         self._constrained[name] = float(value) * TORAD
+        self.revision += 1
         new = str(value)
         return "%(name)s : %(old)s --> %(new)s" % locals()
 
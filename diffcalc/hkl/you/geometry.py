@@ -23,6 +23,7 @@ from diffcalc.util import AbstractPosition
 TORAD = pi / 180
 TODEG = 180 / pi
 from diffcalc.util import x_rotation, z_rotation, y_rotation
+from diffcalc import kernel
 
 from diffcalc.hkl.you.constraints import NUNAME
 
@@ -38,6 +39,24 @@ class YouGeometry(object):
     def internal_position_to_physical_angles(self, physicalAngles):
         raise NotImplementedError()
 
+    def physical_angles_to_internal_positions(self, physicalAngles):
+        """Return N*6 array of internal angles from N*k array of physical
+        angles (in degrees). Requires numpy."""
+        import numpy as np
+        to_internal = self.physical_angles_to_internal_position
+        return np.array([to_internal(tuple(angles)).totuple()
+                         for angles in np.atleast_2d(physicalAngles).tolist()],
+                        dtype=float)
+
+    def internal_positions_to_physical_angles(self, internalAngles):
+        """Return N*k array of physical angles from N*6 array of internal
+        angles (in degrees). Requires numpy."""
+        import numpy as np
+        to_physical = self.internal_position_to_physical_angles
+        return np.array([to_physical(YouPosition(*angles))
+                         for angles in np.atleast_2d(internalAngles).tolist()],
+                        dtype=float)
+
     def create_position(self, *args):
         return YouPosition(*args)
 
@@ -60,6 +79,16 @@ class SixCircle(YouGeometry):
     def internal_position_to_physical_angles(self, internal_position):
         return internal_position.totuple()
 
+    def physical_angles_to_internal_positions(self, physical_angles):
+        import numpy as np
+        angles = np.array(physical_angles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 6), "Wrong length of input list"
+        return angles
+
+    def internal_positions_to_physical_angles(self, internal_angles):
+        import numpy as np
+        return np.array(internal_angles, dtype=float, ndmin=2)
+
 
 class FourCircle(YouGeometry):
     """For a diffractometer with angles:
@@ -77,6 +106,17 @@ class FourCircle(YouGeometry):
         _, delta, _, eta, chi, phi = internal_position.totuple()
         return delta, eta, chi, phi
 
+    def physical_angles_to_internal_positions(self, physical_angles):
+        import numpy as np
+        angles = np.array(physical_angles, dtype=float, ndmin=2)
+        assert (angles.shape[1] == 4), "Wrong length of input list"
+        return np.insert(angles, [0, 1], 0., axis=1)
+
+    def internal_positions_to_physical_angles(self, internal_angles):
+        import numpy as np
+        return np.delete(np.array(internal_angles, dtype=float, ndmin=2),
+                         [0, 2], axis=1)
+
 #==============================================================================
 
 
@@ -94,6 +134,16 @@ def create_you_matrices(mu=None, delta=None, nu=None, eta=None, chi=None,
     return MU, DELTA, NU, ETA, CHI, PHI
 
 
+def create_you_rotations(mu, delta, nu, eta, chi, phi):
+    """
+    Create the transformation matrices from H. You's paper as tuples for use
+    with diffcalc.kernel.
+    """
+    return (kernel.x_rotation(mu), kernel.z_rotation(-delta),
+            kernel.x_rotation(nu), kernel.z_rotation(-eta),
+            kernel.y_rotation(chi), kernel.z_rotation(-phi))
+
+
 def calcNU(nu):
     return x_rotation(nu)
 
@@ -120,6 +170,8 @@ def calcPHI(phi):
 
 class YouPosition(AbstractPosition):
 
+    __slots__ = ('mu', 'delta', 'nu', 'eta', 'chi', 'phi')
+
     def __init__(self, mu=None, delta=None, nu=None, eta=None, chi=None,
                  phi=None):
         self.mu = mu
@@ -0,0 +1,166 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Find every solution for a large grid of reflections using many processes.
+
+The UB matrix, reference vector, constraints, limits, cuts and geometry are
+copied into a picklable YouSnapshot which is sent once to each worker process.
+Each worker rebuilds its own YouHklCalculator from the snapshot and solves
+chunks of reflections with hkl_to_all_angles. Results are yielded in the order
+of the input reflections whatever the number of workers.
+
+Requires the multiprocessing module and so is not available under Jython.
+"""
+
+from diffcalc.hardware import HardwareAdapter
+from diffcalc.hkl.you.calc import YouHklCalculator
+from diffcalc.hkl.you.constraints import YouConstraintManager
+from diffcalc.util import DiffcalcException
+
+CHUNK_SIZE = 256
+
+
+class _SnapshotReference(object):
+
+    def __init__(self, n_phi):
+        self.n_phi = n_phi
+
+
+class _SnapshotUbcalc(object):
+
+    revision = 0
+
+    def __init__(self, UB, n_phi):
+        self.UB = UB
+        self.reference = _SnapshotReference(n_phi)
+
+
+class _SnapshotHardware(HardwareAdapter):
+
+    def __init__(self, names, lower_limits, upper_limits, cuts):
+        HardwareAdapter.__init__(self, names)
+        self._lowerLimitDict = dict(lower_limits)
+        self._upperLimitDict = dict(upper_limits)
+        self._cut_angles = dict(cuts)
+        self._name = 'snapshot'
+
+
+class YouSnapshot(object):
+    """Picklable copy of everything a YouHklCalculator needs to solve"""
+
+    def __init__(self, hklcalc):
+        hardware = hklcalc._hardware
+        names = hardware.get_axes_names()
+        self.UB = hklcalc._get_ubmatrix()
+        self.n_phi = hklcalc._ubcalc.reference.n_phi
+        self.constraints = hklcalc.constraints.all
+        self.axes_names = names
+        self.lower_limits = dict((name, hardware.get_lower_limit(name))
+                                 for name in names
+                                 if hardware.get_lower_limit(name) is not None)
+        self.upper_limits = dict((name, hardware.get_upper_limit(name))
+                                 for name in names
+                                 if hardware.get_upper_limit(name) is not None)
+        self.cuts = dict(hardware.get_cuts())
+        self.geometry = hklcalc._geometry
+        self.raise_exceptions = hklcalc.raiseExceptionsIfAnglesDoNotMapBackToHkl
+        self.numerical_fallback = hklcalc.numerical_fallback
+
+    def create_calculator(self):
+        hardware = _SnapshotHardware(self.axes_names, self.lower_limits,
+                                     self.upper_limits, self.cuts)
+        constraints = YouConstraintManager(hardware)
+        constraints._constrained = dict(self.constraints)
+        calculator = YouHklCalculator(_SnapshotUbcalc(self.UB, self.n_phi),
+                                      self.geometry, hardware, constraints,
+                                      self.raise_exceptions)
+        calculator.set_numerical_fallback(self.numerical_fallback)
+        return calculator
+
+
+def solve_chunk(hklcalc, hkl_chunk, wavelength):
+    """Return a list of (hkl, solutions, message) tuples for a chunk
+
+    solutions is the list of (Position, virtual angles) pairs in degrees from
+    hkl_to_all_angles, or empty with message set if the reflection could not be
+    solved.
+    """
+    results = []
+    for hkl in hkl_chunk:
+        h, k, l = hkl
+        try:
+            solutions = hklcalc.hkl_to_all_angles(h, k, l, wavelength)
+            results.append((hkl, solutions, None))
+        except Exception, e:  # not all failures raise DiffcalcException
+            results.append((hkl, [], str(e).strip()))
+    return results
+
+
+_worker_calculator = None
+
+
+def _init_worker(snapshot):
+    global _worker_calculator
+    _worker_calculator = snapshot.create_calculator()
+
+
+def _solve_chunk_in_worker(args):
+    hkl_chunk, wavelength = args
+    return solve_chunk(_worker_calculator, hkl_chunk, wavelength)
+
+
+def _chunks(hkl_list, chunk_size):
+    chunk = []
+    for h, k, l in hkl_list:
+        chunk.append((h, k, l))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_all_angles(hklcalc, hkl_list, wavelength, workers=None,
+                    chunk_size=CHUNK_SIZE):
+    """Yield (hkl, solutions, message) for each reflection in hkl_list in order
+
+    Reflections are sent to workers processes (one per cpu if None) in chunks
+    of chunk_size. With workers=0 the chunks are solved in this process from
+    the same snapshot.
+    """
+    if chunk_size < 1:
+        raise DiffcalcException("The chunk size must be at least 1")
+    snapshot = YouSnapshot(hklcalc)
+    chunks = _chunks(hkl_list, chunk_size)
+    if workers == 0:
+        calculator = snapshot.create_calculator()
+        for chunk in chunks:
+            for result in solve_chunk(calculator, chunk, wavelength):
+                yield result
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(workers, _init_worker, (snapshot,))
+    try:
+        jobs = ((chunk, wavelength) for chunk in chunks)
+        for results in pool.imap(_solve_chunk_in_worker, jobs):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,277 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Numerical hkl to angles calculations for the You engine.
+
+Constraint combinations without an analytic solution can be solved
+numerically. Each point has six unknown angles and six equations. Three come
+from Equation 12, which maps the angles onto the requested h_phi, and one
+comes from each of the three constraints. These are solved with damped
+(Levenberg-Marquardt) Newton iterations, for all points and starting
+positions at once.
+
+Each point starts from a few generic positions and, optionally, from a given
+start position. Points that converge only outside the hardware limits are
+retried from positions related to those solutions (the same transformations
+the analytic calculation applies), and points still unsolved are retried from
+a solved neighbouring point. Of the solutions found for a point,
+the one closest to the start position (or to all zeros) is chosen, as in the
+analytic calculation.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc import profiling
+from diffcalc.hkl import batch
+from diffcalc.hkl.batch import x_rotations, y_rotations, z_rotations, \
+    transposed, matmul, matvec, norms, axis_values_within_limits
+from diffcalc.hkl.you.batch import AXES, virtual_angles
+
+MAX_ITERATIONS = 100
+TOLERANCE = 1e-20       # on the sum of squared residuals
+STEP = 1e-7             # for the finite difference Jacobian
+MIN_DAMPING = 1e-12
+MAX_DAMPING = 1e12
+
+_AXIS_INDEX = dict((name, i) for i, name in enumerate(AXES))
+_VIRTUAL_CONSTRAINTS = ('qaz', 'naz', 'alpha', 'beta', 'psi', 'a_eq_b')
+
+
+def wrapped(angle):
+    """Return angles wrapped into -pi to pi"""
+    return np.arctan2(np.sin(angle), np.cos(angle))
+
+
+def plan_constraints(plan):
+    """Return the (name, value) pairs constrained by a YouSolverPlan"""
+    constraints = []
+    if plan.ref_name is not None:
+        constraints.append((plan.ref_name, plan.ref_value))
+    for group in (plan.det_constraint, plan.naz_constraint,
+                  plan.samp_constraints):
+        constraints.extend(sorted(group.items()))
+    return tuple(constraints)
+
+
+def _generic_starts(theta, constraints):
+    """Return S*N*6 array of starting positions for N values of theta"""
+    zero = np.zeros_like(theta)
+    starts = np.array([
+        (zero, 2 * theta, zero, theta, zero, zero),
+        (theta, zero, 2 * theta, zero, zero, zero),
+        (zero, 2 * theta, zero, theta, zero + pi / 2, zero),
+        (zero, 2 * theta, zero, theta, zero, zero + pi / 2),
+        (zero, 2 * theta, zero, theta, zero - pi / 2, zero + pi),
+        (theta, zero, 2 * theta, zero, zero + pi / 2, zero + pi / 2)])
+    starts = np.rollaxis(starts, 2, 1)  # S*N*6
+    for name, value in constraints:
+        if name in _AXIS_INDEX:
+            starts[..., _AXIS_INDEX[name]] = value
+        elif name == 'mu_is_' + AXES[2]:
+            starts[..., 0] = starts[..., 2]
+    return starts
+
+
+def _variants(x):
+    """Return V*N*6 array of starts near the other solutions related to N*6
+    solutions x, by transforming each angle as the analytic calculation does
+    (to -v, pi + v and pi - v), and by rotating eta, chi and phi together"""
+    variants = []
+    for j in range(6):
+        for transformed in (-x[:, j], pi + x[:, j], pi - x[:, j]):
+            variant = x.copy()
+            variant[:, j] = transformed
+            variants.append(variant)
+    variant = x.copy()
+    variant[:, 3:] = np.stack((x[:, 3] + pi, -x[:, 4], x[:, 5] + pi), axis=-1)
+    variants.append(variant)
+    return wrapped(np.array(variants))
+
+
+class NumericalSolver(object):
+    """Solve many reflections with any three You constraints.
+
+    UB -- 3*3 UB matrix
+    n_phi -- reference vector in the phi frame
+    constraints -- (name, value) pairs with values in radians
+    hardware -- used to check limits (or None)
+    """
+
+    def __init__(self, UB, n_phi, constraints, hardware=None):
+        self.UB = np.asarray(UB, dtype=float)
+        self.n_phi = np.asarray(n_phi, dtype=float).ravel()
+        self.constraints = tuple(constraints)
+        if len(self.constraints) != 3:
+            raise ValueError('Three constraints are required')
+        self.hardware = hardware
+        self._needs_virtual_angles = any(
+            name in _VIRTUAL_CONSTRAINTS for name, _ in self.constraints)
+        self.iterations = 0  # over all points in the last call to solve
+
+    def residuals(self, x, q_target):
+        """Return N*6 residuals for N*6 positions x in radians and N*3
+        targets for q_phi (in units of the wavevector)"""
+        mu, delta, nu, eta, chi, phi = x.T
+        NU_DELTA = matmul(x_rotations(nu), z_rotations(-delta))
+        q_lab = NU_DELTA[..., 1] - [0, 1, 0]                           # (12)
+        Z = matmul(matmul(x_rotations(mu), z_rotations(-eta)),
+                   matmul(y_rotations(chi), z_rotations(-phi)))
+        r = np.empty((len(x), 6))
+        r[:, :3] = matvec(transposed(Z), q_lab) - q_target
+        angles = None
+        if self._needs_virtual_angles:
+            angles = virtual_angles(x, self.n_phi)
+        for i, (name, value) in enumerate(self.constraints):
+            if name in _AXIS_INDEX:
+                actual = x[:, _AXIS_INDEX[name]]
+            elif name == 'a_eq_b':
+                actual, value = angles['alpha'], angles['beta']
+            elif name == 'mu_is_' + AXES[2]:
+                actual, value = mu, nu
+            else:
+                actual = angles[name]
+            r[:, 3 + i] = wrapped(actual - value)
+        return r
+
+    def _jacobian(self, x, r, q_target):
+        J = np.empty(r.shape + (6,))
+        for j in range(6):
+            x_step = x.copy()
+            x_step[:, j] += STEP
+            J[..., j] = (self.residuals(x_step, q_target) - r) / STEP
+        return J
+
+    def minimise(self, x, q_target):
+        """Return positions and sums of squared residuals after iterating
+        from N*6 positions x towards N*3 targets for q_phi"""
+        x = np.array(x, dtype=float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = self.residuals(x, q_target)
+            cost = np.einsum('ij,ij->i', r, r)
+            cost[np.isnan(cost)] = np.inf
+            damping = np.full(len(x), 1e-3)
+            active = ~(cost < TOLERANCE) & np.all(np.isfinite(x), axis=1)
+            for _ in range(MAX_ITERATIONS):
+                idx = np.flatnonzero(active)
+                if not len(idx):
+                    break
+                self.iterations += len(idx)
+                J = self._jacobian(x[idx], r[idx], q_target[idx])
+                J[~np.isfinite(J)] = 0
+                JtJ = np.einsum('nki,nkj->nij', J, J)
+                g = np.einsum('nki,nk->ni', J, r[idx])
+                diagonal = np.einsum('nii->ni', JtJ) + 1
+                A = JtJ + (damping[idx, np.newaxis, np.newaxis] *
+                           diagonal[:, np.newaxis] * np.eye(6))
+                # the pseudo-inverse copes with badly conditioned points
+                step = -np.einsum('nij,nj->ni', np.linalg.pinv(A), g)
+                x_new = x[idx] + step
+                r_new = self.residuals(x_new, q_target[idx])
+                cost_new = np.einsum('ij,ij->i', r_new, r_new)
+                better = cost_new < cost[idx]
+                better_idx = idx[better]
+                x[better_idx] = x_new[better]
+                r[better_idx] = r_new[better]
+                cost[better_idx] = cost_new[better]
+                damping[idx] = np.clip(
+                    np.where(better, damping[idx] / 10, damping[idx] * 10),
+                    MIN_DAMPING, MAX_DAMPING)
+                active[idx] = (~(cost[idx] < TOLERANCE) &
+                               (damping[idx] < MAX_DAMPING))
+        return wrapped(x), cost
+
+    def _within_limits(self, x):
+        okay = np.ones(len(x), dtype=bool)
+        if self.hardware is not None:
+            for i, name in enumerate(AXES):
+                okay &= axis_values_within_limits(self.hardware, name,
+                                                  x[:, i])
+        return okay
+
+    def _solve_from(self, starts, q_target, reference):
+        """Return two N*6 arrays of positions choosing, for each of the N
+        points, the solution from the S*N*6 starts closest to the N*6
+        reference positions: first of those within the limits and then of any
+        (rows are NaN where there are none)"""
+        s, n = starts.shape[:2]
+        x, cost = self.minimise(starts.reshape(s * n, 6),
+                                np.tile(q_target, (s, 1)))
+        converged = (cost < TOLERANCE).reshape(s, n)
+        okay = converged & self._within_limits(x).reshape(s, n)
+        x = x.reshape(s, n, 6)
+        distance = np.sum(abs(wrapped(x - reference)), axis=-1)
+
+        def closest(mask):
+            masked = np.where(mask, distance, np.inf)
+            best = np.argmin(masked, axis=0)
+            chosen = x[best, np.arange(n)]
+            chosen[np.isinf(masked[best, np.arange(n)])] = np.nan
+            return chosen
+        return closest(okay), closest(converged)
+
+    def solve(self, hkl, wavelength, start=None):
+        """Return N*6 positions in radians for N*3 hkl and N wavelengths.
+
+        Rows are NaN where no solution was found. start may give one or N
+        positions in radians to start from; solutions closest to these are
+        preferred.
+        """
+        t = profiling.start()
+        self.iterations = 0
+        hkl = np.asarray(hkl, dtype=float)
+        n = len(hkl)
+        k = 2 * pi / np.asarray(wavelength, dtype=float)
+        h_phi = np.dot(hkl, self.UB.T)
+        q_target = h_phi / k[:, np.newaxis]
+        sin_theta = norms(q_target) / 2
+        reachable = (sin_theta > 0) & (sin_theta <= 1)
+        theta = np.arcsin(batch.bound(sin_theta))
+
+        starts = _generic_starts(theta, self.constraints)
+        if start is None:
+            reference = np.zeros((n, 6))
+        else:
+            reference = np.zeros((n, 6)) + start
+            starts = np.concatenate((reference[np.newaxis], starts))
+        solutions, converged = self._solve_from(starts, q_target, reference)
+        solutions[~reachable] = np.nan
+
+        # solutions outside the limits may have related ones within them
+        retry = np.flatnonzero(np.isnan(solutions[:, 0]) &
+                               ~np.isnan(converged[:, 0]) & reachable)
+        if len(retry):
+            solutions[retry] = self._solve_from(
+                _variants(converged[retry]), q_target[retry],
+                reference[retry])[0]
+
+        # warm start unsolved points from their nearest solved neighbours
+        while True:
+            solved = ~np.isnan(solutions[:, 0])
+            retry = np.flatnonzero(~solved & reachable)
+            if not len(retry) or not np.any(solved):
+                break
+            solved_idx = np.flatnonzero(solved)
+            nearest = solved_idx[np.argmin(
+                abs(solved_idx[np.newaxis] - retry[:, np.newaxis]), axis=1)]
+            neighbour = solutions[nearest]
+            solutions[retry] = self._solve_from(
+                neighbour[np.newaxis], q_target[retry], reference[retry])[0]
+            reachable[retry] = False  # so each point is retried only once
+        profiling.stop('you.numerical', t, self.iterations)
+        return solutions
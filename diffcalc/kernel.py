@@ -0,0 +1,209 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Small vector and 3*3 matrix arithmetic on plain tuples.
+
+The hkl calculations do a great deal of 3 element work. Building a numpy (or
+Jama) matrix object for each intermediate result costs far more than the
+arithmetic itself, so the solver hot paths use these functions instead.
+Vectors are 3-tuples and matrices are tuples of three row 3-tuples. The
+inverse of a rotation matrix is its transpose, so rotations are never
+inverted; the mt* functions multiply by a transpose without building it.
+
+Matrix objects are kept at the public boundary: use as_vector and as_matrix
+to read them, and to_column and to_matrix to create them.
+"""
+
+from math import sin, cos, sqrt, acos
+
+try:
+    from numpy import matrix
+except ImportError:
+    from numjy import matrix
+
+from diffcalc.util import bound
+
+IDENTITY = ((1., 0., 0.), (0., 1., 0.), (0., 0., 1.))
+X = (1., 0., 0.)
+Y = (0., 1., 0.)
+Z = (0., 0., 1.)
+
+
+### Conversion at the matrix object boundary ###
+
+def as_vector(v):
+    """Return a 3-tuple from a 3*1 matrix or any sequence of three numbers"""
+    if isinstance(v, tuple):
+        return v
+    if isinstance(v, list):
+        return (v[0], v[1], v[2])
+    return (v[0, 0], v[1, 0], v[2, 0])
+
+
+def as_matrix(m):
+    """Return a tuple of row tuples from a 3*3 matrix or nested sequence"""
+    if isinstance(m, tuple):
+        return m
+    if isinstance(m, list):
+        return tuple(tuple(row) for row in m)
+    return ((m[0, 0], m[0, 1], m[0, 2]),
+            (m[1, 0], m[1, 1], m[1, 2]),
+            (m[2, 0], m[2, 1], m[2, 2]))
+
+
+def to_column(v):
+    """Return a 3*1 matrix object from a 3-tuple"""
+    return matrix([[v[0]], [v[1]], [v[2]]])
+
+
+def to_matrix(m):
+    """Return a 3*3 matrix object from a tuple of row tuples"""
+    return matrix([list(m[0]), list(m[1]), list(m[2])])
+
+
+### Rotations (same conventions as diffcalc.util) ###
+
+def x_rotation(th):
+    c, s = cos(th), sin(th)
+    return ((1., 0., 0.), (0., c, -s), (0., s, c))
+
+
+def y_rotation(th):
+    c, s = cos(th), sin(th)
+    return ((c, 0., s), (0., 1., 0.), (-s, 0., c))
+
+
+def z_rotation(th):
+    c, s = cos(th), sin(th)
+    return ((c, -s, 0.), (s, c, 0.), (0., 0., 1.))
+
+
+### Matrix arithmetic ###
+
+def transpose(m):
+    (a, b, c), (d, e, f), (g, h, i) = m
+    return ((a, d, g), (b, e, h), (c, f, i))
+
+
+def mmul(m, n):
+    """Return the product m * n"""
+    (a, b, c), (d, e, f), (g, h, i) = m
+    (n11, n12, n13), (n21, n22, n23), (n31, n32, n33) = n
+    return ((a * n11 + b * n21 + c * n31,
+             a * n12 + b * n22 + c * n32,
+             a * n13 + b * n23 + c * n33),
+            (d * n11 + e * n21 + f * n31,
+             d * n12 + e * n22 + f * n32,
+             d * n13 + e * n23 + f * n33),
+            (g * n11 + h * n21 + i * n31,
+             g * n12 + h * n22 + i * n32,
+             g * n13 + h * n23 + i * n33))
+
+
+def mmul_all(*matrices):
+    """Return the product of two or more matrices (left to right)"""
+    result = matrices[0]
+    for m in matrices[1:]:
+        result = mmul(result, m)
+    return result
+
+
+def mtmul(m, n):
+    """Return the product transpose(m) * n"""
+    return mmul(transpose(m), n)
+
+
+def mvmul(m, v):
+    """Return the product m * v"""
+    x, y, z = v
+    (a, b, c), (d, e, f), (g, h, i) = m
+    return (a * x + b * y + c * z,
+            d * x + e * y + f * z,
+            g * x + h * y + i * z)
+
+
+def mtvmul(m, v):
+    """Return the product transpose(m) * v (i.e. inverse(m) * v for a
+    rotation m)"""
+    x, y, z = v
+    (a, b, c), (d, e, f), (g, h, i) = m
+    return (a * x + d * y + g * z,
+            b * x + e * y + h * z,
+            c * x + f * y + i * z)
+
+
+def column(m, j):
+    """Return column j of m as a vector"""
+    return (m[0][j], m[1][j], m[2][j])
+
+
+def from_columns(a, b, c):
+    """Return a matrix with columns a, b and c"""
+    return ((a[0], b[0], c[0]), (a[1], b[1], c[1]), (a[2], b[2], c[2]))
+
+
+def determinant(m):
+    (a, b, c), (d, e, f), (g, h, i) = m
+    return a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+
+
+def inverse(m):
+    """Return the inverse of a general (non-rotation) matrix such as UB"""
+    (a, b, c), (d, e, f), (g, h, i) = m
+    det = determinant(m)
+    if det == 0:
+        raise ZeroDivisionError('matrix is singular')
+    r = 1. / det
+    return (((e * i - f * h) * r, (c * h - b * i) * r, (b * f - c * e) * r),
+            ((f * g - d * i) * r, (a * i - c * g) * r, (c * d - a * f) * r),
+            ((d * h - e * g) * r, (b * g - a * h) * r, (a * e - b * d) * r))
+
+
+### Vector arithmetic ###
+
+def add(u, v):
+    return (u[0] + v[0], u[1] + v[1], u[2] + v[2])
+
+
+def sub(u, v):
+    return (u[0] - v[0], u[1] - v[1], u[2] - v[2])
+
+
+def scale(v, s):
+    return (v[0] * s, v[1] * s, v[2] * s)
+
+
+def dot(u, v):
+    return u[0] * v[0] + u[1] * v[1] + u[2] * v[2]
+
+
+def cross(u, v):
+    return (u[1] * v[2] - u[2] * v[1],
+            u[2] * v[0] - u[0] * v[2],
+            u[0] * v[1] - u[1] * v[0])
+
+
+def norm(v):
+    return sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2])
+
+
+def normalised(v):
+    return scale(v, 1 / norm(v))
+
+
+def angle_between(u, v):
+    return acos(bound(dot(normalised(u), normalised(v))))
@@ -0,0 +1,130 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Opt-in timing of the stages inside the hkl solvers.
+
+Solvers bracket each stage with:
+
+    t = profiling.start()
+    ...
+    profiling.stop('you.sample', t, candidates)
+
+When profiling is disabled start() returns None and stop() returns at once,
+so the hooks cost two function calls. When enabled, the wall time, number of
+calls and number of candidates handled by each stage are accumulated in
+profiling.registry, which can be shown as a table or dumped as JSON.
+"""
+
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+ENABLED = False
+
+# perf_counter is not available before Python 3.3
+if hasattr(time, 'perf_counter'):
+    _clock = time.perf_counter
+else:
+    _clock = time.time
+
+
+class StageStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.
+        self.candidates = 0
+
+    def as_dict(self):
+        return {'calls': self.calls, 'seconds': self.seconds,
+                'candidates': self.candidates}
+
+
+class ProfileRegistry(object):
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, seconds, candidates=0):
+        try:
+            stats = self.stages[stage]
+        except KeyError:
+            stats = self.stages[stage] = StageStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.candidates += candidates
+
+    def reset(self):
+        self.stages = {}
+
+    def as_dict(self):
+        return dict((stage, stats.as_dict())
+                    for stage, stats in self.stages.items())
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True, indent=2)
+
+    def table(self):
+        """Return the stages as a table, slowest first"""
+        if not self.stages:
+            return '<<no stages recorded>>'
+        width = max(len(stage) for stage in self.stages)
+        lines = ['%s  %8s  %10s  %10s  %10s' %
+                 ('STAGE'.ljust(width), 'CALLS', 'TOTAL (ms)', 'MEAN (us)',
+                  'CANDIDATES')]
+        ordered = sorted(self.stages.items(), key=lambda item: -item[1].seconds)
+        for stage, stats in ordered:
+            lines.append('%s  %8i  %10.3f  %10.1f  %10i' %
+                         (stage.ljust(width), stats.calls,
+                          stats.seconds * 1e3,
+                          stats.seconds * 1e6 / stats.calls,
+                          stats.candidates))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.table()
+
+
+registry = ProfileRegistry()
+
+
+def enable(reset=True):
+    global ENABLED
+    if reset:
+        registry.reset()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def start():
+    """Return a start time, or None if profiling is disabled"""
+    if ENABLED:
+        return _clock()
+    return None
+
+
+def stop(stage, started, candidates=0):
+    """Record the time since start() against stage"""
+    if started is not None:
+        registry.record(stage, _clock() - started, candidates)
@@ -23,17 +23,17 @@ from diffcalc.ub.reflections import ReflectionList
 from diffcalc.util import DiffcalcException, cross3, dot3
 from math import acos, cos, sin, pi
 from diffcalc.ub.reference import YouReference
+from diffcalc.hkl.vlieg.geometry import VliegPosition
 
 try:
-    from numpy import matrix, hstack
-    from numpy.linalg import norm
+    from numpy import matrix
 except ImportError:
-    from numjy import matrix, hstack
-    from numjy.linalg import norm
+    from numjy import matrix
 
 from diffcalc.ub.crystal import CrystalUnderTest
 from diffcalc.ub.reflections import ReflectionList
-from diffcalc.util import DiffcalcException, cross3, dot3
+from diffcalc.util import DiffcalcException, bound
+from diffcalc import kernel
 
 SMALL = 1e-7
 TODEG = 180 / pi
@@ -59,7 +59,7 @@ class PaperSpecificUbCalcStrategy(object):
         raise NotImplementedError()
 
 
-class UBCalculation:
+class UBCalculation(object):
     """A UB matrix calculation for an experiment.
 
     Contains the parameters for the _crystal under test, a list of measured
@@ -79,6 +79,7 @@ class UBCalculation:
         self._strategy = strategy
         self._include_sigtau = include_sigtau
         self.reference = YouReference(self)  # TODO: move into _state and persist
+        self._revision = 0
         self._clear()
 
     def _clear(self, name=None):
@@ -89,7 +90,15 @@ class UBCalculation:
         self._state = UBCalcState(name=name, reflist=reflist)
         self._U = None
         self._UB = None
+        self._peaks = []
         self._state.configure_calc_type()
+        self._revision += 1
+
+    @property
+    def revision(self):
+        """Number which changes whenever UB, sigma, tau or the reference do
+        """
+        return self._revision + self.reference.revision
 
 ### State ###
     def start_new(self, name):
@@ -106,6 +115,8 @@ class UBCalculation:
     def load(self, name):
         state = self._persister.load(name)
         self._state = decode_ubcalcstate(state, self._geometry, self._diffractometer_axes_names)
+        self._peaks = []
+        self._revision += 1
         if self._state.manual_U is not None:
             self.set_U_manually(self._state.manual_U)
         elif self._state.manual_UB is not None:
@@ -235,6 +246,7 @@ class UBCalculation:
         if self._U != None:  # (UB will also exist)
             self._U = None
             self._UB = None
+            self._revision += 1
             print "Warning: the old UB calculation has been cleared."
             print "         Use 'calcub' to recalculate with old reflections."
 
@@ -250,6 +262,7 @@ class UBCalculation:
 
     def _settau(self, tau):
         self._state.tau = tau
+        self._revision += 1
         self.save()
 
     tau = property(_gettau, _settau)
@@ -263,7 +276,8 @@ class UBCalculation:
         return self._state.sigma
 
     def _setsigma(self, sigma):
-        self.state._sigma = sigma
+        self._state.sigma = sigma
+        self._revision += 1
         self.save()
 
     sigma = property(_getsigma, _setsigma)
@@ -344,9 +358,10 @@ class UBCalculation:
                 print "Recalculating UB matrix."
             self.calculate_UB()
 
-#    @property
-#    def reflist(self):
-#        return self._state.reflist
+    @property
+    def reflist(self):
+        return self._state.reflist
+
 ### Calculations ###
 
     def set_U_manually(self, m):
@@ -370,6 +385,7 @@ class UBCalculation:
             raise DiffcalcException(
                 "A crystal must be specified before manually setting U")
         self._UB = self._U * self._state.crystal.B
+        self._revision += 1
         print ("NOTE: A new UB matrix will not be automatically calculated "
                "when the orientation reflections are modified.")
         self.save()
@@ -386,6 +402,7 @@ class UBCalculation:
 
         self._state.configure_calc_type(manual_UB=m)
         self._UB = m
+        self._revision += 1
         self.save()
 
     @property
@@ -429,38 +446,37 @@ class UBCalculation:
         except IndexError:
             raise DiffcalcException(
                 "Two reflections are required to calculate a u matrix")
-        h1 = matrix([h1]).T  # row->column
-        h2 = matrix([h2]).T
         pos1.changeToRadians()
         pos2.changeToRadians()
 
         # Compute the two reflections' reciprical lattice vectors in the
         # cartesian crystal frame
         B = self._state.crystal.B
-        h1c = B * h1
-        h2c = B * h2
+        B_ = kernel.as_matrix(B)
+        h1c = kernel.mvmul(B_, tuple(h1))
+        h2c = kernel.mvmul(B_, tuple(h2))
 
-        u1p = self._strategy.calculate_q_phi(pos1)
-        u2p = self._strategy.calculate_q_phi(pos2)
+        u1p = kernel.as_vector(self._strategy.calculate_q_phi(pos1))
+        u2p = kernel.as_vector(self._strategy.calculate_q_phi(pos2))
 
         # Create modified unit vectors t1, t2 and t3 in crystal and phi systems
         t1c = h1c
-        t3c = cross3(h1c, h2c)
-        t2c = cross3(t3c, t1c)
+        t3c = kernel.cross(h1c, h2c)
+        t2c = kernel.cross(t3c, t1c)
 
         t1p = u1p  # FIXED from h1c 9July08
-        t3p = cross3(u1p, u2p)
-        t2p = cross3(t3p, t1p)
+        t3p = kernel.cross(u1p, u2p)
+        t2p = kernel.cross(t3p, t1p)
 
         # ...and nornmalise and check that the reflections used are appropriate
         SMALL = 1e-4  # Taken from Vlieg's code
         e = DiffcalcException("Invalid orientation reflection(s)")
 
         def normalise(m):
-            d = norm(m)
+            d = kernel.norm(m)
             if d < SMALL:
                 raise e
-            return m / d
+            return kernel.scale(m, 1. / d)
 
         t1c = normalise(t1c)
         t2c = normalise(t2c)
@@ -470,11 +486,13 @@ class UBCalculation:
         t2p = normalise(t2p)
         t3p = normalise(t3p)
 
-        Tc = hstack([t1c, t2c, t3c])
-        Tp = hstack([t1p, t2p, t3p])
+        # Tc is orthonormal so its inverse is its transpose
+        Tc = kernel.from_columns(t1c, t2c, t3c)
+        Tp = kernel.from_columns(t1p, t2p, t3p)
         self._state.configure_calc_type(or0=1, or1=2)
-        self._U = Tp * Tc.I
+        self._U = kernel.to_matrix(kernel.mmul(Tp, kernel.transpose(Tc)))
         self._UB = self._U * B
+        self._revision += 1
         self.save()
 
     def calculate_UB_from_primary_only(self):
@@ -496,22 +514,27 @@ class UBCalculation:
             raise DiffcalcException(
                 "One reflection is required to calculate a u matrix")
 
-        h = matrix([h]).T  # row->column
         pos.changeToRadians()
         B = self._state.crystal.B
-        h_crystal = B * h
-        h_crystal = h_crystal * (1 / norm(h_crystal))
+        h_crystal = kernel.mvmul(kernel.as_matrix(B), tuple(h))
+        h_crystal = kernel.normalised(h_crystal)
 
-        q_measured_phi = self._strategy.calculate_q_phi(pos)
-        q_measured_phi = q_measured_phi * (1 / norm(q_measured_phi))
+        q_measured_phi = kernel.as_vector(self._strategy.calculate_q_phi(pos))
+        q_measured_phi = kernel.normalised(q_measured_phi)
 
-        rotation_axis = cross3(h_crystal, q_measured_phi)
-        rotation_axis = rotation_axis * (1 / norm(rotation_axis))
+        rotation_axis = kernel.cross(h_crystal, q_measured_phi)
+        if kernel.norm(rotation_axis) < SMALL:
+            # h is parallel or anti-parallel to q: any axis perpendicular to h
+            # will do for no rotation or a half turn
+            rotation_axis = kernel.cross(h_crystal, kernel.X)
+            if kernel.norm(rotation_axis) < SMALL:
+                rotation_axis = kernel.cross(h_crystal, kernel.Y)
+        rotation_axis = kernel.normalised(rotation_axis)
 
-        cos_rotation_angle = dot3(h_crystal, q_measured_phi)
-        rotation_angle = acos(cos_rotation_angle)
+        cos_rotation_angle = kernel.dot(h_crystal, q_measured_phi)
+        rotation_angle = acos(bound(cos_rotation_angle))
 
-        uvw = rotation_axis.T.tolist()[0]  # TODO: cleanup
+        uvw = rotation_axis
         print "resulting U angle: %.5f deg" % (rotation_angle * TODEG)
         u_repr = (', '.join(['% .5f' % el for el in uvw]))
         print "resulting U axis direction: [%s]" % u_repr
@@ -541,9 +564,144 @@ class UBCalculation:
         
         self._U = matrix(m)
         self._UB = self._U * B
+        self._revision += 1
+
+        self.save()
+
+    def refine_UB(self, refine_lattice=False):
+        """
+        Refine U, and optionally the lattice parameters, by least squares
+        against all orientation reflections. Returns a UBRefinement with the
+        residuals of each reflection. Requires numpy.
+
+        The refined U is stored as if set manually, so a new UB matrix will
+        not be automatically calculated when the reflections are modified.
+        """
+        from diffcalc.ub.refine import refine
 
+        if self._state.reflist is None:
+            raise DiffcalcException(
+                "Cannot refine a u matrix until a UBCalcaluation has been "
+                "started with newub")
+        if self._state.crystal is None:
+            raise DiffcalcException(
+                "A crystal must be specified before refining U")
+        nref = len(self._state.reflist)
+        if nref < (3 if refine_lattice else 2):
+            raise DiffcalcException(
+                "%s reflections are required to refine %s" %
+                (('Three', 'the lattice') if refine_lattice else ('Two', 'U')))
+
+        reflist = self._state.reflist
+        q_phi = [self._measured_q_phi(pos, energy) for pos, energy in
+                 zip(reflist.get_positions(), reflist.get_energies())]
+        result = refine(reflist.get_hkl_array(), q_phi,
+                        self._state.crystal.B, refine_lattice)
+        self._set_refined_U(result.U, result.lattice)
+        return result
+
+    def _measured_q_phi(self, pos, energy):
+        """Return q in the phi frame in 1/Angstrom from a position in degrees
+        and an energy in keV"""
+        pos = pos.clone()
+        pos.changeToRadians()
+        wavevector = 2 * pi * energy / 12.39842
+        q_phi = kernel.as_vector(self._strategy.calculate_q_phi(pos))
+        return kernel.scale(q_phi, wavevector)
+
+    def _set_refined_U(self, U, lattice=None):
+        if lattice is not None:
+            name = self._state.crystal.getLattice()[0]
+            self._state.crystal = CrystalUnderTest(name, *lattice)
+        self._U = matrix(U.tolist())
+        self._state.configure_calc_type(manual_U=self._U)
+        self._UB = self._U * self._state.crystal.B
+        self._revision += 1
         self.save()
 
+### Indexing ###
+
+    def add_peak(self, position, energy, tag, time):
+        """add_peak(position, energy, tag, time) -- adds a peak of unknown hkl
+
+        position is in degrees and in the systems internal representation.
+        Peaks are kept only until indexed with index_peaks or the calculation
+        is changed, and are not saved.
+        """
+        if self._state.reflist is None:
+            raise DiffcalcException("No UBCalculation loaded")
+        if type(position) in (list, tuple):
+            try:
+                position = self._geometry.create_position(*position)
+            except AttributeError:
+                position = VliegPosition(*position)
+        self._peaks.append((position, float(energy), tag, time))
+
+    def get_number_peaks(self):
+        return len(self._peaks)
+
+    def index_peaks(self, refine_lattice=False, q_tolerance=.01,
+                    angle_tolerance=.5, hkl_tolerance=.15):
+        """
+        Find U, and the hkl of each peak added with add_peak, from the
+        lattice alone. Indexed peaks are moved into the reflection list (in
+        order) and U (and optionally the lattice) refined against them.
+        Returns an IndexingResult for the peaks. Requires numpy.
+
+        q_tolerance is relative, angle_tolerance in degrees and hkl_tolerance
+        the largest distance in each of h, k and l from an integer.
+        """
+        from diffcalc.ub.indexing import index_peaks
+
+        if self._state.reflist is None:
+            raise DiffcalcException(
+                "Cannot index peaks until a UBCalcaluation has been started "
+                "with newub")
+        if self._state.crystal is None:
+            raise DiffcalcException(
+                "A crystal must be specified before indexing peaks")
+        q_phi = [self._measured_q_phi(pos, energy)
+                 for pos, energy, _, _ in self._peaks]
+        result = index_peaks(q_phi, self._state.crystal.B, q_tolerance,
+                             angle_tolerance, hkl_tolerance, refine_lattice)
+
+        remaining = []
+        for peak, hkl, indexed in zip(self._peaks, result.hkl,
+                                      result.indexed):
+            if indexed:
+                pos, energy, tag, time = peak
+                self._state.reflist.add_reflection(
+                    hkl[0], hkl[1], hkl[2], pos, energy, tag, time)
+            else:
+                remaining.append(peak)
+        self._peaks = remaining
+        self._set_refined_U(result.U, result.refinement.lattice)
+        return result
+
     def get_hkl_plane_distance(self, hkl):
         """Calculates and returns the distance between planes"""
         return self._state.crystal.get_hkl_plane_distance(hkl)
+
+    def get_two_theta_batch(self, hkl, wavelength):
+        """Return an N array of two-theta in degrees for N*3 hkl at a
+        wavelength in Angstroms (NaN where unreachable). Requires numpy.
+        """
+        from diffcalc.ub.catalogue import two_theta
+        if self._state.crystal is None:
+            raise DiffcalcException("A crystal must be specified")
+        return two_theta(self._state.crystal.B, hkl, wavelength)
+
+    def reflection_catalogue(self, wavelength, centring='P',
+                             two_theta_max=180.):
+        """Generate the reflections reachable at a wavelength in Angstroms
+        in order of increasing two-theta, as (hkl, two_theta) arrays for
+        successive shells of |Q|. Requires numpy.
+
+        Reflections systematically absent for the lattice centring (P, I, F,
+        C, A, B or R) are left out.
+        """
+        from diffcalc.ub.catalogue import reflections
+        if self._state.crystal is None:
+            raise DiffcalcException("A crystal must be specified")
+        return reflections(self._state.crystal.B, wavelength, centring,
+                           two_theta_max)
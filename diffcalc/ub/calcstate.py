@@ -87,24 +87,31 @@ class UBCalcStateEncoder(json.JSONEncoder):
         
         if isinstance(obj, ReflectionList):
             d = OrderedDict()
-            for n, ref in enumerate(obj._reflist):
-                d[str(n+1)] = ref
+            columns = zip(obj._hkl, obj._positions, obj._energies, obj._tags,
+                          obj._times)
+            for n, (hkl, pos, energy, tag, time) in enumerate(columns):
+                d[str(n+1)] = encode_reflection(hkl, pos, energy, tag, time)
             return d
 
         if isinstance(obj, _Reflection):
-            d = OrderedDict()
-            d['tag'] = obj.tag
-            d['hkl'] = repr([obj.h, obj.k, obj.l])
-            d['pos'] = repr(list(obj.pos.totuple()))
-            d['energy'] = obj.energy
-            dt = eval(obj.time)  # e.g. --> datetime.datetime(2013, 8, 5, 15, 47, 7, 962432)
-            d['time'] = None if dt is None else dt.isoformat()
-            return d
+            return encode_reflection((obj.h, obj.k, obj.l), obj.pos.totuple(),
+                                     obj.energy, obj.tag, obj.time)
         
         
         return json.JSONEncoder.default(self, obj)
 
 
+def encode_reflection(hkl, pos, energy, tag, time):
+    d = OrderedDict()
+    d['tag'] = tag
+    d['hkl'] = repr(list(hkl))
+    d['pos'] = repr(list(pos))
+    d['energy'] = energy
+    dt = eval(time)  # e.g. --> datetime.datetime(2013, 8, 5, 15, 47, 7, 962432)
+    d['time'] = None if dt is None else dt.isoformat()
+    return d
+
+
 def decode_ubcalcstate(state, geometry, diffractometer_axes_names):
     return UBCalcState(
         name=state['name'],
@@ -125,7 +132,7 @@ def decode_matrix(rows):
 
 def decode_reflist(reflist_dict, geometry, diffractometer_axes_names):
     reflections = []
-    for key in sorted(reflist_dict.keys()):
+    for key in sorted(reflist_dict.keys(), key=int):
         reflections.append(decode_reflection(reflist_dict[key], geometry))
         
     return ReflectionList(geometry, diffractometer_axes_names, reflections)
@@ -0,0 +1,166 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Catalogues of the reflections reachable at a given wavelength. Requires
+numpy.
+
+Two-theta increases with |Q|, so the reflections are generated in shells of
+|Q| which are each sorted and yielded in turn. The shells are sized to hold
+about SHELL_SIZE reciprocal lattice points, so memory does not grow with the
+number of reflections. The points of a shell are found column by column: for
+each (h, k) the range of l inside a sphere of |Q| follows from a quadratic in
+l. Shells are at least one step in l thick, so that the (h, k) columns
+searched are not many more than the points found.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.util import DiffcalcException
+
+TODEG = 180 / pi
+
+SHELL_SIZE = 20000  # reciprocal lattice points generated at once
+
+# Reflection conditions for general hkl of each lattice centring (R on
+# hexagonal axes in the obverse setting)
+CENTRING_CONDITIONS = {
+    'P': lambda h, k, l: np.ones(h.shape, dtype=bool),
+    'I': lambda h, k, l: (h + k + l) % 2 == 0,
+    'F': lambda h, k, l: ((h + k) % 2 == 0) & ((k + l) % 2 == 0),
+    'C': lambda h, k, l: (h + k) % 2 == 0,
+    'A': lambda h, k, l: (k + l) % 2 == 0,
+    'B': lambda h, k, l: (h + l) % 2 == 0,
+    'R': lambda h, k, l: (-h + k + l) % 3 == 0,
+}
+
+
+def allowed(hkl, centring='P'):
+    """Return a mask of the N*3 integer hkl not systematically absent for the
+    lattice centring (one of P, I, F, C, A, B or R)."""
+    try:
+        condition = CENTRING_CONDITIONS[centring.upper()]
+    except (KeyError, AttributeError):
+        raise DiffcalcException(
+            "Unknown lattice centring %r, expected one of %s" %
+            (centring, ', '.join(sorted(CENTRING_CONDITIONS))))
+    hkl = np.asarray(hkl).astype(int)
+    return condition(hkl[..., 0], hkl[..., 1], hkl[..., 2])
+
+
+def two_theta(B, hkl, wavelength):
+    """Return an N array of two-theta in degrees for N*3 hkl from the B matrix
+    and wavelength in Angstroms (NaN where unreachable)."""
+    hkl = np.asarray(hkl, dtype=float)
+    q = np.sqrt(np.sum(np.dot(hkl, np.asarray(B, dtype=float).T) ** 2,
+                       axis=-1))
+    sin_theta = q * wavelength / (4 * pi)
+    with np.errstate(invalid='ignore'):
+        return 2 * np.arcsin(np.where(sin_theta <= 1, sin_theta, np.nan)) \
+            * TODEG
+
+
+def _integer_ranges(starts, stops):
+    """Return the indices of and the integers in [starts[i], stops[i]) for
+    each i, concatenated."""
+    counts = np.maximum(stops - starts, 0)
+    column = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                  counts)
+    return column, starts[column] + offsets
+
+
+def _shell(B, q_inner, q_outer):
+    """Return the M*3 integer hkl with q_inner < |B*hkl| <= q_outer and their
+    |B*hkl|."""
+    # |h|, |k| <= |row of inv(B)| * |q|
+    limits = np.floor(q_outer * np.sqrt(np.sum(np.linalg.inv(B)[:2] ** 2,
+                                               axis=1))).astype(int)
+    h, k = np.meshgrid(np.arange(-limits[0], limits[0] + 1),
+                       np.arange(-limits[1], limits[1] + 1), indexing='ij')
+    h, k = h.ravel(), k.ravel()
+
+    # |p + l*b3|^2 = a*l^2 + 2*b*l + c for p = h*b1 + k*b2
+    p = np.outer(h, B[:, 0]) + np.outer(k, B[:, 1])
+    a = np.dot(B[:, 2], B[:, 2])
+    b = np.dot(p, B[:, 2])
+    c = np.sum(p * p, axis=-1)
+
+    def l_bounds(q):
+        with np.errstate(invalid='ignore'):
+            root = np.sqrt(b * b - a * (c - q * q))
+        return (-b - root) / a, (-b + root) / a  # NaN if no l inside
+
+    outer_lo, outer_hi = l_bounds(q_outer)
+    inside = ~np.isnan(outer_lo)
+    h, k, b, c = h[inside], k[inside], b[inside], c[inside]
+    outer_lo, outer_hi = outer_lo[inside], outer_hi[inside]
+    start = np.ceil(outer_lo).astype(int)
+    stop = np.floor(outer_hi).astype(int) + 1
+    inner_lo, inner_hi = l_bounds(q_inner)
+    hole = ~np.isnan(inner_lo)
+    # l outside the inner sphere: [start, inner_lo] and [inner_hi, stop)
+    gap_start = np.where(hole, np.floor(np.where(hole, inner_lo, 0)) + 1,
+                         stop).astype(int)
+    gap_stop = np.where(hole, np.ceil(np.where(hole, inner_hi, 0)),
+                        stop).astype(int)
+    gap_start = np.clip(gap_start, start, stop)
+    gap_stop = np.clip(np.maximum(gap_stop, gap_start), start, stop)
+
+    lower, l_lower = _integer_ranges(start, gap_start)
+    upper, l_upper = _integer_ranges(gap_stop, stop)
+    column = np.concatenate((lower, upper))
+    hkl = np.stack((h[column], k[column],
+                    np.concatenate((l_lower, l_upper))), axis=-1)
+    q = np.sqrt(np.sum(np.dot(hkl, B.T) ** 2, axis=-1))
+    keep = (q > q_inner) & (q <= q_outer)
+    return hkl[keep], q[keep]
+
+
+def reflections(B, wavelength, centring='P', two_theta_max=180.,
+                shell_size=SHELL_SIZE):
+    """Generate the reflections reachable at a wavelength (in Angstroms) in
+    order of increasing two-theta, from the B matrix.
+
+    Yields (hkl, two_theta) for successive shells of |Q|, with hkl an M*3
+    integer array and two_theta an M array in degrees. Reflections
+    systematically absent for the lattice centring are left out.
+    """
+    B = np.asarray(B, dtype=float)
+    if wavelength <= 0:
+        raise DiffcalcException("The wavelength must be positive")
+    allowed(np.zeros((0, 3)), centring)  # check the centring
+    q_max = 4 * pi * np.sin(min(two_theta_max, 180.) / 2 / TODEG) / wavelength
+    # reciprocal lattice points per 1/Angstrom^3 of reciprocal space
+    density = 1 / abs(np.linalg.det(B))
+    shell_volume = shell_size / density
+    l_step = np.linalg.norm(B[:, 2])
+    q_inner = 0.
+    while q_inner < q_max:
+        q_outer = max((q_inner ** 3 + 3 * shell_volume / (4 * pi)) ** (1. / 3),
+                      q_inner + l_step)
+        q_outer = min(q_max, q_outer)
+        hkl, q = _shell(B, q_inner, q_outer)
+        keep = allowed(hkl, centring)
+        hkl, q = hkl[keep], q[keep]
+        order = np.lexsort((hkl[:, 2], hkl[:, 1], hkl[:, 0], q))
+        hkl, q = hkl[order], q[order]
+        sin_theta = np.minimum(q * wavelength / (4 * pi), 1)
+        if len(hkl):
+            yield hkl, 2 * np.arcsin(sin_theta) * TODEG
+        q_inner = q_outer
@@ -56,7 +56,9 @@ class UbCommands(object):
                          self.setu,
                          self.setub,
                          self.calcub,
-                         self.trialub]
+                         self.trialub,
+                         self.refineub,
+                         self.indexub]
         if not include_sigtau:
             self.commands.remove('Surface')
             self.commands.remove(self.sigtau)
@@ -150,11 +152,14 @@ class UbCommands(object):
     def c2th(self, hkl, en=None):
         """
         c2th [h k l]  -- calculate two-theta angle for reflection
+        c2th [[h k l] ..]  -- calculate two-theta angles for reflections
         """
         if en is None:
             wl = self._hardware.get_wavelength()
         else:
             wl = 12.39842 / en
+        if len(hkl) and hasattr(hkl[0], '__len__'):
+            return self._ubcalc.get_two_theta_batch(hkl, wl)
         d = self._ubcalc.get_hkl_plane_distance(hkl)
         return 2.0 * asin(wl / (d * 2)) * TODEG
 
@@ -193,6 +198,7 @@ class UbCommands(object):
         addref -- add reflection interactively
         addref [h k l] {'tag'} -- add reflection with current position and energy
         addref [h k l] (p1,p2...pN) energy {'tag'} -- add arbitrary reflection
+        addref None {(p1,p2...pN) energy} {'tag'} -- add peak to index (indexub)
         """
 
         if len(args) == 0:
@@ -231,9 +237,11 @@ class UbCommands(object):
                                        datetime.now())
         elif len(args) in (1, 2, 3, 4):
             args = list(args)
-            h, k, l = args.pop(0)
-            if not (isnum(h) and isnum(k) and isnum(l)):
-                raise TypeError()
+            hkl = args.pop(0)
+            if hkl is not None:
+                h, k, l = hkl
+                if not (isnum(h) and isnum(k) and isnum(l)):
+                    raise TypeError()
             if len(args) >= 2:
                 pos = self._geometry.physical_angles_to_internal_position(
                     args.pop(0))
@@ -250,8 +258,11 @@ class UbCommands(object):
                     raise TypeError()
             else:
                 tag = None
-            self._ubcalc.add_reflection(h, k, l, pos, energy, tag,
-                                       datetime.now())
+            if hkl is None:
+                self._ubcalc.add_peak(pos, energy, tag, datetime.now())
+            else:
+                self._ubcalc.add_reflection(h, k, l, pos, energy, tag,
+                                           datetime.now())
         else:
             raise TypeError()
 
@@ -373,6 +384,48 @@ class UbCommands(object):
         """
         self._ubcalc.calculate_UB_from_primary_only()
 
+    @command
+    def refineub(self, refine_lattice=False):
+        """refineub {True} -- refine u matrix (and lattice) from all reflections.
+        """
+        result = self._ubcalc.refine_UB(bool(refine_lattice))
+        print "\n     %4s  %4s  %4s    %6s   %6s   %6s   %7s" % (
+            'H', 'K', 'L', 'DH', 'DK', 'DL', 'ANGLE')
+        for n in range(len(result.angle_residuals)):
+            hkl = self._ubcalc.get_reflection(n + 1)[0]
+            dh, dk, dl = result.hkl_residuals[n]
+            print ("  %2d % 4.2f % 4.2f % 4.2f   % 6.4f  % 6.4f  % 6.4f  "
+                   "% 7.4f" % (n + 1, hkl[0], hkl[1], hkl[2], dh, dk, dl,
+                               result.angle_residuals[n]))
+        print "\nrms angle residual: %.4f deg" % result.rms_angle
+        if result.lattice is not None:
+            print ("refined lattice: % 9.5f % 9.5f % 9.5f % 9.5f % 9.5f % 9.5f"
+                   % tuple(result.lattice))
+        print ("NOTE: A new UB matrix will not be automatically calculated "
+               "when the orientation reflections are modified.")
+
+    @command
+    def indexub(self, refine_lattice=False):
+        """indexub {True} -- find u matrix and hkl of unindexed peaks (see addref)
+        """
+        npeak = self._ubcalc.get_number_peaks()
+        nref = self._ubcalc.get_number_reflections()
+        result = self._ubcalc.index_peaks(bool(refine_lattice))
+        print "Indexed %i of %i peaks:" % (sum(result.indexed), npeak)
+        for n, (hkl, indexed) in enumerate(zip(result.hkl, result.indexed)):
+            if indexed:
+                nref += 1
+                print "  peak %2d -> reflection %2d: % 4.2f % 4.2f % 4.2f" % (
+                    n + 1, nref, hkl[0], hkl[1], hkl[2])
+            else:
+                print "  peak %2d not indexed" % (n + 1)
+        print "\nrms angle residual: %.4f deg" % result.refinement.rms_angle
+        if result.refinement.lattice is not None:
+            print ("refined lattice: % 9.5f % 9.5f % 9.5f % 9.5f % 9.5f % 9.5f"
+                   % tuple(result.refinement.lattice))
+        print ("NOTE: A new UB matrix will not be automatically calculated "
+               "when the orientation reflections are modified.")
+
     def _is3x3TupleOrList(self, m):
         if type(m) not in (list, tuple):
             return False
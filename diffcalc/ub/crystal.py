@@ -90,13 +90,9 @@ class CrystalUnderTest(object):
 
     def get_hkl_plane_distance(self, hkl):
         '''Calculates and returns the distance between planes'''
-        h, k, l = hkl
-        c1 = self._a1 * self._a2 * cos(self._beta3)
-        c2 = self._a1 * self._a3 * cos(self._beta2)
-        c3 = self._a2 * self._a3 * cos(self._beta1)
-        return sqrt(1.0 / (h ** 2 * self._a1 ** 2 + k ** 2 * self._a2 ** 2 +
-                           l ** 2 * self._a3 ** 2 + 2 * h * k * c1 +
-                           2 * h * l * c2 + 2 * k * l * c3))
+        b = self._bMatrix
+        q = [sum(b[i, j] * hkl[j] for j in range(3)) for i in range(3)]
+        return 2 * pi / sqrt(q[0] ** 2 + q[1] ** 2 + q[2] ** 2)
 
     def __str__(self):
         '''    Returns lattice name and all set and calculated parameters'''
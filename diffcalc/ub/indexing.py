@@ -0,0 +1,221 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Automatic indexing of peaks whose hkl are unknown. Requires numpy.
+
+Candidate reflections are generated from the B matrix and sorted by |Q|, so
+the candidates for a peak are found with a binary search on its measured |Q|.
+The angles between the candidates of any two |Q| shells are computed once,
+sorted and kept in a table keyed by the two shells, so the candidate pairs
+for a pair of peaks are again found with a binary search on the measured
+angle between them. Each candidate pair gives an orientation (as in
+UBCalculation.calculate_UB), which is scored by the number of peaks it
+indexes. The best orientation is then refined by least squares against all
+of the peaks it indexes.
+"""
+
+from math import pi
+
+import numpy as np
+
+from diffcalc.ub.refine import refine
+from diffcalc.util import DiffcalcException
+
+TORAD = pi / 180
+SMALL = 1e-4  # as used for calculate_UB
+
+PAIR_PEAKS = 12  # number of peaks (taken in order) used to form pairs
+SCORE_CHUNK = 2000  # orientations scored at once
+
+
+def _unit_vectors(v):
+    return v / np.sqrt(np.sum(v * v, axis=-1))[..., np.newaxis]
+
+
+def candidate_hkl(B, q_max):
+    """Return an M*3 array of the non-zero integer hkl with |B*hkl| <= q_max
+    (in 1/Angstrom) sorted by |B*hkl|.
+    """
+    B = np.asarray(B, dtype=float)
+    # |hkl_i| <= |row i of inv(B)| * |q|
+    limits = np.floor(q_max * np.sqrt(np.sum(np.linalg.inv(B) ** 2, axis=1)))
+    h, k, l = [np.arange(-n, n + 1) for n in limits.astype(int)]
+    hkl = np.stack(np.meshgrid(h, k, l, indexing='ij'), axis=-1).reshape(-1, 3)
+    q = np.sqrt(np.sum(np.dot(hkl, B.T) ** 2, axis=-1))
+    keep = (q <= q_max) & np.any(hkl != 0, axis=-1)
+    hkl, q = hkl[keep], q[keep]
+    order = np.argsort(q, kind='mergesort')
+    return hkl[order].astype(float)
+
+
+class CandidateIndex(object):
+    """Candidate reflections sorted by |Q| with tables of the angles between
+    candidates in pairs of |Q| shells."""
+
+    def __init__(self, B, q_max):
+        self.B = np.asarray(B, dtype=float)
+        self.hkl = candidate_hkl(self.B, q_max)
+        self.q_crystal = np.dot(self.hkl, self.B.T)
+        self.q_lengths = np.sqrt(np.sum(self.q_crystal ** 2, axis=-1))
+        self._angle_tables = {}
+
+    def shell(self, q_length, q_tolerance):
+        """Return (start, stop) of the candidates with |Q| within the relative
+        tolerance of q_length."""
+        return (np.searchsorted(self.q_lengths, q_length * (1 - q_tolerance)),
+                np.searchsorted(self.q_lengths, q_length * (1 + q_tolerance),
+                                side='right'))
+
+    def _angle_table(self, shell_a, shell_b):
+        key = shell_a + shell_b
+        table = self._angle_tables.get(key)
+        if table is None:
+            ia, ib = np.meshgrid(np.arange(*shell_a), np.arange(*shell_b),
+                                 indexing='ij')
+            ia, ib = ia.ravel(), ib.ravel()
+            ua = _unit_vectors(self.q_crystal[ia])
+            ub = _unit_vectors(self.q_crystal[ib])
+            angles = np.arccos(np.clip(np.sum(ua * ub, axis=-1), -1, 1))
+            order = np.argsort(angles, kind='mergesort')
+            table = self._angle_tables[key] = (angles[order], ia[order],
+                                               ib[order])
+        return table
+
+    def pairs(self, shell_a, shell_b, angle, angle_tolerance):
+        """Return the indices of the candidate pairs from two shells whose
+        angle (radians) is within the tolerance of that given."""
+        angles, ia, ib = self._angle_table(shell_a, shell_b)
+        start = np.searchsorted(angles, angle - angle_tolerance)
+        stop = np.searchsorted(angles, angle + angle_tolerance, side='right')
+        return ia[start:stop], ib[start:stop]
+
+
+def orientations(h1c, h2c, u1p, u2p):
+    """Return a K*3*3 array of U matrices from K*3 arrays of pairs of
+    reflections in the crystal and phi frames (vectorized calculate_UB)."""
+
+    def frame(v1, v2):
+        t1 = v1
+        t3 = np.cross(v1, v2)
+        t2 = np.cross(t3, t1)
+        return np.stack((_unit_vectors(t1), _unit_vectors(t2),
+                         _unit_vectors(t3)), axis=-1)
+
+    Tc, Tp = frame(h1c, h2c), frame(u1p, u2p)
+    return np.einsum('kij,klj->kil', Tp, Tc)
+
+
+def index_with(UB, q_phi, hkl_tolerance):
+    """Return the hkl calculated from N*3 q_phi with UB, the nearest integer
+    hkl and a mask of those within hkl_tolerance of it."""
+    hkl = np.dot(q_phi, np.linalg.inv(UB).T)
+    nearest = np.round(hkl)
+    indexed = (np.all(abs(hkl - nearest) <= hkl_tolerance, axis=-1) &
+               np.any(nearest != 0, axis=-1))
+    return hkl, nearest, indexed
+
+
+class IndexingResult(object):
+    """The result of indexing a set of peaks.
+
+    U, UB -- refined 3*3 arrays
+    hkl -- N*3 array of integer hkl for each peak (NaN where not indexed)
+    indexed -- N array of booleans, True for indexed peaks
+    refinement -- the UBRefinement of the indexed peaks
+    """
+
+    def __init__(self, U, UB, hkl, indexed, refinement):
+        self.U = U
+        self.UB = UB
+        self.hkl = hkl
+        self.indexed = indexed
+        self.refinement = refinement
+
+
+def index_peaks(q_phi, B, q_tolerance=.01, angle_tolerance=.5,
+                hkl_tolerance=.15, refine_lattice=False):
+    """Return an IndexingResult from an N*3 array of measured q in the phi
+    frame (in 1/Angstrom) and the B matrix.
+
+    q_tolerance is relative, angle_tolerance in degrees and hkl_tolerance
+    the largest distance in each of h, k and l from an integer.
+    """
+    q_phi = np.asarray(q_phi, dtype=float)
+    B = np.asarray(B, dtype=float)
+    if len(q_phi) < 2:
+        raise DiffcalcException("At least two peaks are required to index")
+    q_lengths = np.sqrt(np.sum(q_phi ** 2, axis=-1))
+    if np.any(q_lengths < SMALL):
+        raise DiffcalcException("Cannot index peaks with zero momentum "
+                                "transfer")
+    candidates = CandidateIndex(B, q_lengths.max() * (1 + q_tolerance))
+    shells = [candidates.shell(q, q_tolerance) for q in q_lengths]
+    u_phi = _unit_vectors(q_phi)
+
+    # Vote: each pair of peaks proposes the orientations of its candidate
+    # pairs, which are scored by the number of peaks they index
+    best_U, best_score = None, (0, 0)
+    npair = min(len(q_phi), PAIR_PEAKS)
+    for i in range(npair):
+        for j in range(i + 1, npair):
+            angle = np.arccos(np.clip(np.dot(u_phi[i], u_phi[j]), -1, 1))
+            if min(angle, pi - angle) < SMALL:
+                continue  # parallel peaks do not fix an orientation
+            ia, ib = candidates.pairs(shells[i], shells[j], angle,
+                                      angle_tolerance * TORAD)
+            for start in range(0, len(ia), SCORE_CHUNK):
+                chunk = slice(start, start + SCORE_CHUNK)
+                U, score = _best_orientation(
+                    candidates.q_crystal[ia[chunk]],
+                    candidates.q_crystal[ib[chunk]], q_phi[i], q_phi[j],
+                    q_phi, B, hkl_tolerance)
+                if score > best_score:
+                    best_U, best_score = U, score
+    if best_U is None or best_score[0] < 2:
+        raise DiffcalcException("No orientation indexes more than one of the "
+                                "peaks")
+
+    # Refine against all indexed peaks and re-index with the refined UB
+    UB = np.dot(best_U, B)
+    for _ in range(3):
+        _, nearest, indexed = index_with(UB, q_phi, hkl_tolerance)
+        refinement = refine(nearest[indexed], q_phi[indexed], B,
+                            refine_lattice)
+        B = np.dot(refinement.U.T, refinement.UB)
+        UB = refinement.UB
+    _, nearest, indexed = index_with(UB, q_phi, hkl_tolerance)
+    hkl = np.where(indexed[:, np.newaxis], nearest, np.nan)
+    return IndexingResult(refinement.U, UB, hkl, indexed, refinement)
+
+
+def _best_orientation(h1c, h2c, u1p, u2p, q_phi, B, hkl_tolerance):
+    """Return the U from the candidate pairs which indexes most peaks, and its
+    score as (number indexed, -sum of squared hkl residuals)"""
+    n = len(h1c)
+    U = orientations(h1c, np.broadcast_to(h2c, (n, 3)),
+                     np.broadcast_to(u1p, (n, 3)),
+                     np.broadcast_to(u2p, (n, 3)))
+    # hkl = inv(B) * U.T * q for every orientation and peak
+    hkl = np.einsum('ij,kmj->kmi', np.linalg.inv(B),
+                    np.einsum('kji,mj->kmi', U, q_phi))
+    residuals = hkl - np.round(hkl)
+    indexed = np.all(abs(residuals) <= hkl_tolerance, axis=-1)
+    counts = np.sum(indexed, axis=-1)
+    errors = np.sum(np.where(indexed, np.sum(residuals ** 2, axis=-1), 0),
+                    axis=-1)
+    best = np.lexsort((errors, -counts))[0]
+    return U[best], (counts[best], -errors[best])
@@ -16,6 +16,7 @@ class YouReference(object):
     
     def __init__(self, ubcalc):
         self._ubcalc = ubcalc
+        self.revision = 0  # bumped whenever the reference vector changes
         self._n_phi_configured = None
         self._n_hkl_configured = None
         self._set_n_phi_configured(matrix('0; 0; 1'))
@@ -23,6 +24,7 @@ class YouReference(object):
     def _set_n_phi_configured(self, n_phi):
         self._n_phi_configured = n_phi
         self._n_hkl_configured = None
+        self.revision += 1
     
     def _get_n_phi_configured(self):
         return self._n_phi_configured
@@ -32,6 +34,7 @@ class YouReference(object):
     def _set_n_hkl_configured(self, n_hkl):
         self._n_phi_configured = None
         self._n_hkl_configured = n_hkl
+        self.revision += 1
         
     def _get_n_hkl_configured(self):
         return self._n_hkl_configured
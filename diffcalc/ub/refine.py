@@ -0,0 +1,152 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+"""Least-squares refinement of U, and optionally the lattice, from any number
+of reflections. Requires numpy.
+
+With the lattice fixed, U is the rotation which best maps the directions of
+B*hkl onto the measured momentum transfer directions (the orthogonal
+Procrustes problem, solved with one SVD). With the lattice free, UB is fitted
+as a general matrix by linear least squares and split into a rotation and an
+upper triangular B matrix (as in Busing and Levy) by QR decomposition.
+"""
+
+from math import pi, acos, sqrt
+
+import numpy as np
+
+from diffcalc.util import DiffcalcException
+
+TODEG = 180 / pi
+SMALL = 1e-4  # as used for calculate_UB
+
+
+def _unit_vectors(v):
+    lengths = np.sqrt(np.sum(v * v, axis=-1))
+    if np.any(lengths < SMALL):
+        raise DiffcalcException(
+            "Invalid orientation reflection(s): zero length q or hkl")
+    return v / lengths[:, np.newaxis]
+
+
+def fit_U(h_crystal, q_phi):
+    """Return the 3*3 rotation U minimising the sum of the squared distances
+    between U*h_c and q_phi, with both N*3 arrays normalised first.
+    """
+    h_crystal = _unit_vectors(np.asarray(h_crystal, dtype=float))
+    q_phi = _unit_vectors(np.asarray(q_phi, dtype=float))
+    V, S, Wt = np.linalg.svd(np.dot(q_phi.T, h_crystal))
+    if S[1] < SMALL:
+        raise DiffcalcException(
+            "At least two non-parallel reflections are required to refine U")
+    d = np.sign(np.linalg.det(np.dot(V, Wt)))
+    return np.dot(V * [1, 1, d], Wt)
+
+
+def fit_UB(hkl, q_phi):
+    """Return the general 3*3 matrix UB minimising the sum of the squared
+    distances between UB*hkl and q_phi (N*3 arrays, q_phi in 1/Angstrom).
+    """
+    hkl = np.asarray(hkl, dtype=float)
+    UBt, _, rank, _ = np.linalg.lstsq(hkl, np.asarray(q_phi, dtype=float),
+                                      rcond=None)
+    if rank < 3:
+        raise DiffcalcException("At least three non-coplanar reflections are "
+                                "required to refine the lattice")
+    return UBt.T
+
+
+def split_UB(UB):
+    """Return (U, B) with U a rotation and B upper triangular with a positive
+    diagonal, such that U*B = UB.
+    """
+    U, B = np.linalg.qr(np.asarray(UB, dtype=float))
+    signs = np.sign(np.diag(B))
+    U, B = U * signs, B * signs[:, np.newaxis]
+    if np.linalg.det(U) < 0:
+        raise DiffcalcException("The refined UB matrix is left handed; check "
+                                "the indices of the reflections")
+    return U, B
+
+
+def lattice_from_B(B):
+    """Return the lattice parameters (a, b, c, alpha, beta, gamma) in
+    Angstroms and degrees corresponding to a B matrix.
+    """
+    G = np.linalg.inv(np.dot(B.T, B)) * (2 * pi) ** 2  # direct metric tensor
+    a, b, c = np.sqrt(np.diag(G))
+
+    def angle(cos_angle):
+        return acos(max(-1., min(1., cos_angle))) * TODEG
+
+    return (a, b, c, angle(G[1, 2] / (b * c)), angle(G[0, 2] / (a * c)),
+            angle(G[0, 1] / (a * b)))
+
+
+def residuals(UB, hkl, q_phi):
+    """Return the angle in degrees between UB*hkl and q_phi, and the N*3
+    difference between the hkl calculated from q_phi and that given, for each
+    reflection.
+    """
+    UB = np.asarray(UB, dtype=float)
+    hkl = np.asarray(hkl, dtype=float)
+    q_phi = np.asarray(q_phi, dtype=float)
+    cos_angles = np.sum(_unit_vectors(np.dot(hkl, UB.T)) *
+                        _unit_vectors(q_phi), axis=-1)
+    angles = np.arccos(np.clip(cos_angles, -1, 1)) * TODEG
+    hkl_calculated = np.dot(q_phi, np.linalg.inv(UB).T)
+    return angles, hkl_calculated - hkl
+
+
+class UBRefinement(object):
+    """The result of refining U (and optionally the lattice).
+
+    U, UB -- refined 3*3 arrays
+    lattice -- refined (a, b, c, alpha, beta, gamma) or None if fixed
+    angle_residuals -- N array of angles in degrees between calculated and
+                       measured q for each reflection
+    hkl_residuals -- N*3 array of calculated minus given hkl
+    """
+
+    def __init__(self, U, UB, lattice, angle_residuals, hkl_residuals):
+        self.U = U
+        self.UB = UB
+        self.lattice = lattice
+        self.angle_residuals = angle_residuals
+        self.hkl_residuals = hkl_residuals
+
+    @property
+    def rms_angle(self):
+        return sqrt(np.mean(self.angle_residuals ** 2))
+
+
+def refine(hkl, q_phi, B, refine_lattice=False):
+    """Return a UBRefinement from N*3 arrays of hkl and measured q in the phi
+    frame (in 1/Angstrom) and the current B matrix.
+    """
+    hkl = np.asarray(hkl, dtype=float)
+    q_phi = np.asarray(q_phi, dtype=float)
+    B = np.asarray(B, dtype=float)
+    if refine_lattice:
+        U, B = split_UB(fit_UB(hkl, q_phi))
+        lattice = lattice_from_B(B)
+    else:
+        U = fit_U(np.dot(hkl, B.T), q_phi)
+        lattice = None
+    UB = np.dot(U, B)
+    angles, hkl_residuals = residuals(UB, hkl, q_phi)
+    return UBRefinement(U, UB, lattice, angles, hkl_residuals)
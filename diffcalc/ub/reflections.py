@@ -16,11 +16,16 @@
 # along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
 ###
 
-from copy import deepcopy
 import datetime  # @UnusedImport for the eval below
 from diffcalc.util import DiffcalcException
 from diffcalc.hkl.vlieg.geometry import VliegPosition
 
+HKL_INDEX_DIGITS = 4  # hkl are rounded to this many decimals when indexed
+
+
+def _hkl_key(hkl):
+    return tuple(round(x, HKL_INDEX_DIGITS) + 0. for x in hkl)
+
 
 class _Reflection:
     """A reflection"""
@@ -44,12 +49,55 @@ class _Reflection:
 
 
 class ReflectionList:
+    """Numbered reflections (from 1) stored as columns.
+
+    hkl, positions (in degrees), energies, tags and times are held in one
+    list per column, with indexes by tag and by rounded hkl built when first
+    needed after a change. Whole columns are available as numpy arrays.
+    """
 
     def __init__(self, diffractometerPluginObject, externalAngleNames, reflections=None):
         self._geometry = diffractometerPluginObject
         self._externalAngleNames = externalAngleNames
-        self._reflist = reflections if reflections else []
-            
+        self._hkl = []  # (h, k, l) tuples
+        self._positions = []  # position tuples in degrees
+        self._position_types = []
+        self._energies = []
+        self._tags = []
+        self._times = []  # saved as e.g. repr(datetime.now())
+        self._indexes = None  # (by tag, by hkl) or None until rebuilt
+        self._arrays = {}
+        for reflection in (reflections if reflections else []):
+            self._append(reflection)
+
+    def _append(self, reflection):
+        self._hkl.append((reflection.h, reflection.k, reflection.l))
+        self._positions.append(tuple(reflection.pos.totuple()))
+        self._position_types.append(type(reflection.pos))
+        self._energies.append(reflection.energy)
+        self._tags.append(reflection.tag)
+        self._times.append(reflection.time)
+        self._changed()
+
+    def _set(self, i, reflection):
+        self._hkl[i] = (reflection.h, reflection.k, reflection.l)
+        self._positions[i] = tuple(reflection.pos.totuple())
+        self._position_types[i] = type(reflection.pos)
+        self._energies[i] = reflection.energy
+        self._tags[i] = reflection.tag
+        self._times[i] = reflection.time
+        self._changed()
+
+    def _columns(self):
+        return (self._hkl, self._positions, self._position_types,
+                self._energies, self._tags, self._times)
+
+    def _changed(self):
+        self._indexes = None
+        self._arrays = {}
+
+    def _position(self, i):
+        return self._position_types[i](*self._positions[i])
 
     def add_reflection(self, h, k, l, position, energy, tag, time):
         """adds a reflection, position in degrees
@@ -59,53 +107,113 @@ class ReflectionList:
                 position = self._geometry.create_position(*position)
             except AttributeError:
                 position = VliegPosition(*position)
-        self._reflist += [_Reflection(h, k, l, position, energy, tag,
-                                     time.__repr__())]
+        self._append(_Reflection(h, k, l, position, energy, tag,
+                                 time.__repr__()))
 
     def edit_reflection(self, num, h, k, l, position, energy, tag, time):
         """num starts at 1"""
         if type(position) in (list, tuple):
             position = VliegPosition(*position)
-        try:
-            self._reflist[num - 1] = _Reflection(h, k, l, position, energy, tag,
-                                                time.__repr__())
-        except IndexError:
+        if not 0 < num <= len(self):
             raise DiffcalcException("There is no reflection " + repr(num)
                                      + " to edit.")
+        self._set(num - 1, _Reflection(h, k, l, position, energy, tag,
+                                       time.__repr__()))
 
     def getReflection(self, num):
         """
         getReflection(num) --> ( [h, k, l], position, energy, tag, time ) --
         num starts at 1 position in degrees
         """
-        r = deepcopy(self._reflist[num - 1])  # for convenience
-        return [r.h, r.k, r.l], deepcopy(r.pos), r.energy, r.tag, eval(r.time)
+        i = num - 1
+        h, k, l = self._hkl[i]
+        return ([h, k, l], self._position(i), self._energies[i],
+                self._tags[i], eval(self._times[i]))
 
     def get_reflection_in_external_angles(self, num):
         """getReflection(num) --> ( [h, k, l], (angle1...angleN), energy, tag )
         -- num starts at 1 position in degrees"""
-        r = deepcopy(self._reflist[num - 1])  # for convenience
-        externalAngles = self._geometry.internal_position_to_physical_angles(r.pos)
-        result = [r.h, r.k, r.l], externalAngles, r.energy, r.tag, eval(r.time)
-        return result
+        i = num - 1
+        h, k, l = self._hkl[i]
+        externalAngles = self._geometry.internal_position_to_physical_angles(
+            self._position(i))
+        return ([h, k, l], externalAngles, self._energies[i], self._tags[i],
+                eval(self._times[i]))
 
     def removeReflection(self, num):
-        del self._reflist[num - 1]
+        for column in self._columns():
+            del column[num - 1]
+        self._changed()
 
     def swap_reflections(self, num1, num2):
-        orig1 = self._reflist[num1 - 1]
-        self._reflist[num1 - 1] = self._reflist[num2 - 1]
-        self._reflist[num2 - 1] = orig1
+        for column in self._columns():
+            column[num1 - 1], column[num2 - 1] = \
+                column[num2 - 1], column[num1 - 1]
+        self._changed()
+
+### Lookups ###
+
+    def _get_indexes(self):
+        if self._indexes is None:
+            by_tag, by_hkl = {}, {}
+            for i, (tag, hkl) in enumerate(zip(self._tags, self._hkl)):
+                by_tag.setdefault(tag, []).append(i + 1)
+                by_hkl.setdefault(_hkl_key(hkl), []).append(i + 1)
+            self._indexes = by_tag, by_hkl
+        return self._indexes
+
+    def find_by_tag(self, tag):
+        """Return the numbers (from 1) of the reflections with the tag"""
+        return list(self._get_indexes()[0].get(tag, ()))
+
+    def find_by_hkl(self, hkl):
+        """Return the numbers (from 1) of the reflections with the hkl (to
+        HKL_INDEX_DIGITS decimal places)"""
+        return list(self._get_indexes()[1].get(_hkl_key(hkl), ()))
+
+### Columns ###
+
+    def _array(self, name, column, width=None):
+        array = self._arrays.get(name)
+        if array is None:
+            import numpy as np
+            array = np.array(column, dtype=float)
+            if width is not None:
+                array = array.reshape(len(column), width)
+            array.flags.writeable = False
+            self._arrays[name] = array
+        return array
+
+    def get_hkl_array(self):
+        """Return a read only N*3 numpy array of the reflections' hkl"""
+        return self._array('hkl', self._hkl, 3)
+
+    def get_positions_array(self):
+        """Return a read only N*k numpy array of the reflections' positions in
+        degrees (in the systems internal representation)"""
+        width = len(self._positions[0]) if self._positions else 0
+        return self._array('positions', self._positions, width)
+
+    def get_energies(self):
+        """Return a read only N numpy array of the reflections' energies"""
+        return self._array('energies', self._energies)
+
+    def get_positions(self):
+        """Return a list of the reflections' positions in degrees"""
+        return [self._position(i) for i in range(len(self))]
+
+    def get_tags(self):
+        return list(self._tags)
 
     def __len__(self):
-        return len(self._reflist)
+        return len(self._hkl)
 
     def __str__(self):
         return '\n'.join(self.str_lines())
 
     def str_lines(self):
         axes = tuple(s.upper() for s in self._externalAngleNames)
-        if not self._reflist:
+        if not self._hkl:
             return ["   <<< none specified >>>"]
 
         lines = []
@@ -114,7 +222,7 @@ class ReflectionList:
         values = ('ENERGY', 'H', 'K', 'L') + axes
         lines.append(format % values)
 
-        for n in range(len(self._reflist)):
+        for n in range(len(self)):
             ref_tuple = self.get_reflection_in_external_angles(n + 1)
             [h, k, l], externalAngles, energy, tag, _ = ref_tuple
             if tag is None:
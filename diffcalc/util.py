@@ -69,6 +69,16 @@ class DiffcalcException(Exception):
 
 
 class AbstractPosition(object):
+    """Subclasses name their axes in __slots__, in constructor order."""
+
+    __slots__ = ()
+
+    def __getstate__(self):  # pickle cannot otherwise copy __slots__
+        return self.totuple()
+
+    def __setstate__(self, state):
+        for name, value in zip(type(self).__slots__, state):
+            setattr(self, name, value)
 
     def inRadians(self):
         pos = self.clone()
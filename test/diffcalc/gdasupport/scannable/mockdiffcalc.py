@@ -34,6 +34,9 @@ class MockDiffcalc:
         self.numberAngles = numberAngles
         self.parameter_manager = MockParameterManager()
 
+    def check_reachable(self, h, k, l):
+        pass
+
     def hkl_to_angles(self, h, k, l):
         params = {}
         params['theta'] = 1.
@@ -24,6 +24,7 @@ from diffcalc import diffcalc_
 from diffcalc.gdasupport.scannable.diffractometer import \
     DiffractometerScannableGroup
 from diffcalc.gdasupport.scannable.hkl import Hkl
+from diffcalc.util import DiffcalcException
 from test.diffcalc.gdasupport.scannable.mockdiffcalc import MockDiffcalc
 try:
     from gda.device.scannable.scannablegroup import ScannableGroup
@@ -186,6 +187,26 @@ class TestHklReturningVirtualangles(TestHkl):
                          [1, 0, 1, 1, 12, 123, 1234, 12345])
         self.mockDiffcalc.angles_to_hkl.assert_called_with([6, 5, 4, 3, 2, 1])
 
+    def testGetPositionsFromAngles(self):
+        self.mockDiffcalc.angles_to_hkl_batch.return_value = [[1, 0, 1],
+                                                              [0, 1, 1]]
+        angles = dict((name, [v, v + 1]) for name, v in PARAM_DICT.items())
+        self.mockDiffcalc.angles_to_virtual_angles_batch.return_value = (
+            angles, [0, 0])
+        self.assertEqual(
+            self.hkl.getPositionsFromAngles([[6, 5, 4, 3, 2, 1]] * 2),
+            [[1, 0, 1, 1, 12, 123, 1234, 12345],
+             [0, 1, 1, 2, 13, 124, 1235, 12346]])
+        self.assertFalse(self.mockDiffcalc.angles_to_hkl.called)
+
+    def testGetPositionsFromAnglesWithoutBatchSupport(self):
+        self.mockDiffcalc.angles_to_hkl_batch.side_effect = \
+            DiffcalcException('not supported')
+        self.mockDiffcalc.angles_to_hkl.return_value = ([1, 0, 1], PARAM_DICT)
+        self.assertEqual(
+            self.hkl.getPositionsFromAngles([[6, 5, 4, 3, 2, 1]] * 2),
+            [[1, 0, 1, 1, 12, 123, 1234, 12345]] * 2)
+
 
 class TestHklWithFailingAngleCalculator(unittest.TestCase):
     def setUp(self):
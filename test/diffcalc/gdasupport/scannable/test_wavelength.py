@@ -19,6 +19,7 @@
 import unittest
 
 from diffcalc.gdasupport.scannable.wavelength import Wavelength
+from diffcalc.hardware import ScannableHardwareAdapter
 try:
     from gdascripts.pd.dummy_pds import DummyPD
 except ImportError:
@@ -40,3 +41,12 @@ class TestWavelength(unittest.TestCase):
         self.wl.asynchronousMoveTo(1.)
         self.assertEqual(self.wl.getPosition(), 1.)
         self.assertEqual(self.en.getPosition(), 12.39842)
+
+    def testMoveInvalidatesHardwareSnapshot(self):
+        hardware = ScannableHardwareAdapter(DummyPD('diff'), self.en)
+        hardware.set_snapshot_lifetime(60)
+        self.wl.hardware = hardware
+        self.en.asynchronousMoveTo(12.39842)
+        self.assertEqual(hardware.get_wavelength(), 1.)
+        self.wl.asynchronousMoveTo(2.)
+        self.assertEqual(hardware.get_wavelength(), 2.)
@@ -41,7 +41,8 @@ EXPECTED_OBJECTS = set(['delref', 'en', 'uncon', 'showref', 'l',
                     'setmax', 'dc', 'loadub', 'beta', 'hkl', 'delta', 'alpha',
                     'gam_par', 'trialub', 'delta_par', 'h', 'k', 'phi_par',
                      'a_eq_b', 'mu', 'setu', 'eta', 'editref', 'con', 'setub', 'c2th',
-                    'calcub', 'chi_par', 'hklverbose', 'allhkl'])
+                    'calcub', 'chi_par', 'hklverbose', 'allhkl', 'refineub',
+                    'indexub'])
 
 # Placeholders for names to be added to globals (for benefit of IDE)
 delref = en = uncon = showref = l = hardware = checkub = listub = None
@@ -0,0 +1,157 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import pickle
+from math import pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from numpy.testing import assert_array_almost_equal
+    from diffcalc.hkl.batch import PositionBatch, HklBatchResult, OK, \
+        as_position_array
+except ImportError:
+    np = None
+
+from diffcalc.hkl.vlieg.geometry import VliegPosition
+from diffcalc.hkl.willmott.calc import WillmottHorizontalPosition
+from diffcalc.hkl.you.geometry import YouPosition
+from diffcalc.util import DiffcalcException
+
+POSITIONS = [(1, 2, 3, 4, 5, 6), (10, 20, 30, 40, 50, 60),
+             (-1, -2, -3, -4, -5, -6)]
+
+
+class TestPositionSlots(object):
+
+    def _check(self, position):
+        assert not hasattr(position, '__dict__')
+        copy = pickle.loads(pickle.dumps(position))
+        eq_(type(copy), type(position))
+        eq_(copy.totuple(), position.totuple())
+
+    def test_you(self):
+        self._check(YouPosition(*POSITIONS[0]))
+
+    def test_vlieg(self):
+        self._check(VliegPosition(*POSITIONS[0]))
+
+    def test_willmott(self):
+        self._check(WillmottHorizontalPosition(1, 2, 3, 4))
+
+    @raises(AttributeError)
+    def test_no_other_attributes(self):
+        YouPosition(*POSITIONS[0]).theta = 1
+
+
+class TestPositionBatch(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for position batches')
+        self.batch = PositionBatch.from_array(YouPosition, POSITIONS)
+
+    def test_one_array_per_axis(self):
+        eq_(len(self.batch), 3)
+        eq_(self.batch.axes, ('mu', 'delta', 'nu', 'eta', 'chi', 'phi'))
+        eta = self.batch.axis('eta')
+        assert eta.flags['C_CONTIGUOUS']
+        assert_array_almost_equal(eta, [4, 40, -4])
+
+    @raises(DiffcalcException)
+    def test_unknown_axis(self):
+        self.batch.axis('alpha')
+
+    @raises(DiffcalcException)
+    def test_wrong_number_of_axes(self):
+        PositionBatch.from_array(YouPosition, [(1, 2, 3, 4)])
+
+    def test_round_trip_through_positions(self):
+        positions = self.batch.to_positions()
+        eq_(type(positions[1]), YouPosition)
+        eq_(positions[1].totuple(), POSITIONS[1])
+        batch = PositionBatch.from_positions(positions)
+        assert_array_almost_equal(batch.to_array(), POSITIONS)
+
+    def test_view_reads_and_writes_batch(self):
+        pos = self.batch[1]
+        assert isinstance(pos, YouPosition)
+        eq_(pos.totuple(), POSITIONS[1])
+        eq_(self.batch[-1].totuple(), POSITIONS[2])
+        pos.chi = 51
+        eq_(self.batch.axis('chi')[1], 51)
+        self.batch.axis('phi')[1] = 61
+        eq_(pos.phi, 61)
+
+    def test_view_clone_is_independent(self):
+        pos = self.batch[0].clone()
+        eq_(type(pos), YouPosition)
+        pos.mu = 100
+        eq_(self.batch[0].mu, 1)
+        radians = self.batch[0].inRadians()
+        assert_array_almost_equal(radians.totuple(),
+                                  np.array(POSITIONS[0]) * pi / 180)
+        eq_(self.batch[0].totuple(), POSITIONS[0])
+
+    @raises(DiffcalcException)
+    def test_view_cannot_change_unit_alone(self):
+        self.batch[0].changeToRadians()
+
+    def test_view_pickles_as_position(self):
+        pos = pickle.loads(pickle.dumps(self.batch[2]))
+        eq_(type(pos), YouPosition)
+        eq_(pos.totuple(), POSITIONS[2])
+
+    @raises(IndexError)
+    def test_index_out_of_range(self):
+        self.batch[3]
+
+    def test_iteration(self):
+        eq_([pos.totuple() for pos in self.batch], POSITIONS)
+
+    def test_slice_shares_values(self):
+        part = self.batch[1:]
+        eq_(len(part), 2)
+        part.axis('mu')[0] = 7
+        eq_(self.batch[1].mu, 7)
+
+    def test_units(self):
+        radians = self.batch.inRadians()
+        eq_(radians.unit, 'rad')
+        eq_(self.batch.unit, 'deg')
+        assert_array_almost_equal(radians.to_array(),
+                                  np.array(POSITIONS) * pi / 180)
+        radians.changeToDegrees()
+        eq_(radians.unit, 'deg')
+        assert_array_almost_equal(radians.to_array(), POSITIONS)
+
+    @raises(DiffcalcException)
+    def test_bad_unit(self):
+        PositionBatch.from_array(YouPosition, POSITIONS, 'grad')
+
+    def test_accepted_as_position_array_in_degrees(self):
+        assert_array_almost_equal(
+            as_position_array(self.batch.inRadians(), 6), POSITIONS)
+
+    def test_from_hkl_batch_result(self):
+        result = HklBatchResult(np.array(POSITIONS, dtype=float), {},
+                                np.array([OK] * 3))
+        batch = result.position_batch(VliegPosition)
+        eq_(batch[2].omega, -4)
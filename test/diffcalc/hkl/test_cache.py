@@ -0,0 +1,76 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from nose.tools import eq_, raises  # @UnresolvedImport
+
+from diffcalc.hkl.cache import SolutionCache
+from diffcalc.util import DiffcalcException
+
+
+class TestSolutionCache(object):
+
+    def setup(self):
+        self.cache = SolutionCache(2)
+
+    def test_disabled_by_default(self):
+        cache = SolutionCache()
+        cache.put('a', 1)
+        eq_(len(cache), 0)
+        eq_(cache.get('a'), None)
+        eq_(cache.misses, 1)
+
+    def test_hit_and_miss_counters(self):
+        eq_(self.cache.get('a'), None)
+        self.cache.put('a', 1)
+        eq_(self.cache.get('a'), 1)
+        eq_((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        eq_(self.cache.get('b'), None)
+        eq_(self.cache.get('a'), 1)
+        eq_(self.cache.get('c'), 3)
+        eq_(self.cache.evictions, 1)
+
+    def test_replacing_an_entry_does_not_evict(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.put('a', 3)
+        eq_(self.cache.get('a'), 3)
+        eq_(self.cache.evictions, 0)
+
+    def test_resize_smaller_evicts(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.resize(1)
+        eq_(len(self.cache), 1)
+        eq_(self.cache.get('b'), 2)
+
+    def test_clear(self):
+        self.cache.put('a', 1)
+        self.cache.get('a')
+        self.cache.clear()
+        eq_(len(self.cache), 0)
+        eq_((self.cache.hits, self.cache.misses), (0, 0))
+
+    @raises(DiffcalcException)
+    def test_negative_size(self):
+        self.cache.resize(-1)
@@ -0,0 +1,153 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from diffcalc.hkl.batch import OK, Q_TOO_LONG, NO_DETECTOR_SOLUTION
+    from diffcalc.hkl.reachability import ReachabilityMap, \
+        build_reachability_map
+except ImportError:
+    np = None
+
+from diffcalc.diffcalc_ import create_diffcalc
+from diffcalc.hardware import DummyHardwareAdapter
+from diffcalc.hkl.you.constraints import NUNAME
+from diffcalc.hkl.you.geometry import SixCircle
+from diffcalc.util import DiffcalcException
+
+
+class TestReachabilityMap(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for reachability maps')
+        reasons = np.zeros((3, 3, 3), dtype=np.uint8)
+        reasons[2] = Q_TOO_LONG
+        self.map = ReachabilityMap((0, 0, 0), (.5, .5, .5), reasons)
+
+    def test_nodes(self):
+        eq_(self.map.reason(0, 0, 0), OK)
+        eq_(self.map.reason(1, 1, 1), Q_TOO_LONG)
+
+    def test_cell_with_agreeing_corners(self):
+        eq_(self.map.is_reachable(.25, .75, .1), True)
+
+    def test_cell_with_disagreeing_corners(self):
+        eq_(self.map.reason(.75, .5, .5), None)
+
+    def test_unreachable_corners_do_not_imply_unreachable_cell(self):
+        # nodes at half integers, 2k = 1.55 in hkl units of a unit cube
+        reasons = np.zeros((5, 2, 2), dtype=np.uint8)
+        reasons[2:] = Q_TOO_LONG
+        grid = ReachabilityMap((-.5, -.5, -.5), (1, 1, 1), reasons,
+                               2 / 1.55, np.eye(3) * 2 * np.pi)
+        eq_(grid.reason(1.5, 0, 0), None)  # all corners at |hkl| > 1.58
+        eq_(grid.reason(2, 0, 0), None)
+        eq_(grid.reason(3, 0, 0), Q_TOO_LONG)  # whole cell beyond 2k
+        eq_(grid.reason(2.5, .5, .5), Q_TOO_LONG)  # a node
+
+    def test_limit_failures_are_only_reported_at_nodes(self):
+        reasons = np.empty((3, 3, 3), dtype=np.uint8)
+        reasons[:] = NO_DETECTOR_SOLUTION
+        grid = ReachabilityMap((0, 0, 0), (.5, .5, .5), reasons, 1,
+                               np.eye(3) * 2 * np.pi)
+        eq_(grid.reason(.5, .5, .5), NO_DETECTOR_SOLUTION)
+        eq_(grid.reason(.25, .5, .5), None)
+        eq_(grid.is_reachable(.25, .5, .5), None)
+
+    def test_outside(self):
+        eq_(self.map.reason(-.1, 0, 0), None)
+        eq_(self.map.reason(0, 0, 1.1), None)
+
+    def test_region(self):
+        eq_(self.map.region((.4, 0, 0), (1, 1, .5)).shape, (2, 3, 2))
+        eq_(self.map.region((2, 2, 2), (3, 3, 3)).size, 0)
+
+    def test_save_and_load_memmap(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'map')
+            self.map.save(path)
+            loaded = ReachabilityMap.load(path)
+            assert isinstance(loaded.reasons, np.memmap)
+            eq_(loaded.reason(1, 0, 0), Q_TOO_LONG)
+            eq_(list(loaded.step), [.5, .5, .5])
+            eq_(loaded.UB, None)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestReachabilityWithYouEngine(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for reachability maps')
+        self.hardware = DummyHardwareAdapter(
+            ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi'))
+        self.hardware.energy = 12.39842
+        self.dc = create_diffcalc('you', SixCircle(), self.hardware)
+        self.dc.ub.newub('test')
+        self.dc.ub.setlat('cubic', 1, 1, 1, 90, 90, 90)
+        self.dc.ub.addref([1, 0, 0], [0, 60, 0, 30, 0, 0], 12.39842, 'ref1')
+        self.dc.ub.addref([0, 1, 0], [0, 60, 0, 30, 0, 90], 12.39842, 'ref2')
+        self.dc.hkl.con('a_eq_b')
+        self.dc.hkl.con('mu', 0)
+        self.dc.hkl.con(NUNAME, 0)
+
+    def test_map_agrees_with_batch_solver(self):
+        hklcalc = self.dc._hklcalc
+        reachability_map = build_reachability_map(
+            hklcalc, (0, 0, 0), (2, 2, 0), (5, 5, 1), 1)
+        hkl = reachability_map.hkl_grid()
+        expected = hklcalc.hkl_to_angles_batch(hkl, 1).reasons
+        eq_(list(reachability_map.reasons.ravel()), list(expected))
+        eq_(reachability_map.reason(2, 2, 0), Q_TOO_LONG)
+        eq_(reachability_map.reason(1, 0, 0), OK)
+
+    def test_check_reachable(self):
+        self.dc.configure_reachability((0, 0, 0), (2, 2, 0), (5, 5, 1))
+        self.dc.check_reachable(1, 0, 0)
+        try:
+            self.dc.check_reachable(2, 2, 0)
+        except DiffcalcException, e:
+            assert 'too long' in str(e)
+        else:
+            raise AssertionError('2 2 0 should not be reachable')
+
+    def test_rebuilt_lazily(self):
+        self.dc.configure_reachability((0, 0, 0), (2, 2, 0), (5, 5, 1))
+        index = self.dc._reachability
+        self.dc.check_reachable(1, 0, 0)
+        self.dc.check_reachable(.5, .5, 0)
+        eq_(index.builds, 1)
+        self.hardware.set_upper_limit('delta', 170)
+        self.dc.check_reachable(.5, .5, 0)
+        eq_(index.builds, 2)
+        self.dc.check_reachable(.5, .5, 0, energy=20)
+        eq_(index.builds, 3)
+
+    @raises(DiffcalcException)
+    def test_bad_box(self):
+        self.dc.configure_reachability((0, 0, 0), (-1, 1, 1), 3)
@@ -188,6 +188,19 @@ class BaseTestHklCalculator():
                 print params
                 print param
 
+    def testAnglesToHklBatch(self):
+        if self.calc:
+            mockUbcalc = createMockUbcalc(
+                matrix(self.sess.umatrix) * matrix(self.sess.bmatrix))
+            ac = VliegHklCalculator(mockUbcalc,
+                                    createMockDiffractometerGeometry(),
+                                    createMockHardwareMonitor())
+            positions = [pos.totuple() for pos in self.calc.posList]
+            hkl_batch = ac.angles_to_hkl_batch(positions, self.calc.wavelength)
+            for hkl, pos in zip(hkl_batch, self.calc.posList):
+                (hkl_expected, _) = ac.anglesToHkl(pos, self.calc.wavelength)
+                mneq_(matrix([list(hkl)]), matrix([hkl_expected]), 10)
+
     def testHklToAngles(self):
         if self.calc:
             # Configure the angle calculator for this session scenario
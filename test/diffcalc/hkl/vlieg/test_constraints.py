@@ -47,6 +47,28 @@ class TestModeSelector(unittest.TestCase):
     def testShowAvailableModes(self):
         print self.ms.reportAvailableModes()
 
+    def testPlan(self):
+        self.ms.setModeByName('5cgBin')
+        plan = self.ms.plan
+        self.assertEqual(plan.mode.name, '5cgBin')
+        self.assertEqual(plan.solver, '_hklToAnglesFourAndFiveCirclesModes')
+        self.assertEqual(plan.beta, 'betain')
+        self.assertFalse(plan.fixed_phi)
+        self.assert_(self.ms.plan is plan)
+
+    def testPlanRebuiltWhenModeChanges(self):
+        plan = self.ms.plan
+        self.ms.setModeByName('4cPhi')
+        self.assert_(self.ms.plan is not plan)
+        self.assertEqual(self.ms.plan.beta, None)
+        self.assert_(self.ms.plan.fixed_phi)
+        self.ms.setModeByName('6czBout')
+        self.assertEqual(self.ms.plan.solver, '_hklToAnglesZaxisModes')
+
+    def testPlanCannotBeModified(self):
+        self.assertRaises(AttributeError, setattr, self.ms.plan, 'beta',
+                          'betain')
+
 
 class TestParameterManager(unittest.TestCase):
 
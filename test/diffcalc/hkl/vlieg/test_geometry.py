@@ -20,6 +20,12 @@ import random
 import unittest
 from math import pi
 
+from nose.plugins.skip import SkipTest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 try:
     from numpy import matrix
     from numpy.linalg import norm
@@ -30,7 +36,8 @@ from test.tools import mneq_
 
 
 from diffcalc.hkl.vlieg.geometry import SixCircleGammaOnArmGeometry, \
-    gammaOnArmToBase, gammaOnBaseToArm, SixCircleGeometry, Fivec, Fourc
+    gammaOnArmToBase, gammaOnBaseToArm, SixCircleGeometry, Fivec, Fourc, \
+    FivecWithGammaOnBase
 from diffcalc.hkl.vlieg.geometry import createVliegMatrices
 from diffcalc.hkl.vlieg.geometry import VliegPosition
 from diffcalc.util import nearlyEqual, radiansEquivilant as radeq
@@ -186,6 +193,87 @@ def test_generator_for_cases():
                        delta * TORAD, gamma * TORAD)
 
 
+class TestGammaOnBaseArrays(unittest.TestCase):
+
+    def setUp(self):
+        if np is None:
+            raise SkipTest('numpy is required for batch calculations')
+        from diffcalc.hkl.vlieg import batch
+        self.batch = batch
+        angles = [(alpha, delta, gamma)
+                  for alpha in [-89.9, -45, -1, 0, 1, 45, 89.9]
+                  for gamma in [-89.9, -46, -45, -1, 0, 1, 45, 46, 89.9]
+                  for delta in [-179.9, -135, -91, -89.9, -46, -45, -1, 0, 1,
+                                45, 46, 89.9, 91, 135, 179.9]]
+        self.alpha, self.delta, self.gamma = np.array(angles).T * TORAD
+
+    def test_gamma_on_arm_to_base_matches_scalar(self):
+        deltaB, gammaB = self.batch.gamma_on_arm_to_base(
+            self.delta, self.gamma, self.alpha)
+        for i in range(len(self.alpha)):
+            args = self.delta[i], self.gamma[i], self.alpha[i]
+            try:
+                expected = gammaOnArmToBase(*args)
+            except RuntimeError:
+                # the array version always finds the root with the same lab
+                # vector (checked below)
+                continue
+            self.assert_(radeq(deltaB[i], expected[0], 1e-8), args)
+            self.assert_(radeq(gammaB[i], expected[1], 1e-8), args)
+        self.assert_(np.all((gammaB >= 0) & (gammaB <= pi)))
+        for i in range(len(self.alpha)):
+            labA = armAnglesToLabVector(self.alpha[i], self.delta[i],
+                                        self.gamma[i])
+            labB = baseAnglesToLabVector(deltaB[i], gammaB[i])
+            self.assert_(nearlyEqual(labA, labB, TOLERANCE))
+
+    def test_gamma_on_base_to_arm_matches_scalar(self):
+        deltaA, gammaA = self.batch.gamma_on_base_to_arm(
+            self.delta, self.gamma, self.alpha)
+        for i in range(len(self.alpha)):
+            args = self.delta[i], self.gamma[i], self.alpha[i]
+            expected = gammaOnBaseToArm(*args)
+            self.assert_(radeq(deltaA[i], expected[0], 1e-8), args)
+            self.assert_(radeq(gammaA[i], expected[1], 1e-8), args)
+
+    def test_geometry_batch_methods_match_scalar(self):
+        sixc = SixCircleGeometry()
+        fivec = FivecWithGammaOnBase()
+        rows = [(self.alpha[i] * TODEG, self.delta[i] * TODEG,
+                 self.gamma[i] * TODEG, 10., 20., 30.)
+                for i in range(0, len(self.alpha), 7)]
+        fivec_rows = [(0.,) + row[1:] for row in rows]
+        for geometry, rows in ((sixc, rows), (fivec, fivec_rows)):
+            if geometry is fivec:
+                physical_rows = [row[1:] for row in rows]
+            else:
+                physical_rows = rows
+            internal = geometry.physical_angles_to_internal_positions(
+                physical_rows)
+            physical = geometry.internal_positions_to_physical_angles(rows)
+            for i in range(len(rows)):
+                expected = geometry.physical_angles_to_internal_position(
+                    physical_rows[i])
+                mneq_(matrix([list(internal[i])]),
+                      matrix([list(expected.totuple())]), 6)
+                expected = geometry.internal_position_to_physical_angles(
+                    VliegPosition(*rows[i]))
+                mneq_(matrix([list(physical[i])]), matrix([list(expected)]),
+                      6)
+
+    def test_pass_through_geometry_batch_methods_match_scalar(self):
+        row = (1., 2., 3., 4., 5., 6.)
+        for geometry in (SixCircleGammaOnArmGeometry(), Fivec(), Fourc()):
+            physical = geometry.internal_position_to_physical_angles(
+                VliegPosition(*row))
+            internal = geometry.physical_angles_to_internal_position(physical)
+            mneq_(matrix(geometry.physical_angles_to_internal_positions(
+                [physical, physical]).tolist()),
+                  matrix([list(internal.totuple())] * 2), 10)
+            mneq_(matrix(geometry.internal_positions_to_physical_angles(
+                [row]).tolist()), matrix([list(physical)]), 10)
+
+
 class TestFiveCirclePlugin(unittest.TestCase):
 
     def setUp(self):
@@ -370,6 +370,27 @@ class TestSectorSelectorAutoCode(unittest.TestCase):
         self.assert_(self.ss.transformPosition(self.pos) == self.pos_in2)
         self.assertEquals(self.ss.sector, 2)
 
+    def testAutoTransformPositionChoosesSmallestMove(self):
+        self.ss.addAutoTransorm(2)
+        self.ss.addAutoTransorm(3)
+        moves = {2: 50., 3: 10.}
+
+        def candidateChecker(positions):
+            sectors = [2 if pos == self.pos_in2 else 3 for pos in positions]
+            return ([True] * len(positions),
+                    [moves[sector] for sector in sectors])
+        self.ss.candidateCheckerFunction = candidateChecker
+        result = self.ss.autoTransformPositionBySector(self.pos)
+        self.assert_(result == self.pos_in3)
+        self.assertEquals(self.ss.sector, 3)
+
+    def testTransformPositionAutoSectorsStartFromSectorZero(self):
+        self.ss.addAutoTransorm(2)
+        self.ss.addAutoTransorm(3)
+        self.ss.setSector(1)  # not within limits (delta positive)
+        self.assert_(self.ss.transformPosition(self.pos) == self.pos_in2)
+        self.assertEquals(self.ss.sector, 2)
+
     def testTransformPositionWithAutoTransforms2(self):
         self.ss.addAutoTransorm(2)
         self.assert_(self.ss.transformPosition(self.pos) == self.pos_in2)
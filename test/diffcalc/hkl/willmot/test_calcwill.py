@@ -18,7 +18,7 @@
 
 # TODO: class largely copied from test_calc
 
-from math import pi
+from math import pi, isnan
 from mock import Mock
 from nose.tools import raises
 
@@ -187,6 +187,54 @@ class TestSurfaceNormalVertical_Si_5_5_12_PosGamma(_BaseTest):
                     Pos(delta=5.224, gamma=10.415, omegah=2, phi=-1.972),
                     {'betain': 2})
 
+    def testAnglesToHklBatch(self):
+        self._configure_ub()
+        positions = [Si_5_5_12_REF0.totuple(), Si_5_5_12_REF1.totuple(),
+                     (5.224, 10.415, 2, -1.972)]
+        hkl_batch = self.calc.angles_to_hkl_batch(positions, self.wavelength)
+        for hkl, angles in zip(hkl_batch, positions):
+            hkl_expected, _ = self.calc.anglesToHkl(Pos(*angles),
+                                                    self.wavelength)
+            assert_array_almost_equal(hkl, hkl_expected, 10)
+
+    def _check_hkl_to_angles_batch(self, hkl_list):
+        self._configure_ub()
+        result = self.calc.hkl_to_angles_batch(hkl_list, self.wavelength)
+        assert result.ok.all()
+        for i, hkl in enumerate(hkl_list):
+            pos, virtual = self.calc.hklToAngles(hkl[0], hkl[1], hkl[2],
+                                                 self.wavelength)
+            assert_array_almost_equal(result.positions[i], pos.totuple(), 10)
+            for name in ('betain', 'betaout'):
+                assert_array_almost_equal([result.virtual_angles[name][i]],
+                                          [virtual[name]], 10)
+
+    def testHklToAnglesBatchBetain(self):
+        self._check_hkl_to_angles_batch([(2, 19, 32), (0, 7, 22),
+                                         (2, -5, 12), (0, 0, 30)])
+
+    def testHklToAnglesBatchBetaout(self):
+        self.constraints.reference = {'betaout': 10}
+        self._check_hkl_to_angles_batch([(2, 19, 32), (0, 7, 22),
+                                         (0, 0, 30)])
+
+    def testHklToAnglesBatchBinEqBout(self):
+        self.constraints.reference = {'bin_eq_bout': None}
+        self._check_hkl_to_angles_batch([(2, 19, 32), (0, 7, 22),
+                                         (2, -5, 12), (1, 1, 0)])
+
+    def testHklToAnglesBatchReportsUnreachableBetain(self):
+        from diffcalc.hkl import batch
+        self.constraints.reference = {'bin_eq_bout': None}
+        self._configure_ub()
+        result = self.calc.hkl_to_angles_batch(
+            [(2, 19, 32), (2, 19, -32), (0, 0, 0)], self.wavelength)
+        assert list(result.reasons) == [batch.OK,
+                                        batch.REFERENCE_UNREACHABLE,
+                                        batch.Q_ZERO]
+        assert result.messages[1].startswith('betain was -ve')
+        assert all(isnan(x) for x in result.positions[1])
+
 # conlcusion:
 # given or1 from testHkl_2_19_32_found_orientation_setting and,
 # or1 from testHkl_0_7_22_found_orientation_setting
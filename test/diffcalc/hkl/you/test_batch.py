@@ -0,0 +1,168 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import pi
+
+from nose.plugins.skip import SkipTest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from diffcalc.hkl.you.calc import YouHklCalculator, youAnglesToHkl
+from diffcalc.hkl.you.geometry import YouPosition, SixCircle, FourCircle
+from diffcalc.hkl.you.constraints import YouConstraintManager, NUNAME
+from diffcalc.ub.crystal import CrystalUnderTest
+from diffcalc.util import y_rotation, z_rotation, DiffcalcException
+from test.diffcalc.test_hardware import SimpleHardwareAdapter
+from test.diffcalc.hkl.vlieg.test_calc import \
+    createMockDiffractometerGeometry, createMockUbcalc
+from test.tools import assert_array_almost_equal
+
+TORAD = pi / 180
+
+HKL_LIST = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1),
+            (0, 1, 1), (1, 1, 1), (.5, .3, .8), (2, 1, 0), (0, 0, 0),
+            (9, 9, 9), (-1, .2, .3), (0, 0, 1.5)]
+
+MODES = [
+    {'a_eq_b': None, 'mu': 0, NUNAME: 0},
+    {'psi': 90 * TORAD, 'mu': 0, NUNAME: 0},
+    {'a_eq_b': None, 'qaz': 0, 'eta': 0},
+    {'a_eq_b': None, 'delta': 0, 'eta': 0},
+    {'alpha': 2 * TORAD, 'delta': 40 * TORAD, 'chi': 30 * TORAD},
+    {'beta': 3 * TORAD, 'naz': 10 * TORAD, 'phi': 20 * TORAD},
+    {'chi': 0, 'phi': 0, 'a_eq_b': None},
+    {'chi': 90 * TORAD, 'phi': 0, 'eta': 0}]
+
+
+class TestYouBatchAgainstScalar(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for batch calculations')
+        self.ubcalc = createMockUbcalc(None)
+        names = ['delta', NUNAME, 'mu', 'eta', 'chi', 'phi']
+        self.hardware = SimpleHardwareAdapter(names)
+        self.hardware.set_lower_limit('delta', 0)
+        self.hardware.set_upper_limit('delta', 179.999)
+        self.hardware.set_lower_limit('mu', 0)
+        self.hardware.set_lower_limit('eta', 0)
+        self.hardware.set_lower_limit('chi', -10)
+        self.constraints = YouConstraintManager(self.hardware)
+        self.calc = YouHklCalculator(
+            self.ubcalc, createMockDiffractometerGeometry(), self.hardware,
+            self.constraints)
+        B = CrystalUnderTest('xtal', 3.8, 4.1, 5.3, 90, 90, 90).B
+        self.ubcalc.UB = z_rotation(3 * TORAD) * y_rotation(4 * TORAD) * B
+
+    def _check_mode(self, constrained, wavelength):
+        self.constraints._constrained = constrained
+        result = self.calc.hkl_to_angles_batch(HKL_LIST, wavelength)
+        assert len(result) == len(HKL_LIST)
+        for i, hkl in enumerate(HKL_LIST):
+            try:
+                pos, virtual = self.calc.hklToAngles(hkl[0], hkl[1], hkl[2],
+                                                     wavelength)
+            except Exception:
+                assert not result.ok[i], (
+                    'batch solved %s which scalar calculation could not: %s' %
+                    (hkl, result.positions[i]))
+                assert np.all(np.isnan(result.positions[i]))
+                continue
+            assert result.ok[i], ('batch could not solve %s (%s)' %
+                                  (hkl, result.reason(i)))
+            assert_array_almost_equal(result.positions[i], pos.totuple(), 7)
+            for name in ('theta', 'qaz', 'alpha', 'naz', 'tau', 'beta'):
+                assert_array_almost_equal(
+                    [result.virtual_angles[name][i]], [virtual[name]], 7)
+
+    def test_modes_match_scalar_calculation(self):
+        for constrained in MODES:
+            yield self._check_mode, constrained, 1.
+
+    def test_one_wavelength_per_point(self):
+        self.constraints._constrained = MODES[0]
+        wavelengths = np.linspace(.8, 1.2, len(HKL_LIST))
+        result = self.calc.hkl_to_angles_batch(HKL_LIST, wavelengths)
+        for i, (hkl, wl) in enumerate(zip(HKL_LIST, wavelengths)):
+            if result.ok[i]:
+                pos, _ = self.calc.hklToAngles(hkl[0], hkl[1], hkl[2], wl)
+                assert_array_almost_equal(result.positions[i],
+                                          pos.totuple(), 7)
+
+    def test_unreachable_points_are_marked_not_raised(self):
+        from diffcalc.hkl import batch
+        self.constraints._constrained = MODES[0]
+        result = self.calc.hkl_to_angles_batch([(0, 0, 0), (9, 9, 9)], 1.)
+        assert list(result.reasons) == [batch.Q_ZERO, batch.Q_TOO_LONG]
+        assert result.reason(1) == '|Q| is too long'
+
+    def test_bad_shapes(self):
+        self.constraints._constrained = MODES[0]
+        for hkl, wl in (([(1, 0)], 1.), ([(1, 0, 0)], [1., 1.])):
+            try:
+                self.calc.hkl_to_angles_batch(hkl, wl)
+            except DiffcalcException:
+                pass
+            else:
+                raise AssertionError('DiffcalcException not raised')
+
+    def test_angles_to_hkl_batch(self):
+        positions = [(0, 60, 0, 30, 0, 0), (1, 50, 2, 30, 4, 5),
+                     (-10, 20, 30, 40, 50, 60), (5, 120, -10, 80, 95, -170)]
+        hkl = self.calc.angles_to_hkl_batch(positions, [1, 1.5, 1, .8])
+        assert hkl.shape == (4, 3)
+        for hkl_batch, angles, wl in zip(hkl, positions, [1, 1.5, 1, .8]):
+            pos = YouPosition(*[v * TORAD for v in angles])
+            assert_array_almost_equal(
+                hkl_batch, youAnglesToHkl(pos, wl, self.ubcalc.UB), 10)
+
+    def test_geometry_batch_methods_match_scalar(self):
+        row = (1., 2., 3., 4., 5., 6.)
+        for geometry in (SixCircle(), FourCircle()):
+            physical = geometry.internal_position_to_physical_angles(
+                YouPosition(*row))
+            internal = geometry.physical_angles_to_internal_position(physical)
+            for result in geometry.physical_angles_to_internal_positions(
+                    [physical, physical]):
+                assert_array_almost_equal(result, internal.totuple(), 10)
+            result = geometry.internal_positions_to_physical_angles([row])
+            assert_array_almost_equal(result[0], physical, 10)
+
+    def test_angles_to_virtual_angles_batch(self):
+        positions = [(1, 50, 2, 30, 4, 5), (-10, 20, 30, 40, 50, 60),
+                     (5, 120, -10, 80, 95, -170)]
+        angles, psi_flags = self.calc.angles_to_virtual_angles_batch(
+            positions)
+        assert list(psi_flags) == [0, 0, 0]
+        for i, position in enumerate(positions):
+            expected = self.calc.anglesToVirtualAngles(YouPosition(*position),
+                                                       1.)
+            for name in expected:
+                assert_array_almost_equal([angles[name][i]], [expected[name]],
+                                          10)
+
+    def test_angles_to_virtual_angles_batch_flags_undefined_psi(self):
+        from diffcalc.hkl.you.batch import PSI_OK, PSI_Q_PARALLEL_TO_N
+        angles, psi_flags = self.calc.angles_to_virtual_angles_batch(
+            [(0, 0, 0, 0, 0, 0), (1, 50, 2, 30, 4, 5)])
+        assert list(psi_flags) == [PSI_Q_PARALLEL_TO_N, PSI_OK]
+        assert np.isnan(angles['psi'][0])
+        assert not np.isnan(angles['psi'][1])
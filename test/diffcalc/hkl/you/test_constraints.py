@@ -16,6 +16,7 @@
 # along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
 ###
 
+from math import pi
 
 from nose.tools import eq_  # @UnresolvedImport
 from mock import Mock
@@ -569,4 +570,53 @@ class TestConstraintManagerWithFourCircles:
 
     @raises(DiffcalcException)
     def test_set_constrain_fixed_sample_angle(self):
-        self.cm.set_constraint('mu', 0)
\ No newline at end of file
+        self.cm.set_constraint('mu', 0)
+
+class TestSolverPlan:
+
+    def setUp(self):
+        self.cm = YouConstraintManager(Mock())
+
+    def _constrain(self, **constraints):
+        for name, value in constraints.items():
+            self.cm.constrain(name)
+            if value is not None:
+                self.cm.set_constraint(name, value)
+
+    @raises(DiffcalcException)
+    def test_not_fully_constrained(self):
+        self._constrain(delta=1, alpha=2)
+        self.cm.plan
+
+    def test_not_implemented(self):
+        self._constrain(alpha=1, mu=2, phi=3)
+        eq_(self.cm.plan.implemented, False)
+        eq_(self.cm.plan.sample_column, None)
+
+    def test_one_sample(self):
+        self._constrain(delta=90, a_eq_b=None, mu=0)
+        plan = self.cm.plan
+        eq_(plan.ref_name, 'a_eq_b')
+        eq_(plan.det_constraint, {'delta': pi / 2})
+        eq_(plan.naz_constraint, {})
+        eq_(plan.samp_constraints, {'mu': 0})
+        eq_(plan.sample_column, '_sample_column_given_one_sample')
+
+    def test_three_sample(self):
+        self._constrain(eta=1, chi=2, phi=3)
+        plan = self.cm.plan
+        eq_(plan.ref_name, None)
+        eq_(plan.sample_column, '_sample_column_given_three_sample')
+
+    def test_reused_until_constraints_change(self):
+        self._constrain(delta=90, a_eq_b=None, mu=0)
+        plan = self.cm.plan
+        assert self.cm.plan is plan
+        self.cm.set_constraint('mu', 10)
+        assert self.cm.plan is not plan
+        eq_(self.cm.plan.samp_constraints, {'mu': 10 * pi / 180})
+
+    @raises(AttributeError)
+    def test_plan_cannot_be_modified(self):
+        self._constrain(delta=90, a_eq_b=None, mu=0)
+        self.cm.plan.ref_name = 'psi'
@@ -0,0 +1,100 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from diffcalc.diffcalc_ import create_diffcalc
+from diffcalc.hardware import DummyHardwareAdapter
+from diffcalc.hkl.you.constraints import NUNAME
+from diffcalc.hkl.you.geometry import SixCircle
+from diffcalc.util import DiffcalcException
+from test.tools import aneq_
+
+TORAD = pi / 180
+
+
+class TestHklToAllAnglesGrid(object):
+
+    def setup(self):
+        hardware = DummyHardwareAdapter(
+            ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi'))
+        dc = create_diffcalc('you', SixCircle(), hardware)
+        en = 12.39842
+        dc.ub.newub('test')
+        dc.ub.setlat('cubic', 1, 1, 1, 90, 90, 90)
+        dc.ub.addref([1, 0, 0], [0, 60, 0, 30, 0, 0], en, 'ref1')
+        dc.ub.addref([0, 1, 0], [0, 60, 0, 30, 0, 90], en, 'ref2')
+        dc.hkl.con('eta', 0, 'chi', 0, 'phi', 0)
+        self.hklcalc = dc._hklcalc
+        self.grid = [(.1 * h, .1 * k, .1 * l)
+                     for h in range(3) for k in range(-1, 2) for l in (0, 3)]
+
+    def _positions(self, results):
+        return [(hkl, [pos.totuple() for pos, _ in solutions], message)
+                for hkl, solutions, message in results]
+
+    def test_in_process_matches_hkl_to_all_angles(self):
+        results = list(self.hklcalc.hkl_to_all_angles_grid(
+            self.grid, 1, workers=0, chunk_size=4))
+        eq_([hkl for hkl, _, _ in results], self.grid)
+        for hkl, solutions, message in results:
+            try:
+                expected = self.hklcalc.hkl_to_all_angles(hkl[0], hkl[1],
+                                                          hkl[2], 1)
+            except Exception:
+                assert message
+                eq_(solutions, [])
+                continue
+            eq_(len(solutions), len(expected))
+            for (pos, _), (expected_pos, _) in zip(solutions, expected):
+                aneq_(pos.totuple(), expected_pos.totuple())
+
+    def test_output_independent_of_workers_and_chunks(self):
+        in_process = list(self.hklcalc.hkl_to_all_angles_grid(
+            self.grid, 1, workers=0, chunk_size=5))
+        pooled = list(self.hklcalc.hkl_to_all_angles_grid(
+            self.grid, 1, workers=2, chunk_size=3))
+        eq_(self._positions(pooled), self._positions(in_process))
+
+    def test_numerical_fallback_is_copied_to_workers(self):
+        if np is None:
+            raise SkipTest('numpy is required for numerical calculations')
+        # delta, mu and eta fixed have no analytic solution
+        self.hklcalc.constraints._constrained = {
+            'delta': 10 * TORAD, 'mu': 0, 'eta': 5 * TORAD}
+        self.hklcalc.set_numerical_fallback(True)
+        expected = self.hklcalc.hkl_to_all_angles(1, 0, 0, 1.)
+        for workers in (0, 2):
+            results = list(self.hklcalc.hkl_to_all_angles_grid(
+                [(1, 0, 0)], 1., workers=workers))
+            [(_, solutions, message)] = results
+            eq_(message, None)
+            eq_(len(solutions), len(expected))
+            aneq_(solutions[0][0].totuple(), expected[0][0].totuple())
+
+    @raises(DiffcalcException)
+    def test_bad_chunk_size(self):
+        list(self.hklcalc.hkl_to_all_angles_grid(self.grid, 1, chunk_size=0))
@@ -0,0 +1,130 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from numpy.testing import assert_array_almost_equal
+except ImportError:
+    np = None
+
+from diffcalc.hkl.you.calc import YouHklCalculator
+from diffcalc.hkl.you.constraints import YouConstraintManager, NUNAME
+from diffcalc.ub.crystal import CrystalUnderTest
+from diffcalc.util import y_rotation, z_rotation, DiffcalcException
+from test.diffcalc.test_hardware import SimpleHardwareAdapter
+from test.diffcalc.hkl.vlieg.test_calc import \
+    createMockDiffractometerGeometry, createMockUbcalc
+from test.diffcalc.hkl.you.test_batch import HKL_LIST, MODES
+
+TORAD = pi / 180
+
+# Combinations with no analytic solution
+UNIMPLEMENTED_MODES = [
+    {'delta': 10 * TORAD, 'mu': 0, 'eta': 5 * TORAD},
+    {'naz': 10 * TORAD, 'chi': 20 * TORAD, 'phi': 30 * TORAD},
+    {'alpha': 2 * TORAD, 'mu': 0, 'phi': 30 * TORAD}]
+
+
+class TestYouNumerical(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for numerical calculations')
+        self.ubcalc = createMockUbcalc(None)
+        names = ['delta', NUNAME, 'mu', 'eta', 'chi', 'phi']
+        self.hardware = SimpleHardwareAdapter(names)
+        self.hardware.set_lower_limit('delta', 0)
+        self.hardware.set_upper_limit('delta', 179.999)
+        self.hardware.set_lower_limit('mu', 0)
+        self.hardware.set_lower_limit('eta', 0)
+        self.hardware.set_lower_limit('chi', -10)
+        self.constraints = YouConstraintManager(self.hardware)
+        self.calc = YouHklCalculator(
+            self.ubcalc, createMockDiffractometerGeometry(), self.hardware,
+            self.constraints)
+        B = CrystalUnderTest('xtal', 3.8, 4.1, 5.3, 90, 90, 90).B
+        self.ubcalc.UB = z_rotation(3 * TORAD) * y_rotation(4 * TORAD) * B
+
+    def _check_solutions(self, result, wavelength):
+        """Check solved points map back to hkl and meet the constraints"""
+        positions = result.positions[result.ok]
+        assert_array_almost_equal(
+            self.calc.angles_to_hkl_batch(positions, wavelength),
+            np.array(HKL_LIST)[result.ok], 7)
+        angles = self.calc.angles_to_virtual_angles_batch(positions)[0]
+        axes = dict(zip(('mu', 'delta', NUNAME, 'eta', 'chi', 'phi'),
+                        positions.T))
+        for name, value in self.constraints.all.items():
+            if name == 'a_eq_b':
+                actual, value = angles['alpha'], angles['beta'] * TORAD
+            else:
+                actual = axes[name] if name in axes else angles[name]
+            assert_array_almost_equal(
+                actual, np.full(len(positions), value / TORAD), 5)
+
+    def _check_analytic_mode(self, constrained):
+        self.constraints._constrained = constrained
+        analytic = self.calc.hkl_to_angles_batch(HKL_LIST, 1.)
+        numerical = self.calc.hkl_to_angles_numerical(HKL_LIST, 1.)
+        self._check_solutions(numerical, 1.)
+        # the numerical solver finds a solution wherever the analytic one does
+        assert np.all(numerical.ok[analytic.ok])
+        # and converges on the analytic solution when started from it
+        positions = analytic.positions[analytic.ok]
+        started = self.calc.hkl_to_angles_numerical(
+            np.array(HKL_LIST)[analytic.ok], 1., positions)
+        assert_array_almost_equal(started.positions, positions, 5)
+
+    def test_agrees_with_analytic_modes(self):
+        for constrained in MODES:
+            yield self._check_analytic_mode, constrained
+
+    def _check_unimplemented_mode(self, constrained):
+        self.constraints._constrained = constrained
+        result = self.calc.hkl_to_angles_numerical(HKL_LIST, 1.)
+        assert np.any(result.ok)
+        self._check_solutions(result, 1.)
+
+    def test_unimplemented_modes(self):
+        for constrained in UNIMPLEMENTED_MODES:
+            yield self._check_unimplemented_mode, constrained
+
+    def test_unreachable_points_are_marked(self):
+        from diffcalc.hkl import batch
+        self.constraints._constrained = UNIMPLEMENTED_MODES[0]
+        result = self.calc.hkl_to_angles_numerical([(0, 0, 0), (9, 9, 9)],
+                                                   1.)
+        assert list(result.reasons) == [batch.Q_ZERO, batch.Q_TOO_LONG]
+        assert np.all(np.isnan(result.positions))
+
+    def test_fallback_is_opt_in(self):
+        self.constraints._constrained = UNIMPLEMENTED_MODES[0]
+        assert_raises(DiffcalcException, self.calc.hklToAngles, 1, 0, 0, 1.)
+        assert_raises(DiffcalcException, self.calc.hkl_to_angles_batch,
+                      [(1, 0, 0)], 1.)
+        self.calc.set_numerical_fallback(True)
+        pos, virtual = self.calc.hklToAngles(1, 0, 0, 1.)
+        assert abs(pos.delta - 10) < 1e-6
+        assert abs(pos.eta - 5) < 1e-6
+        result = self.calc.hkl_to_angles_batch([(1, 0, 0)], 1.)
+        assert_array_almost_equal(result.positions[0], pos.totuple(), 5)
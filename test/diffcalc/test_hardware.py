@@ -16,6 +16,7 @@
 # along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
 ###
 
+import time
 import unittest
 
 try:
@@ -103,6 +104,20 @@ class TestHardwareAdapterBase(unittest.TestCase):
         self.assertFalse(self.hardware.is_position_within_limits([0, 2.01, 999]))
         self.assertFalse(self.hardware.is_position_within_limits([-1.01, 0, 999]))
 
+    def testare_positions_within_limits(self):
+        self.hardware.set_upper_limit('a', 1)
+        self.hardware.set_upper_limit('b', 2)
+        self.hardware.set_lower_limit('a', -1)
+        positions = [[0, 0, 999], [1.01, 0, 999], [-1, -999, 999],
+                     [0, 2.01, 999], [-1.01, 0, 999]]
+        self.assertEquals(
+            self.hardware.are_positions_within_limits(positions),
+            [self.hardware.is_position_within_limits(pos)
+             for pos in positions])
+        self.assertEquals(
+            self.hardware.are_positions_within_limits(positions),
+            [True, False, True, False, False])
+
     def testIsAxisWithinLimits(self):
         self.hardware.set_upper_limit('a', 1)
         self.hardware.set_upper_limit('b', 2)
@@ -251,3 +266,36 @@ class TestGdaHardwareMonitor(unittest.TestCase):
     def testGetWavelength(self):
         self.energyhw.asynchronousMoveTo(1.0)
         self.assertEqual(self.hardware.get_wavelength(), 12.39842 / 1.0)
+
+    def testSnapshotIsOffByDefault(self):
+        self.hardware.get_position()
+        self.hardware.get_position()
+        eq_((self.hardware.real_reads, self.hardware.cached_reads), (2, 0))
+
+    def testSnapshotReusesReadsWithinLifetime(self):
+        self.hardware.set_snapshot_lifetime(60)
+        self.energyhw.asynchronousMoveTo(1.0)
+        for _ in range(3):
+            eq_(self.hardware.get_position(), [0.] * 6)
+        eq_(self.hardware.get_energy(), 1.0)
+        eq_(self.hardware.get_wavelength(), 12.39842)
+        eq_((self.hardware.real_reads, self.hardware.cached_reads), (2, 3))
+
+        self.energyhw.asynchronousMoveTo(2.0)  # not seen until invalidated
+        eq_(self.hardware.get_energy(), 1.0)
+        self.hardware.invalidate_snapshot()
+        eq_(self.hardware.get_energy(), 2.0)
+
+    def testSnapshotExpires(self):
+        self.hardware.set_snapshot_lifetime(.01)
+        self.hardware.get_position()
+        time.sleep(.02)
+        self.hardware.get_position()
+        eq_((self.hardware.real_reads, self.hardware.cached_reads), (2, 0))
+
+    def testDiffractometerMoveInvalidatesSnapshot(self):
+        self.diffhw.diffcalc._hardware = self.hardware
+        self.hardware.set_snapshot_lifetime(60)
+        eq_(self.hardware.get_position(), [0.] * 6)
+        self.diffhw.asynchronousMoveTo((1, 2, 3, 4, 5, 6))
+        eq_(self.hardware.get_position(), [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
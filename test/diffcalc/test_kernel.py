@@ -0,0 +1,87 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import unittest
+
+try:
+    from numpy import matrix
+except ImportError:
+    from numjy import matrix
+
+from diffcalc import kernel
+from diffcalc.util import x_rotation, y_rotation, z_rotation, cross3, \
+    dot3, angle_between_vectors
+from test.tools import assert_matrix_almost_equal, \
+    assert_array_almost_equal
+
+M = ((1., 2., 3.), (0., 1., 4.), (5., 6., 0.))
+N = ((2., 0., 1.), (1., 3., 0.), (0., 1., 1.))
+U = (1., 2., 3.)
+V = (-4., .5, 2.)
+
+
+class TestKernel(unittest.TestCase):
+
+    def testRotationsMatchUtil(self):
+        for th in (0, .3, -1.2, 3):
+            assert_matrix_almost_equal(
+                kernel.to_matrix(kernel.x_rotation(th)), x_rotation(th))
+            assert_matrix_almost_equal(
+                kernel.to_matrix(kernel.y_rotation(th)), y_rotation(th))
+            assert_matrix_almost_equal(
+                kernel.to_matrix(kernel.z_rotation(th)), z_rotation(th))
+
+    def testMatrixProducts(self):
+        Mm, Nm = matrix(M), matrix(N)
+        assert_matrix_almost_equal(kernel.to_matrix(kernel.mmul(M, N)),
+                                   Mm * Nm)
+        assert_matrix_almost_equal(kernel.to_matrix(kernel.mtmul(M, N)),
+                                   Mm.T * Nm)
+        assert_matrix_almost_equal(
+            kernel.to_matrix(kernel.mmul_all(M, N, M)), Mm * Nm * Mm)
+        assert_matrix_almost_equal(kernel.to_column(kernel.mvmul(M, U)),
+                                   Mm * kernel.to_column(U))
+        assert_matrix_almost_equal(kernel.to_column(kernel.mtvmul(M, U)),
+                                   Mm.T * kernel.to_column(U))
+
+    def testInverse(self):
+        assert_matrix_almost_equal(kernel.to_matrix(kernel.inverse(M)),
+                                   matrix(M).I)
+        self.assertRaises(ZeroDivisionError, kernel.inverse,
+                          ((1, 2, 3), (2, 4, 6), (0, 0, 1)))
+
+    def testRotationInverseIsTranspose(self):
+        R = kernel.mmul(kernel.x_rotation(.4), kernel.z_rotation(-1.1))
+        assert_matrix_almost_equal(kernel.to_matrix(kernel.transpose(R)),
+                                   kernel.to_matrix(kernel.inverse(R)))
+
+    def testVectors(self):
+        u, v = kernel.to_column(U), kernel.to_column(V)
+        assert_array_almost_equal(kernel.cross(U, V),
+                                  kernel.as_vector(cross3(u, v)))
+        self.assertAlmostEqual(kernel.dot(U, V), dot3(u, v))
+        self.assertAlmostEqual(kernel.angle_between(U, V),
+                               angle_between_vectors(u, v))
+        self.assertAlmostEqual(kernel.norm(kernel.normalised(V)), 1)
+
+    def testBoundaryConversions(self):
+        self.assertEqual(kernel.as_vector(kernel.to_column(U)), U)
+        self.assertEqual(kernel.as_vector([1, 2, 3]), (1, 2, 3))
+        self.assertEqual(kernel.as_matrix(kernel.to_matrix(M)), M)
+        self.assertEqual(kernel.column(M, 1), (2., 1., 6.))
+        self.assertEqual(kernel.from_columns(*kernel.transpose(M)), M)
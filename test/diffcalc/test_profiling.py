@@ -0,0 +1,89 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+import json
+
+from nose.tools import eq_  # @UnresolvedImport
+
+from diffcalc import profiling
+from diffcalc.diffcalc_ import create_diffcalc
+from diffcalc.hardware import DummyHardwareAdapter
+from diffcalc.hkl.you.constraints import NUNAME
+from diffcalc.hkl.you.geometry import SixCircle
+
+
+class TestProfileRegistry(object):
+
+    def setup(self):
+        self.registry = profiling.ProfileRegistry()
+
+    def test_record_accumulates(self):
+        self.registry.record('a', .5, 2)
+        self.registry.record('a', .25, 3)
+        self.registry.record('b', .1)
+        eq_(self.registry.as_dict(),
+            {'a': {'calls': 2, 'seconds': .75, 'candidates': 5},
+             'b': {'calls': 1, 'seconds': .1, 'candidates': 0}})
+
+    def test_to_json(self):
+        self.registry.record('a', .5, 2)
+        eq_(json.loads(self.registry.to_json()),
+            {'a': {'calls': 1, 'seconds': .5, 'candidates': 2}})
+
+    def test_table_orders_slowest_first(self):
+        eq_(self.registry.table(), '<<no stages recorded>>')
+        self.registry.record('fast', .1)
+        self.registry.record('slow', .5)
+        lines = self.registry.table().split('\n')
+        eq_(len(lines), 3)
+        assert lines[1].startswith('slow')
+        assert lines[2].startswith('fast')
+
+
+class TestSolverHooks(object):
+
+    def setup(self):
+        hardware = DummyHardwareAdapter(
+            ('mu', 'delta', NUNAME, 'eta', 'chi', 'phi'))
+        hardware.set_lower_limit('delta', 0)
+        self.dc = create_diffcalc('you', SixCircle(), hardware)
+        en = 12.39842
+        self.dc.ub.newub('test')
+        self.dc.ub.setlat('cubic', 1, 1, 1, 90, 90, 90)
+        self.dc.ub.addref([1, 0, 0], [0, 60, 0, 30, 0, 0], en, 'ref1')
+        self.dc.ub.addref([0, 1, 0], [0, 60, 0, 30, 0, 90], en, 'ref2')
+        self.dc.hkl.con('qaz', 90, 'alpha', 10, 'mu', 0)
+
+    def teardown(self):
+        profiling.disable()
+        profiling.registry.reset()
+
+    def test_disabled_records_nothing(self):
+        profiling.registry.reset()
+        self.dc._hklcalc.hklToAngles(1, 0, 0, 1)
+        eq_(profiling.registry.as_dict(), {})
+
+    def test_enabled_records_you_stages(self):
+        profiling.enable()
+        self.dc._hklcalc.hklToAngles(1, 0, 0, 1)
+        self.dc._hklcalc.hklToAngles(0, 1, 0, 1)
+        stages = profiling.registry.as_dict()
+        for stage in ('you.reference', 'you.detector', 'you.sample',
+                      'you.tidy', 'verify.hkl'):
+            eq_(stages[stage]['calls'], 2)
+        assert stages['you.sample']['candidates'] >= 2
@@ -403,6 +403,77 @@ class SixCircleGammaOnArmTest(TestSixcBase):
         self.hkl([.7, .9, 1.3])
         aneq_((15.4706, 22.0994, 1., -45.5521, 1.3500, 106.), self.sixc(), 4)
 
+    def _check_batch_matches_scalar(self, hkl_list):
+        hklcalc = self.d._hklcalc
+        result = hklcalc.hkl_to_angles_batch(hkl_list, 1.24)
+        self.assertEqual(len(result), len(hkl_list))
+        for i, hkl in enumerate(hkl_list):
+            try:
+                pos, virtual = hklcalc.hklToAngles(hkl[0], hkl[1], hkl[2],
+                                                   1.24)
+            except Exception:
+                self.assertFalse(result.ok[i], 'batch solved %s which '
+                                 'scalar calculation could not' % (hkl,))
+                continue
+            self.assertTrue(result.ok[i], 'batch could not solve %s (%s)' %
+                            (hkl, result.reason(i)))
+            aneq_(result.positions[i], pos.totuple(), 6)
+            for name in ('Bin', 'Bout', '2theta', 'azimuth'):
+                aneq_([result.virtual_angles[name][i]], [virtual[name]], 6)
+
+    def test_hkl_to_angles_batch_matches_scalar(self):
+        hkl_list = [[.7, .9, 1.3], [1, 0, 1.0628], [0, 1, 1.0628],
+                    [.3, -.2, .9], [1.1, .4, .2], [9, 9, 9]]
+        modes = [dict(mode=1),
+                 dict(mode=1, alpha=5, gamma=10, sig=-1.35, tau=-106),
+                 dict(mode=2, alpha=5, gamma=10, betain=4),
+                 dict(mode=3, alpha=5, gamma=10, sig=-1.35, tau=-106,
+                      betaout=7),
+                 dict(mode=10, gamma=10, sig=-1.35, tau=-106),
+                 dict(mode=11, gamma=10, betain=3, sig=-1.35, tau=-106),
+                 dict(mode=13, alpha=5, sig=-1.35, tau=-106),
+                 dict(mode=15, alpha=5, betaout=2, sig=-1.35, tau=-106),
+                 dict(mode=20, sig=-1.35, tau=-106),
+                 dict(mode=21, betain=8, sig=-1.35, tau=-106),
+                 dict(mode=22, betaout=1, sig=-1.35, tau=-106)]
+        for kwargs in modes:
+            self.mode(**kwargs)
+            self._check_batch_matches_scalar(hkl_list)
+
+    def test_hkl_to_angles_batch_marks_unreachable_points(self):
+        from diffcalc.hkl import batch
+        self.mode(2, betain=50)
+        result = self.d.hkl_to_angles_batch([[.7, .9, 1.3], [0, 0, 0],
+                                             [9, 9, 9], [.7, .9, -1.3]])
+        aneq_(result.positions[0], self.d.hkl_to_angles(.7, .9, 1.3)[0], 4)
+        self.assertEqual(list(result.reasons),
+                         [batch.OK, batch.Q_ZERO, batch.Q_TOO_LONG,
+                          batch.REFERENCE_UNREACHABLE])
+
+    def test_frames_are_reused_until_ub_or_constraints_change(self):
+        hklcalc = self.d._hklcalc
+        self.mode(2, alpha=5, gamma=10, betain=4, sig=-1.35, tau=-106)
+        frames = hklcalc._frames()
+        self.assert_(hklcalc._frames() is frames)
+        self.hkl([.7, .9, 1.3])
+        self.assert_(hklcalc._frames() is frames)
+
+        self.d.ub.sigtau(0, 0)
+        self.assert_(hklcalc._frames() is not frames)
+        frames = hklcalc._frames()
+        self.d.hkl.setpar('betain', 6)
+        self.assert_(hklcalc._frames() is not frames)
+        frames = hklcalc._frames()
+        self.d.ub.calcub()
+        self.assert_(hklcalc._frames() is not frames)
+
+        # and the solution still matches one from freshly built matrices
+        self.hkl([.7, .9, 1.3])
+        expected = self.sixc()
+        hklcalc._cached_frames = None
+        self.hkl([.7, .9, 1.3])
+        aneq_(self.sixc(), expected, 8)
+
 
 class ZAxisGammaOnBaseTest(TestSixcBase):
 
@@ -473,6 +544,15 @@ class ZAxisGammaOnBaseTest(TestSixcBase):
         self.checkHKL([.7, .8, 1], [30, 57.0626, 96.8659, 86.6739, 0, 0],
                       betaout=30, nu=-63.0210)
 
+    def test_batch_conversions_match_scalar(self):
+        hkl_list = [[0, 0, 1], [0, 1, 1], [1, 0, 1], [1, 1, 1], [.7, .8, .8]]
+        result = self.d.hkl_to_angles_batch(hkl_list)
+        for hkl, angles in zip(hkl_list, result.positions):
+            aneq_(angles, self.d.hkl_to_angles(*hkl)[0], 6)
+        hkl_batch = self.d.angles_to_hkl_batch(result.positions)
+        for hkl, angles in zip(hkl_batch, result.positions):
+            aneq_(hkl, self.d.angles_to_hkl(tuple(angles))[0], 6)
+
 
 class ZAxisGammaOnBaseIncludingNuRotationTest(ZAxisGammaOnBaseTest):
 
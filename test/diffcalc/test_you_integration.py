@@ -18,12 +18,14 @@
 
 from diffcalc.diffcalc_ import create_diffcalc
 from diffcalc.hardware import DummyHardwareAdapter
-from diffcalc.hkl.you.geometry import SixCircle, FourCircle
+from diffcalc.hkl.you.geometry import SixCircle, FourCircle, YouPosition
 from math import pi
 from test.tools import mneq_, aneq_, assert_dict_almost_equal
 import diffcalc.gdasupport.factory # @UnusedImport for VERBOSE
 import diffcalc.util
 from diffcalc.hkl.you.constraints import NUNAME
+from diffcalc.util import DiffcalcException
+from nose.tools import assert_raises  # @UnresolvedImport
 
 try:
     from numpy import matrix
@@ -50,7 +52,19 @@ class _BaseCubic():
         UB = U * 2 * pi
         mneq_(self.dc.ub._ubcalc.U, U)
         mneq_(self.dc.ub._ubcalc.UB, UB)
-        
+
+    def test_check_ub(self):
+        check = self.dc.check_ub()
+        assert len(check) == 2
+        assert list(check.tags) == ['ref1', 'ref2']
+        for n in range(len(check)):
+            hkl, pos, energy, _, _ = self.dc._ubcalc.get_reflection(n + 1)
+            hkl_calc, _ = self.dc._hklcalc.anglesToHkl(pos, 12.39842 / energy)
+            aneq_(check.entered_hkl[n], hkl)
+            aneq_(check.computed_hkl[n], hkl_calc)
+            aneq_(check.residuals[n], [c - e for c, e in zip(hkl_calc, hkl)])
+            assert abs(check.energies[n] - energy) < 1e-10
+
 
 class TestDiffcalcSixc(_BaseCubic):
 
@@ -105,6 +119,101 @@ class TestDiffcalcSixc(_BaseCubic):
         self.dc.hkl.con('eta', 0, 'chi', 0, 'phi', 0)
         self.dc.hkl.allhkl([.1, 0, .01], 1)
 
+    def test_angles_to_hkl_batch(self):
+        hkl = self.dc.angles_to_hkl_batch([self.angles, [0, 60, 0, 30, 0, 90]],
+                                          self.en)
+        aneq_(hkl[0], self.hkl)
+        aneq_(hkl[1], [0, 1, 0])
+
+    def test_hkl_to_angles_batch(self):
+        self.dc.hkl.con('a_eq_b')
+        self.dc.hkl.con('mu', 0)
+        self.dc.hkl.con(NUNAME, 0)
+        result = self.dc.hkl_to_angles_batch([self.hkl, [0, 0, 0]], self.en)
+        aneq_(result.positions[0], self.angles)
+        assert list(result.ok) == [True, False]
+
+    def test_angles_to_virtual_angles_batch(self):
+        angles, psi_flags = self.dc.angles_to_virtual_angles_batch(
+            [self.angles, [0, 60, 0, 30, 0, 90]])
+        for name, value in self.param.items():
+            aneq_(angles[name], [value, value])
+        assert list(psi_flags) == [0, 0]
+
+    def test_hkl_to_angles_uses_solution_cache(self):
+        self.dc.hkl.con('a_eq_b')
+        self.dc.hkl.con('mu', 0)
+        self.dc.hkl.con(NUNAME, 0)
+        cache = self.dc._hklcalc.solution_cache
+        h, k, l = self.hkl
+        self.dc.hkl_to_angles(h, k, l, self.en)
+        angles_calc, param_calc = self.dc.hkl_to_angles(h, k, l, self.en)
+        aneq_(angles_calc, self.angles)
+        assert_dict_almost_equal(param_calc, self.param)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_solution_cache_invalidated_by_changes(self):
+        self.dc.hkl.con('a_eq_b')
+        self.dc.hkl.con('mu', 0)
+        self.dc.hkl.con(NUNAME, 0)
+        cache = self.dc._hklcalc.solution_cache
+        h, k, l = self.hkl
+        self.dc.hkl_to_angles(h, k, l, self.en)
+        self.dc.hkl.con(NUNAME, 0)
+        self.dc.hkl_to_angles(h, k, l, self.en)
+        self.hardware.set_lower_limit('delta', -180)
+        self.dc.hkl_to_angles(h, k, l, self.en)
+        self.dc.ub._ubcalc.set_U_manually([[0, 1, 0], [-1, 0, 0], [0, 0, 1]])
+        angles_calc, _ = self.dc.hkl_to_angles(h, k, l, self.en)
+        assert (cache.hits, cache.misses) == (0, 4)
+        aneq_(angles_calc, [0, 60, 0, 30, 0, 270])
+
+    def test_hkl_to_angles_trajectory_follows_branch(self):
+        self.hardware.set_lower_limit('delta', 0)
+        self.hardware.set_lower_limit(NUNAME, -90)
+        self.hardware.set_upper_limit(NUNAME, 90)
+        self.dc.hkl.con('qaz', 90, 'alpha', 10, 'mu', 0)
+        hkl_list = [(.7, .2, .3), (.7, .25, .3), (.7, .3, .3)]
+        solutions = self.dc.hkl_to_angles_trajectory(
+            hkl_list, self.en, start=[0, 46, 0, -150, -20, -170])
+        for (angles, _), (h, k, l) in zip(solutions, hkl_list):
+            assert angles[4] < 0  # chi stays on the starting branch
+            hkl_calc, _ = self.dc.angles_to_hkl(angles, self.en)
+            aneq_(hkl_calc, (h, k, l))
+        angles_calc, _ = self.dc.hkl_to_angles(.7, .3, .3, self.en)
+        assert angles_calc[4] > 0  # chosen when not following a trajectory
+
+    def test_hkl_to_angles_trajectory_max_jump(self):
+        self.hardware.set_lower_limit('delta', 0)
+        self.hardware.set_lower_limit(NUNAME, -90)
+        self.hardware.set_upper_limit(NUNAME, 90)
+        self.dc.hkl.con('qaz', 90, 'alpha', 10, 'mu', 0)
+        assert_raises(DiffcalcException, self.dc.hkl_to_angles_trajectory,
+                      [(.7, .2, .3)], self.en, [0, 46, 0, 80, 0, 100], 45)
+
+    def test_sampled_verification_policy(self):
+        self.dc.hkl.con('a_eq_b')
+        self.dc.hkl.con('mu', 0)
+        self.dc.hkl.con(NUNAME, 0)
+        hklcalc = self.dc._hklcalc
+        hklcalc.set_solution_cache_size(0)
+        hklcalc.set_verification_policy('sampled', every=3)
+        for _ in range(4):
+            self.dc.hkl_to_angles(1, 0, 0, self.en)
+        assert hklcalc.verifications == 2
+        hklcalc.set_verification_policy('trust')
+        angles_calc, _ = self.dc.hkl_to_angles(1, 0, 0, self.en)
+        aneq_(angles_calc, self.angles)
+        assert hklcalc.verifications == 2
+
+    def test_verification_failures_are_counted(self):
+        hklcalc = self.dc._hklcalc
+        hklcalc.raiseExceptionsIfAnglesDoNotMapBackToHkl = False
+        wrong_pos = YouPosition(0, 60, 0, 30, 0, 90)
+        hklcalc._verify_pos_map_to_hkl(1, 0, 0, 1, wrong_pos)
+        assert hklcalc.verification_failures == 1
+        assert '1 failed checks' in hklcalc.repr_verification()
+
 
 class TestDiffcalcFourc(_BaseCubic):
 
@@ -146,4 +255,16 @@ class TestDiffcalcFourc(_BaseCubic):
         self.energy = self.en
         angles_calc, param_calc = self.dc.hkl_to_angles(h, k, l, self.en)
         aneq_(angles_calc, self.angles)
-        assert_dict_almost_equal(param_calc, self.param)
\ No newline at end of file
+        assert_dict_almost_equal(param_calc, self.param)
+
+    def test_angles_to_hkl_batch(self):
+        hkl = self.dc.angles_to_hkl_batch([self.angles], self.en)
+        aneq_(hkl[0], self.hkl)
+
+    def test_hkl_to_angles_batch(self):
+        self.dc.hkl.con('a_eq_b')
+        result = self.dc.hkl_to_angles_batch([self.hkl], self.en)
+        aneq_(result.positions[0], self.angles)
+        assert_dict_almost_equal(
+            dict((k, v[0]) for k, v in result.virtual_angles.items()),
+            self.param)
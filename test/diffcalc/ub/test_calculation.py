@@ -120,6 +120,17 @@ class TestUBCalculationWithYouStrategy():
         eq_(self.ubcalc.get_reflection(2), ref2)
         eq_(self.ubcalc.get_reflection(3), ref3)
         
+    def test_save_and_restore_ubcalc_keeps_reflection_order(self):
+        NAME = 'test_save_and_restore_ubcalc_keeps_reflection_order'
+        self.ubcalc.start_new(NAME)
+        now = datetime.datetime.now()
+        for n in range(12):
+            self.ubcalc.add_reflection(0, 0, n, REF1b, EN1, str(n), now)
+        self.ubcalc.start_new(NAME + '2')
+        self.ubcalc.load(NAME)
+        for n in range(12):
+            eq_(self.ubcalc.get_reflection(n + 1)[3], str(n))
+
     def test_save_and_restore_ubcalc_with_UB_from_two_ref(self):
         NAME = 'test_save_and_restore_ubcalc_with_UB_from_two_ref'
         self.ubcalc.start_new(NAME)
@@ -146,6 +157,16 @@ class TestUBCalculationWithYouStrategy():
         
         matrixeq_(self.ubcalc.UB, UB1,  places=2)
 
+    def test_calculate_UB_from_primary_only_anti_parallel(self):
+        # q measured along x for a reflection whose B*h is along -x
+        self.ubcalc.start_new('test_anti_parallel')
+        self.ubcalc.set_lattice('latt', 1, 1, 1, 90, 90, 90)
+        pos = posFromI16sEuler(0, 0, 30, 0, 60, 0)
+        self.ubcalc.add_reflection(-1, 0, 0, pos, EN1, '-100', None)
+        self.ubcalc.calculate_UB_from_primary_only()
+        matrixeq_(self.ubcalc.UB * matrix([[-1], [0], [0]]),
+                  matrix([[2 * pi], [0], [0]]))
+
     def test_save_and_restore_ubcalc_with_manual_ub(self):
         NAME = 'test_save_and_restore_ubcalc_with_manual_ub'
         UB = matrix([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
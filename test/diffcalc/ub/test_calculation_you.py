@@ -18,6 +18,8 @@
 
 from math import pi
 from mock import Mock
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
 
 try:
     from numpy import matrix
@@ -26,9 +28,10 @@ except ImportError:
 
 from diffcalc.hkl.you.geometry import SixCircle
 from diffcalc.hkl.you.geometry import YouPosition
-from diffcalc.hkl.you.calc import YouUbCalcStrategy
+from diffcalc.hkl.you.calc import YouUbCalcStrategy, _q_phi
 from test.tools import matrixeq_
 from diffcalc.ub.calc import UBCalculation
+from diffcalc.ub.crystal import CrystalUnderTest
 from diffcalc.ub.persistence import UbCalculationNonPersister
 
 #newub 'cubic'                   <-->  reffile('cubic)
@@ -81,3 +84,72 @@ class TestUBCalculationWithYouStrategy():
         self.ubcalc.add_reflection(0, 0, 1, REF1b, EN1, '001', None)
         self.ubcalc.calculate_UB()
         matrixeq_(self.ubcalc.UB, UB1)
+
+    def _add_reflections_for(self, UB, positions):
+        # hkl need not be integer, so those matching any position can be used
+        UB_I = UB.I
+        for pos in positions:
+            pos_rad = YouPosition(*pos)
+            pos_rad.changeToRadians()
+            q_phi = matrix(_q_phi(pos_rad, 2 * pi / (12.39842 / EN1))).T
+            hkl = (UB_I * q_phi).T.tolist()[0]
+            self.ubcalc.add_reflection(hkl[0], hkl[1], hkl[2],
+                                       YouPosition(*pos), EN1, None, None)
+
+    def testRefineUMatchesTwoExactReflections(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for UB refinement')
+        self.ubcalc.start_new('cubcalc')
+        self.ubcalc.set_lattice('latt', 1, 1, 1, 90, 90, 90)
+        self.ubcalc.add_reflection(1, 0, 0, REF1a, EN1, '100', None)
+        self.ubcalc.add_reflection(0, 0, 1, REF1b, EN1, '001', None)
+        result = self.ubcalc.refine_UB()
+        matrixeq_(self.ubcalc.UB, UB1)
+        assert result.rms_angle < 1e-6
+
+    def testRefineULatticeFromManyReflections(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for UB refinement')
+        UB = UB1 / (2 * pi) * CrystalUnderTest('latt', 3.1, 4.2, 5.3,
+                                               88, 92, 95).B
+        self.ubcalc.start_new('refine')
+        self.ubcalc.set_lattice('latt', 3, 4, 5, 90, 90, 90)
+        self._add_reflections_for(UB, [(0, 40, 0, 20, 10, 30),
+                                       (0, 60, 5, 25, -20, 100),
+                                       (0, 80, 10, 40, 45, -60),
+                                       (5, 100, 0, 50, 70, 15),
+                                       (0, 30, 0, 15, 85, -150)])
+        result = self.ubcalc.refine_UB(refine_lattice=True)
+        matrixeq_(self.ubcalc.UB, UB)
+        matrixeq_(self.ubcalc.U, UB1 / (2 * pi))
+        for value, expected in zip(result.lattice,
+                                   (3.1, 4.2, 5.3, 88, 92, 95)):
+            assert abs(value - expected) < 1e-8
+        eq_(self.ubcalc._state.crystal.getLattice()[0], 'latt')
+        assert result.rms_angle < 1e-6
+
+    def testIndexPeaks(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for indexing')
+        self.ubcalc.start_new('index')
+        self.ubcalc.set_lattice('latt', 1, 1, 1, 90, 90, 90)
+        self.ubcalc.add_peak(REF1a, EN1, 'a', None)
+        self.ubcalc.add_peak(REF1b, EN1, 'b', None)
+        result = self.ubcalc.index_peaks()
+        assert all(result.indexed)
+        eq_(self.ubcalc.get_number_peaks(), 0)
+        eq_(self.ubcalc.get_number_reflections(), 2)
+        # any of the cubic orientations will do, as long as it maps the
+        # reflections' hkl back to their positions
+        for num in (1, 2):
+            hkl, pos, _, tag, _ = self.ubcalc.get_reflection(num)
+            eq_(tag, 'ab'[num - 1])
+            pos.changeToRadians()
+            q_phi = matrix(_q_phi(pos, 2 * pi)).T
+            matrixeq_(self.ubcalc.UB * matrix(hkl).T, q_phi)
@@ -0,0 +1,101 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import asin, pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from numpy.testing import assert_array_almost_equal
+except ImportError:
+    np = None
+
+from diffcalc.ub.crystal import CrystalUnderTest
+from diffcalc.util import DiffcalcException
+
+TODEG = 180 / pi
+LATTICE = (5.1, 6.2, 7.3, 85., 95., 105.)
+
+
+class TestCatalogue(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for reflection catalogues')
+        from diffcalc.ub import catalogue
+        self.catalogue = catalogue
+        self.crystal = CrystalUnderTest('xtal', *LATTICE)
+        self.B = np.array(self.crystal.B)
+
+    def _all(self, *args, **kwargs):
+        shells = list(self.catalogue.reflections(*args, **kwargs))
+        return (np.concatenate([hkl for hkl, _ in shells]),
+                np.concatenate([tth for _, tth in shells]), len(shells))
+
+    def _brute_force(self, q_max):
+        grid = np.mgrid[-12:13, -12:13, -12:13].reshape(3, -1).T
+        q = np.sqrt(np.sum(np.dot(grid, self.B.T) ** 2, axis=-1))
+        return set(map(tuple, grid[(q > 0) & (q <= q_max)]))
+
+    def test_two_theta_matches_plane_distance(self):
+        hkl = [(1, 0, 0), (1, 2, 3), (0, -1, 2), (9, 9, 9)]
+        tth = self.catalogue.two_theta(self.B, hkl, 1.2)
+        for (h, k, l), result in zip(hkl[:3], tth[:3]):
+            d = self.crystal.get_hkl_plane_distance((h, k, l))
+            assert abs(result - 2 * asin(1.2 / (2 * d)) * TODEG) < 1e-10
+        assert np.isnan(tth[3])
+
+    def test_reflections_are_complete_and_sorted(self):
+        hkl, tth, nshell = self._all(self.B, 1.5, shell_size=100)
+        assert nshell > 1
+        assert set(map(tuple, hkl)) == self._brute_force(4 * pi / 1.5)
+        assert len(set(map(tuple, hkl))) == len(hkl)
+        assert np.all(np.diff(tth) >= 0)
+        assert_array_almost_equal(tth, self.catalogue.two_theta(self.B, hkl,
+                                                                1.5), 10)
+
+    def test_two_theta_max(self):
+        hkl, tth, _ = self._all(self.B, 1.5, two_theta_max=60)
+        q_max = 4 * pi * np.sin(30 / TODEG) / 1.5
+        assert set(map(tuple, hkl)) == self._brute_force(q_max)
+        assert tth[-1] <= 60
+
+    def test_centring(self):
+        allowed = self.catalogue.allowed
+        hkl = [(1, 0, 0), (1, 1, 0), (1, 1, 1), (2, 0, 0), (0, 1, 1),
+               (1, 0, 1), (-1, 1, 0)]
+        eq = lambda centring, expected: list(allowed(hkl, centring)) == \
+            expected
+        assert eq('P', [True] * 7)
+        assert eq('I', [False, True, False, True, True, True, True])
+        assert eq('F', [False, False, True, True, False, False, False])
+        assert eq('C', [False, True, True, True, False, False, True])
+        assert eq('A', [True, False, True, True, True, False, False])
+        assert eq('b', [False, False, True, True, False, True, False])
+        assert eq('R', [False, True, False, False, False, True, False])
+        assert list(allowed([(1, 0, 1), (0, 1, 2)], 'R')) == [True, True]
+        hkl, _, _ = self._all(self.B, 1.5, 'I', shell_size=100)
+        assert np.all((hkl.sum(axis=-1) % 2) == 0)
+
+    def test_unknown_centring(self):
+        assert_raises(DiffcalcException, self.catalogue.allowed, [(1, 0, 0)],
+                      'X')
+        assert_raises(DiffcalcException, list,
+                      self.catalogue.reflections(self.B, 1., 'X'))
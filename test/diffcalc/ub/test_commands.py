@@ -17,6 +17,8 @@
 ###
 
 import unittest
+from math import pi
+from nose.plugins.skip import SkipTest
 from nose.tools import eq_
 
 try:
@@ -25,18 +27,23 @@ except ImportError:
     from numjy import matrix
 
 import diffcalc.util  # @UnusedImport
-from diffcalc.hkl.vlieg.geometry import SixCircleGammaOnArmGeometry
+from diffcalc.hkl.vlieg.geometry import SixCircleGammaOnArmGeometry, \
+    VliegPosition
 from diffcalc.hardware import DummyHardwareAdapter
 from test.tools import assert_iterable_almost_equal, mneq_
 from diffcalc.ub.commands import UbCommands
 from diffcalc.ub.persistence import UbCalculationNonPersister
-from diffcalc.util import DiffcalcException, MockRawInput
+from diffcalc.util import DiffcalcException, MockRawInput, x_rotation, \
+    y_rotation, z_rotation
+from diffcalc.ub.crystal import CrystalUnderTest
 from diffcalc.ub.calc import UBCalculation
 from diffcalc.hkl.vlieg.calc import VliegUbCalcStrategy
 from test.diffcalc import scenarios
 
 diffcalc.util.DEBUG = True
 
+TORAD = pi / 180
+
 
 def prepareRawInput(listOfStrings):
     diffcalc.util.raw_input = MockRawInput(listOfStrings)
@@ -341,11 +348,72 @@ class TestUbCommands(unittest.TestCase):
         mneq_(self.ubcalc.UB, matrix(s.umatrix) * matrix(s.bmatrix),
               4, note="wrong UB matrix after calculating U")
 
+    def _addref_for(self, UB, pos):
+        # add the (non-integer) hkl which UB places exactly at pos
+        pos_rad = VliegPosition(*pos)
+        pos_rad.changeToRadians()
+        q_phi = matrix(VliegUbCalcStrategy().calculate_q_phi(pos_rad)) * 2 * pi
+        hkl = (UB.I * q_phi).T.tolist()[0]
+        self.ubcommands.addref(hkl, pos, 12.39842)
+
+    def testRefineub(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for UB refinement')
+        self.ubcommands.newub('testrefineub')
+        s = scenarios.sessions()[0]
+        self.ubcommands.setlat(s.name, *s.lattice)
+        # not enougth reflections:
+        self.assertRaises(DiffcalcException, self.ubcommands.refineub)
+        U = (z_rotation(10 * TORAD) * y_rotation(-20 * TORAD) *
+             x_rotation(30 * TORAD))
+        UB = U * CrystalUnderTest('xtal', *s.lattice).B
+        self._addref_for(UB, (0, 40, 0, 20, 10, 30))
+        self._addref_for(UB, (0, 60, 5, 25, -20, 100))
+        self.ubcommands.refineub()
+        mneq_(self.ubcalc.U, U, 8, note="wrong U matrix after refining U")
+        # not enougth reflections to refine the lattice:
+        self.assertRaises(DiffcalcException, self.ubcommands.refineub, True)
+        self._addref_for(UB, (5, 80, 10, 40, 45, -60))
+        self.ubcommands.refineub(True)
+        mneq_(self.ubcalc.U, U, 8, note="wrong U matrix after refining U")
+        assert_iterable_almost_equal(
+            self.ubcalc._state.crystal.getLattice()[1:], s.lattice)
+
+    def testIndexub(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for indexing')
+        self.ubcommands.newub('testindexub')
+        s = scenarios.sessions()[1]
+        self.ubcommands.setlat(s.name, *s.lattice)
+        for r in (s.ref1, s.ref2):
+            self.ubcommands.addref(None, r.pos.totuple(), r.energy, r.tag)
+        eq_(self.ubcalc.get_number_reflections(), 0)
+        eq_(self.ubcalc.get_number_peaks(), 2)
+        self.ubcommands.indexub()
+        eq_(self.ubcalc.get_number_reflections(), 2)
+        eq_(self.ubcalc.get_number_peaks(), 0)
+
     def testC2th(self):
         self.ubcommands.newub('testcalcub')
         self.ubcommands.setlat('cube', 1, 1, 1, 90, 90, 90)
         self.assertAlmostEquals(self.ubcommands.c2th((0, 0, 1)), 60)
 
+    def testC2thBatch(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            raise SkipTest('numpy is required for batch calculations')
+        self.ubcommands.newub('testc2th')
+        self.ubcommands.setlat('xtal', 3, 4, 5, 90, 95, 90)
+        hkl_list = [(0, 0, 1), (1, 1, 0), (1, -2, 3)]
+        tth = self.ubcommands.c2th(hkl_list, 8)
+        for hkl, result in zip(hkl_list, tth):
+            self.assertAlmostEquals(result, self.ubcommands.c2th(hkl, 8))
+
     def testSigtau(self):
         # sigtau [sig tau]
         self.assertRaises(TypeError, self.ubcommands.sigtau, 1)
@@ -59,4 +59,14 @@ class TestCrystalUnderTest(unittest.TestCase):
 
     def test__str__(self):
         cut = CrystalUnderTest("HCl", 1, 2, 3, 4, 5, 6)
-        print cut.__str__()
\ No newline at end of file
+        print cut.__str__()
+
+    def testGetHklPlaneDistance(self):
+        cut = CrystalUnderTest('xtal', 5.1, 6.2, 7.3, 90, 90, 90)
+        self.assertAlmostEqual(cut.get_hkl_plane_distance((1, 0, 0)), 5.1)
+        self.assertAlmostEqual(cut.get_hkl_plane_distance((0, 2, 0)), 3.1)
+        self.assertAlmostEqual(cut.get_hkl_plane_distance((1, 1, 1)),
+                               (5.1 ** -2 + 6.2 ** -2 + 7.3 ** -2) ** -.5)
+        hexagonal = CrystalUnderTest('hex', 4, 4, 10, 90, 90, 120)
+        self.assertAlmostEqual(hexagonal.get_hkl_plane_distance((1, 0, 0)),
+                               4 * 3 ** .5 / 2)
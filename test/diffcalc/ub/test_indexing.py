@@ -0,0 +1,88 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from numpy.testing import assert_array_almost_equal
+except ImportError:
+    np = None
+
+from diffcalc.ub.crystal import CrystalUnderTest
+from diffcalc.util import DiffcalcException, x_rotation, y_rotation, \
+    z_rotation
+
+TORAD = pi / 180
+LATTICE = (5.1, 6.2, 7.3, 85., 95., 105.)
+
+
+class TestIndexing(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for indexing')
+        from diffcalc.ub import indexing
+        self.indexing = indexing
+        self.U = np.array(z_rotation(20 * TORAD) * y_rotation(-35 * TORAD) *
+                          x_rotation(50 * TORAD))
+        self.B = np.array(CrystalUnderTest('xtal', *LATTICE).B)
+        random = np.random.RandomState(0)
+        hkl = random.randint(-4, 5, (100, 3))
+        self.hkl = hkl[np.any(hkl != 0, axis=-1)].astype(float)
+        self.q_phi = (np.dot(self.hkl, np.dot(self.U, self.B).T) +
+                      random.normal(0, 1e-3, self.hkl.shape))
+
+    def test_candidate_hkl_sorted_by_q(self):
+        hkl = self.indexing.candidate_hkl(self.B, 3.)
+        q = np.sqrt(np.sum(np.dot(hkl, self.B.T) ** 2, axis=-1))
+        assert np.all(np.diff(q) >= 0)
+        assert q[-1] <= 3. and q[0] > 0
+        # every reflection within the limit is included
+        grid = np.mgrid[-5:6, -5:6, -5:6].reshape(3, -1).T
+        q_grid = np.sqrt(np.sum(np.dot(grid, self.B.T) ** 2, axis=-1))
+        assert len(hkl) == np.sum((q_grid <= 3.) & (q_grid > 0))
+
+    def test_index_peaks(self):
+        result = self.indexing.index_peaks(self.q_phi, self.B)
+        assert np.all(result.indexed)
+        assert_array_almost_equal(result.hkl, self.hkl)
+        assert_array_almost_equal(result.U, self.U, 3)
+        assert result.refinement.lattice is None
+
+    def test_index_peaks_ignores_spurious_peaks(self):
+        spurious = np.random.RandomState(1).normal(0, 2, (5, 3))
+        result = self.indexing.index_peaks(np.vstack((self.q_phi, spurious)),
+                                           self.B)
+        assert np.all(result.indexed[:len(self.hkl)])
+        assert not np.any(result.indexed[len(self.hkl):])
+        assert np.all(np.isnan(result.hkl[len(self.hkl):]))
+
+    def test_index_peaks_and_refine_lattice(self):
+        B = np.array(CrystalUnderTest('xtal', 5.12, 6.18, 7.31, 85.2, 94.9,
+                                      105.1).B)
+        result = self.indexing.index_peaks(self.q_phi, B, refine_lattice=True)
+        assert np.all(result.indexed)
+        assert_array_almost_equal(result.refinement.lattice, LATTICE, 1)
+
+    def test_one_peak_is_not_enough(self):
+        assert_raises(DiffcalcException, self.indexing.index_peaks,
+                      self.q_phi[:1], self.B)
@@ -0,0 +1,86 @@
+###
+# Copyright 2008-2011 Diamond Light Source Ltd.
+# This file is part of Diffcalc.
+#
+# Diffcalc is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Diffcalc is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Diffcalc.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+from math import pi
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises  # @UnresolvedImport
+
+try:
+    import numpy as np
+    from numpy.testing import assert_array_almost_equal
+except ImportError:
+    np = None
+
+from diffcalc.ub.crystal import CrystalUnderTest
+from diffcalc.util import DiffcalcException, x_rotation, y_rotation, \
+    z_rotation
+
+TORAD = pi / 180
+LATTICE = (5.1, 6.2, 7.3, 85., 95., 105.)
+
+
+class TestRefine(object):
+
+    def setup(self):
+        if np is None:
+            raise SkipTest('numpy is required for UB refinement')
+        from diffcalc.ub import refine
+        self.refine = refine
+        self.U = np.array(z_rotation(20 * TORAD) * y_rotation(-35 * TORAD) *
+                          x_rotation(50 * TORAD))
+        self.B = np.array(CrystalUnderTest('xtal', *LATTICE).B)
+        grid = np.mgrid[-3:4, -3:4, -3:4].reshape(3, -1).T
+        self.hkl = grid[np.any(grid != 0, axis=-1)].astype(float)
+        self.q_phi = np.dot(self.hkl, np.dot(self.U, self.B).T)
+
+    def test_lattice_from_B(self):
+        assert_array_almost_equal(self.refine.lattice_from_B(self.B), LATTICE,
+                                  10)
+
+    def test_fit_U_from_exact_reflections(self):
+        result = self.refine.refine(self.hkl, self.q_phi, self.B)
+        assert_array_almost_equal(result.U, self.U, 10)
+        assert result.lattice is None
+        assert result.rms_angle < 1e-6
+        assert_array_almost_equal(result.hkl_residuals,
+                                  np.zeros_like(self.hkl), 10)
+
+    def test_fit_U_from_noisy_reflections(self):
+        noise = np.random.RandomState(0).normal(0, 1e-3, self.q_phi.shape)
+        result = self.refine.refine(self.hkl, self.q_phi + noise, self.B)
+        assert_array_almost_equal(result.U, self.U, 3)
+        assert_array_almost_equal(np.dot(result.U.T, result.U), np.eye(3), 10)
+        assert 0 < result.rms_angle < .1
+
+    def test_refine_lattice(self):
+        B_wrong = np.array(CrystalUnderTest('xtal', 5, 6, 7, 90, 90, 90).B)
+        result = self.refine.refine(self.hkl, self.q_phi, B_wrong, True)
+        assert_array_almost_equal(result.lattice, LATTICE, 8)
+        assert_array_almost_equal(result.U, self.U, 10)
+        assert_array_almost_equal(result.UB, np.dot(self.U, self.B), 10)
+
+    def test_parallel_reflections_are_rejected(self):
+        hkl = [(1, 0, 0), (2, 0, 0)]
+        assert_raises(DiffcalcException, self.refine.refine, hkl,
+                      np.dot(hkl, self.B.T), self.B)
+
+    def test_coplanar_reflections_do_not_refine_lattice(self):
+        hkl = [(1, 0, 0), (0, 1, 0), (1, 1, 0)]
+        assert_raises(DiffcalcException, self.refine.refine, hkl,
+                      np.dot(hkl, self.B.T), self.B, True)
@@ -69,6 +69,40 @@ class TestReflectionList(unittest.TestCase):
         self.assertEqual(self.reflist.getReflection(2),
                      ([1, 2, 3], pos, 1000, "ref1", self.time))
 
+    def testFindByTagAndHkl(self):
+        self.reflist.add_reflection(1, 2, 3.00001, Pos(1, 2, 3, 4, 5, 6), 1000,
+                                    "ref1", self.time)
+        self.assertEqual(self.reflist.find_by_tag("ref1"), [1, 3])
+        self.assertEqual(self.reflist.find_by_tag("ref2"), [2])
+        self.assertEqual(self.reflist.find_by_tag("ref3"), [])
+        self.assertEqual(self.reflist.find_by_hkl((1, 2, 3)), [1, 3])
+        self.assertEqual(self.reflist.find_by_hkl([1.1, 2.2, 3.3]), [2])
+        self.reflist.removeReflection(1)
+        self.assertEqual(self.reflist.find_by_tag("ref1"), [2])
+        self.reflist.swap_reflections(1, 2)
+        self.assertEqual(self.reflist.find_by_hkl((1, 2, 3)), [1])
+        self.reflist.edit_reflection(1, 0, 0, 1, Pos(1, 2, 3, 4, 5, 6), 1000,
+                                     "new1", self.time)
+        self.assertEqual(self.reflist.find_by_hkl((1, 2, 3)), [])
+        self.assertEqual(self.reflist.find_by_tag("new1"), [1])
+
+    def testColumnArrays(self):
+        try:
+            import numpy  # @UnusedImport
+        except ImportError:
+            return
+        self.assertEqual(self.reflist.get_hkl_array().tolist(),
+                         [[1, 2, 3], [1.1, 2.2, 3.3]])
+        self.assertEqual(self.reflist.get_positions_array().tolist(),
+                         [[0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+                          [0.11, 0.22, 0.33, 0.44, 0.55, 0.66]])
+        self.assertEqual(self.reflist.get_energies().tolist(), [1000, 1100])
+        self.reflist.swap_reflections(1, 2)
+        self.assertEqual(self.reflist.get_energies().tolist(), [1100, 1000])
+        self.reflist.removeReflection(1)
+        self.reflist.removeReflection(1)
+        self.assertEqual(self.reflist.get_hkl_array().shape, (0, 3))
+
     def createRefStateDicts(self):
         ref_0 = {
             'h': 1,